@@ -1,5 +1,4 @@
 from datetime import timedelta
-from email import policy
 import os
 
 from flask import Flask
@@ -13,7 +12,18 @@ from api.exceptions.notfound import NotFoundException
 from .exceptions.badrequest import BadRequestException
 from .exceptions.validation import ValidationException
 
-from .neo4j import init_driver
+from .bookmarks import BookmarkStore, HEADER as BOOKMARKS_HEADER, save_bookmarks
+from .bodies import init_bodies
+from .cache import init_cache
+from .instrumentation import add_server_timing, start_query_stats, stop_query_stats
+from .memprofile import init_memory_profile
+from .metrics import init_metrics
+from .tracing import TRACERESPONSE, init_tracing
+from .profiling import ID_HEADER as PROFILE_ID_HEADER, abandon_profile, start_profile, stop_profile
+from .neo4j import get_driver, init_driver, driver_config
+from .querylog import QueryLog
+from .snapshot import init_snapshots
+from .warmup import Readiness, start_warmup
 
 from .routes.auth import auth_routes
 from .routes.account import account_routes
@@ -21,6 +31,19 @@ from .routes.movies import movie_routes
 from .routes.genres import genre_routes
 from .routes.people import people_routes
 from .routes.status import status_routes
+from .routes.admin import admin_routes
+
+def env(name, cast=str, default=None):
+    value = os.getenv(name)
+
+    if value is None or value == '':
+        return default
+
+    if cast is bool:
+        return value.lower() in ('1', 'true', 'yes', 'on')
+
+    return cast(value)
+
 
 def create_app(test_config=None):
     # Create and configure app
@@ -32,6 +55,53 @@ def create_app(test_config=None):
         NEO4J_USERNAME=os.getenv('NEO4J_USERNAME'),
         NEO4J_PASSWORD=os.getenv('NEO4J_PASSWORD'),
         NEO4J_DATABASE=os.getenv('NEO4J_DATABASE'),
+        NEO4J_MAX_CONNECTION_POOL_SIZE=env('NEO4J_MAX_CONNECTION_POOL_SIZE', int),
+        NEO4J_CONNECTION_ACQUISITION_TIMEOUT=env('NEO4J_CONNECTION_ACQUISITION_TIMEOUT', float),
+        NEO4J_MAX_CONNECTION_LIFETIME=env('NEO4J_MAX_CONNECTION_LIFETIME', float),
+        NEO4J_FETCH_SIZE=env('NEO4J_FETCH_SIZE', int),
+        NEO4J_KEEP_ALIVE=env('NEO4J_KEEP_ALIVE', bool),
+        NEO4J_DEFERRED_STARTUP=env('NEO4J_DEFERRED_STARTUP', bool, True),
+        NEO4J_WARMUP_CONNECTIONS=env('NEO4J_WARMUP_CONNECTIONS', int, 4),
+        NEO4J_WARMUP_RETRIES=env('NEO4J_WARMUP_RETRIES', int),
+        NEO4J_RECORD=os.getenv('NEO4J_RECORD'),
+        NEO4J_REPLAY=os.getenv('NEO4J_REPLAY'),
+        NEO4J_REPLAY_LATENCY=os.getenv('NEO4J_REPLAY_LATENCY'),
+        NPLUSONE_THRESHOLD=env('NPLUSONE_THRESHOLD', int, 5),
+        SLOW_QUERY_MS=env('SLOW_QUERY_MS', float, 100.0),
+        SLOW_QUERY_PROFILE_RATE=env('SLOW_QUERY_PROFILE_RATE', float, 0.0),
+        ADMIN_TOKEN=os.getenv('ADMIN_TOKEN'),
+        METRICS_DIR=os.getenv('METRICS_DIR'),
+        METRICS_FLUSH_INTERVAL=env('METRICS_FLUSH_INTERVAL', float, 1.0),
+        PROFILE_SECRET=os.getenv('PROFILE_SECRET'),
+        PROFILE_SAMPLE_RATE=env('PROFILE_SAMPLE_RATE', float, 0.0),
+        PROFILE_MODE=env('PROFILE_MODE', str, 'sampling'),
+        PROFILE_INTERVAL=env('PROFILE_INTERVAL', float, 0.001),
+        PROFILE_DIR=os.getenv('PROFILE_DIR'),
+        PROFILE_KEEP=env('PROFILE_KEEP', int, 1000),
+        MEMORY_PROFILING=env('MEMORY_PROFILING', bool, False),
+        MEMORY_PROFILING_FRAMES=env('MEMORY_PROFILING_FRAMES', int, 10),
+        MEMORY_PROFILING_SNAPSHOTS=env('MEMORY_PROFILING_SNAPSHOTS', bool, True),
+        TRACING_EXPORT=os.getenv('TRACING_EXPORT'),
+        TRACING_SAMPLE_RATE=env('TRACING_SAMPLE_RATE', float, 0.0),
+        CACHE=env('CACHE', bool, False),
+        CACHE_SIZE=env('CACHE_SIZE', int, 10000),
+        CACHE_SHARED=os.getenv('CACHE_SHARED'),
+        CACHE_SHARED_SIZE=env('CACHE_SHARED_SIZE', int, 100000),
+        CACHE_LOCAL_TTL=env('CACHE_LOCAL_TTL', float, 5.0),
+        WORKERS=env('GUNICORN_WORKERS', int, 1),
+        CACHE_WRITE_WINDOW=env('CACHE_WRITE_WINDOW', float, 1.0),
+        CACHE_TTLS=os.getenv('CACHE_TTLS'),
+        CACHE_STALE=os.getenv('CACHE_STALE'),
+        CACHE_BODIES=env('CACHE_BODIES', bool, False),
+        CACHE_BODIES_GZIP=env('CACHE_BODIES_GZIP', bool, True),
+        CACHE_SNAPSHOT=os.getenv('CACHE_SNAPSHOT'),
+        CACHE_SNAPSHOT_INTERVAL=env('CACHE_SNAPSHOT_INTERVAL', float, 300.0),
+        CATALOG_VERSION=os.getenv('CATALOG_VERSION'),
+        DAO_BACKEND=env('DAO_BACKEND', str, 'neo4j'),
+        MEMORY_SEED=env('MEMORY_SEED', str, 'fixtures'),
+        MEMORY_CATALOG=env('MEMORY_CATALOG', str, None),
+        MEMORY_SYNTHETIC_MOVIES=env('MEMORY_SYNTHETIC_MOVIES', int, 1000),
+        MEMORY_SYNTHETIC_SEED=env('MEMORY_SYNTHETIC_SEED', int, 0),
         JWT_SECRET_KEY=os.getenv('JWT_SECRET'),
         JWT_AUTH_HEADER_PREFIX="Bearer",
         JWT_VERIFY_CLAIMS="signature",
@@ -48,19 +118,98 @@ def create_app(test_config=None):
     except OSError:
         pass
 
-    with app.app_context():
-        init_driver(
-            app.config.get('NEO4J_URI'),
-            app.config.get('NEO4J_USERNAME'),
-            app.config.get('NEO4J_PASSWORD'),
-        )
+    # Listeners notified of every query, see api.instrumentation
+    app.query_listeners = []
+
+    # Per-fingerprint statistics and the slow-query log, see api.querylog
+    def profile_driver():
+        with app.app_context():
+            return get_driver()
+
+    app.query_log = QueryLog(
+        app.config.get('SLOW_QUERY_MS'),
+        app.config.get('SLOW_QUERY_PROFILE_RATE'),
+        profile_driver,
+    )
+    app.query_listeners.append(app.query_log)
+
+    # Profile requests that ask for it (registered first so that the other
+    # hooks are included in the profile)
+    app.before_request(start_profile)
+    app.after_request(stop_profile)
+    app.teardown_request(abandon_profile)
+
+    # Request, DAO, driver, bcrypt, JSON and cache metrics
+    init_metrics(app)
+
+    # Allocations per route and DAO method, see api.memprofile
+    init_memory_profile(app)
+
+    # Trace spans for a sample of requests, see api.tracing
+    init_tracing(app)
+
+    # Two-tier cache of DAO reads, see api.cache
+    init_cache(app)
+
+    # Encoded movie and person bodies kept in that cache, see api.bodies
+    init_bodies(app)
+
+    # Warm the cache from the last worker's snapshot, see api.snapshot
+    init_snapshots(app)
+
+    if app.config.get('DAO_BACKEND') == 'memory':
+        # The in-memory graph is seeded on first use, see api.memory.dao
+        app.driver = None
+        app.pool_metrics = None
+        app.readiness = Readiness()
+        app.readiness.state = Readiness.READY
+    else:
+        # A replayed recording has nothing to connect to or warm up
+        deferred = app.config.get('NEO4J_DEFERRED_STARTUP') and not app.config.get('NEO4J_REPLAY')
+
+        with app.app_context():
+            driver = init_driver(
+                app.config.get('NEO4J_URI'),
+                app.config.get('NEO4J_USERNAME'),
+                app.config.get('NEO4J_PASSWORD'),
+                app.config.get('NEO4J_DATABASE'),
+                verify=not deferred,
+                **driver_config(app.config)
+            )
+
+        # Verify the connection and warm the pool without blocking startup
+        if deferred:
+            app.readiness = start_warmup(
+                driver,
+                app.config.get('NEO4J_DATABASE'),
+                app.config.get('NEO4J_WARMUP_CONNECTIONS'),
+                app.config.get('NEO4J_WARMUP_RETRIES'),
+            )
+        else:
+            app.readiness = Readiness()
+            app.readiness.state = Readiness.READY
 
     # JWT
     jwt = JWTManager(app)
 
+    # Routes read the claims of the verified token through `current_user`
+    @jwt.user_lookup_loader
+    def user_lookup(_jwt_header, jwt_data):
+        return jwt_data
+
     CORS(app, 
-        resources={r"/*": {"origins": ["http://localhost:3000", "http://127.0.0.1:3000"]}}
+        resources={r"/*": {"origins": ["http://localhost:3000", "http://127.0.0.1:3000"]}},
+        expose_headers=[BOOKMARKS_HEADER, "Server-Timing", PROFILE_ID_HEADER, TRACERESPONSE]
     )
+
+    # Causal bookmarks for read-your-writes
+    app.bookmarks = BookmarkStore()
+    app.after_request(save_bookmarks)
+
+    # Per-request query counts in Server-Timing headers
+    app.before_request(start_query_stats)
+    app.after_request(add_server_timing)
+    app.teardown_request(stop_query_stats)
     
     # Register Routes
     app.register_blueprint(auth_routes)
@@ -69,6 +218,7 @@ def create_app(test_config=None):
     app.register_blueprint(movie_routes)
     app.register_blueprint(people_routes)
     app.register_blueprint(status_routes)
+    app.register_blueprint(admin_routes)
 
     # Serve all other routes as static
     @app.route('/', methods=['GET'])
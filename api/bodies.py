@@ -0,0 +1,170 @@
+"""
+Pre-encoded response bodies for movie and person details.
+
+With `CACHE=true` and `CACHE_BODIES=true`, `GET /api/movies/<id>` and
+`GET /api/people/<id>` are served from JSON bodies encoded once and kept in
+the DAO cache (`api.cache`) next to the records they were made from.  They
+are tagged like `MovieDAO.find_by_id` and `PeopleDAO.find_by_id`, so the
+writes that change the entity, or the version of one of its tags in the
+shared tier, drop them as well, and they live as long.  A request with
+bookmarks skips the bodies encoded before its user's last write, like the
+DAO reads do.
+
+A movie's body is encoded without its `favorite` flag, which is appended
+last, so a body is stored as the bytes before the flag and the bytes after
+it.  A request writes the two around `true` or `false` for its user, from
+the user's cached favorite set, without copying or re-encoding them.
+
+With `CACHE_BODIES_GZIP=true` (the default) bodies of at least
+`GZIP_MIN_SIZE` bytes are also kept gzipped, and sent as they are to
+clients that accept gzip.  Only the anonymous variant is compressed when
+the body is stored; the other is compressed the first time it is asked for.
+"""
+
+import gzip
+import time
+
+from flask import Response, current_app, request
+
+from api.cache import MISS, movie_detail_tags, request_written_at
+from api.metrics import cache_hit, cache_miss
+
+GZIP_MIN_SIZE = 512
+
+
+class EncodedBody:
+    """
+    A JSON object encoded without its `favorite` flag (when `flag` is set),
+    and its gzipped variants by flag value
+    """
+
+    __slots__ = ("head", "tail", "flag", "gzipped")
+
+    def __init__(self, head, tail, flag, gzipped=None):
+        self.head = head
+        self.tail = tail
+        self.flag = flag
+        self.gzipped = gzipped or {}
+
+    @classmethod
+    def encode(cls, record, flag=False, compress=False):
+        fields = {key: value for key, value in record.items() if not flag or key != "favorite"}
+        body = current_app.json.dumps(fields).encode("utf8")
+
+        if flag:
+            # No comma after an empty object
+            head, tail = body[:-1] + (b',"favorite":' if fields else b'"favorite":'), body[-1:]
+        else:
+            head, tail = body, b""
+
+        encoded = cls(head, tail, flag)
+
+        if compress and len(body) >= GZIP_MIN_SIZE:
+            encoded.compress(False)
+
+        return encoded
+
+    def chunks(self, favorite=False):
+        if not self.flag:
+            return [self.head]
+
+        return [self.head, b"true" if favorite else b"false", self.tail]
+
+    def compress(self, favorite):
+        # Shared by every request for the entity: racing threads store the
+        # same bytes
+        data = self.gzipped.get(favorite)
+
+        if data is None:
+            data = self.gzipped[favorite] = gzip.compress(
+                b"".join(self.chunks(favorite)), mtime=0
+            )
+
+        return data
+
+    def response(self, favorite=False, accepts_gzip=False):
+        headers = {"Vary": "Accept-Encoding"}
+
+        if accepts_gzip and self.gzipped:
+            chunks = [self.compress(favorite)]
+            headers["Content-Encoding"] = "gzip"
+        else:
+            chunks = self.chunks(favorite)
+
+        headers["Content-Length"] = str(sum(len(chunk) for chunk in chunks))
+
+        return Response(chunks, mimetype="application/json", headers=headers, direct_passthrough=True)
+
+
+class BodyCache:
+    def __init__(self, cache, compress=True):
+        self.cache = cache
+        self.compress = compress
+        self.hits = 0
+        self.misses = 0
+
+    def _body(self, dao, key, method, load, tags, flag):
+        # Same read-your-writes rule as the DAO reads (`CachedMethods`)
+        encoded = self.cache.get(key, request_written_at(dao))
+
+        if encoded is not MISS:
+            self.hits += 1
+            cache_hit("bodies")
+            return encoded
+
+        self.misses += 1
+        cache_miss("bodies")
+        token = self.cache.token()
+        computed = time.time()
+        record = load()
+        encoded = EncodedBody.encode(record, flag, self.compress)
+        self.cache.set(key, encoded, self.cache.ttl(method), tags(record), token, computed=computed)
+
+        return encoded
+
+    def movie(self, dao, movie_id, user_id=None):
+        """
+        The response for `GET /api/movies/<movie_id>`, where `dao` is a
+        `MovieDAO` from `get_dao`
+        """
+        encoded = self._body(
+            dao, "body movie %s" % movie_id, "MovieDAO.find_by_id",
+            lambda: dao.find_by_id(movie_id),
+            lambda movie: movie_detail_tags({}, movie),
+            flag=True,
+        )
+        favorite = user_id is not None and movie_id in dao.favorite_ids(user_id)
+
+        return encoded.response(favorite, accepts_gzip())
+
+    def person(self, dao, person_id):
+        """
+        The response for `GET /api/people/<person_id>`
+        """
+        encoded = self._body(
+            dao, "body person %s" % person_id, "PeopleDAO.find_by_id",
+            lambda: dao.find_by_id(person_id),
+            lambda person: ["person:%s" % person_id],
+            flag=False,
+        )
+
+        return encoded.response(accepts_gzip=accepts_gzip())
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+def accepts_gzip():
+    return "gzip" in request.accept_encodings
+
+
+def init_bodies(app):
+    """
+    Cache encoded detail bodies if `CACHE_BODIES` is set and the DAO cache is
+    enabled
+    """
+    if not app.config.get("CACHE_BODIES") or app.cache is None:
+        app.bodies = None
+        return
+
+    app.bodies = BodyCache(app.cache, app.config.get("CACHE_BODIES_GZIP", True))
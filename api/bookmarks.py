@@ -0,0 +1,211 @@
+"""
+Causal consistency for reads that are routed to followers.
+
+Whenever a DAO writes to the database, the session's bookmarks are collected.
+They are returned to the client in the `X-Neo4j-Bookmarks` response header
+and remembered for the user in this process.  The next request sends the
+token back (or is matched to the stored bookmarks by its JWT subject) and
+every session it opens waits until the server it lands on has caught up with
+those bookmarks.  Reads can therefore be served by followers while a user
+still sees their own favorites and ratings.
+
+The time of the write travels with its bookmarks, so that cached reads
+(`api.cache`) can skip the results computed before it, and only those.
+"""
+
+import base64
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, g, has_request_context, request
+from flask_jwt_extended import get_jwt
+from neo4j import Bookmarks
+
+from api.metrics import cache_eviction, cache_hit, cache_miss
+
+HEADER = "X-Neo4j-Bookmarks"
+
+"""
+Limits on the bookmarks a client can send.  A request waits for up to one
+bookmark per cluster member it wrote through, each a short printable token
+such as `FB:kcwQ...`; anything else is dropped rather than passed on to
+sessions, where it could stall or fail them.
+"""
+MAX_BOOKMARKS = 16
+MAX_BOOKMARK_LENGTH = 256
+MAX_TOKEN_LENGTH = 4 * MAX_BOOKMARKS * MAX_BOOKMARK_LENGTH // 3 + 64
+BOOKMARK = re.compile(r"[A-Za-z0-9:_.+/=-]+")
+
+
+class RequestBookmarks:
+    """
+    The bookmarks a single request must wait for, updated after each write,
+    and the time of the write they come from (`time.time()`)
+    """
+
+    def __init__(self, raw_values=(), written_at=None):
+        self.raw_values = frozenset(raw_values)
+        self.written_at = written_at
+        self.updated = False
+
+    def current(self):
+        if not self.raw_values:
+            return None
+
+        return Bookmarks.from_raw_values(self.raw_values)
+
+    def update(self, bookmarks):
+        if bookmarks:
+            self.raw_values = bookmarks.raw_values
+            self.written_at = time.time()
+            self.updated = True
+
+
+class BookmarkStore:
+    """
+    The latest bookmarks for each user and the time of the write they come
+    from, bounded to the most recent `size` users.
+    """
+
+    def __init__(self, size=10000):
+        self.size = size
+        self._lock = threading.Lock()
+        self._users = OrderedDict()
+
+    def lookup(self, user_id):
+        """
+        The user's bookmarks and the time they were written at
+        """
+        with self._lock:
+            raw_values, written_at = self._users.get(user_id, (frozenset(), None))
+
+            if raw_values:
+                self._users.move_to_end(user_id)
+
+        if raw_values:
+            cache_hit("bookmarks")
+        else:
+            cache_miss("bookmarks")
+
+        return raw_values, written_at
+
+    def get(self, user_id):
+        return self.lookup(user_id)[0]
+
+    def set(self, user_id, raw_values, written_at=None):
+        with self._lock:
+            self._users[user_id] = (frozenset(raw_values), written_at)
+            self._users.move_to_end(user_id)
+
+            evicted = 0
+            while len(self._users) > self.size:
+                self._users.popitem(last=False)
+                evicted += 1
+
+        if evicted:
+            cache_eviction("bookmarks", evicted)
+
+
+def encode_token(raw_values, written_at=None):
+    """
+    The bookmarks as a header value: a JSON list, or with the time of the
+    write an object `{"bookmarks": [...], "writtenAt": ...}`
+    """
+    payload = sorted(raw_values)
+
+    if written_at is not None:
+        payload = {"bookmarks": payload, "writtenAt": written_at}
+
+    return base64.urlsafe_b64encode(json.dumps(payload).encode("utf8")).decode("ascii")
+
+
+def decode_token(token):
+    """
+    Decode the bookmarks of a token from the request header, ignoring
+    anything malformed or over the limits above
+    """
+    return _decode(token)[0]
+
+
+def _decode(token):
+    nothing = frozenset(), None
+
+    if len(token) > MAX_TOKEN_LENGTH:
+        return nothing
+
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+    except (ValueError, TypeError):
+        return nothing
+
+    values, written_at = payload, None
+    if isinstance(payload, dict):
+        values, written_at = payload.get("bookmarks"), payload.get("writtenAt")
+
+    if not isinstance(values, list) or len(values) > MAX_BOOKMARKS:
+        return nothing
+
+    # A write cannot have happened in the future
+    if isinstance(written_at, (int, float)) and not isinstance(written_at, bool):
+        written_at = min(float(written_at), time.time())
+    else:
+        written_at = None
+
+    return frozenset(
+        v for v in values
+        if isinstance(v, str) and len(v) <= MAX_BOOKMARK_LENGTH and BOOKMARK.fullmatch(v)
+    ), written_at
+
+
+def _current_user_id():
+    try:
+        return get_jwt().get("sub")
+    except RuntimeError:
+        # No JWT has been verified for this request
+        return None
+
+
+def request_bookmarks():
+    """
+    Get the bookmarks for the current request, creating them from the request
+    header and the bookmarks stored for the current user on first use.
+    """
+    if "bookmarks" not in g:
+        raw_values, written_at = frozenset(), None
+
+        if has_request_context():
+            raw_values, written_at = _decode(request.headers.get(HEADER, ""))
+
+            user_id = _current_user_id()
+            if user_id is not None:
+                stored, stored_at = current_app.bookmarks.lookup(user_id)
+                raw_values |= stored
+                written_at = max(
+                    (t for t in (written_at, stored_at) if t is not None), default=None
+                )
+
+        g.bookmarks = RequestBookmarks(raw_values, written_at)
+
+    return g.bookmarks
+
+
+def save_bookmarks(response):
+    """
+    `after_request` handler that remembers and returns bookmarks from writes
+    """
+    bookmarks = g.get("bookmarks")
+
+    if bookmarks is None or not bookmarks.raw_values:
+        return response
+
+    if bookmarks.updated:
+        user_id = _current_user_id()
+        if user_id is not None:
+            current_app.bookmarks.set(user_id, bookmarks.raw_values, bookmarks.written_at)
+
+    response.headers[HEADER] = encode_token(bookmarks.raw_values, bookmarks.written_at)
+
+    return response
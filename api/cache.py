@@ -0,0 +1,1037 @@
+"""
+Two-tier caching of DAO reads with tag-based invalidation.
+
+With `CACHE=true`, `get_dao` hooks `CachedMethods` into every DAO's proxy
+(see `api.proxy`).  Reads listed in `TAGS` are looked up first in a
+per-process `LocalCache` and then,
+if `CACHE_SHARED` is set, in a shared tier used by every worker; on a miss
+the DAO runs and the result is stored in both.  Writes listed in
+`INVALIDATES` drop every cached read tagged with the entities they change:
+
+    movie:<tmdbId>   a movie appears in the result
+    person:<tmdbId>  an actor or director appears in the result
+    genre:<name>     a genre appears in the result
+    user:<userId>    the result lists the user's favorites or ratings
+
+Movie reads in `PERSONALIZED` are cached once in anonymous form, whoever
+asks: the DAO runs without the user, and the requesting user's `favorite`
+flags are applied to copies of the cached records from their favorite set,
+itself a cached read (`MovieDAO.favorite_ids`).  Adding or removing a
+favorite only invalidates that set, and a page browsed by thousands of
+signed-in users is computed once.
+
+The local tier is an LRU with TinyLFU admission: once it is full, a new key
+only replaces the least recently used entry if it has been requested more
+often recently, so a burst of one-off reads (a crawler paging through the
+catalog) cannot flush out the popular pages.
+
+The shared tier keeps a version number for every tag, and stores with each
+entry the versions of its tags; invalidating a tag increments its version,
+which makes every entry stored under the old version a miss in every
+process.  The local tiers of other processes are not told about an
+invalidation, so with a shared tier, or with several workers
+(`GUNICORN_WORKERS`), local entries live at most `CACHE_LOCAL_TTL` seconds.  Two shared tiers are included: `memory` (within
+one process, for tests) and `sqlite:<path>`, a stand-in for a networked
+cache that works across the processes of one machine.  Shared keys are
+prefixed with `CATALOG_VERSION`, so that after the catalog is re-imported
+the workers stop reading the results computed from the old one, which
+expire in their own time.
+
+Reads in `STALE` (overridden with `CACHE_STALE`) have a hard TTL on top of
+their TTL.  Between the two the result is still served, while one request
+per process refreshes it in the background; once the hard TTL has passed,
+requests wait, and all the requests for a key wait for the same
+computation of it.  A refresh may also start a little before the TTL
+passes, at random and sooner for results that were slow to compute, so that
+popular keys stored at the same time are not all refreshed at the same
+time.  The time refreshes take is recorded in the
+`cache_revalidation_duration_seconds` histogram.
+
+Cached results are shared between requests and must be treated as
+read-only.  TTLs are set per method in `TTLS` and can be overridden with
+`CACHE_TTLS`, a JSON object such as `{"MovieDAO.all": 300}`; `0` disables
+caching of a method.
+
+Every entry records when its computation started.  A request that carries
+bookmarks (see `api.bookmarks`) knows when its user last wrote, and skips
+the entries computed before that, plus `CACHE_WRITE_WINDOW` seconds for
+followers to catch up with the write: it computes the result again and
+stores it for everyone.  Entries computed after that are served to it as to
+anyone else, so a user who wrote once reads from the cache again a moment
+later.
+"""
+
+import inspect
+import json
+import logging
+import math
+import os
+import pickle
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+from api.dao.movies import with_favorites
+from api.metrics import CACHE_REVALIDATION, cache_eviction, cache_hit, cache_miss, cache_stale
+from api.proxy import DAOProxy
+
+log = logging.getLogger(__name__)
+
+
+"""
+Frequency estimates for TinyLFU admission
+"""
+
+
+class FrequencySketch:
+    """
+    A count-min sketch of how often keys were requested.  Counts are halved
+    every `10 * width` increments so that old popularity fades.
+    """
+
+    def __init__(self, width, depth=4, maximum=15):
+        self.width = max(width, 64)
+        self.depth = depth
+        self.maximum = maximum
+        self.rows = [[0] * self.width for _ in range(depth)]
+        self.additions = 0
+        self.sample_size = 10 * self.width
+
+    def _indexes(self, key):
+        # Double hashing, so that keys sharing a cell in one row rarely share
+        # one in the others
+        first = hash(key)
+        second = hash((key, self.depth)) | 1
+
+        return [(first + row * second) % self.width for row in range(self.depth)]
+
+    def increment(self, key):
+        for row, index in zip(self.rows, self._indexes(key)):
+            if row[index] < self.maximum:
+                row[index] += 1
+
+        self.additions += 1
+
+        if self.additions >= self.sample_size:
+            for row in self.rows:
+                for i, count in enumerate(row):
+                    row[i] = count >> 1
+            self.additions //= 2
+
+    def estimate(self, key):
+        return min(row[index] for row, index in zip(self.rows, self._indexes(key)))
+
+
+class Entry:
+    """
+    A cached result, fresh until `fresh_until` and kept until `expires`
+    (both `time.monotonic()` times).  `delta` is how long it took to compute
+    and `computed` the `time.time()` its computation started at.
+    `lifetime` is the `(fresh_until, expires)` it was cached for before the
+    local tier capped them (`Cache.put_local`).
+    """
+
+    __slots__ = ("value", "fresh_until", "expires", "tags", "delta", "computed", "lifetime")
+
+    def __init__(self, value, fresh_until, expires, tags, delta=0.0, computed=None, lifetime=None):
+        self.value = value
+        self.fresh_until = fresh_until
+        self.expires = expires
+        self.tags = tags
+        self.delta = delta
+        self.computed = computed if computed is not None else time.time()
+        self.lifetime = lifetime if lifetime is not None else (fresh_until, expires)
+
+    def refresh_due(self, now, beta=1.0):
+        """
+        True once the entry is no longer fresh, and with a probability that
+        rises as that time approaches, sooner for results that are slow to
+        compute (XFetch), so that refreshes of popular keys are spread out
+        """
+        return now - self.delta * beta * math.log(1.0 - random.random()) >= self.fresh_until
+
+
+MISS = object()
+
+
+class LocalCache:
+    """
+    A bounded in-process cache with per-entry TTLs, tags and TinyLFU
+    admission
+    """
+
+    def __init__(self, size=10000, name="dao"):
+        self.size = size
+        self.name = name
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._sketch = FrequencySketch(size)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejections = 0
+        # Incremented by every invalidation
+        self.generation = 0
+
+    def get(self, key):
+        entry = self.get_entry(key)
+
+        return entry.value if entry is not None else MISS
+
+    def get_entry(self, key):
+        with self._lock:
+            self._sketch.increment(key)
+            entry = self._entries.get(key)
+
+            if entry is not None and entry.expires <= time.monotonic():
+                self._remove(key)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+            return entry
+
+    def set(self, key, value, ttl, tags=(), stale=0, delta=0.0, computed=None, uncapped_ttl=None):
+        evicted = 0
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            elif len(self._entries) >= self.size:
+                victim = next(iter(self._entries))
+
+                # An expired entry makes room whatever its frequency, or a
+                # once popular key nobody reads any more would keep new ones out
+                if self._entries[victim].expires <= time.monotonic():
+                    self._remove(victim)
+                elif self._sketch.estimate(key) <= self._sketch.estimate(victim):
+                    self.rejections += 1
+                    return False
+                else:
+                    self._remove(victim)
+                    self.evictions += 1
+                    evicted = 1
+
+            now = time.monotonic()
+            uncapped_ttl = uncapped_ttl if uncapped_ttl is not None else ttl
+            self._entries[key] = Entry(
+                value, now + ttl, now + ttl + stale, tuple(tags), delta, computed,
+                (now + uncapped_ttl, now + uncapped_ttl + stale),
+            )
+
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+
+        if evicted:
+            cache_eviction(self.name, evicted)
+
+        return True
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+
+        for tag in entry.tags:
+            keys = self._tags.get(tag)
+
+            if keys is not None:
+                keys.discard(key)
+
+                if not keys:
+                    del self._tags[tag]
+
+    def invalidate(self, tags):
+        with self._lock:
+            self.generation += 1
+            keys = set()
+
+            for tag in tags:
+                keys.update(self._tags.get(tag, ()))
+
+            for key in keys:
+                self._remove(key)
+
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def items(self):
+        """
+        The unexpired (key, entry) pairs, least recently used first
+        """
+        now = time.monotonic()
+
+        with self._lock:
+            return [(key, entry) for key, entry in self._entries.items() if entry.expires > now]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxSize": self.size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "rejections": self.rejections,
+            }
+
+
+"""
+Shared tiers store pickled entries and a version for every tag.  The `ANY`
+tag is bumped by every invalidation.
+
+Keys are made from request arguments, so every `PRUNE_EVERY` writes a
+shared tier deletes its expired entries and, past `size` entries, those
+closest to expiring: it holds at most `size` plus `PRUNE_EVERY` entries.  Tag versions are never deleted: an entry stored under
+a deleted tag's version could match it again once the tag restarts at 0.
+"""
+ANY = "*"
+PRUNE_EVERY = 1000
+
+
+class MemorySharedCache:
+    """
+    A shared tier that lives in this process, for tests and single-process
+    servers
+    """
+
+    def __init__(self, size=100000):
+        self.size = size
+        self._entries = {}
+        self._versions = {}
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+
+            if item is None or item[1] <= time.time():
+                return None
+
+            return item[0]
+
+    def set(self, key, data, ttl):
+        with self._lock:
+            self._entries[key] = (data, time.time() + ttl)
+            self._writes += 1
+
+            if self._writes % PRUNE_EVERY == 0:
+                self._prune()
+
+    def _prune(self):
+        now = time.time()
+        self._entries = {key: item for key, item in self._entries.items() if item[1] > now}
+
+        if len(self._entries) > self.size:
+            by_expiry = sorted(self._entries, key=lambda key: self._entries[key][1])
+
+            for key in by_expiry[:len(self._entries) - self.size]:
+                del self._entries[key]
+
+    def versions(self, tags):
+        with self._lock:
+            return {tag: self._versions.get(tag, 0) for tag in tags}
+
+    def bump(self, tags):
+        with self._lock:
+            for tag in list(tags) + [ANY]:
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+
+
+class SqliteSharedCache:
+    """
+    A shared tier in an SQLite database, which every process on the machine
+    can open.  Entries are unpickled when they are read, so the file must
+    only be writable by the app's user: whoever can write to it can run code
+    in the app.
+    """
+
+    def __init__(self, path, size=100000):
+        self.path = path
+        self.size = size
+        self._writes = 0
+        self._local = threading.local()
+
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, data BLOB, expires REAL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS entries_expires ON entries (expires)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS tags (tag TEXT PRIMARY KEY, version INTEGER)"
+            )
+
+    def _connection(self):
+        # Connections can't be shared between threads or forked processes
+        connection = getattr(self._local, "connection", None)
+
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+
+        return connection
+
+    def get(self, key):
+        row = self._connection().execute(
+            "SELECT data FROM entries WHERE key = ? AND expires > ?", (key, time.time())
+        ).fetchone()
+
+        return row[0] if row else None
+
+    def set(self, key, data, ttl):
+        connection = self._connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO entries (key, data, expires) VALUES (?, ?, ?)",
+            (key, data, time.time() + ttl),
+        )
+
+        # Counted per process: the processes sharing the file prune it in turn
+        self._writes += 1
+        if self._writes % PRUNE_EVERY == 0:
+            self.prune(connection)
+
+    def prune(self, connection=None):
+        connection = connection or self._connection()
+        connection.execute("DELETE FROM entries WHERE expires <= ?", (time.time(),))
+        connection.execute(
+            "DELETE FROM entries WHERE key IN ("
+            "SELECT key FROM entries ORDER BY expires "
+            "LIMIT max((SELECT count(*) FROM entries) - ?, 0))",
+            (self.size,),
+        )
+
+    def versions(self, tags):
+        tags = list(tags)
+        versions = dict.fromkeys(tags, 0)
+
+        if tags:
+            rows = self._connection().execute(
+                "SELECT tag, version FROM tags WHERE tag IN (%s)" % ",".join("?" * len(tags)),
+                tags,
+            )
+            versions.update(rows)
+
+        return versions
+
+    def bump(self, tags):
+        connection = self._connection()
+
+        for tag in list(tags) + [ANY]:
+            connection.execute(
+                "INSERT INTO tags (tag, version) VALUES (?, 1) "
+                "ON CONFLICT(tag) DO UPDATE SET version = version + 1",
+                (tag,),
+            )
+
+
+def shared_cache(target, size=100000):
+    if not target:
+        return None
+
+    if target == "memory":
+        return MemorySharedCache(size)
+
+    if target.startswith("sqlite:"):
+        return SqliteSharedCache(target[len("sqlite:"):], size)
+
+    raise ValueError("Unknown shared cache %r" % target)
+
+
+class Flight:
+    """
+    One computation of a key that other requests for it wait for
+    """
+
+    __slots__ = ("done", "value", "error", "started")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.started = time.time()
+
+
+class Revalidations:
+    """
+    How often stale or nearly stale results were refreshed, and how long
+    refreshing took
+    """
+
+    def __init__(self):
+        self.stale = 0
+        self.early = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, duration):
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+
+    def as_dict(self):
+        return {
+            "servedStale": self.stale,
+            "refreshedEarly": self.early,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "count": self.count,
+            "meanMs": self.total / self.count * 1000 if self.count else 0,
+            "maxMs": self.max * 1000,
+        }
+
+
+class Cache:
+    """
+    The local tier in front of an optional shared tier, where keys are
+    prefixed with `namespace`
+    """
+
+    def __init__(
+        self, local, shared=None, ttls=None, local_ttl=5.0, stale=None, beta=1.0, workers=1,
+        write_window=1.0, namespace=None,
+    ):
+        self.local = local
+        self.shared = shared
+        self.namespace = namespace
+        self.workers = workers
+        self.write_window = write_window
+        self.ttls = {**TTLS, **(ttls or {})}
+        self.stales = {**STALE, **(stale or {})}
+        self.local_ttl = local_ttl
+        self.beta = beta
+        self.shared_hits = 0
+        self.revalidations = Revalidations()
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def ttl(self, method):
+        return self.ttls.get(method, 0)
+
+    def stale(self, method):
+        return self.stales.get(method, 0)
+
+    def get(self, key, written_at=None):
+        entry = self.get_entry(key, written_at)
+
+        return entry.value if entry is not None else MISS
+
+    def since(self, written_at):
+        """
+        The oldest computation a request whose user wrote at `written_at`
+        (None if they have not) can be served
+        """
+        return written_at + self.write_window if written_at is not None else None
+
+    def get_entry(self, key, written_at=None):
+        """
+        The entry for `key`, leaving out those computed too long before the
+        write at `written_at` (see `since`)
+        """
+        since = self.since(written_at)
+        entry = self.local.get_entry(key)
+
+        if entry is not None and (since is None or entry.computed >= since):
+            return entry
+
+        if self.shared is None:
+            return None
+
+        entry = self.get_shared(key)
+
+        if entry is not None and since is not None and entry.computed < since:
+            return None
+
+        return entry
+
+    def shared_key(self, key):
+        return "%s %s" % (self.namespace, key) if self.namespace is not None else key
+
+    def get_shared(self, key):
+        data = self.shared.get(self.shared_key(key))
+
+        if data is None:
+            return None
+
+        try:
+            value, versions, fresh_until, expires, delta, computed = pickle.loads(data)
+        except ValueError:
+            # Stored by an older release, in another layout
+            return None
+
+        # Stored before one of its tags was invalidated
+        if self.shared.versions(versions) != versions:
+            return None
+
+        self.shared_hits += 1
+
+        # The shared tier's times are wall-clock times, the local tier's monotonic
+        now, monotonic = time.time(), time.monotonic()
+        self.put_local(key, value, fresh_until - now, expires - fresh_until, versions, delta, computed)
+
+        return Entry(
+            value, monotonic + fresh_until - now, monotonic + expires - now, versions, delta, computed
+        )
+
+    def put_local(self, key, value, ttl, stale, tags, delta, computed=None):
+        """
+        Store in the local tier only, for at most `local_ttl` seconds when
+        other processes may invalidate entries without this one knowing:
+        with a shared tier, or with several workers.  The entry keeps the
+        `ttl` it was given as its `lifetime`, for snapshots.
+        """
+        capped = ttl
+
+        if self.shared is not None or self.workers > 1:
+            capped = min(ttl, self.local_ttl)
+
+        if capped + stale > 0:
+            self.local.set(key, value, capped, tags, stale, delta, computed, ttl)
+
+    def token(self):
+        """
+        Changes whenever anything is invalidated.  A result computed before
+        an invalidation must not be stored after it.
+        """
+        shared = self.shared.versions([ANY])[ANY] if self.shared is not None else None
+
+        return self.local.generation, shared
+
+    def set(self, key, value, ttl, tags, token=None, stale=0, delta=0.0, computed=None):
+        if token is not None and token != self.token():
+            return
+
+        now = time.time()
+        computed = computed if computed is not None else now
+
+        if self.shared is not None:
+            versions = self.shared.versions(tags)
+            self.shared.set(self.shared_key(key), pickle.dumps(
+                (value, versions, now + ttl, now + ttl + stale, delta, computed),
+                pickle.HIGHEST_PROTOCOL,
+            ), ttl + stale)
+
+        self.put_local(key, value, ttl, stale, tags, delta, computed)
+
+    def _flight(self, key):
+        with self._lock:
+            flight = self._flights.get(key)
+
+            if flight is not None:
+                return flight, False
+
+            flight = self._flights[key] = Flight()
+
+            return flight, True
+
+    def _fly(self, key, flight, compute):
+        try:
+            flight.value = compute()
+        except Exception as e:
+            flight.error = e
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def single_flight(self, key, compute, written_at=None):
+        """
+        Compute `key` once however many threads ask for it at the same time:
+        the first one runs `compute` and the others wait for its result,
+        unless it started too long before the write at `written_at`
+        """
+        flight, leader = self._flight(key)
+        since = self.since(written_at)
+
+        if not leader and since is not None and flight.started < since:
+            return compute()
+
+        if leader:
+            self._fly(key, flight, compute)
+        else:
+            self.revalidations.coalesced += 1
+            flight.done.wait()
+
+        if flight.error is not None:
+            raise flight.error
+
+        return flight.value
+
+    def refresh(self, key, compute, app):
+        """
+        Recompute `key` in the background unless that is already under way
+        """
+        flight, leader = self._flight(key)
+
+        if not leader:
+            return False
+
+        def run():
+            with app.app_context():
+                self._fly(key, flight, compute)
+
+            # The stale result is served until it expires
+            if flight.error is not None:
+                self.revalidations.errors += 1
+
+        threading.Thread(target=run, name="cache-refresh", daemon=True).start()
+
+        return True
+
+    def wait(self, timeout=None):
+        """
+        Wait for the computations under way, for tests
+        """
+        with self._lock:
+            flights = list(self._flights.values())
+
+        for flight in flights:
+            flight.done.wait(timeout)
+
+    def invalidate(self, tags):
+        tags = set(tags)
+
+        if self.shared is not None:
+            self.shared.bump(tags)
+
+        return self.local.invalidate(tags)
+
+    def stats(self):
+        return {
+            "local": self.local.stats(),
+            "sharedHits": self.shared_hits if self.shared is not None else None,
+            "revalidations": self.revalidations.as_dict(),
+            "ttls": self.ttls,
+            "stale": self.stales,
+        }
+
+
+"""
+What to cache and what to invalidate.  Tags are computed from the call's
+arguments (by name, with defaults applied) and its result.
+"""
+
+
+def user_tags(args):
+    return ["user:%s" % args["user_id"]] if args.get("user_id") else []
+
+
+def movie_tags(movies):
+    return ["movie:%s" % movie["tmdbId"] for movie in movies]
+
+
+def person_tags(people):
+    return ["person:%s" % person["tmdbId"] for person in people]
+
+
+def movie_detail_tags(args, movie):
+    return (
+        ["movie:%s" % movie["tmdbId"]]
+        + person_tags(movie.get("actors", []) + movie.get("directors", []))
+        + ["genre:%s" % genre["name"] for genre in movie.get("genres", [])]
+    )
+
+
+TAGS = {
+    "MovieDAO.all": lambda args, movies: movie_tags(movies),
+    "MovieDAO.get_by_genre": lambda args, movies: (
+        ["genre:%s" % args["name"]] + movie_tags(movies)
+    ),
+    "MovieDAO.get_for_actor": lambda args, movies: (
+        ["person:%s" % args["id"]] + movie_tags(movies)
+    ),
+    "MovieDAO.get_for_director": lambda args, movies: (
+        ["person:%s" % args["id"]] + movie_tags(movies)
+    ),
+    "MovieDAO.find_by_id": movie_detail_tags,
+    "MovieDAO.get_similar_movies": lambda args, movies: (
+        ["movie:%s" % args["id"]] + movie_tags(movies)
+    ),
+    "MovieDAO.favorite_ids": lambda args, ids: user_tags(args),
+    "GenreDAO.all": lambda args, genres: ["genre:%s" % genre["name"] for genre in genres],
+    "GenreDAO.find": lambda args, genre: ["genre:%s" % args["name"]],
+    "PeopleDAO.all": lambda args, people: person_tags(people),
+    "PeopleDAO.find_by_id": lambda args, person: ["person:%s" % args["id"]],
+    "PeopleDAO.get_similar_people": lambda args, people: (
+        ["person:%s" % args["id"]] + person_tags(people)
+    ),
+    "RatingDAO.for_movie": lambda args, reviews: (
+        ["movie:%s" % args["id"]]
+        + ["user:%s" % review["user"]["userId"] for review in reviews]
+    ),
+    "FavoriteDAO.all": lambda args, movies: user_tags(args) + movie_tags(movies),
+}
+
+"""
+Default TTLs in seconds.  The catalog only changes through imports, so
+catalog reads live longer than reads that include a user's own data.
+"""
+TTLS = {
+    "MovieDAO.all": 300,
+    "MovieDAO.get_by_genre": 300,
+    "MovieDAO.get_for_actor": 300,
+    "MovieDAO.get_for_director": 300,
+    "MovieDAO.find_by_id": 300,
+    "MovieDAO.get_similar_movies": 600,
+    "MovieDAO.favorite_ids": 60,
+    "GenreDAO.all": 3600,
+    "GenreDAO.find": 3600,
+    "PeopleDAO.all": 600,
+    "PeopleDAO.find_by_id": 600,
+    "PeopleDAO.get_similar_people": 600,
+    "RatingDAO.for_movie": 60,
+    "FavoriteDAO.all": 60,
+}
+
+"""
+How many seconds past its TTL a result may still be served, while one
+request refreshes it in the background, for reads expensive enough that
+their expiry would send every concurrent request to the database
+"""
+STALE = {
+    "GenreDAO.all": 3600,
+    "MovieDAO.get_similar_movies": 600,
+    "PeopleDAO.get_similar_people": 600,
+}
+
+"""
+Reads cached without their `user_id`, whose result gets the user's
+favorite flags afterwards
+"""
+PERSONALIZED = {
+    "MovieDAO.all",
+    "MovieDAO.get_by_genre",
+    "MovieDAO.get_for_actor",
+    "MovieDAO.get_for_director",
+    "MovieDAO.find_by_id",
+    "MovieDAO.get_similar_movies",
+}
+
+"""
+The tags each write changes
+"""
+INVALIDATES = {
+    # The movie's rating count and reviews, and the user's own ratings
+    "RatingDAO.add": lambda args, movie: [
+        "movie:%s" % args["movie_id"], "user:%s" % args["user_id"]
+    ],
+    # Only the user's favorite set and list change
+    "FavoriteDAO.add": lambda args, movie: ["user:%s" % args["user_id"]],
+    "FavoriteDAO.remove": lambda args, movie: ["user:%s" % args["user_id"]],
+    "AuthDAO.register": lambda args, user: ["user:%s" % user["userId"]],
+}
+
+
+_signatures = {}
+
+
+def bind(function, name, args, kwargs):
+    """
+    The arguments of a call by parameter name, with defaults applied
+    """
+    signature = _signatures.get(name)
+
+    if signature is None:
+        signature = _signatures[name] = inspect.signature(function)
+
+    bound = signature.bind(*args, **kwargs)
+    bound.apply_defaults()
+
+    return bound.arguments
+
+
+def request_written_at(dao):
+    """
+    When the user of the request `dao` serves last wrote, from its bookmarks
+    """
+    bookmarks = getattr(dao, "bookmarks", None)
+
+    return bookmarks.written_at if bookmarks is not None else None
+
+
+class CachedMethods:
+    """
+    `api.proxy` hook serving a DAO's reads from the cache and invalidating
+    the tags its writes change
+    """
+
+    def __init__(self, cache):
+        self._cache = cache
+
+    def __call__(self, dao, dao_name, method, call):
+        name = "%s.%s" % (dao_name, method)
+
+        if name in INVALIDATES:
+            return self._write(call, name)
+
+        if name in TAGS and self._cache.ttl(name) > 0:
+            return self._read(dao, dao_name, call, name)
+
+        return call
+
+    def _read(self, dao, dao_name, call, name):
+        def cached(*args, **kwargs):
+            arguments = bind(call, name, args, kwargs)
+            written_at = request_written_at(dao)
+
+            if name in PERSONALIZED:
+                return self._personalize(
+                    dao, dao_name,
+                    self._lookup(call, name, {**arguments, "user_id": None}, written_at),
+                    arguments["user_id"],
+                )
+
+            return self._lookup(call, name, arguments, written_at)
+
+        return cached
+
+    def _lookup(self, call, name, arguments, written_at=None):
+        cache = self._cache
+        key = "%s %s" % (name, json.dumps(arguments, sort_keys=True, default=str))
+
+        entry = cache.get_entry(key, written_at)
+
+        if entry is None:
+            cache_miss(name)
+            return cache.single_flight(
+                key, self._loader(call, name, arguments, key, "blocking"), written_at
+            )
+
+        now = time.monotonic()
+
+        if entry.refresh_due(now, cache.beta):
+            loader = self._loader(call, name, arguments, key, "background")
+
+            if cache.refresh(key, loader, current_app._get_current_object()):
+                if now >= entry.fresh_until:
+                    cache.revalidations.stale += 1
+                else:
+                    cache.revalidations.early += 1
+
+        if now >= entry.fresh_until:
+            cache_stale(name)
+        else:
+            cache_hit(name)
+
+        return entry.value
+
+    def _loader(self, call, name, arguments, key, mode):
+        cache = self._cache
+
+        def load():
+            # Another process may have refreshed the shared tier already
+            if cache.shared is not None and mode == "background":
+                entry = cache.get_shared(key)
+
+                if entry is not None and not entry.refresh_due(time.monotonic(), cache.beta):
+                    return entry.value
+
+            token = cache.token()
+            computed = time.time()
+            started = time.perf_counter()
+            value = call(**arguments)
+            delta = time.perf_counter() - started
+
+            cache.revalidations.add(delta)
+            CACHE_REVALIDATION.observe(delta, cache=name, mode=mode)
+            cache.set(
+                key, value, cache.ttl(name), TAGS[name](arguments, value), token,
+                cache.stale(name), delta, computed,
+            )
+
+            return value
+
+        return load
+
+    def _personalize(self, dao, dao_name, value, user_id):
+        # Flag copies: the cached records are shared by every user
+        if user_id is not None:
+            favorite_ids = self(dao, dao_name, "favorite_ids", dao.favorite_ids)
+            favorites = favorite_ids(user_id)
+        else:
+            favorites = frozenset()
+
+        if isinstance(value, dict):
+            return with_favorites([value], favorites)[0]
+
+        return with_favorites(value, favorites)
+
+    def _write(self, call, name):
+        def invalidating(*args, **kwargs):
+            value = call(*args, **kwargs)
+            self._cache.invalidate(INVALIDATES[name](bind(call, name, args, kwargs), value))
+
+            return value
+
+        return invalidating
+
+
+class CachedDAO(DAOProxy):
+    """
+    A DAO behind the cache alone
+    """
+
+    def __init__(self, dao, name, cache):
+        super().__init__(dao, name, [CachedMethods(cache)])
+
+
+def init_cache(app):
+    """
+    Cache DAO reads if `CACHE` is set
+    """
+    if not app.config.get("CACHE"):
+        app.cache = None
+        return
+
+    ttls = app.config.get("CACHE_TTLS")
+    if isinstance(ttls, str):
+        ttls = json.loads(ttls)
+
+    stale = app.config.get("CACHE_STALE")
+    if isinstance(stale, str):
+        stale = json.loads(stale)
+
+    shared = shared_cache(app.config.get("CACHE_SHARED"), app.config.get("CACHE_SHARED_SIZE") or 100000)
+    local_ttl = app.config.get("CACHE_LOCAL_TTL") or 5.0
+    workers = app.config.get("WORKERS") or 1
+
+    if shared is None and workers > 1:
+        log.warning(
+            "CACHE is on without CACHE_SHARED in %d workers: invalidations only "
+            "reach the other workers as their entries expire, after at most %g seconds",
+            workers, local_ttl,
+        )
+
+    app.cache = Cache(
+        LocalCache(app.config.get("CACHE_SIZE") or 10000),
+        shared,
+        ttls,
+        local_ttl,
+        stale,
+        workers=workers,
+        write_window=app.config.get("CACHE_WRITE_WINDOW", 1.0),
+        namespace=app.config.get("CATALOG_VERSION"),
+    )
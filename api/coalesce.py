@@ -0,0 +1,104 @@
+"""
+Single-flight coalescing of identical concurrent reads.
+
+When many requests ask for the same thing at the same time (a trending movie,
+its similar movies), only the first caller runs the query.  Everyone else who
+arrives while that query is still in flight waits for it and receives the same
+result.
+
+Results are shared between all callers, so they must be treated as read-only.
+"""
+
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls that share a key.
+
+    `executed` counts the calls that ran, `coalesced` the calls that were
+    served from another caller's execution.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            call.done.wait()
+
+            if call.error is not None:
+                raise call.error
+
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            return {
+                "executed": self.executed,
+                "coalesced": self.coalesced,
+                "inFlight": len(self._calls),
+            }
+
+
+"""
+The process-wide group used by the DAOs
+"""
+reads = SingleFlight()
+
+
+# tag::sharedRead[]
+def shared_read(driver, work, *args, database=None, bookmarks=None):
+    """
+    Run `work` in a read transaction, sharing the execution with any identical
+    call (same driver, database, bookmarks, unit of work and arguments) that is
+    already in flight.
+    """
+
+    def execute():
+        with driver.session(database=database, bookmarks=bookmarks) as session:
+            return session.execute_read(work, *args)
+
+    # A read that must observe a write can't share a result with a read that
+    # started before it, so the bookmarks are part of the key
+    raw_bookmarks = bookmarks.raw_values if bookmarks else None
+
+    return reads.do(
+        (id(driver), database, raw_bookmarks, work.__qualname__, args), execute
+    )
+
+
+# end::sharedRead[]
@@ -6,6 +6,8 @@ from flask import current_app
 
 from api.exceptions.badrequest import BadRequestException
 from api.exceptions.validation import ValidationException
+from api.bookmarks import RequestBookmarks
+from api.metrics import BCRYPT_DURATION
 
 from neo4j.exceptions import ConstraintError
 
@@ -13,12 +15,15 @@ from neo4j.exceptions import ConstraintError
 class AuthDAO:
     """
     The constructor expects an instance of the Neo4j Driver, which will be
-    used to interact with Neo4j.
+    used to interact with Neo4j, and optionally the name of the database to
+    open sessions against and the bookmarks that sessions should wait for.
     """
 
-    def __init__(self, driver, jwt_secret):
+    def __init__(self, driver, jwt_secret, database=None, bookmarks=None):
         self.driver = driver
         self.jwt_secret = jwt_secret
+        self.database = database
+        self.bookmarks = bookmarks if bookmarks is not None else RequestBookmarks()
 
     """
     This method should create a new User node in the database with the email and name
@@ -45,13 +50,17 @@ class AuthDAO:
 
             return result
 
-        encrypted = bcrypt.hashpw(
-            plain_password.encode("utf8"), bcrypt.gensalt()
-        ).decode("utf8")
+        with BCRYPT_DURATION.time(operation="hash"):
+            encrypted = bcrypt.hashpw(
+                plain_password.encode("utf8"), bcrypt.gensalt()
+            ).decode("utf8")
 
         try:
-            with self.driver.session() as session:
+            with self.driver.session(
+                database=self.database, bookmarks=self.bookmarks.current()
+            ) as session:
                 result = session.execute_write(create_user, email, encrypted, name)
+                self.bookmarks.update(session.last_bookmarks())
                 user = result["u"]
 
                 payload = {
@@ -102,13 +111,18 @@ class AuthDAO:
             else:
                 return result["u"]
 
-        with self.driver.session() as session:
+        with self.driver.session(
+            database=self.database, bookmarks=self.bookmarks.current()
+        ) as session:
             user = session.execute_read(get_user, email)
 
             if user is None:
                 return False
             
-            if not bcrypt.checkpw(plain_password.encode("utf8"), user.get("password").encode("utf8")):
+            with BCRYPT_DURATION.time(operation="check"):
+                valid = bcrypt.checkpw(plain_password.encode("utf8"), user.get("password").encode("utf8"))
+
+            if not valid:
                 return False
 
             payload = {
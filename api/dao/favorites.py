@@ -1,15 +1,18 @@
-from api.data import popular, goodfellas
 from api.exceptions.notfound import NotFoundException
+from api.bookmarks import RequestBookmarks
 
 
 class FavoriteDAO:
     """
     The constructor expects an instance of the Neo4j Driver, which will be
-    used to interact with Neo4j.
+    used to interact with Neo4j, and optionally the name of the database to
+    open sessions against and the bookmarks that sessions should wait for.
     """
 
-    def __init__(self, driver):
+    def __init__(self, driver, database=None, bookmarks=None):
         self.driver = driver
+        self.database = database
+        self.bookmarks = bookmarks if bookmarks is not None else RequestBookmarks()
 
     """
     This method should retrieve a list of movies that have an incoming :HAS_FAVORITE
@@ -45,7 +48,9 @@ class FavoriteDAO:
 
             return [record["movie"] for record in result]
 
-        with self.driver.session() as session:
+        with self.driver.session(
+            database=self.database, bookmarks=self.bookmarks.current()
+        ) as session:
             return session.read_transaction(
                 get_all_favorites, user_id, sort, order, limit, skip
             )
@@ -79,8 +84,13 @@ class FavoriteDAO:
 
             return result["movie"]
 
-        with self.driver.session() as session:
-            return session.write_transaction(add_to_favorite, user_id, movie_id)
+        with self.driver.session(
+            database=self.database, bookmarks=self.bookmarks.current()
+        ) as session:
+            movie = session.write_transaction(add_to_favorite, user_id, movie_id)
+            self.bookmarks.update(session.last_bookmarks())
+
+            return movie
 
     # end::add[]
 
@@ -110,7 +120,12 @@ class FavoriteDAO:
 
             return result["movie"]
 
-        with self.driver.session() as session:
-            return session.write_transaction(remove_favorite, user_id, movie_id)
+        with self.driver.session(
+            database=self.database, bookmarks=self.bookmarks.current()
+        ) as session:
+            movie = session.write_transaction(remove_favorite, user_id, movie_id)
+            self.bookmarks.update(session.last_bookmarks())
+
+            return movie
 
     # end::remove[]
@@ -1,15 +1,19 @@
-from api.data import genres
+from api.coalesce import shared_read
 from api.exceptions.notfound import NotFoundException
+from api.bookmarks import RequestBookmarks
 
 
 class GenreDAO:
     """
     The constructor expects an instance of the Neo4j Driver, which will be
-    used to interact with Neo4j.
+    used to interact with Neo4j, and optionally the name of the database to
+    open sessions against and the bookmarks that sessions should wait for.
     """
 
-    def __init__(self, driver):
+    def __init__(self, driver, database=None, bookmarks=None):
         self.driver = driver
+        self.database = database
+        self.bookmarks = bookmarks if bookmarks is not None else RequestBookmarks()
 
     """
     This method should return a list of genres from the database with a
@@ -51,10 +55,10 @@ class GenreDAO:
             )
             return [record.value("g") for record in result]
 
-        with self.driver.session() as session:
-            genres = session.execute_read(get_genres)
-
-            return genres
+        return shared_read(
+            self.driver, get_genres,
+            database=self.database, bookmarks=self.bookmarks.current()
+        )
 
     # end::all[]
 
@@ -88,9 +92,11 @@ class GenreDAO:
 
             return [record.value("genre") for record in result]
 
-        with self.driver.session() as session:
-            genres = session.execute_read(get_genre, name)
+        genres = shared_read(
+            self.driver, get_genre, name,
+            database=self.database, bookmarks=self.bookmarks.current()
+        )
 
-            return [g for g in genres if g["name"] == name][0]
+        return [g for g in genres if g["name"] == name][0]
 
     # end::find[]
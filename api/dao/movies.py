@@ -1,17 +1,19 @@
-from api.data import popular, goodfellas
-
+from api.coalesce import shared_read
 from api.exceptions.notfound import NotFoundException
-from api.data import popular
+from api.bookmarks import RequestBookmarks
 
 
 class MovieDAO:
     """
     The constructor expects an instance of the Neo4j Driver, which will be
-    used to interact with Neo4j.
+    used to interact with Neo4j, and optionally the name of the database to
+    open sessions against and the bookmarks that sessions should wait for.
     """
 
-    def __init__(self, driver):
+    def __init__(self, driver, database=None, bookmarks=None):
         self.driver = driver
+        self.database = database
+        self.bookmarks = bookmarks if bookmarks is not None else RequestBookmarks()
 
     """
     This method should return a paginated list of movies ordered by the `sort`
@@ -24,17 +26,12 @@ class MovieDAO:
 
     # tag::all[]
     def all(self, sort, order, limit=6, skip=0, user_id=None):
-        def get_movies(tx, sort, order, limit, skip, user_id):
-            favorites = self.get_user_favorites(tx, user_id)
-
+        def get_movies(tx, sort, order, limit, skip):
             result = tx.run(
                 """
                 MATCH (m:Movie)
                 WHERE m.`{0}` IS NOT NULL
-                RETURN m {{ 
-                    .*,
-                    favorite: m.tmdbId IN $favorites
-                }} AS movie
+                RETURN m {{ .* }} AS movie
                 ORDER BY m.`{0}` {1}
                 SKIP $skip
                 LIMIT $limit
@@ -43,13 +40,15 @@ class MovieDAO:
                 ),
                 skip=skip,
                 limit=limit,
-                user_id=user_id,
-                favorites=favorites,
             )
             return [record.value("movie") for record in result]
 
-        with self.driver.session() as session:
-            return session.execute_read(get_movies, sort, order, limit, skip, user_id)
+        movies = shared_read(
+            self.driver, get_movies, sort, order, limit, skip,
+            database=self.database, bookmarks=self.bookmarks.current()
+        )
+
+        return self.flag_favorites(movies, user_id)
 
     # end::all[]
 
@@ -70,17 +69,12 @@ class MovieDAO:
     def get_by_genre(
         self, name, sort="title", order="ASC", limit=6, skip=0, user_id=None
     ):
-        def get_movies(tx, sort, order, limit, skip, user_id, genre_name):
-            favorites = self.get_user_favorites(tx, user_id)
-
+        def get_movies(tx, sort, order, limit, skip, genre_name):
             result = tx.run(
                 """
                 MATCH (m:Movie)-[:IN_GENRE]->(:Genre {{name: $name}})
                 WHERE m.`{0}` IS NOT NULL
-                RETURN m {{ 
-                    .*,
-                    favorite: m.tmdbId IN $favorites
-                }} AS movie
+                RETURN m {{ .* }} AS movie
                 ORDER BY m.`{0}` {1}
                 SKIP $skip
                 LIMIT $limit
@@ -89,16 +83,16 @@ class MovieDAO:
                 ),
                 skip=skip,
                 limit=limit,
-                user_id=user_id,
-                favorites=favorites,
                 name=genre_name,
             )
             return [record.value("movie") for record in result]
 
-        with self.driver.session() as session:
-            return session.execute_read(
-                get_movies, sort, order, limit, skip, user_id, genre_name=name
-            )
+        movies = shared_read(
+            self.driver, get_movies, sort, order, limit, skip, name,
+            database=self.database, bookmarks=self.bookmarks.current()
+        )
+
+        return self.flag_favorites(movies, user_id)
 
     # end::getByGenre[]
 
@@ -120,17 +114,12 @@ class MovieDAO:
         self, id, sort="title", order="ASC", limit=6, skip=0, user_id=None
     ):
 
-        def get_movies(tx, sort, order, limit, skip, user_id, actor_id):
-            favorites = self.get_user_favorites(tx, user_id)
-
+        def get_movies(tx, sort, order, limit, skip, actor_id):
             result = tx.run(
                 """
                 MATCH (p:Person {{tmdbId: $actor_id}})-[:ACTED_IN]->(m:Movie)
                 WHERE m.`{0}` IS NOT NULL
-                RETURN m {{ 
-                    .*,
-                    favorite: m.tmdbId IN $favorites
-                }} AS movie
+                RETURN m {{ .* }} AS movie
                 ORDER BY m.`{0}` {1}
                 SKIP $skip
                 LIMIT $limit
@@ -139,16 +128,16 @@ class MovieDAO:
                 ),
                 skip=skip,
                 limit=limit,
-                user_id=user_id,
-                favorites=favorites,
                 actor_id=actor_id,
             )
             return [record.value("movie") for record in result]
 
-        with self.driver.session() as session:
-            return session.execute_read(
-                get_movies, sort, order, limit, skip, user_id, actor_id=id
-            )
+        movies = shared_read(
+            self.driver, get_movies, sort, order, limit, skip, id,
+            database=self.database, bookmarks=self.bookmarks.current()
+        )
+
+        return self.flag_favorites(movies, user_id)
 
     # end::getForActor[]
 
@@ -170,17 +159,12 @@ class MovieDAO:
         self, id, sort="title", order="ASC", limit=6, skip=0, user_id=None
     ):
 
-        def get_movies(tx, sort, order, limit, skip, user_id, director_id):
-            favorites = self.get_user_favorites(tx, user_id)
-
+        def get_movies(tx, sort, order, limit, skip, director_id):
             result = tx.run(
                 """
                 MATCH (p:Person {{tmdbId: $director_id}})-[:DIRECTED]->(m:Movie)
                 WHERE m.`{0}` IS NOT NULL
-                RETURN m {{ 
-                    .*,
-                    favorite: m.tmdbId IN $favorites
-                }} AS movie
+                RETURN m {{ .* }} AS movie
                 ORDER BY m.`{0}` {1}
                 SKIP $skip
                 LIMIT $limit
@@ -189,16 +173,16 @@ class MovieDAO:
                 ),
                 skip=skip,
                 limit=limit,
-                user_id=user_id,
-                favorites=favorites,
                 director_id=director_id,
             )
             return [record.value("movie") for record in result]
 
-        with self.driver.session() as session:
-            return session.execute_read(
-                get_movies, sort, order, limit, skip, user_id, director_id=id
-            )
+        movies = shared_read(
+            self.driver, get_movies, sort, order, limit, skip, id,
+            database=self.database, bookmarks=self.bookmarks.current()
+        )
+
+        return self.flag_favorites(movies, user_id)
 
     # end::getForDirector[]
 
@@ -215,9 +199,7 @@ class MovieDAO:
     # tag::findById[]
     def find_by_id(self, id, user_id=None):
 
-        def get_movies(tx, user_id, id):
-            favorites = self.get_user_favorites(tx, user_id)
-
+        def get_movies(tx, id):
             result = tx.run(
                 """
                 MATCH (m:Movie {tmdbId: $id})
@@ -226,12 +208,10 @@ class MovieDAO:
                     actors: [ (a)-[r:ACTED_IN]->(m) | a { .*, role: r.role } ],
                     directors: [ (d)-[:DIRECTED]->(m) | d { .* } ],
                     genres: [ (m)-[:IN_GENRE]->(g) | g { .name }],
-                    ratingCount: count{ (m)<-[:RATED]-() },
-                    favorite: m.tmdbId IN $favorites
+                    ratingCount: count{ (m)<-[:RATED]-() }
                 } AS movie
                 LIMIT 1
                 """,
-                favorites=favorites,
                 id=id,
             ).single()
 
@@ -240,10 +220,12 @@ class MovieDAO:
 
             return result.value("movie")
 
-        with self.driver.session() as session:
-            return session.execute_read(get_movies, user_id, id=id)
+        movie = shared_read(
+            self.driver, get_movies, id,
+            database=self.database, bookmarks=self.bookmarks.current()
+        )
 
-        return goodfellas
+        return self.flag_favorites([movie], user_id)[0]
 
     # end::findById[]
 
@@ -264,9 +246,7 @@ class MovieDAO:
     # tag::getSimilarMovies[]
     def get_similar_movies(self, id, limit=6, skip=0, user_id=None):
 
-        def get_movies(tx, limit, skip, user_id, id):
-            favorites = self.get_user_favorites(tx, user_id)
-
+        def get_movies(tx, limit, skip, id):
             result = tx.run(
                 """
                 MATCH (:Movie {tmdbId: $id})-[:IN_GENRE|ACTED_IN|DIRECTED]->()<-[:IN_GENRE|ACTED_IN|DIRECTED]-(m)
@@ -281,20 +261,21 @@ class MovieDAO:
 
                 RETURN m {
                     .*,
-                    score: score,
-                    favorite: m.tmdbId IN $favorites
+                    score: score
                 } AS movie
                 """,
                 id = id,
                 skip=skip,
                 limit=limit,
-                user_id=user_id,
-                favorites=favorites,
             )
             return [record.value("movie") for record in result]
 
-        with self.driver.session() as session:
-            return session.execute_read(get_movies, limit, skip, user_id, id) 
+        movies = shared_read(
+            self.driver, get_movies, limit, skip, id,
+            database=self.database, bookmarks=self.bookmarks.current()
+        )
+
+        return self.flag_favorites(movies, user_id)
 
     # end::getSimilarMovies[]
 
@@ -319,3 +300,42 @@ class MovieDAO:
         return [record["id"] for record in result]
 
     # end::getUserFavorites[]
+
+    """
+    This function returns the tmdbId properties of the movies in the user's
+    'My Favorites' list as a set, which is empty for anonymous requests.
+    """
+
+    # tag::favoriteIds[]
+    def favorite_ids(self, user_id):
+        if user_id is None:
+            return frozenset()
+
+        with self.driver.session(
+            database=self.database, bookmarks=self.bookmarks.current()
+        ) as session:
+            return frozenset(session.execute_read(self.get_user_favorites, user_id))
+
+    # end::favoriteIds[]
+
+    """
+    The anonymous results above are shared between every caller, so the
+    requesting user's `favorite` flags are applied to copies of the records
+    rather than being baked into the query.
+    """
+
+    # tag::flagFavorites[]
+    def flag_favorites(self, movies, user_id):
+        return with_favorites(movies, self.favorite_ids(user_id))
+
+    # end::flagFavorites[]
+
+
+def with_favorites(movies, favorites):
+    """
+    Copies of `movies` with `favorite` set from a set of tmdbIds
+    """
+    return [
+        {**movie, "favorite": movie["tmdbId"] in favorites}
+        for movie in movies
+    ]
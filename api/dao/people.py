@@ -1,15 +1,19 @@
-from api.data import people, pacino
+from api.coalesce import shared_read
 from api.exceptions.notfound import NotFoundException
+from api.bookmarks import RequestBookmarks
 
 
 class PeopleDAO:
     """
     The constructor expects an instance of the Neo4j Driver, which will be
-    used to interact with Neo4j.
+    used to interact with Neo4j, and optionally the name of the database to
+    open sessions against and the bookmarks that sessions should wait for.
     """
 
-    def __init__(self, driver):
+    def __init__(self, driver, database=None, bookmarks=None):
         self.driver = driver
+        self.database = database
+        self.bookmarks = bookmarks if bookmarks is not None else RequestBookmarks()
 
     """
     This method should return a paginated list of People (actors or directors),
@@ -38,10 +42,10 @@ class PeopleDAO:
 
             return [record["person"] for record in result]
 
-        with self.driver.session() as session:
-            return session.read_transaction(get_people, q, sort, order, limit, skip)
-
-        return people[skip:limit]
+        return shared_read(
+            self.driver, get_people, q, sort, order, limit, skip,
+            database=self.database, bookmarks=self.bookmarks.current()
+        )
 
     # end::all[]
 
@@ -72,8 +76,10 @@ class PeopleDAO:
             else:
                 raise NotFoundException("Person not found")
 
-        with self.driver.session() as session:
-            return session.read_transaction(get_people, id)
+        return shared_read(
+            self.driver, get_people, id,
+            database=self.database, bookmarks=self.bookmarks.current()
+        )
 
     # end::findById[]
 
@@ -106,7 +112,9 @@ class PeopleDAO:
 
             return [record["person"] for record in result]
 
-        with self.driver.session() as session:
-            return session.read_transaction(get_people, id, limit, skip)
+        return shared_read(
+            self.driver, get_people, id, limit, skip,
+            database=self.database, bookmarks=self.bookmarks.current()
+        )
 
     # end::getSimilarPeople[]
@@ -1,17 +1,19 @@
-from api.data import ratings
+from api.coalesce import shared_read
 from api.exceptions.notfound import NotFoundException
-
-from api.data import goodfellas
+from api.bookmarks import RequestBookmarks
 
 
 class RatingDAO:
     """
     The constructor expects an instance of the Neo4j Driver, which will be
-    used to interact with Neo4j.
+    used to interact with Neo4j, and optionally the name of the database to
+    open sessions against and the bookmarks that sessions should wait for.
     """
 
-    def __init__(self, driver):
+    def __init__(self, driver, database=None, bookmarks=None):
         self.driver = driver
+        self.database = database
+        self.bookmarks = bookmarks if bookmarks is not None else RequestBookmarks()
 
     """
     Add a relationship between a User and Movie with a `rating` property.
@@ -38,8 +40,11 @@ class RatingDAO:
 
             return result
 
-        with self.driver.session() as session:
+        with self.driver.session(
+            database=self.database, bookmarks=self.bookmarks.current()
+        ) as session:
             result = session.write_transaction(create_rating, user_id, movie_id, rating)
+            self.bookmarks.update(session.last_bookmarks())
 
             if result is None:
                 raise NotFoundException()
@@ -86,7 +91,9 @@ class RatingDAO:
             )
             return [record["review"] for record in result]
 
-        with self.driver.session() as session:
-            return session.read_transaction(get_rating, id, sort, order, limit, skip)
+        return shared_read(
+            self.driver, get_rating, id, sort, order, limit, skip,
+            database=self.database, bookmarks=self.bookmarks.current()
+        )
 
     # end::forMovie[]
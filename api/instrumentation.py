@@ -0,0 +1,505 @@
+"""
+Per-request database statistics.
+
+`InstrumentedDriver` wraps the driver created by `api.neo4j.init_driver` and
+counts, for the HTTP request being served on the current thread, the
+sessions opened, the queries run (`tx.run` and `session.run`), the rows
+streamed back and the time spent on them.  Bytes received are counted at the
+Bolt socket.  The in-memory backend counts its emulated queries the same way.
+
+At the end of each request the totals are returned to the client in a
+`Server-Timing` header:
+
+    Server-Timing: db;dur=4.2, db-queries;desc=2, db-sessions;desc=2, db-rows;desc=7, db-bytes;desc=1840
+
+and logged to the `api.queries` logger at DEBUG level.  A request that runs
+the same query text `NPLUSONE_THRESHOLD` times or more (one query per item of
+a list: an N+1 pattern) is logged at WARNING level.
+
+Sessions, transaction functions and queries also get trace spans when the
+request is being traced, see `api.tracing`.
+
+Other components can observe every query by adding a listener to
+`app.query_listeners`; see `QueryEvent`.  A listener may also define
+`transaction_finished(mode, attempts, error)`, called after each transaction
+function with the number of times the driver ran it.
+"""
+
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import current_app, g, request
+
+from api.querylog import fingerprint
+from api.tracing import child_span, enter_span, exit_span, transaction_metadata
+
+log = logging.getLogger("api.queries")
+
+_local = threading.local()
+
+
+class QueryStats:
+    """
+    Database activity of one request
+    """
+
+    def __init__(self):
+        self.sessions = 0
+        self.queries = 0
+        self.rows = 0
+        self.bytes = 0
+        self.duration = 0.0
+        self.texts = Counter()
+
+    def as_dict(self):
+        return {
+            "sessions": self.sessions,
+            "queries": self.queries,
+            "rows": self.rows,
+            "bytes": self.bytes,
+            "durationMs": self.duration * 1000,
+        }
+
+
+def current_stats():
+    """
+    The statistics of the request being served on this thread, if any
+    """
+    return getattr(_local, "stats", None)
+
+
+def set_current_stats(stats):
+    """
+    Count this thread's queries into `stats`, or stop counting them with
+    None.  Returns what they were counted into before.
+    """
+    previous = current_stats()
+    _local.stats = stats
+
+    return previous
+
+
+@contextmanager
+def collect_query_stats(stats=None):
+    """
+    Count the queries run on this thread inside the block into `stats`, a
+    new `QueryStats` by default, which is yielded
+    """
+    stats = stats if stats is not None else QueryStats()
+    previous = set_current_stats(stats)
+
+    try:
+        yield stats
+    finally:
+        set_current_stats(previous)
+
+
+def record_query(query, rows=0, duration=0.0, sessions=1):
+    """
+    Count a query that did not go through the driver, such as an emulated
+    query of the in-memory backend.
+    """
+    stats = current_stats()
+
+    if stats is not None:
+        stats.sessions += sessions
+        stats.queries += 1
+        stats.rows += rows
+        stats.duration += duration
+        stats.texts[query] += 1
+
+
+class QueryEvent:
+    """
+    Passed to each listener's `query_finished` once a query's result has been
+    consumed (or its transaction has ended).  `summary` is the driver's
+    `ResultSummary`, or None if the result was abandoned or the query failed.
+    `mode` is READ or WRITE for transaction functions and None for
+    auto-commit queries.
+    """
+
+    def __init__(self, query, parameters, database, mode=None):
+        self.query = query
+        self.parameters = parameters
+        self.database = database
+        self.mode = mode
+        self.started = time.perf_counter()
+        self.duration = None
+        self.rows = 0
+        self.summary = None
+        self.error = None
+        self.span = None
+
+
+class InstrumentedResult:
+    """
+    Counts the rows streamed from a result and reports the query when the
+    result has been consumed.
+    """
+
+    def __init__(self, result, event, driver):
+        self._result = result
+        self._event = event
+        self._driver = driver
+        self._finished = False
+
+    def _finish(self, summary=None, error=None):
+        if self._finished:
+            return
+
+        self._finished = True
+        self._event.summary = summary
+        self._event.error = error
+        self._driver._finished(self._event)
+
+    def __iter__(self):
+        try:
+            for record in self._result:
+                self._event.rows += 1
+                yield record
+        except Exception as e:
+            self._finish(error=e)
+            raise
+
+        self._finish(self._result.consume())
+
+    def single(self, *args, **kwargs):
+        try:
+            record = self._result.single(*args, **kwargs)
+        except Exception as e:
+            self._finish(error=e)
+            raise
+
+        self._event.rows += record is not None
+        self._finish(self._result.consume())
+
+        return record
+
+    def consume(self):
+        summary = self._result.consume()
+        self._finish(summary)
+
+        return summary
+
+    def value(self, key=0, default=None):
+        return [record.value(key, default) for record in self]
+
+    def values(self, *keys):
+        return [record.values(*keys) for record in self]
+
+    def data(self, *keys):
+        return [record.data(*keys) for record in self]
+
+    def __getattr__(self, name):
+        return getattr(self._result, name)
+
+
+class InstrumentedTransaction:
+    def __init__(self, tx, session, mode):
+        self._tx = tx
+        self._session = session
+        self._mode = mode
+
+    def run(self, query, parameters=None, **kwparameters):
+        return self._session._run(self._tx, query, parameters, kwparameters, self._mode)
+
+    def __getattr__(self, name):
+        return getattr(self._tx, name)
+
+
+class InstrumentedSession:
+    def __init__(self, session, driver, database, span=None):
+        self._session = session
+        self._driver = driver
+        self._database = database
+        self._span = span
+        self._open = []
+
+    def _run(self, runner, query, parameters, kwparameters, mode=None):
+        event = QueryEvent(
+            query, {**(parameters or {}), **kwparameters}, self._database, mode
+        )
+        event.span = child_span("neo4j.query")
+
+        try:
+            result = runner.run(query, parameters, **kwparameters)
+        except Exception as e:
+            event.error = e
+            self._driver._finished(event)
+            raise
+
+        result = InstrumentedResult(result, event, self._driver)
+        self._open.append(result)
+
+        return result
+
+    def _wrap(self, work, mode, attempts, span):
+        def instrumented_work(tx, *args, **kwargs):
+            attempts[0] += 1
+
+            try:
+                return work(InstrumentedTransaction(tx, self, mode), *args, **kwargs)
+            finally:
+                # Results left unconsumed are discarded with the transaction
+                for result in self._open:
+                    result._finish()
+                self._open = []
+
+        # Keep the settings of `neo4j.unit_of_work`, and tag traced
+        # transactions so that the server's query log can be correlated
+        instrumented_work.timeout = getattr(work, "timeout", None)
+        instrumented_work.metadata = getattr(work, "metadata", None)
+
+        if span is not None:
+            instrumented_work.metadata = {
+                **(instrumented_work.metadata or {}), **transaction_metadata(span)
+            }
+
+        return instrumented_work
+
+    def _execute(self, execute, work, mode, args, kwargs):
+        # The driver calls the work function again for every retry
+        attempts = [0]
+        error = None
+        span = enter_span("neo4j.transaction", **{"neo4j.mode": mode})
+
+        try:
+            return execute(self._wrap(work, mode, attempts, span), *args, **kwargs)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if span is not None:
+                span.set("neo4j.attempts", attempts[0])
+            exit_span(span, error)
+
+            self._driver._transaction_finished(mode, attempts[0], error)
+
+    def execute_read(self, work, *args, **kwargs):
+        return self._execute(self._session.execute_read, work, "READ", args, kwargs)
+
+    def execute_write(self, work, *args, **kwargs):
+        return self._execute(self._session.execute_write, work, "WRITE", args, kwargs)
+
+    def read_transaction(self, work, *args, **kwargs):
+        return self.execute_read(work, *args, **kwargs)
+
+    def write_transaction(self, work, *args, **kwargs):
+        return self.execute_write(work, *args, **kwargs)
+
+    def run(self, query, parameters=None, **kwparameters):
+        return self._run(self._session, query, parameters, kwparameters)
+
+    def close(self):
+        for result in self._open:
+            result._finish()
+        self._open = []
+
+        exit_span(self._span)
+        self._span = None
+
+        return self._session.close()
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+    def __enter__(self):
+        self._session.__enter__()
+        return self
+
+    def __exit__(self, *args):
+        for result in self._open:
+            result._finish()
+        self._open = []
+
+        exit_span(self._span, args[1])
+        self._span = None
+
+        return self._session.__exit__(*args)
+
+
+class InstrumentedDriver:
+    """
+    Wraps a driver, counting its activity against the current request and
+    notifying `listeners` of every query.
+    """
+
+    def __init__(self, driver, listeners=None):
+        self._driver = driver
+        self.listeners = listeners if listeners is not None else []
+        self._lock = threading.Lock()
+        self.queries = 0
+
+        instrument_sockets()
+
+    def session(self, **config):
+        stats = current_stats()
+        if stats is not None:
+            stats.sessions += 1
+
+        span = enter_span("neo4j.session", **{"db.name": config.get("database")})
+
+        return InstrumentedSession(
+            self._driver.session(**config), self, config.get("database"), span
+        )
+
+    def _finished(self, event):
+        event.duration = time.perf_counter() - event.started
+
+        with self._lock:
+            self.queries += 1
+
+        stats = current_stats()
+        if stats is not None:
+            stats.queries += 1
+            stats.rows += event.rows
+            stats.duration += event.duration
+            stats.texts[event.query] += 1
+
+        if event.span is not None:
+            event.span.set("db.query.fingerprint", fingerprint(event.query))
+            event.span.set("db.rows", event.rows)
+
+            if event.summary is not None:
+                event.span.set("db.server.available_ms", event.summary.result_available_after)
+                event.span.set("db.server.consumed_ms", event.summary.result_consumed_after)
+
+            event.span.finish(event.error)
+
+        for listener in self.listeners:
+            try:
+                listener.query_finished(event)
+            except Exception:
+                log.exception("Query listener %r failed", listener)
+
+    def _transaction_finished(self, mode, attempts, error):
+        for listener in self.listeners:
+            transaction_finished = getattr(listener, "transaction_finished", None)
+
+            if transaction_finished is None:
+                continue
+
+            try:
+                transaction_finished(mode, attempts, error)
+            except Exception:
+                log.exception("Query listener %r failed", listener)
+
+    def __getattr__(self, name):
+        return getattr(self._driver, name)
+
+
+"""
+Bytes received are counted where the driver reads from its sockets.  The
+socket class is private to the driver, so if it moves the count is left at 0.
+"""
+_sockets_instrumented = False
+
+
+def instrument_sockets():
+    global _sockets_instrumented
+
+    if _sockets_instrumented:
+        return
+
+    _sockets_instrumented = True
+
+    try:
+        from neo4j._async_compat.network import BoltSocket
+    except ImportError:
+        return
+
+    recv_into = BoltSocket.recv_into
+
+    def counted_recv_into(self, buffer, nbytes):
+        received = recv_into(self, buffer, nbytes)
+
+        stats = current_stats()
+        if stats is not None:
+            stats.bytes += received
+
+        return received
+
+    BoltSocket.recv_into = counted_recv_into
+
+
+"""
+Request hooks
+"""
+
+
+def start_query_stats():
+    """
+    `before_request` handler that starts counting for this request
+    """
+    g.query_stats = QueryStats()
+    set_current_stats(g.query_stats)
+
+
+def server_timing(stats):
+    return ", ".join([
+        "db;dur=%.2f" % (stats.duration * 1000),
+        "db-queries;desc=%d" % stats.queries,
+        "db-sessions;desc=%d" % stats.sessions,
+        "db-rows;desc=%d" % stats.rows,
+        "db-bytes;desc=%d" % stats.bytes,
+    ])
+
+
+def parse_server_timing(header):
+    """
+    Read the `db-*` counts back from a `Server-Timing` header
+    """
+    counts = {}
+
+    for metric in (header or "").split(","):
+        name, _, rest = metric.strip().partition(";")
+
+        for param in rest.split(";"):
+            key, _, value = param.partition("=")
+
+            if key.strip() in ("desc", "dur"):
+                try:
+                    counts[name] = float(value.strip().strip('"'))
+                except ValueError:
+                    pass
+
+    return counts
+
+
+def add_server_timing(response):
+    """
+    `after_request` handler that reports the request's database activity
+    """
+    stats = g.get("query_stats")
+
+    if stats is None:
+        return response
+
+    response.headers.add("Server-Timing", server_timing(stats))
+
+    log.debug(
+        "%s %s %s queries=%d sessions=%d rows=%d bytes=%d db=%.2fms",
+        request.method, request.path, response.status_code, stats.queries,
+        stats.sessions, stats.rows, stats.bytes, stats.duration * 1000,
+    )
+
+    threshold = current_app.config.get("NPLUSONE_THRESHOLD")
+    if threshold:
+        for query, count in stats.texts.items():
+            if count >= threshold:
+                log.warning(
+                    "Possible N+1: %s %s ran the same query %d times: %s",
+                    request.method, request.path, count, " ".join(query.split())[:200],
+                )
+
+    return response
+
+
+def stop_query_stats(exc=None):
+    """
+    `teardown_request` handler that stops counting on this thread
+    """
+    set_current_stats(None)
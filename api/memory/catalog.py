@@ -0,0 +1,466 @@
+"""
+A read-only movie catalog in one memory-mapped file, shared by every worker.
+
+The loader builds a `MemoryGraph` once, from the fixtures or a synthetic
+catalog, and writes its movies, people and genres to a file:
+
+    python -m api.memory.catalog --out catalog.bin --synthetic 100000
+
+The file holds:
+
+* every property of every movie, person and genre as a column (see
+  `api.memory.columns`), with all of their strings in one pool
+* ACTED_IN (with roles), DIRECTED and IN_GENRE, in both directions
+* the order of the movies by each of `ORDERS`, overall and per genre
+* each genre's summary: its number of movies and the poster of its highest
+  rated movie
+
+With `MEMORY_CATALOG` set to the file, the memory backend maps it instead of
+seeding a graph, and reads records straight from the mapping.  Its pages are
+shared by every process through the page cache, so adding a worker adds
+only what the worker builds for its requests.
+
+Users, ratings and favorites change, so they are not part of the catalog:
+each worker keeps its own in `MemoryGraph` dicts, starting empty.
+"""
+
+import array
+import json
+import mmap
+import os
+import struct
+from collections.abc import Mapping
+
+from api.memory.columns import (
+    NUMBER, INTEGER, STRING, TYPECODES, Keys, Relation, StringPool, StringPoolBuilder,
+    Table, column_type, decode_column, encode_column, encode_relation,
+)
+from api.memory.graph import MemoryGraph
+
+MAGIC = b"NEOFLIXCATALOG\0\0"
+FORMAT = 1
+
+"""
+Movie properties to store orders for.  Movies are sorted by other
+properties on demand, and the order is kept by each worker.
+"""
+ORDERS = ("title", "imdbRating", "released", "year", "runtime")
+
+"""
+(table, key, graph attribute) for each node label
+"""
+TABLES = (
+    ("movies", "tmdbId", "movies"),
+    ("people", "tmdbId", "people"),
+    ("genres", "name", "genres"),
+)
+
+"""
+(relation, source table, target table) for each relationship index of
+`MemoryGraph`
+"""
+RELATIONS = (
+    ("cast", "movies", "people"),
+    ("acted_in", "people", "movies"),
+    ("directors", "movies", "people"),
+    ("directed", "people", "movies"),
+    ("movie_genres", "movies", "genres"),
+    ("genre_movies", "genres", "movies"),
+)
+
+_SIZE = struct.Struct("<Q")
+
+
+"""
+Writing
+"""
+
+
+class Writer:
+    """
+    Lays arrays out one after the other, 8-byte aligned
+    """
+
+    def __init__(self):
+        self.segments = {}
+        self.chunks = []
+        self.size = 0
+
+    def add(self, name, data, typecode=None):
+        if isinstance(data, array.array):
+            typecode = data.typecode
+            data = data.tobytes()
+
+        padding = -self.size % 8
+        if padding:
+            self.chunks.append(b"\0" * padding)
+            self.size += padding
+
+        self.segments[name] = [self.size, len(data), typecode or "B"]
+        self.chunks.append(data)
+        self.size += len(data)
+
+    def write(self, path, header):
+        header = json.dumps({**header, "segments": self.segments}).encode("utf8")
+        start = len(MAGIC) + _SIZE.size + len(header)
+        padding = -start % 8
+
+        temporary = "%s.%d.tmp" % (path, os.getpid())
+
+        with open(temporary, "wb") as f:
+            f.write(MAGIC)
+            f.write(_SIZE.pack(len(header)))
+            f.write(header)
+            f.write(b"\0" * padding)
+
+            for chunk in self.chunks:
+                f.write(chunk)
+
+        os.replace(temporary, path)
+
+
+def _ordered(values):
+    """
+    Rows with a value, in ascending order of it, ties in row order
+    """
+    return sorted((row for row, value in enumerate(values) if value is not None), key=values.__getitem__)
+
+
+def build(graph, path, version=None):
+    """
+    Write the catalog part of `graph` to `path`
+    """
+    writer = Writer()
+    pool = StringPoolBuilder()
+    tables = {}
+    ids = {}
+    rows = {}
+
+    for table, key, attribute in TABLES:
+        records = getattr(graph, attribute)
+        ids[table] = list(records)
+        rows[table] = {id: row for row, id in enumerate(ids[table])}
+
+        names = {}
+        for record in records.values():
+            names.update(dict.fromkeys(record))
+
+        columns = {}
+        for name in names:
+            values = [records[id].get(name) for id in ids[table]]
+            columns[name] = column_type(values)
+
+            for part, data in encode_column(columns[name], values, pool).items():
+                writer.add("%s.%s.%s" % (table, name, part), data)
+
+            if table == "movies" and name in ORDERS and columns[name] in (NUMBER, INTEGER, STRING):
+                writer.add("movies.order.%s" % name, array.array("i", _ordered(values)))
+
+        by_key = sorted(range(len(ids[table])), key=ids[table].__getitem__)
+        writer.add("%s.keys" % table, array.array("i", by_key))
+
+        tables[table] = {"rows": len(ids[table]), "key": key, "columns": columns}
+
+    for relation, source, target in RELATIONS:
+        index = getattr(graph, relation)
+        targets = rows[target]
+        lists = []
+        roles = array.array("i")
+
+        for id in ids[source]:
+            items = index.get(id, ())
+
+            if relation == "cast":
+                items = [(person, role) for person, role in items if person in targets]
+                roles.extend(-1 if role is None else pool.add(role) for _, role in items)
+                lists.append([targets[person] for person, _ in items])
+            else:
+                lists.append(sorted(targets[item] for item in items if item in targets))
+
+        offsets, target_rows = encode_relation(lists)
+        writer.add("%s.offsets" % relation, offsets)
+        writer.add("%s.targets" % relation, target_rows)
+
+        if relation == "cast":
+            writer.add("cast.roles", roles)
+
+    # Orders per genre: the overall order, filtered
+    orders = [name for name in ORDERS if "movies.order.%s" % name in writer.segments]
+    members = [set(rows["movies"][id] for id in graph.genre_movies.get(name, ())) for name in ids["genres"]]
+
+    for name in orders:
+        values = [graph.movies[id].get(name) for id in ids["movies"]]
+        overall = _ordered(values)
+        offsets, target_rows = encode_relation([[row for row in overall if row in genre] for genre in members])
+        writer.add("genre_orders.%s.offsets" % name, offsets)
+        writer.add("genre_orders.%s.targets" % name, target_rows)
+
+    counts = array.array("q")
+    posters = array.array("i")
+
+    for name in ids["genres"]:
+        summary = graph.genre_summary(name)
+        counts.append(summary["movies"] if summary else 0)
+        posters.append(pool.add(summary["poster"]) if summary else -1)
+
+    writer.add("genre_summaries.movies", counts)
+    writer.add("genre_summaries.poster", posters)
+
+    offsets, data = pool.encode()
+    writer.add("pool.offsets", offsets)
+    writer.add("pool.data", data)
+
+    writer.write(path, {
+        "format": FORMAT,
+        "version": version,
+        "tables": tables,
+        "orders": orders,
+    })
+
+    return path
+
+
+"""
+Reading
+"""
+
+
+class Catalog:
+    """
+    A catalog file, mapped into memory
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self._view = memoryview(self._mmap)
+
+        if self._view[:len(MAGIC)] != MAGIC:
+            raise ValueError("%s is not a catalog" % path)
+
+        size, = _SIZE.unpack(self._view[len(MAGIC):len(MAGIC) + _SIZE.size])
+        start = len(MAGIC) + _SIZE.size
+        self.header = json.loads(bytes(self._view[start:start + size]))
+
+        if self.header["format"] != FORMAT:
+            raise ValueError("%s has catalog format %s, not %s" % (path, self.header["format"], FORMAT))
+
+        self._start = start + size + (-(start + size) % 8)
+        self.version = self.header["version"]
+        self.pool = StringPool(self.segment("pool.offsets"), self.segment("pool.data"))
+
+    def segment(self, name):
+        offset, length, typecode = self.header["segments"][name]
+        data = self._view[self._start + offset:self._start + offset + length]
+
+        return data if typecode == "B" else data.cast(typecode)
+
+    def has(self, name):
+        return name in self.header["segments"]
+
+    def table(self, name):
+        meta = self.header["tables"][name]
+        columns = {
+            column: decode_column(type, {
+                part: self.segment("%s.%s.%s" % (name, column, part)) for part in TYPECODES[type]
+            })
+            for column, type in meta["columns"].items()
+        }
+
+        return Table(meta["rows"], columns, self.pool)
+
+    def relation(self, name):
+        return Relation(self.segment("%s.offsets" % name), self.segment("%s.targets" % name))
+
+
+class Records(Mapping):
+    """
+    A table's records by key, decoded when they are read
+    """
+
+    def __init__(self, catalog, name):
+        meta = catalog.header["tables"][name]
+
+        self.table = catalog.table(name)
+        self.pool = catalog.pool
+        self._keys = self.table.columns[meta["key"]]
+        self._sorted = catalog.segment("%s.keys" % name)
+
+    def key(self, row):
+        return self._keys.get(row, self.pool)
+
+    def row(self, key):
+        """
+        The row of `key`, found by binary search, or None
+        """
+        if not isinstance(key, str):
+            return None
+
+        low, high = 0, len(self._sorted)
+
+        while low < high:
+            middle = (low + high) // 2
+
+            if self.key(self._sorted[middle]) < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        if low < len(self._sorted) and self.key(self._sorted[low]) == key:
+            return self._sorted[low]
+
+        return None
+
+    def value(self, row, name):
+        return self.table.value(row, name)
+
+    def order(self, rows, name):
+        return self.table.order(rows, name)
+
+    def __getitem__(self, key):
+        row = self.row(key)
+
+        if row is None:
+            raise KeyError(key)
+
+        return self.table.record(row)
+
+    def __contains__(self, key):
+        return self.row(key) is not None
+
+    def __iter__(self):
+        return (self.key(row) for row in range(len(self.table)))
+
+    def __len__(self):
+        return len(self.table)
+
+    def values(self):
+        return [self.table.record(row) for row in range(len(self.table))]
+
+
+class Related(Mapping):
+    """
+    One of `MemoryGraph`'s relationship indexes, read from the catalog: the
+    keys related to each key
+    """
+
+    def __init__(self, relation, source, target, roles=None, pool=None):
+        self.relation = relation
+        self.source = source
+        self.target = target
+        self.roles = roles
+        self.pool = pool
+
+    def __getitem__(self, key):
+        row = self.source.row(key)
+
+        if row is None:
+            raise KeyError(key)
+
+        keys = [self.target.key(target) for target in self.relation.get(row)]
+
+        if self.roles is None:
+            return keys
+
+        start = self.relation.offsets[row]
+        roles = self.roles[start:start + len(keys)]
+
+        return [(key, None if role < 0 else self.pool[role]) for key, role in zip(keys, roles)]
+
+    def __iter__(self):
+        return (
+            self.source.key(row) for row in range(len(self.source))
+            if self.relation.count(row)
+        )
+
+    def __len__(self):
+        return sum(1 for row in range(len(self.source)) if self.relation.count(row))
+
+
+class CatalogGraph(MemoryGraph):
+    """
+    A `MemoryGraph` whose movies, people and genres are read from a
+    `Catalog`
+    """
+
+    READ_ONLY_LABELS = {"Movie", "Person", "Genre"}
+    READ_ONLY_TYPES = {"ACTED_IN", "DIRECTED", "IN_GENRE"}
+
+    def __init__(self, catalog):
+        super().__init__()
+        self.catalog = catalog
+
+        self.movies = Records(catalog, "movies")
+        self.people = Records(catalog, "people")
+        self.genres = Records(catalog, "genres")
+
+        tables = {"movies": self.movies, "people": self.people, "genres": self.genres}
+
+        for relation, source, target in RELATIONS:
+            roles = catalog.segment("cast.roles") if relation == "cast" else None
+            setattr(self, relation, Related(
+                catalog.relation(relation), tables[source], tables[target], roles, catalog.pool
+            ))
+
+        self._genre_counts = catalog.segment("genre_summaries.movies")
+        self._genre_posters = catalog.segment("genre_summaries.poster")
+
+    def add_node(self, label, properties):
+        if label in self.READ_ONLY_LABELS:
+            raise ValueError("%s nodes are read-only in a catalog" % label)
+
+        super().add_node(label, properties)
+
+    def add_relationship(self, type, start, end, properties=None):
+        if type in self.READ_ONLY_TYPES:
+            raise ValueError("%s relationships are read-only in a catalog" % type)
+
+        super().add_relationship(type, start, end, properties)
+
+    def sorted_movie_ids(self, scope, movie_ids, sort):
+        if sort in self.catalog.header["orders"]:
+            if scope is None:
+                return Keys(self.catalog.segment("movies.order.%s" % sort), self.movies)
+
+            if scope[0] == "genre":
+                row = self.genres.row(scope[1])
+                rows = self.catalog.relation("genre_orders.%s" % sort).get(row) if row is not None else ()
+
+                return Keys(rows, self.movies)
+
+        return super().sorted_movie_ids(scope, movie_ids, sort)
+
+    def genre_summary(self, name):
+        row = self.genres.row(name)
+
+        if row is None or self._genre_posters[row] < 0:
+            return None
+
+        return {"movies": self._genre_counts[row], "poster": self.catalog.pool[self._genre_posters[row]]}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Write a catalog file for MEMORY_CATALOG")
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--synthetic", type=int, metavar="MOVIES",
+                        help="Generate a catalog of this many movies instead of loading the fixtures")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--version", help="Recorded in the file, such as the import's date")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        graph = MemoryGraph.synthetic(args.synthetic, args.seed)
+    else:
+        graph = MemoryGraph.from_fixtures()
+
+    build(graph, args.out, args.version)
+
+    print("%s: %d movies, %d people, %d genres, %d bytes" % (
+        args.out, len(graph.movies), len(graph.people), len(graph.genres),
+        os.path.getsize(args.out),
+    ))
@@ -0,0 +1,599 @@
+"""
+Records stored column by column.
+
+A `Table` holds the properties of its records in one column per key,
+each of a single type, and builds a record's dict only when it is asked
+for.  Strings are kept once each in a `StringPool` and columns refer to them
+by index.  Relationships between the rows of two tables are kept as
+`Relation`s: one list of target rows per source row, concatenated, with the
+offset where each row's list starts.
+
+Columns are plain sequences: `array.array`s built in this process, or
+`memoryview`s over a memory-mapped file (see `api.memory.catalog`), which
+are read without being copied.  A `GrowingTable` stores records the same
+way while they are being added and changed.
+"""
+
+import array
+import json
+import math
+import sys
+from collections.abc import Mapping, Sequence
+
+NUMBER = "number"
+INTEGER = "integer"
+STRING = "string"
+STRINGS = "strings"
+JSON = "json"
+
+"""
+How each part of a column is stored, as `array` type codes
+"""
+TYPECODES = {
+    NUMBER: {"values": "d"},
+    INTEGER: {"values": "q"},
+    STRING: {"values": "i"},
+    STRINGS: {"offsets": "q", "values": "i", "present": "B"},
+    JSON: {"values": "i"},
+}
+
+# Stands for null in integer columns; NaN does in number columns and -1 in
+# string columns
+INTEGER_NULL = -(2 ** 63)
+_INTEGER_MAX = 2 ** 63 - 1
+
+
+def _kind(value):
+    if isinstance(value, bool):
+        return JSON
+    if isinstance(value, int):
+        return INTEGER if INTEGER_NULL < value <= _INTEGER_MAX else JSON
+    if isinstance(value, float):
+        return NUMBER
+    if isinstance(value, str):
+        return STRING
+    if isinstance(value, list) and all(isinstance(item, str) for item in value):
+        return STRINGS
+
+    return JSON
+
+
+def column_type(values):
+    """
+    The narrowest type that holds every value.  Integers mixed with floats
+    are stored as floats; any other mix is stored as JSON.
+    """
+    kinds = {_kind(value) for value in values if value is not None}
+
+    if kinds == {INTEGER, NUMBER}:
+        return NUMBER
+
+    if len(kinds) == 1:
+        return kinds.pop()
+
+    return JSON if kinds else STRING
+
+
+"""
+Strings
+"""
+
+
+class StringPoolBuilder:
+    def __init__(self):
+        self.indexes = {}
+        self.strings = []
+
+    def add(self, string):
+        index = self.indexes.get(string)
+
+        if index is None:
+            index = self.indexes[string] = len(self.strings)
+            self.strings.append(string)
+
+        return index
+
+    def encode(self):
+        """
+        (offsets, data): the UTF-8 strings laid end to end, and where each
+        one starts, with the end of the last one at the end
+        """
+        offsets = array.array("q", [0])
+        chunks = []
+
+        for string in self.strings:
+            chunk = string.encode("utf8")
+            chunks.append(chunk)
+            offsets.append(offsets[-1] + len(chunk))
+
+        return offsets, b"".join(chunks)
+
+
+class StringPool:
+    """
+    Strings encoded by `StringPoolBuilder`, decoded when they are read
+    """
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def __getitem__(self, index):
+        return str(self.data[self.offsets[index]:self.offsets[index + 1]], "utf8")
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+
+"""
+Columns
+"""
+
+
+class NumberColumn:
+    def __init__(self, values):
+        self.values = values
+
+    def get(self, row, pool):
+        value = self.values[row]
+
+        return None if math.isnan(value) else value
+
+
+class IntegerColumn:
+    def __init__(self, values):
+        self.values = values
+
+    def get(self, row, pool):
+        value = self.values[row]
+
+        return None if value == INTEGER_NULL else value
+
+
+class StringColumn:
+    def __init__(self, values):
+        self.values = values
+
+    def get(self, row, pool):
+        index = self.values[row]
+
+        return None if index < 0 else pool[index]
+
+
+class StringsColumn:
+    def __init__(self, offsets, values, present):
+        self.offsets = offsets
+        self.values = values
+        self.present = present
+
+    def get(self, row, pool):
+        if not self.present[row]:
+            return None
+
+        return [pool[index] for index in self.values[self.offsets[row]:self.offsets[row + 1]]]
+
+
+class JsonColumn(StringColumn):
+    def get(self, row, pool):
+        text = super().get(row, pool)
+
+        return None if text is None else json.loads(text)
+
+
+COLUMNS = {
+    NUMBER: NumberColumn,
+    INTEGER: IntegerColumn,
+    STRING: StringColumn,
+    STRINGS: StringsColumn,
+    JSON: JsonColumn,
+}
+
+
+def encode_column(type, values, pool):
+    """
+    The parts of a column of `type` holding `values`, as arrays, adding its
+    strings to `pool` (a `StringPoolBuilder`)
+    """
+    codes = TYPECODES[type]
+    parts = {part: array.array(code) for part, code in codes.items()}
+
+    if type == STRINGS:
+        parts["offsets"].append(0)
+
+    for value in values:
+        if type == NUMBER:
+            parts["values"].append(math.nan if value is None else value)
+        elif type == INTEGER:
+            parts["values"].append(INTEGER_NULL if value is None else value)
+        elif type == STRING:
+            parts["values"].append(-1 if value is None else pool.add(value))
+        elif type == JSON:
+            parts["values"].append(-1 if value is None else pool.add(json.dumps(value)))
+        else:
+            parts["values"].extend(pool.add(item) for item in value or ())
+            parts["offsets"].append(len(parts["values"]))
+            parts["present"].append(value is not None)
+
+    return parts
+
+
+def decode_column(type, parts):
+    if type == STRINGS:
+        return StringsColumn(parts["offsets"], parts["values"], parts["present"])
+
+    return COLUMNS[type](parts["values"])
+
+
+class Table:
+    """
+    Records stored as columns, looked up by row number
+    """
+
+    def __init__(self, rows, columns, pool):
+        self.rows = rows
+        self.columns = columns
+        self.pool = pool
+
+    def value(self, row, name):
+        column = self.columns.get(name)
+
+        return None if column is None else column.get(row, self.pool)
+
+    def record(self, row):
+        record = {}
+
+        for name, column in self.columns.items():
+            value = column.get(row, self.pool)
+
+            if value is not None:
+                record[name] = value
+
+        return record
+
+    def order(self, rows, name):
+        """
+        The `rows` with a value for `name`, in ascending order of it
+        """
+        column = self.columns.get(name)
+
+        if column is None:
+            return array.array("i")
+
+        return array.array("i", sorted(
+            (row for row in rows if column.get(row, self.pool) is not None),
+            key=lambda row: column.get(row, self.pool),
+        ))
+
+    def __len__(self):
+        return self.rows
+
+
+class Keys(Sequence):
+    """
+    The keys of a sequence of rows, decoded when they are read
+    """
+
+    def __init__(self, rows, records):
+        self.rows = rows
+        self.records = records
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.records.key(row) for row in self.rows[index]]
+
+        return self.records.key(self.rows[index])
+
+    def __len__(self):
+        return len(self.rows)
+
+
+"""
+Relationships
+"""
+
+
+def encode_relation(lists):
+    """
+    (offsets, targets) for one list of target rows per source row
+    """
+    offsets = array.array("q", [0])
+    targets = array.array("i")
+
+    for targets_of_row in lists:
+        targets.extend(targets_of_row)
+        offsets.append(len(targets))
+
+    return offsets, targets
+
+
+class Relation:
+    def __init__(self, offsets, targets):
+        self.offsets = offsets
+        self.targets = targets
+
+    def get(self, row):
+        return self.targets[self.offsets[row]:self.offsets[row + 1]]
+
+    def count(self, row):
+        return self.offsets[row + 1] - self.offsets[row]
+
+
+"""
+Growing tables
+
+Columns that rows can be appended to and changed in place, for the records
+a `MemoryGraph` is loaded with.  Each value is stored by the first column
+type that fits it: floats and integers in arrays, strings as UTF-8 in a
+per-column buffer, and lists of strings, such as languages, as indexes
+into a table of interned lists.  Anything else, or a value that does not
+fit the type the column started with, is kept as a Python object.
+"""
+
+
+class Interned:
+    """
+    Values stored once each, by index
+    """
+
+    def __init__(self):
+        self.indexes = {}
+        self.values = []
+
+    def add(self, value):
+        index = self.indexes.get(value)
+
+        if index is None:
+            index = self.indexes[value] = len(self.values)
+            self.values.append(value)
+
+        return index
+
+    def __getitem__(self, index):
+        return self.values[index]
+
+
+class GrowingNumbers:
+    def __init__(self):
+        self.values = array.array("d")
+
+    @staticmethod
+    def accepts(value):
+        return isinstance(value, float)
+
+    def append(self, value):
+        self.values.append(math.nan if value is None else value)
+
+    def set(self, row, value):
+        self.values[row] = math.nan if value is None else value
+
+    def get(self, row):
+        value = self.values[row]
+
+        return None if math.isnan(value) else value
+
+
+class GrowingIntegers:
+    def __init__(self):
+        self.values = array.array("q")
+
+    @staticmethod
+    def accepts(value):
+        return _kind(value) == INTEGER
+
+    def append(self, value):
+        self.values.append(INTEGER_NULL if value is None else value)
+
+    def set(self, row, value):
+        self.values[row] = INTEGER_NULL if value is None else value
+
+    def get(self, row):
+        value = self.values[row]
+
+        return None if value == INTEGER_NULL else value
+
+
+class GrowingText:
+    """
+    Strings encoded one after the other.  A changed value is appended and
+    the old one is left in the buffer.
+    """
+
+    def __init__(self):
+        self.data = bytearray()
+        self.starts = array.array("q")
+        self.lengths = array.array("i")
+
+    @staticmethod
+    def accepts(value):
+        return isinstance(value, str)
+
+    def append(self, value):
+        self.starts.append(0)
+        self.lengths.append(-1)
+        self.set(len(self.starts) - 1, value)
+
+    def set(self, row, value):
+        if value is None:
+            self.lengths[row] = -1
+            return
+
+        encoded = value.encode("utf8")
+        self.starts[row] = len(self.data)
+        self.lengths[row] = len(encoded)
+        self.data += encoded
+
+    def get(self, row):
+        length = self.lengths[row]
+
+        if length < 0:
+            return None
+
+        start = self.starts[row]
+
+        return self.data[start:start + length].decode("utf8")
+
+
+class GrowingStrings:
+    """
+    Lists of strings, each list interned as a tuple of interned strings
+    """
+
+    def __init__(self, lists):
+        self.lists = lists
+        self.values = array.array("i")
+
+    @staticmethod
+    def accepts(value):
+        return _kind(value) == STRINGS
+
+    def _index(self, value):
+        return -1 if value is None else self.lists.add(tuple(sys.intern(item) for item in value))
+
+    def append(self, value):
+        self.values.append(self._index(value))
+
+    def set(self, row, value):
+        self.values[row] = self._index(value)
+
+    def get(self, row):
+        index = self.values[row]
+
+        return None if index < 0 else list(self.lists[index])
+
+
+class GrowingObjects:
+    def __init__(self, values=None):
+        self.values = values if values is not None else []
+
+    @staticmethod
+    def accepts(value):
+        return True
+
+    def append(self, value):
+        self.values.append(value)
+
+    def set(self, row, value):
+        self.values[row] = value
+
+    def get(self, row):
+        return self.values[row]
+
+
+class GrowingTable(Mapping):
+    """
+    Records by key, stored as growing columns and decoded into a new dict
+    whenever they are read.  Rows are numbered in the order their keys were
+    first added, and the only per-record Python objects are their keys.
+    """
+
+    def __init__(self, key):
+        self.key_name = key
+        self.keys = []
+        self.rows = {}
+        self.columns = {}
+        self.lists = Interned()
+
+    def _column(self, value):
+        kind = _kind(value)
+
+        if isinstance(value, float):
+            return GrowingNumbers()
+        if kind == INTEGER:
+            return GrowingIntegers()
+        if kind == STRING:
+            return GrowingText()
+        if kind == STRINGS:
+            return GrowingStrings(self.lists)
+
+        return GrowingObjects()
+
+    def merge(self, properties):
+        """
+        Add a record, or update the one with the same key, and return its
+        row
+        """
+        key = properties[self.key_name]
+        row = self.rows.get(key)
+
+        if row is None:
+            row = self.rows[key] = len(self.keys)
+            self.keys.append(key)
+
+            for column in self.columns.values():
+                column.append(None)
+
+        for name, value in properties.items():
+            if name != self.key_name:
+                self.set(row, name, value)
+
+        return row
+
+    def set(self, row, name, value):
+        column = self.columns.get(name)
+
+        if column is None:
+            if value is None:
+                return
+
+            column = self.columns[name] = self._column(value)
+
+            for _ in self.keys:
+                column.append(None)
+        elif value is not None and not column.accepts(value):
+            # Widen the column to hold any value
+            column = self.columns[name] = GrowingObjects([column.get(r) for r in range(len(self.keys))])
+
+        column.set(row, value)
+
+    def key(self, row):
+        return self.keys[row]
+
+    def row(self, key):
+        return self.rows.get(key)
+
+    def value(self, row, name):
+        if name == self.key_name:
+            return self.keys[row]
+
+        column = self.columns.get(name)
+
+        return None if column is None else column.get(row)
+
+    def record(self, row):
+        record = {self.key_name: self.keys[row]}
+
+        for name, column in self.columns.items():
+            value = column.get(row)
+
+            if value is not None:
+                record[name] = value
+
+        return record
+
+    def order(self, rows, name):
+        """
+        The `rows` with a value for `name`, in ascending order of it
+        """
+        if name == self.key_name:
+            get = self.keys.__getitem__
+        elif name in self.columns:
+            get = self.columns[name].get
+        else:
+            return array.array("i")
+
+        return array.array("i", sorted((row for row in rows if get(row) is not None), key=get))
+
+    def __getitem__(self, key):
+        return self.record(self.rows[key])
+
+    def __contains__(self, key):
+        return key in self.rows
+
+    def __iter__(self):
+        return iter(self.keys)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def values(self):
+        return [self.record(row) for row in range(len(self.keys))]
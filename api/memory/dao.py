@@ -0,0 +1,400 @@
+"""
+DAOs backed by `MemoryGraph`.
+
+Each class mirrors the public methods, arguments and return values of its
+Neo4j counterpart in `api.dao`, so routes can use either backend through
+`api.neo4j.get_dao`.  Select this backend with `DAO_BACKEND=memory`.
+"""
+
+import threading
+import time
+import uuid
+
+import bcrypt
+from flask import current_app
+
+from api.dao.auth import AuthDAO
+from api.dao.favorites import FavoriteDAO
+from api.dao.genres import GenreDAO
+from api.dao.movies import MovieDAO, with_favorites
+from api.dao.people import PeopleDAO
+from api.dao.ratings import RatingDAO
+from api.exceptions.notfound import NotFoundException
+from api.exceptions.validation import ValidationException
+from api.instrumentation import record_query
+from api.metrics import BCRYPT_DURATION
+from api.memory.catalog import Catalog, CatalogGraph
+from api.memory.graph import NO_GENRE, MemoryGraph, sort_records
+
+_graph_lock = threading.Lock()
+
+
+def get_graph():
+    """
+    Get the app's graph, seeding it on first use from `MEMORY_SEED`: either
+    `fixtures` (the default) or `synthetic`.  With `MEMORY_CATALOG` set,
+    the movies, people and genres are read from that catalog file instead
+    (see `api.memory.catalog`).
+    """
+    graph = getattr(current_app, "graph", None)
+
+    if graph is None:
+        with _graph_lock:
+            graph = getattr(current_app, "graph", None)
+
+            if graph is None:
+                if current_app.config.get("MEMORY_CATALOG"):
+                    graph = CatalogGraph(Catalog(current_app.config["MEMORY_CATALOG"]))
+                elif current_app.config.get("MEMORY_SEED") == "synthetic":
+                    graph = MemoryGraph.synthetic(
+                        current_app.config.get("MEMORY_SYNTHETIC_MOVIES") or 1000,
+                        current_app.config.get("MEMORY_SYNTHETIC_SEED") or 0,
+                    )
+                else:
+                    graph = MemoryGraph.from_fixtures()
+
+                current_app.graph = graph
+
+    return graph
+
+
+class MemoryDAO:
+    def __init__(self, graph):
+        self.graph = graph
+
+    def _query(self, name):
+        # Count the queries the Neo4j implementation would have run
+        self.graph.queries += 1
+        record_query("%s.%s" % (type(self).__name__, name))
+
+
+class MemoryMovieDAO(MemoryDAO):
+    def _page(self, scope, movie_ids, sort, order, limit, skip, user_id):
+        self._query("get_movies")
+        graph = self.graph
+        page = graph.page_movie_ids(scope, movie_ids, sort, order, skip, limit)
+
+        return self.flag_favorites([graph.movies[id] for id in page], user_id)
+
+    def all(self, sort, order, limit=6, skip=0, user_id=None):
+        return self._page(
+            None, self.graph.movies, sort, order, limit, skip, user_id
+        )
+
+    def get_by_genre(self, name, sort="title", order="ASC", limit=6, skip=0, user_id=None):
+        return self._page(
+            ("genre", name), self.graph.genre_movies.get(name, ()),
+            sort, order, limit, skip, user_id,
+        )
+
+    def get_for_actor(self, id, sort="title", order="ASC", limit=6, skip=0, user_id=None):
+        return self._page(
+            ("actor", id), self.graph.acted_in.get(id, ()),
+            sort, order, limit, skip, user_id,
+        )
+
+    def get_for_director(self, id, sort="title", order="ASC", limit=6, skip=0, user_id=None):
+        return self._page(
+            ("director", id), self.graph.directed.get(id, ()),
+            sort, order, limit, skip, user_id,
+        )
+
+    def find_by_id(self, id, user_id=None):
+        self._query("find_by_id")
+        graph = self.graph
+        movie = graph.movies.get(id)
+
+        if movie is None:
+            raise NotFoundException()
+
+        movie = {
+            **movie,
+            "actors": [
+                {**graph.people[person], "role": role}
+                for person, role in graph.cast.get(id, ())
+            ],
+            "directors": [
+                dict(graph.people[person]) for person in graph.directors.get(id, ())
+            ],
+            "genres": [{"name": name} for name in graph.movie_genres.get(id, ())],
+            "ratingCount": len(graph.ratings.get(id, ())),
+        }
+
+        return self.flag_favorites([movie], user_id)[0]
+
+    def get_similar_movies(self, id, limit=6, skip=0, user_id=None):
+        self._query("get_similar_movies")
+        graph = self.graph
+
+        # Movies in common genres, scored by rating times genres in common.
+        # The Cypher pattern starts with (:Movie)-[:IN_GENRE|ACTED_IN|DIRECTED]->(),
+        # and ACTED_IN and DIRECTED point from people into movies, so of the
+        # three only IN_GENRE can match there: the database scores by genres
+        # alone too.
+        in_common = {}
+        for genre in graph.movie_genres.get(id, ()):
+            for other in graph.genre_movies[genre]:
+                if other != id:
+                    in_common[other] = in_common.get(other, 0) + 1
+
+        scored = []
+        for other, count in in_common.items():
+            movie = graph.movies[other]
+
+            if movie.get("imdbRating") is not None:
+                movie["score"] = movie["imdbRating"] * count
+                scored.append(movie)
+
+        scored.sort(key=lambda m: m["score"], reverse=True)
+
+        return self.flag_favorites(scored[skip:skip + limit], user_id)
+
+    def get_user_favorites(self, user_id):
+        if user_id is None:
+            return []
+
+        self._query("get_user_favorites")
+
+        return list(self.graph.favorites.get(user_id, ()))
+
+    def favorite_ids(self, user_id):
+        return frozenset(self.get_user_favorites(user_id))
+
+    def flag_favorites(self, movies, user_id):
+        return with_favorites(movies, self.favorite_ids(user_id))
+
+
+class MemoryGenreDAO(MemoryDAO):
+    def _summary(self, name):
+        summary = self.graph.genre_summary(name)
+
+        if summary is None:
+            return None
+
+        return {**self.graph.genres[name], **summary}
+
+    def all(self):
+        self._query("all")
+        genres = [
+            self._summary(name) for name in sorted(self.graph.genres)
+            if name != NO_GENRE
+        ]
+
+        return [genre for genre in genres if genre is not None]
+
+    def find(self, name):
+        self._query("find")
+
+        if name not in self.graph.genres or name == NO_GENRE:
+            raise NotFoundException()
+
+        genre = self._summary(name)
+
+        if genre is None:
+            raise NotFoundException()
+
+        return {"name": genre["name"], "movies": genre["movies"], "poster": genre["poster"]}
+
+
+class MemoryPeopleDAO(MemoryDAO):
+    def _with_counts(self, id):
+        graph = self.graph
+
+        return {
+            **graph.people[id],
+            "actedCount": len(graph.acted_in.get(id, ())),
+            "directedCount": len(graph.directed.get(id, ())),
+        }
+
+    def all(self, q, sort="name", order="ASC", limit=6, skip=0):
+        self._query("all")
+        people = self.graph.people.values()
+
+        if q:
+            people = [p for p in people if q in (p.get("name") or "")]
+
+        people = sort_records(list(people), sort, order)
+
+        return [dict(p) for p in people[skip:skip + limit]]
+
+    def find_by_id(self, id):
+        self._query("find_by_id")
+
+        if id not in self.graph.people:
+            raise NotFoundException("Person not found")
+
+        return self._with_counts(id)
+
+    def get_similar_people(self, id, limit=6, skip=0):
+        self._query("get_similar_people")
+        graph = self.graph
+
+        # Every relationship (other person, type) into a movie this person
+        # acted in or directed, other than the relationship it was reached by
+        mine = [(m, "ACTED_IN") for m in graph.acted_in.get(id, ())]
+        mine += [(m, "DIRECTED") for m in graph.directed.get(id, ())]
+
+        in_common = {}
+        for movie_id, my_type in mine:
+            movie = graph.movies.get(movie_id, {})
+            others = [(p, "ACTED_IN") for p, _ in graph.cast.get(movie_id, ())]
+            others += [(p, "DIRECTED") for p in graph.directors.get(movie_id, ())]
+
+            for person, type in others:
+                if person == id and type == my_type:
+                    continue
+
+                in_common.setdefault(person, []).append({
+                    "tmdbId": movie.get("tmdbId"),
+                    "title": movie.get("title"),
+                    "type": type,
+                })
+
+        people = [
+            {**self._with_counts(person), "inCommon": movies}
+            for person, movies in in_common.items()
+        ]
+        people.sort(key=lambda p: len(p["inCommon"]), reverse=True)
+
+        return people[skip:skip + limit]
+
+
+class MemoryRatingDAO(MemoryDAO):
+    def add(self, user_id, movie_id, rating):
+        self._query("add")
+        graph = self.graph
+
+        if user_id not in graph.users or movie_id not in graph.movies:
+            raise NotFoundException()
+
+        graph.add_relationship("RATED", user_id, movie_id, {
+            "rating": rating,
+            "timestamp": int(time.time() * 1000),
+        })
+
+        return {**graph.movies[movie_id], "rating": rating}
+
+    def for_movie(self, id, sort="timestamp", order="ASC", limit=6, skip=0):
+        self._query("for_movie")
+        graph = self.graph
+
+        reviews = [
+            {
+                "rating": rating["rating"],
+                "timestamp": rating["timestamp"],
+                "user": {"userId": user_id, "name": graph.users[user_id].get("name")},
+            }
+            for user_id, rating in graph.ratings.get(id, {}).items()
+        ]
+
+        return sort_records(reviews, sort, order)[skip:skip + limit]
+
+
+class MemoryFavoriteDAO(MemoryDAO):
+    def all(self, user_id, sort="title", order="ASC", limit=6, skip=0):
+        self._query("all")
+        graph = self.graph
+
+        movies = [graph.movies[id] for id in graph.favorites.get(user_id, ())]
+        movies = sort_records(movies, sort, order)
+
+        return [{**movie, "favorite": True} for movie in movies[skip:skip + limit]]
+
+    def add(self, user_id, movie_id):
+        self._query("add")
+        graph = self.graph
+
+        if user_id not in graph.users or movie_id not in graph.movies:
+            raise NotFoundException()
+
+        graph.add_relationship("HAS_FAVORITE", user_id, movie_id)
+
+        return {**graph.movies[movie_id], "favorite": True}
+
+    def remove(self, user_id, movie_id):
+        self._query("remove")
+        graph = self.graph
+
+        with graph.lock:
+            favorites = graph.favorites.get(user_id, {})
+
+            if movie_id not in favorites:
+                raise NotFoundException()
+
+            del favorites[movie_id]
+
+        return {**graph.movies[movie_id], "favorite": False}
+
+
+class MemoryAuthDAO(MemoryDAO, AuthDAO):
+    def __init__(self, graph, jwt_secret):
+        self.graph = graph
+        self.jwt_secret = jwt_secret
+
+    def register(self, email, plain_password, name):
+        with BCRYPT_DURATION.time(operation="hash"):
+            encrypted = bcrypt.hashpw(
+                plain_password.encode("utf8"), bcrypt.gensalt()
+            ).decode("utf8")
+
+        self._query("register")
+        graph = self.graph
+
+        with graph.lock:
+            if email in graph.users_by_email:
+                message = (
+                    "Node already exists with label `User` and property "
+                    "`email` = '%s'" % email
+                )
+                raise ValidationException(message, {"email": message})
+
+            user_id = str(uuid.uuid4())
+            graph.add_node("User", {
+                "userId": user_id,
+                "email": email,
+                "password": encrypted,
+                "name": name,
+            })
+
+        payload = {"userId": user_id, "email": email, "name": name}
+        payload["token"] = self._generate_token(payload)
+
+        return payload
+
+    def authenticate(self, email, plain_password):
+        self._query("authenticate")
+        graph = self.graph
+        user_id = graph.users_by_email.get(email)
+
+        if user_id is None:
+            return False
+
+        user = graph.users[user_id]
+
+        with BCRYPT_DURATION.time(operation="check"):
+            valid = bcrypt.checkpw(plain_password.encode("utf8"), user["password"].encode("utf8"))
+
+        if not valid:
+            return False
+
+        payload = {"userId": user["userId"], "email": user["email"], "name": user["name"]}
+        payload["token"] = self._generate_token(payload)
+
+        return payload
+
+
+"""
+The in-memory implementation of each Neo4j DAO
+"""
+MEMORY_DAOS = {
+    AuthDAO: MemoryAuthDAO,
+    FavoriteDAO: MemoryFavoriteDAO,
+    GenreDAO: MemoryGenreDAO,
+    MovieDAO: MemoryMovieDAO,
+    PeopleDAO: MemoryPeopleDAO,
+    RatingDAO: MemoryRatingDAO,
+}
+
+
+def memory_dao(dao_class, *args):
+    return MEMORY_DAOS[dao_class](get_graph(), *args)
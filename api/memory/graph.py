@@ -0,0 +1,295 @@
+"""
+An indexed, in-memory movie graph.
+
+Holds the same shape of data as the Neo4j database (Movie, Person, Genre and
+User nodes joined by ACTED_IN, DIRECTED, IN_GENRE, RATED and HAS_FAVORITE
+relationships) with an index for every traversal the DAOs make, so that the
+HTTP and serialization layers can be profiled without a database.
+
+Data is loaded as a stream of node and relationship records:
+
+    {"label": "Movie", "properties": {"tmdbId": "862", ...}}
+    {"type": "ACTED_IN", "start": "31", "end": "862", "properties": {"role": "Woody"}}
+
+Relationship endpoints are the key of each node: `tmdbId` for movies and
+people, `name` for genres and `userId` for users.
+
+Movies, the most numerous records, are kept in a `GrowingTable`: one array
+per property rather than one dict per movie, with their lists of languages
+and countries interned.  Reading a movie builds a new dict.
+"""
+
+import sys
+import threading
+from collections import defaultdict
+
+from api.memory.columns import GrowingTable, Keys
+
+"""
+Keys in the fixtures in `api/data.py` that hold nested records rather than
+properties of the node itself.
+"""
+NESTED_KEYS = {"actors", "directors", "genres", "favorite", "ratingCount", "ratings", "role"}
+
+NO_GENRE = "(no genres listed)"
+
+
+def sort_records(records, key, order="ASC"):
+    """
+    Sort records by a property the way Cypher's ORDER BY does: nulls come last
+    in ascending order and first in descending order.
+    """
+    present = [r for r in records if r.get(key) is not None]
+    missing = [r for r in records if r.get(key) is None]
+
+    present.sort(key=lambda r: r[key], reverse=order.upper() == "DESC")
+
+    if order.upper() == "DESC":
+        return missing + present
+
+    return present + missing
+
+
+class MemoryGraph:
+    def __init__(self):
+        self.lock = threading.RLock()
+
+        # Movies are stored column by column, people and genres as dicts
+        self.movies = GrowingTable("tmdbId")
+        self.people = {}
+        self.genres = {}
+        self.users = {}
+        self.users_by_email = {}
+
+        # movie -> [(person, role)], person -> {movie}
+        self.cast = defaultdict(list)
+        self.acted_in = defaultdict(set)
+
+        # movie -> [person], person -> {movie}
+        self.directors = defaultdict(list)
+        self.directed = defaultdict(set)
+
+        # movie -> [genre], genre -> {movie}
+        self.movie_genres = defaultdict(list)
+        self.genre_movies = defaultdict(set)
+
+        # movie -> {user: rating}, user -> {movie: rating}
+        self.ratings = defaultdict(dict)
+        self.user_ratings = defaultdict(dict)
+
+        # user -> {movie: None}, kept in insertion order
+        self.favorites = defaultdict(dict)
+
+        # Sorted movie ids per (scope, sort key), dropped whenever movies change
+        self._sorted = {}
+
+        # Number of emulated queries, one per `tx.run` the Neo4j DAOs would make
+        self.queries = 0
+
+    """
+    Loading
+    """
+
+    def add_node(self, label, properties):
+        properties = dict(properties)
+
+        # Nodes are merged on their key, like a Cypher MERGE
+        with self.lock:
+            if label == "Movie":
+                self.movies.merge(properties)
+                self._sorted.clear()
+            elif label == "Person":
+                self.people.setdefault(properties["tmdbId"], {}).update(properties)
+            elif label == "Genre":
+                self.genres.setdefault(properties["name"], {}).update(properties)
+            elif label == "User":
+                self.users.setdefault(properties["userId"], {}).update(properties)
+                if properties.get("email") is not None:
+                    self.users_by_email[properties["email"]] = properties["userId"]
+            else:
+                raise ValueError("Unknown label %s" % label)
+
+    def add_relationship(self, type, start, end, properties=None):
+        properties = properties or {}
+
+        # Relationships are merged too, at most one of each type per pair
+        with self.lock:
+            if type == "ACTED_IN":
+                if end not in self.acted_in[start]:
+                    self.cast[end].append((start, properties.get("role")))
+                    self.acted_in[start].add(end)
+                    self._sorted.clear()
+            elif type == "DIRECTED":
+                if end not in self.directed[start]:
+                    self.directors[end].append(start)
+                    self.directed[start].add(end)
+                    self._sorted.clear()
+            elif type == "IN_GENRE":
+                if start not in self.genre_movies[end]:
+                    self.movie_genres[start].append(sys.intern(end))
+                    self.genre_movies[end].add(start)
+                    self._sorted.clear()
+            elif type == "RATED":
+                rating = {
+                    "rating": properties.get("rating"),
+                    "timestamp": properties.get("timestamp"),
+                }
+                self.ratings[end][start] = rating
+                self.user_ratings[start][end] = rating
+            elif type == "HAS_FAVORITE":
+                self.favorites[start][end] = None
+            else:
+                raise ValueError("Unknown relationship type %s" % type)
+
+    def load(self, records):
+        """
+        Load a stream of node and relationship records
+        """
+        for record in records:
+            if "label" in record:
+                self.add_node(record["label"], record["properties"])
+            else:
+                self.add_relationship(
+                    record["type"], record["start"], record["end"],
+                    record.get("properties"),
+                )
+
+        return self
+
+    """
+    Indexes
+    """
+
+    def sorted_movie_ids(self, scope, movie_ids, sort):
+        """
+        The ids of the movies in `movie_ids` that have a `sort` property,
+        in ascending order of it.  The order is cached per (scope, sort), as
+        an array of movie rows.
+        """
+        key = (scope, sort)
+        ordered = self._sorted.get(key)
+
+        if ordered is None:
+            with self.lock:
+                rows = (self.movies.row(id) for id in movie_ids)
+                ordered = Keys(
+                    self.movies.order([row for row in rows if row is not None], sort),
+                    self.movies,
+                )
+                self._sorted[key] = ordered
+
+        return ordered
+
+    def page_movie_ids(self, scope, movie_ids, sort, order, skip, limit):
+        """
+        One page of `sorted_movie_ids`, in `order`, without copying the
+        rest of it
+        """
+        ordered = self.sorted_movie_ids(scope, movie_ids, sort)
+
+        if order.upper() != "DESC":
+            return list(ordered[skip:skip + limit])
+
+        end = max(len(ordered) - skip, 0)
+
+        return list(ordered[max(end - limit, 0):end])[::-1]
+
+    def genre_summary(self, name):
+        """
+        The number of movies in a genre and the poster of its highest rated
+        movie, or None if none of its movies has a rating and a poster
+        """
+        movies = self.movies
+        rated = [
+            row for row in map(movies.row, self.genre_movies.get(name, ()))
+            if row is not None
+            and movies.value(row, "imdbRating") is not None
+            and movies.value(row, "poster") is not None
+        ]
+
+        if not rated:
+            return None
+
+        top = max(rated, key=lambda row: movies.value(row, "imdbRating"))
+
+        return {"movies": len(self.genre_movies.get(name, ())), "poster": movies.value(top, "poster")}
+
+    """
+    Seeding
+    """
+
+    @classmethod
+    def from_fixtures(cls):
+        """
+        Build a graph from the hand-written records in `api/data.py`
+        """
+        return cls().load(fixture_records())
+
+    @classmethod
+    def synthetic(cls, movies=1000, seed=0):
+        """
+        Build a graph from a generated catalog of the given number of movies
+        """
+        # Imported here to keep the generator out of the default backend
+        from api.synthetic import Catalog
+
+        return cls().load(Catalog(movies=movies, seed=seed))
+
+
+def _movie_records(movie):
+    properties = {k: v for k, v in movie.items() if k not in NESTED_KEYS}
+    yield {"label": "Movie", "properties": properties}
+
+    for actor in movie.get("actors", []):
+        yield {"label": "Person", "properties": actor}
+        yield {"type": "ACTED_IN", "start": actor["tmdbId"], "end": movie["tmdbId"]}
+
+    for director in movie.get("directors", []):
+        yield {"label": "Person", "properties": director}
+        yield {"type": "DIRECTED", "start": director["tmdbId"], "end": movie["tmdbId"]}
+
+    for genre in movie.get("genres", []):
+        yield {"label": "Genre", "properties": {"name": genre["name"]}}
+        yield {"type": "IN_GENRE", "start": movie["tmdbId"], "end": genre["name"]}
+
+
+def fixture_records():
+    # Imported here so the fixtures are only loaded when they are needed
+    from api import data
+
+    for genre in data.genres:
+        yield {"label": "Genre", "properties": {"name": genre["name"]}}
+
+    for movie in data.popular + data.latest + data.similar + [data.goodfellas]:
+        yield from _movie_records(movie)
+
+    for person in data.people + [data.pacino]:
+        properties = {
+            k: v for k, v in person.items() if k not in ("actedCount", "directedCount")
+        }
+        yield {"label": "Person", "properties": properties}
+
+    for role in data.roles:
+        yield from _movie_records(role)
+        yield {
+            "type": "ACTED_IN",
+            "start": data.pacino["tmdbId"],
+            "end": role["tmdbId"],
+            "properties": {"role": role.get("role")},
+        }
+
+    for review in data.ratings:
+        user = review["user"]
+        yield {
+            "label": "User",
+            "properties": {"userId": user["tmdbId"], "name": user["name"]},
+        }
+        yield {
+            "type": "RATED",
+            "start": user["tmdbId"],
+            "end": data.goodfellas["tmdbId"],
+            "properties": {
+                "rating": review["imdbRating"],
+                "timestamp": review["timestamp"],
+            },
+        }
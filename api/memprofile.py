@@ -0,0 +1,309 @@
+"""
+Memory attribution per route and DAO method with `tracemalloc`.
+
+With `MEMORY_PROFILING=true` the app traces every allocation (keeping
+`MEMORY_PROFILING_FRAMES` frames of each traceback) and records, for every
+request:
+
+* its peak: the most memory traced at any point during the request, above
+  what was traced when it started
+* what it retained: the memory still traced when the response is ready,
+  which includes the response itself and anything the request left behind
+
+The same two numbers are kept for every DAO method called through `get_dao`,
+where the retained memory is mostly the size of the returned records.  With
+`MEMORY_PROFILING_SNAPSHOTS=true` (the default) the traces are also
+snapshotted around each request, and the lines that allocated the most
+memory that was still alive at the end of the request are added up per
+route.
+
+`GET /api/admin/memory` returns the totals.  Tracing slows every allocation
+down and snapshots take time proportional to the traced memory, so this is
+a diagnostic mode.  The peak is shared by all threads: serve one request at
+a time (a single thread per worker) while profiling.
+
+`api.testing.assert_no_leak` uses the same machinery to check that repeating
+a request does not grow memory.
+"""
+
+import gc
+import linecache
+import threading
+import tracemalloc
+from collections import Counter
+
+from flask import current_app, g, request
+
+"""
+Allocations made by these files are the profiler's own
+"""
+IGNORED = {tracemalloc.__file__, linecache.__file__, __file__}
+
+
+class Usage:
+    """
+    Peak and retained bytes over a number of calls
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.peak_total = 0
+        self.peak_max = 0
+        self.retained_total = 0
+        self.retained_max = 0
+
+    def add(self, peak, retained):
+        self.count += 1
+        self.peak_total += peak
+        self.peak_max = max(self.peak_max, peak)
+        self.retained_total += retained
+        self.retained_max = max(self.retained_max, retained)
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "peakBytes": {
+                "mean": self.peak_total / self.count if self.count else 0,
+                "max": self.peak_max,
+            },
+            "retainedBytes": {
+                "mean": self.retained_total / self.count if self.count else 0,
+                "max": self.retained_max,
+                "total": self.retained_total,
+            },
+        }
+
+
+def site(frame):
+    return "%s:%d" % (frame.filename, frame.lineno)
+
+
+def allocation_sites(before, after, limit=10):
+    """
+    The lines that allocated the most memory between two snapshots, as
+    (site, bytes, allocations)
+    """
+    # Filtering the snapshots first would take longer than comparing them
+    diffs = [
+        diff for diff in after.compare_to(before, "lineno")
+        if diff.size_diff > 0 and diff.traceback[0].filename not in IGNORED
+    ]
+
+    return [
+        (site(diff.traceback[0]), diff.size_diff, diff.count_diff)
+        for diff in diffs[:limit]
+    ]
+
+
+class Measurement:
+    """
+    Tracks the peak of one request across the DAO calls that reset it
+    """
+
+    def __init__(self):
+        self.start, _ = tracemalloc.get_traced_memory()
+        self.peak = self.start
+        tracemalloc.reset_peak()
+
+    def checkpoint(self):
+        current, peak = tracemalloc.get_traced_memory()
+        self.peak = max(self.peak, peak)
+
+        return current
+
+    def finish(self):
+        current = self.checkpoint()
+
+        return self.peak - self.start, current - self.start
+
+
+class MemoryProfile:
+    def __init__(self, frames=10, snapshots=True, sites=20):
+        self.frames = frames
+        self.snapshots = snapshots
+        self.sites = sites
+        self.routes = {}
+        self.daos = {}
+        self.route_sites = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+
+    def _usage(self, table, key):
+        usage = table.get(key)
+
+        if usage is None:
+            usage = table[key] = Usage()
+
+        return usage
+
+    def dao_hook(self, dao, name, method, call):
+        """
+        `api.proxy` hook attributing the memory allocated by each DAO method
+        """
+        def profiled(*args, **kwargs):
+            request_measurement = g.get("memory")
+            before = request_measurement.checkpoint() if request_measurement else None
+
+            measurement = Measurement()
+
+            try:
+                return call(*args, **kwargs)
+            finally:
+                peak, retained = measurement.finish()
+                self.record_dao(name, method, peak, retained)
+
+                # Carry the DAO call's peak over to the request
+                if request_measurement is not None:
+                    request_measurement.peak = max(
+                        request_measurement.peak, before + peak
+                    )
+
+        return profiled
+
+    def record_dao(self, name, method, peak, retained):
+        with self._lock:
+            self._usage(self.daos, "%s.%s" % (name, method)).add(peak, retained)
+
+    def record_request(self, route, peak, retained, sites=()):
+        with self._lock:
+            self._usage(self.routes, route).add(peak, retained)
+
+            if sites:
+                counter = self.route_sites.setdefault(route, Counter())
+
+                for line, size, _ in sites:
+                    counter[line] += size
+
+    def report(self, limit=10):
+        with self._lock:
+            return {
+                "tracedBytes": dict(zip(("current", "peak"), tracemalloc.get_traced_memory())),
+                "routes": {route: usage.as_dict() for route, usage in self.routes.items()},
+                "daos": {name: usage.as_dict() for name, usage in self.daos.items()},
+                "sites": {
+                    route: [{"site": line, "bytes": size} for line, size in counter.most_common(limit)]
+                    for route, counter in self.route_sites.items()
+                },
+            }
+
+
+"""
+Request hooks
+"""
+
+
+def start_memory_profile():
+    """
+    `before_request` handler
+    """
+    profile = current_app.memory_profile
+
+    g.memory_snapshot = tracemalloc.take_snapshot() if profile.snapshots else None
+    g.memory = Measurement()
+
+
+def stop_memory_profile(response):
+    """
+    `after_request` handler
+    """
+    measurement = g.pop("memory", None)
+
+    if measurement is None:
+        return response
+
+    peak, retained = measurement.finish()
+    before = g.pop("memory_snapshot", None)
+    profile = current_app.memory_profile
+
+    sites = ()
+    if before is not None:
+        sites = allocation_sites(before, tracemalloc.take_snapshot(), profile.sites)
+
+    route = "%s %s" % (
+        request.method,
+        request.url_rule.rule if request.url_rule is not None else "<unmatched>",
+    )
+    profile.record_request(route, peak, retained, sites)
+
+    return response
+
+
+def init_memory_profile(app):
+    """
+    Trace allocations if `MEMORY_PROFILING` is set
+    """
+    if not app.config.get("MEMORY_PROFILING"):
+        app.memory_profile = None
+        return
+
+    app.memory_profile = MemoryProfile(
+        app.config.get("MEMORY_PROFILING_FRAMES") or 10,
+        app.config.get("MEMORY_PROFILING_SNAPSHOTS", True),
+    )
+    app.memory_profile.start()
+
+    app.before_request(start_memory_profile)
+    app.after_request(stop_memory_profile)
+
+
+"""
+Leak detection
+"""
+
+
+class LeakReport:
+    def __init__(self, iterations, growth, sites, samples):
+        self.iterations = iterations
+        self.growth = growth
+        self.sites = sites
+        self.samples = samples
+
+    @property
+    def per_iteration(self):
+        return self.growth / self.iterations
+
+    def __str__(self):
+        lines = ["%d bytes retained over %d iterations (%.1f per iteration)" % (
+            self.growth, self.iterations, self.per_iteration)]
+        lines += ["  %s: %+d bytes in %+d blocks" % site for site in self.sites]
+
+        return "\n".join(lines)
+
+
+def measure_growth(fn, iterations=200, warmup=20, frames=10, limit=10):
+    """
+    Call `fn` `warmup` times, then `iterations` more times, and report how
+    much traced memory the second batch left behind.  Garbage is collected
+    before each measurement so that only reachable memory counts.
+    """
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start(frames)
+
+    try:
+        for _ in range(warmup):
+            fn()
+
+        gc.collect()
+        before = tracemalloc.take_snapshot()
+        baseline, _ = tracemalloc.get_traced_memory()
+        samples = []
+
+        for i in range(iterations):
+            fn()
+
+            if (i + 1) % max(iterations // 4, 1) == 0:
+                gc.collect()
+                samples.append(tracemalloc.get_traced_memory()[0] - baseline)
+
+        gc.collect()
+        after = tracemalloc.take_snapshot()
+        growth = tracemalloc.get_traced_memory()[0] - baseline
+
+        return LeakReport(iterations, growth, allocation_sites(before, after, limit), samples)
+    finally:
+        if started:
+            tracemalloc.stop()
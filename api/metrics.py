@@ -0,0 +1,553 @@
+"""
+Application metrics in the Prometheus text exposition format.
+
+    GET /api/status/metrics
+
+Counters, gauges and histograms are kept in the process-wide `registry` and
+cover:
+
+* HTTP requests per route, method and status, with a latency histogram
+* the time taken by every DAO method (through the proxy added by `get_dao`)
+* Neo4j queries and transaction functions, including the retries the driver
+  made, reported by `InstrumentedDriver` (see `api.instrumentation`)
+* the driver's connection pool (see `api.pool`)
+* time spent hashing and checking passwords with bcrypt
+* time spent serializing JSON responses
+* hits, misses and evictions of the application's caches
+
+Under a pre-forking server every worker has its own registry.  When
+`METRICS_DIR` is set each process writes its values to
+`METRICS_DIR/metrics-<pid>.json` every `METRICS_FLUSH_INTERVAL` seconds (and
+at exit), and whichever worker serves the scrape adds up the files of all
+processes: counters and histograms of every process that has ever run, gauges
+of the processes that are still alive.  The directory should be emptied when
+the server is (re)started.
+"""
+
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+from flask import g, request
+from flask.json.provider import DefaultJSONProvider
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+"""
+Upper bounds (in seconds) of the latency histogram buckets
+"""
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, registry, name, help, labels=()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+
+    def key(self, labels):
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def snapshot(self):
+        return {
+            "type": self.type,
+            "help": self.help,
+            "labels": list(self.labels),
+            "samples": [[list(key), value] for key, value in self.values.items()],
+        }
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        key = self.key(labels)
+
+        with self.registry.lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    """
+    Values are stored per label set as the count in each bucket (the last
+    one is +Inf), followed by the sum and the count of observations.
+    """
+    type = "histogram"
+
+    def __init__(self, registry, name, help, labels=(), buckets=BUCKETS):
+        super().__init__(registry, name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+
+        with self.registry.lock:
+            sample = self.values.get(key)
+
+            if sample is None:
+                sample = self.values[key] = [0] * (len(self.buckets) + 3)
+
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    sample[i] += 1
+                    break
+            else:
+                sample[len(self.buckets)] += 1
+
+            sample[-2] += value
+            sample[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        snapshot = super().snapshot()
+        snapshot["buckets"] = list(self.buckets)
+        snapshot["samples"] = [[key, list(value)] for key, value in snapshot["samples"]]
+
+        return snapshot
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.collectors = []
+        self.directory = None
+        self.interval = None
+        self._flusher_pid = None
+
+    def _add(self, cls, name, *args, **kwargs):
+        if name not in self.metrics:
+            self.metrics[name] = cls(self, name, *args, **kwargs)
+
+        return self.metrics[name]
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter, name, help, labels)
+
+    def gauge(self, name, help, labels=()):
+        return self._add(Gauge, name, help, labels)
+
+    def histogram(self, name, help, labels=(), buckets=BUCKETS):
+        return self._add(Histogram, name, help, labels, buckets)
+
+    def snapshot(self):
+        """
+        The values of this process, after refreshing the collected gauges
+        """
+        for collect in list(self.collectors):
+            collect()
+
+        with self.lock:
+            return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+    def reset(self):
+        """
+        Forget every value, as in a freshly forked child whose parent's
+        values are already accounted for
+        """
+        self.lock = threading.Lock()
+
+        for metric in self.metrics.values():
+            metric.values = {}
+
+    """
+    Multi-process aggregation
+    """
+
+    def path(self, pid=None):
+        return os.path.join(self.directory, "metrics-%d.json" % (pid or os.getpid()))
+
+    def write(self):
+        if self.directory is None:
+            return
+
+        path = self.path()
+        temporary = "%s.tmp" % path
+
+        with open(temporary, "w") as f:
+            json.dump({"pid": os.getpid(), "metrics": self.snapshot()}, f)
+
+        os.replace(temporary, path)
+
+    def start_flusher(self, directory, interval=1.0):
+        """
+        Write this process's values to `directory` every `interval` seconds
+        """
+        self.directory = directory
+        self.interval = interval
+
+        if self._flusher_pid == os.getpid():
+            return
+
+        self._flusher_pid = os.getpid()
+        os.makedirs(directory, exist_ok=True)
+
+        def flush():
+            while True:
+                time.sleep(self.interval)
+
+                try:
+                    self.write()
+                except OSError:
+                    pass
+
+        threading.Thread(target=flush, name="metrics-flusher", daemon=True).start()
+
+    def collect(self):
+        """
+        The values of every process writing to `directory`, or of this
+        process alone
+        """
+        if self.directory is None:
+            return self.snapshot()
+
+        self.write()
+        snapshots = []
+
+        for path in glob.glob(os.path.join(self.directory, "metrics-*.json")):
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+
+        return aggregate(snapshots)
+
+    def after_fork(self):
+        self.reset()
+
+        if self.directory is not None:
+            self._flusher_pid = None
+            self.start_flusher(self.directory, self.interval)
+
+
+def alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+
+    return True
+
+
+def aggregate(snapshots):
+    """
+    Add up the snapshots of several processes.  Gauges only count for live
+    processes.
+    """
+    merged = {}
+
+    for snapshot in snapshots:
+        live = snapshot["pid"] == os.getpid() or alive(snapshot["pid"])
+
+        for name, metric in snapshot["metrics"].items():
+            if metric["type"] == "gauge" and not live:
+                continue
+
+            target = merged.setdefault(name, {**metric, "samples": {}})
+
+            for key, value in metric["samples"]:
+                key = tuple(key)
+                current = target["samples"].get(key)
+
+                if current is None:
+                    target["samples"][key] = value
+                elif isinstance(value, list):
+                    target["samples"][key] = [a + b for a, b in zip(current, value)]
+                else:
+                    target["samples"][key] = current + value
+
+    for metric in merged.values():
+        metric["samples"] = [[list(key), value] for key, value in metric["samples"].items()]
+
+    return merged
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+
+    if not pairs:
+        return ""
+
+    return "{%s}" % ",".join('%s="%s"' % (name, _escape(value)) for name, value in pairs)
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def exposition(snapshot):
+    """
+    Format a snapshot in the Prometheus text exposition format
+    """
+    lines = []
+
+    for name in sorted(snapshot):
+        metric = snapshot[name]
+        lines.append("# HELP %s %s" % (name, metric["help"]))
+        lines.append("# TYPE %s %s" % (name, metric["type"]))
+
+        for key, value in sorted(metric["samples"]):
+            if metric["type"] != "histogram":
+                lines.append("%s%s %s" % (name, _labels(metric["labels"], key), _number(value)))
+                continue
+
+            cumulative = 0
+            bounds = metric["buckets"] + [float("inf")]
+
+            for bound, count in zip(bounds, value):
+                cumulative += count
+                lines.append("%s_bucket%s %d" % (
+                    name, _labels(metric["labels"], key, [("le", _number(bound))]), cumulative
+                ))
+
+            lines.append("%s_sum%s %s" % (name, _labels(metric["labels"], key), _number(value[-2])))
+            lines.append("%s_count%s %d" % (name, _labels(metric["labels"], key), value[-1]))
+
+    return "\n".join(lines) + "\n"
+
+
+"""
+The process-wide registry and the application's metrics
+"""
+registry = Registry()
+
+HTTP_REQUESTS = registry.counter(
+    "http_requests_total", "HTTP requests served", ("method", "route", "status"))
+HTTP_DURATION = registry.histogram(
+    "http_request_duration_seconds", "Time to handle an HTTP request", ("method", "route"))
+
+DAO_DURATION = registry.histogram(
+    "dao_method_duration_seconds", "Time spent in DAO methods", ("dao", "method"))
+DAO_ERRORS = registry.counter(
+    "dao_method_errors_total", "DAO method calls that raised", ("dao", "method", "error"))
+
+QUERIES = registry.counter(
+    "neo4j_queries_total", "Queries run through the driver", ("mode", "outcome"))
+QUERY_DURATION = registry.histogram(
+    "neo4j_query_duration_seconds", "Time from running a query to consuming its result", ("mode",))
+TRANSACTIONS = registry.counter(
+    "neo4j_transactions_total", "Transaction functions run through the driver", ("mode", "outcome"))
+RETRIES = registry.counter(
+    "neo4j_transaction_retries_total", "Transaction function attempts retried by the driver", ("mode",))
+
+POOL_CONNECTIONS = registry.gauge(
+    "neo4j_pool_connections", "Connections in the driver's pool", ("state",))
+POOL_MAX_SIZE = registry.gauge(
+    "neo4j_pool_max_size", "Maximum size of the driver's pool")
+POOL_ACQUISITIONS = registry.counter(
+    "neo4j_pool_acquisitions_total", "Connections acquired from the driver's pool", ("outcome",))
+POOL_WAIT = registry.counter(
+    "neo4j_pool_acquisition_wait_seconds_total", "Time spent waiting for pooled connections")
+
+BCRYPT_DURATION = registry.histogram(
+    "bcrypt_duration_seconds", "Time spent hashing and checking passwords", ("operation",),
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5))
+JSON_DURATION = registry.histogram(
+    "json_serialization_duration_seconds", "Time spent serializing JSON responses",
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1))
+
+CACHE_REQUESTS = registry.counter(
+    "cache_requests_total", "Cache lookups", ("cache", "result"))
+CACHE_EVICTIONS = registry.counter(
+    "cache_evictions_total", "Entries evicted from caches", ("cache",))
+CACHE_REVALIDATION = registry.histogram(
+    "cache_revalidation_duration_seconds", "Time to recompute a cached result",
+    ("cache", "mode"))
+
+
+def cache_hit(cache):
+    CACHE_REQUESTS.inc(cache=cache, result="hit")
+
+
+def cache_miss(cache):
+    CACHE_REQUESTS.inc(cache=cache, result="miss")
+
+
+def cache_stale(cache):
+    CACHE_REQUESTS.inc(cache=cache, result="stale")
+
+
+def cache_eviction(cache, count=1):
+    CACHE_EVICTIONS.inc(count, cache=cache)
+
+
+"""
+Request hooks
+"""
+
+
+def start_request_timer():
+    """
+    `before_request` handler
+    """
+    g.metrics_started = time.perf_counter()
+
+
+def record_request(response):
+    """
+    `after_request` handler that counts and times the request by route
+    """
+    started = g.get("metrics_started")
+
+    if started is None:
+        return response
+
+    route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+
+    HTTP_REQUESTS.inc(method=request.method, route=route, status=response.status_code)
+    HTTP_DURATION.observe(time.perf_counter() - started, method=request.method, route=route)
+
+    return response
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """
+    Times the serialization of every JSON response
+    """
+
+    def response(self, *args, **kwargs):
+        with JSON_DURATION.time():
+            return super().response(*args, **kwargs)
+
+
+def time_dao_method(dao, name, method, call):
+    """
+    `api.proxy` hook timing every DAO method call
+    """
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+
+        try:
+            return call(*args, **kwargs)
+        except Exception as e:
+            DAO_ERRORS.inc(dao=name, method=method, error=type(e).__name__)
+            raise
+        finally:
+            DAO_DURATION.observe(time.perf_counter() - start, dao=name, method=method)
+
+    return timed
+
+
+class MetricsListener:
+    """
+    A query listener (see `api.instrumentation`) counting queries and
+    transaction retries
+    """
+
+    def query_finished(self, event):
+        mode = event.mode or "AUTO"
+
+        QUERIES.inc(mode=mode, outcome="error" if event.error is not None else "ok")
+        QUERY_DURATION.observe(event.duration, mode=mode)
+
+    def transaction_finished(self, mode, attempts, error):
+        TRANSACTIONS.inc(mode=mode, outcome="error" if error is not None else "ok")
+
+        if attempts > 1:
+            RETRIES.inc(attempts - 1, mode=mode)
+
+
+listener = MetricsListener()
+
+"""
+Pool metrics are read from the pools of every app in this process when the
+metrics are collected.  A pool keeps running totals, which the counters are
+advanced by: `_counted` holds the totals each pool had at the last
+collection, so a driver replaced after a fork or a reconnect starts from
+zero without the counters going back.
+"""
+_apps = weakref.WeakSet()
+_counted = weakref.WeakKeyDictionary()
+_counted_lock = threading.Lock()
+
+
+def collect_pools():
+    pools = [
+        app.pool_metrics for app in list(_apps)
+        if getattr(app, "pool_metrics", None) is not None
+    ]
+    snapshots = [pool.snapshot() for pool in pools]
+
+    POOL_CONNECTIONS.set(sum(s["inUse"] for s in snapshots), state="in_use")
+    POOL_CONNECTIONS.set(sum(s["idle"] for s in snapshots), state="idle")
+    POOL_MAX_SIZE.set(sum(s["maxSize"] for s in snapshots))
+
+    with _counted_lock:
+        for pool, s in zip(pools, snapshots):
+            totals = (s["acquisitions"], s["acquisitionFailures"], s["acquisitionWaitMs"]["total"] / 1000)
+            ok, failed, wait = (
+                total - counted for total, counted in zip(totals, _counted.get(pool, (0, 0, 0.0)))
+            )
+            _counted[pool] = totals
+
+            POOL_ACQUISITIONS.inc(ok, outcome="ok")
+            POOL_ACQUISITIONS.inc(failed, outcome="failed")
+            POOL_WAIT.inc(wait)
+
+
+registry.collectors.append(collect_pools)
+
+
+def init_metrics(app):
+    """
+    Record the metrics of `app`
+    """
+    _apps.add(app)
+
+    app.json = TimedJSONProvider(app)
+    app.query_listeners.append(listener)
+    app.before_request(start_request_timer)
+    app.after_request(record_request)
+
+    if app.config.get("METRICS_DIR"):
+        registry.start_flusher(app.config["METRICS_DIR"], app.config.get("METRICS_FLUSH_INTERVAL") or 1.0)
+
+
+def _write_at_exit():
+    try:
+        registry.write()
+    except OSError:
+        pass
+
+
+atexit.register(_write_at_exit)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=registry.after_fork)
@@ -1,3 +1,7 @@
+import os
+import threading
+import weakref
+
 from flask import Flask, current_app
 
 # tag::import[]
@@ -5,21 +9,103 @@ from neo4j import GraphDatabase
 
 # end::import[]
 
+from api.bookmarks import request_bookmarks
+from api.cache import CachedMethods
+from api.instrumentation import InstrumentedDriver
+from api.metrics import time_dao_method
+from api.pool import instrument_pool
+from api.proxy import wrap_dao
+from api.replay import RecordingDriver, ReplayDriver, parse_latency
+
+"""
+Connection pool settings that can be tuned through the app config, mapped to
+the name of the matching Driver configuration option.
+"""
+POOL_SETTINGS = {
+    "NEO4J_MAX_CONNECTION_POOL_SIZE": "max_connection_pool_size",
+    "NEO4J_CONNECTION_ACQUISITION_TIMEOUT": "connection_acquisition_timeout",
+    "NEO4J_MAX_CONNECTION_LIFETIME": "max_connection_lifetime",
+    "NEO4J_FETCH_SIZE": "fetch_size",
+    "NEO4J_KEEP_ALIVE": "keep_alive",
+}
+
+
+def driver_config(config):
+    """
+    Build the keyword arguments for `GraphDatabase.driver` from the app config,
+    leaving out anything that has not been set so the driver default applies.
+    """
+    return {
+        option: config[key]
+        for key, option in POOL_SETTINGS.items()
+        if config.get(key) is not None
+    }
+
+"""
+Apps that own a driver, so their drivers can be replaced after a fork, and
+drivers inherited from a parent process.  Inherited drivers are kept alive and
+never closed: closing them (or letting them be garbage collected) would send
+GOODBYE over sockets that still belong to the parent.
+"""
+_apps = weakref.WeakSet()
+_inherited = []
+_fork_lock = threading.Lock()
+
 """
 Initiate the Neo4j Driver
 """
 
 
 # tag::initDriver[]
-def init_driver(uri, username, password):
-    current_app.driver = GraphDatabase.driver(uri, auth=(username, password))
-    current_app.driver.verify_connectivity()
+def init_driver(uri, username, password, database=None, verify=True, **config):
+    replay = current_app.config.get("NEO4J_REPLAY")
+
+    if replay:
+        # Answer every query from a recording instead of the database
+        current_app.driver = ReplayDriver.from_file(
+            replay, parse_latency(current_app.config.get("NEO4J_REPLAY_LATENCY"))
+        )
+        current_app.pool_metrics = None
+    else:
+        current_app.driver = GraphDatabase.driver(uri, auth=(username, password), **config)
+        current_app.pool_metrics = instrument_pool(current_app.driver)
+
+        if current_app.config.get("NEO4J_RECORD"):
+            current_app.driver = RecordingDriver(
+                current_app.driver, current_app.config.get("NEO4J_RECORD")
+            )
+
+    # Count sessions, queries and rows per request, see api.instrumentation
+    current_app.driver = InstrumentedDriver(
+        current_app.driver, getattr(current_app, "query_listeners", None)
+    )
+
+    # Remember how the driver was built so a forked worker can build its own
+    current_app.driver_pid = os.getpid()
+    current_app.driver_settings = (uri, username, password, database, config)
+    _apps.add(current_app._get_current_object())
+
+    # Verifying against the configured database also fetches and caches its
+    # routing table, so the first request doesn't have to.  With `verify`
+    # disabled this is left to `api.warmup`.
+    if verify:
+        verify_connectivity(current_app.driver, database)
+
     return current_app.driver
 
 
 # end::initDriver[]
 
 
+def verify_connectivity(driver, database=None):
+    # Session configuration for verify_connectivity is experimental in the
+    # 5.0 driver, so only pass the database when one has been configured
+    if database is None:
+        driver.verify_connectivity()
+    else:
+        driver.verify_connectivity(database=database)
+
+
 """
 Get the instance of the Neo4j Driver created in the `initDriver` function
 """
@@ -27,11 +113,60 @@ Get the instance of the Neo4j Driver created in the `initDriver` function
 
 # tag::getDriver[]
 def get_driver():
+    # A driver created before a fork must not be used by the child
+    if getattr(current_app, "driver_pid", None) not in (None, os.getpid()):
+        reinit_driver(current_app._get_current_object())
+
     return current_app.driver
 
 
 # end::getDriver[]
 
+"""
+Create a DAO bound to the current driver, the configured database and the
+bookmarks of the current request (see `api.bookmarks`).
+
+Passing the database name explicitly means sessions never have to ask the
+server to resolve the user's home database, which costs an extra round-trip
+per session on a routing (`neo4j://`) cluster.
+
+With `DAO_BACKEND=memory` the matching DAO from `api.memory.dao` is returned
+instead, backed by an in-memory graph rather than the driver.
+
+With `CACHE` its reads are cached, see `api.cache`.
+
+Either way the DAO's methods are timed, see `api.metrics`, and with
+`MEMORY_PROFILING` their allocations are measured, see `api.memprofile`, and
+with tracing each call gets a span, see `api.tracing`.
+"""
+
+
+def get_dao(dao_class, *args):
+    if current_app.config.get("DAO_BACKEND") == "memory":
+        from api.memory.dao import memory_dao
+
+        dao = memory_dao(dao_class, *args)
+    else:
+        dao = dao_class(
+            get_driver(),
+            *args,
+            database=current_app.config.get("NEO4J_DATABASE"),
+            bookmarks=request_bookmarks(),
+        )
+
+    cache = getattr(current_app, "cache", None)
+    memory_profile = getattr(current_app, "memory_profile", None)
+    tracer = getattr(current_app, "tracer", None)
+
+    # Innermost first: cached calls are timed, profiled and traced too
+    return wrap_dao(dao, dao_class.__name__, [
+        CachedMethods(cache) if cache is not None else None,
+        time_dao_method,
+        memory_profile.dao_hook if memory_profile is not None else None,
+        tracer.dao_hook if tracer is not None else None,
+    ])
+
+
 """
 If the driver has been instantiated, close it and all remaining open sessions
 """
@@ -40,10 +175,88 @@ If the driver has been instantiated, close it and all remaining open sessions
 # tag::closeDriver[]
 def close_driver():
     if current_app.driver != None:
-        current_app.driver.close()
+        if getattr(current_app, "driver_pid", os.getpid()) == os.getpid():
+            current_app.driver.close()
+        else:
+            _inherited.append(current_app.driver)
+
         current_app.driver = None
+        current_app.pool_metrics = None
 
         return current_app.driver
 
 
 # end::closeDriver[]
+
+
+"""
+Multi-process servers.
+
+A driver's connections are sockets, and a forked child shares them with its
+parent.  If both use the same connection their messages interleave and the
+server sees corrupted traffic.  After a fork each app's driver is therefore
+set aside (not closed) and replaced by a new one owned by the child.
+
+`get_driver` checks the owning process and builds the child's driver on
+first use, so children that never touch the database (a multiprocessing
+pool, say) never build one.  Server workers build theirs straight away:
+`gunicorn.conf.py` calls `after_fork` from its `post_fork` hook, and
+`close_drivers` on worker exit.
+"""
+
+
+def reinit_driver(app):
+    """
+    Replace a driver inherited from a parent process with a new one
+    """
+    with _fork_lock:
+        if app.driver is None or app.driver_pid == os.getpid():
+            return app.driver
+
+        _inherited.append(app.driver)
+        uri, username, password, database, config = app.driver_settings
+
+        with app.app_context():
+            init_driver(uri, username, password, database, verify=False, **config)
+
+        if app.config.get("NEO4J_DEFERRED_STARTUP") and not app.config.get("NEO4J_REPLAY"):
+            from api.warmup import start_warmup
+
+            app.readiness = start_warmup(
+                app.driver,
+                database,
+                app.config.get("NEO4J_WARMUP_CONNECTIONS"),
+                app.config.get("NEO4J_WARMUP_RETRIES"),
+            )
+
+        return app.driver
+
+
+def _reset_fork_lock():
+    global _fork_lock
+
+    # The lock may have been held by another thread of the parent at the
+    # moment of the fork
+    _fork_lock = threading.Lock()
+
+
+def after_fork():
+    """
+    Give every app in this (child) process its own driver now, rather than
+    on first use
+    """
+    for app in list(_apps):
+        reinit_driver(app)
+
+
+def close_drivers():
+    """
+    Close the drivers owned by this process, for example on worker exit
+    """
+    for app in list(_apps):
+        with app.app_context():
+            close_driver()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_fork_lock)
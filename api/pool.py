@@ -0,0 +1,84 @@
+"""
+Connection pool telemetry for the Neo4j Driver.
+
+The driver does not publish metrics for its connection pool, so `PoolMetrics`
+wraps the pool's `acquire` method to time how long callers wait for a
+connection and to count acquisitions that fail (for example when
+`connection_acquisition_timeout` expires because every connection is in use).
+Pool occupancy is read from the pool itself whenever a snapshot is taken.
+The wait is also added to the current trace span, if any.
+"""
+
+import threading
+import time
+
+from api.tracing import annotate
+
+
+class PoolMetrics:
+    def __init__(self, pool):
+        self.pool = pool
+        self._lock = threading.Lock()
+        self.acquisitions = 0
+        self.failures = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+        self._acquire = pool.acquire
+        pool.acquire = self.acquire
+
+    def acquire(self, *args, **kwargs):
+        start = time.perf_counter()
+
+        try:
+            connection = self._acquire(*args, **kwargs)
+        except Exception:
+            with self._lock:
+                self.failures += 1
+            raise
+
+        waited = time.perf_counter() - start
+
+        with self._lock:
+            self.acquisitions += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+        annotate("neo4j.pool.wait_ms", waited * 1000, accumulate=True)
+
+        return connection
+
+    def snapshot(self):
+        in_use = 0
+        idle = 0
+
+        with self.pool.lock:
+            for connections in self.pool.connections.values():
+                for connection in connections:
+                    if connection.in_use:
+                        in_use += 1
+                    else:
+                        idle += 1
+
+        with self._lock:
+            return {
+                "maxSize": self.pool.pool_config.max_connection_pool_size,
+                "size": in_use + idle,
+                "inUse": in_use,
+                "idle": idle,
+                "acquisitions": self.acquisitions,
+                "acquisitionFailures": self.failures,
+                "acquisitionWaitMs": {
+                    "total": self.wait_total * 1000,
+                    "max": self.wait_max * 1000,
+                    "mean": (self.wait_total / self.acquisitions * 1000)
+                    if self.acquisitions else 0.0,
+                },
+            }
+
+
+def instrument_pool(driver):
+    """
+    Attach `PoolMetrics` to the driver's connection pool and return it.
+    """
+    return PoolMetrics(driver._pool)
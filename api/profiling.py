@@ -0,0 +1,307 @@
+"""
+On-demand profiling of single requests.
+
+A request is profiled when it carries a valid `X-Profile` header, or at
+random for a share `PROFILE_SAMPLE_RATE` of all requests.  The header holds
+an expiry time and an HMAC of it and the request path, made with
+`PROFILE_SECRET`:
+
+    python -m api.profiling /api/movies/ --secret "$PROFILE_SECRET"
+
+The request then runs under one of two profilers (`PROFILE_MODE`):
+
+* `sampling` (the default) records the request thread's stack every
+  `PROFILE_INTERVAL` seconds from a background thread.  Its overhead is
+  low and does not depend on how many calls the request makes.
+* `tracing` records every Python and C call on the request thread with
+  `sys.setprofile` and weighs each stack by the microseconds spent in it.
+  It is exact but can slow the request down several times.
+
+The stacks are written to `PROFILE_DIR` in the collapsed format read by
+`flamegraph.pl` and speedscope, one `<id>.collapsed` file per request, under
+a root frame naming the method and route.  A `<id>.json` file next to it
+records the route, path, query parameters, status and duration, and the
+response carries the id in an `X-Profile-Id` header.  Only the newest
+`PROFILE_KEEP` profiles are kept: older ones are deleted as new ones are
+written.
+
+When neither trigger is configured the only cost is one check per request.
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from flask import current_app, g, request
+
+HEADER = "X-Profile"
+ID_HEADER = "X-Profile-Id"
+
+
+_names = {}
+
+
+def frame_name(code):
+    """
+    How a function appears in a flame graph
+    """
+    name = _names.get(code)
+
+    if name is None:
+        name = _names[code] = _frame_name(code)
+
+    return name
+
+
+def _frame_name(code):
+    filename = code.co_filename
+
+    for path in sys.path:
+        if path and filename.startswith(path + os.sep):
+            filename = filename[len(path) + 1:]
+            break
+
+    return "%s (%s:%d)" % (code.co_name, filename, code.co_firstlineno)
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread at a fixed interval
+    """
+
+    def __init__(self, thread_id, interval=0.001):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+
+        while frame is not None:
+            stack.append(frame_name(frame.f_code))
+            frame = frame.f_back
+
+        if stack:
+            self.stacks[";".join(reversed(stack))] += 1
+
+    def run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="request-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+        return self.stacks
+
+
+class TracingProfiler:
+    """
+    Times every call made on the current thread
+    """
+
+    def __init__(self):
+        self.stacks = Counter()
+        self._stack = []
+        self._last = None
+
+    def _charge(self, now):
+        if self._stack:
+            self.stacks[";".join(self._stack)] += int((now - self._last) * 1e6)
+        self._last = now
+
+    def trace(self, frame, event, arg):
+        self._charge(time.perf_counter())
+
+        if event == "call":
+            self._stack.append(frame_name(frame.f_code))
+        elif event == "c_call":
+            self._stack.append("%s (builtin)" % getattr(arg, "__qualname__", arg))
+        elif self._stack:
+            self._stack.pop()
+
+    def start(self):
+        # Calls already in progress are not known, so the stack starts here
+        self._last = time.perf_counter()
+        sys.setprofile(self.trace)
+
+    def stop(self):
+        sys.setprofile(None)
+        self._charge(time.perf_counter())
+
+        return self.stacks
+
+
+PROFILERS = {
+    "sampling": lambda app: SamplingProfiler(
+        threading.get_ident(), app.config.get("PROFILE_INTERVAL") or 0.001
+    ),
+    "tracing": lambda app: TracingProfiler(),
+}
+
+
+"""
+Signed trigger header
+"""
+
+
+def signature(secret, path, expires):
+    message = ("%d:%s" % (expires, path)).encode("utf8")
+
+    return hmac.new(secret.encode("utf8"), message, hashlib.sha256).hexdigest()
+
+
+def sign(secret, path, ttl=300):
+    """
+    A header value that enables profiling of `path` for `ttl` seconds
+    """
+    expires = int(time.time()) + ttl
+
+    return "%d.%s" % (expires, signature(secret, path, expires))
+
+
+def verify(secret, path, value):
+    expires, _, given = (value or "").partition(".")
+
+    try:
+        expires = int(expires)
+    except ValueError:
+        return False
+
+    if expires < time.time():
+        return False
+
+    return hmac.compare_digest(given, signature(secret, path, expires))
+
+
+"""
+Request hooks
+"""
+
+
+def requested():
+    config = current_app.config
+    value = request.headers.get(HEADER)
+
+    if value is not None and config.get("PROFILE_SECRET"):
+        return verify(config["PROFILE_SECRET"], request.path, value)
+
+    rate = config.get("PROFILE_SAMPLE_RATE")
+
+    return bool(rate) and random.random() < rate
+
+
+def start_profile():
+    """
+    `before_request` handler that starts profiling if the request asks for it
+    or is sampled
+    """
+    if not requested():
+        return
+
+    mode = current_app.config.get("PROFILE_MODE") or "sampling"
+    profiler = PROFILERS[mode](current_app)
+    g.profile = (profiler, mode, time.perf_counter())
+    profiler.start()
+
+
+def stop_profile(response):
+    """
+    `after_request` handler that writes the profile of the request
+    """
+    profile = g.pop("profile", None)
+
+    if profile is None:
+        return response
+
+    profiler, mode, started = profile
+    stacks = profiler.stop()
+    duration = time.perf_counter() - started
+
+    route = request.url_rule.rule if request.url_rule is not None else request.path
+    root = "%s %s" % (request.method, route)
+    id = "%d-%s" % (time.time(), uuid.uuid4().hex[:8])
+
+    directory = current_app.config.get("PROFILE_DIR") or os.path.join(
+        current_app.instance_path, "profiles"
+    )
+    os.makedirs(directory, exist_ok=True)
+
+    with open(os.path.join(directory, "%s.collapsed" % id), "w") as f:
+        for stack, weight in stacks.most_common():
+            f.write("%s;%s %d\n" % (root, stack, weight))
+
+    with open(os.path.join(directory, "%s.json" % id), "w") as f:
+        json.dump({
+            "id": id,
+            "method": request.method,
+            "route": route,
+            "path": request.path,
+            "args": request.args.to_dict(flat=False),
+            "viewArgs": request.view_args,
+            "status": response.status_code,
+            "durationMs": duration * 1000,
+            "mode": mode,
+            "samples": sum(stacks.values()),
+            "pid": os.getpid(),
+        }, f, indent=2)
+
+    prune(directory, current_app.config.get("PROFILE_KEEP") or 1000)
+
+    response.headers[ID_HEADER] = id
+
+    return response
+
+
+def prune(directory, keep):
+    """
+    Delete all but the newest `keep` profiles in `directory`
+    """
+    profiles = sorted(
+        (entry.stat().st_mtime, entry.name[:-len(".json")])
+        for entry in os.scandir(directory) if entry.name.endswith(".json")
+    )
+
+    for _, id in profiles[:max(len(profiles) - keep, 0)]:
+        for extension in (".json", ".collapsed"):
+            try:
+                os.remove(os.path.join(directory, id + extension))
+            except FileNotFoundError:
+                # Pruned by another worker
+                pass
+
+
+def abandon_profile(exc=None):
+    """
+    `teardown_request` handler that stops a profile left running by an error
+    """
+    profile = g.pop("profile", None)
+
+    if profile is not None:
+        profile[0].stop()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Print an X-Profile header value")
+    parser.add_argument("path", help="Request path, such as /api/movies/")
+    parser.add_argument("--secret", default=os.getenv("PROFILE_SECRET"), required=not os.getenv("PROFILE_SECRET"))
+    parser.add_argument("--ttl", type=int, default=300, help="Seconds the header stays valid")
+    args = parser.parse_args()
+
+    print("%s: %s" % (HEADER, sign(args.secret, args.path, args.ttl)))
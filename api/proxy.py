@@ -0,0 +1,52 @@
+"""
+One proxy around each DAO, which caching, metrics, memory profiling and
+tracing hook into.
+
+A hook is called once per public method of the DAO, the first time the
+method is looked up on the proxy:
+
+    def hook(dao, name, method, call):
+        ...
+        return wrapped
+
+`dao` is the wrapped DAO, `name` its class name (such as `MovieDAO`),
+`method` the method's name and `call` the callable built so far, which the
+hook returns as is or wrapped.  Hooks run in order, so the first one wraps
+the DAO's own method and the last one is called first.
+"""
+
+
+class DAOProxy:
+    def __init__(self, dao, name, hooks):
+        self._dao = dao
+        self._name = name
+        self._hooks = hooks
+        self._methods = {}
+
+    def __getattr__(self, method):
+        call = self._methods.get(method)
+
+        if call is not None:
+            return call
+
+        attribute = getattr(self._dao, method)
+
+        if method.startswith("_") or not callable(attribute):
+            return attribute
+
+        call = attribute
+        for hook in self._hooks:
+            call = hook(self._dao, self._name, method, call)
+
+        self._methods[method] = call
+
+        return call
+
+
+def wrap_dao(dao, name, hooks):
+    """
+    `dao` behind one proxy running `hooks`, leaving out those that are None
+    """
+    hooks = [hook for hook in hooks if hook is not None]
+
+    return DAOProxy(dao, name, hooks) if hooks else dao
@@ -0,0 +1,256 @@
+"""
+Query fingerprints, per-fingerprint statistics and a slow-query log.
+
+Every query reported by `api.instrumentation.InstrumentedDriver` is reduced
+to a fingerprint: whitespace is collapsed and literals are replaced with `?`,
+as are the backticked property names and ASC/DESC directions that the DAOs
+format into their ORDER BY clauses, so that every sort and order of one DAO
+query is grouped together.  For each fingerprint `QueryLog` keeps a count,
+error count, total and maximum time and a latency histogram.
+
+A query that takes at least `SLOW_QUERY_MS` milliseconds is logged as a
+warning to the `api.slow_queries` logger with its parameters (values of
+`password` and `encrypted` are redacted), the server's
+`result_available_after` and `result_consumed_after` timings and, for a
+sample of read queries (`SLOW_QUERY_PROFILE_RATE`), the db hits and rows of
+a `PROFILE` of the same query, run in the background.
+
+`GET /api/admin/queries` lists the fingerprints that cost the most time.
+"""
+
+import hashlib
+import logging
+import random
+import re
+import threading
+import time
+from collections import deque
+
+log = logging.getLogger("api.slow_queries")
+
+"""
+Upper bounds (in milliseconds) of the latency histogram buckets
+"""
+BUCKETS_MS = [1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+REDACTED_KEYS = {"password", "encrypted"}
+
+_STRING = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBER = re.compile(r"(?<![\w$.])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+_IDENTIFIER = re.compile(r"`[^`]*`")
+_DIRECTION = re.compile(r"\b(?:ASC|DESC|ASCENDING|DESCENDING)\b", re.IGNORECASE)
+_SPACE = re.compile(r"\s+")
+
+
+def normalize(query):
+    """
+    The query text with literals, quoted identifiers and sort directions
+    replaced by `?`
+    """
+    query = _STRING.sub("?", query)
+    query = _IDENTIFIER.sub("`?`", query)
+    query = _NUMBER.sub("?", query)
+    query = _DIRECTION.sub("?", query)
+
+    return _SPACE.sub(" ", query).strip()
+
+
+def fingerprint(query):
+    """
+    A short, stable id for the normalized query
+    """
+    return hashlib.sha1(normalize(query).encode("utf8")).hexdigest()[:12]
+
+
+def redact(value):
+    if isinstance(value, dict):
+        return {
+            k: "***" if k.lower() in REDACTED_KEYS else redact(v)
+            for k, v in value.items()
+        }
+
+    if isinstance(value, (list, tuple)):
+        return [redact(v) for v in value]
+
+    return value
+
+
+def server_timings(summary):
+    if summary is None:
+        return None
+
+    return {
+        "resultAvailableAfter": summary.result_available_after,
+        "resultConsumedAfter": summary.result_consumed_after,
+    }
+
+
+def summarize_profile(plan):
+    """
+    Total db hits and the operators of a `PROFILE` plan
+    """
+    db_hits = 0
+    operators = []
+    stack = [plan]
+
+    while stack:
+        operator = stack.pop()
+        db_hits += operator.get("dbHits", 0)
+        operators.append({
+            "operator": operator.get("operatorType"),
+            "dbHits": operator.get("dbHits", 0),
+            "rows": operator.get("rows", 0),
+        })
+        stack.extend(reversed(operator.get("children", [])))
+
+    return {"dbHits": db_hits, "rows": plan.get("rows", 0), "operators": operators}
+
+
+class Fingerprint:
+    def __init__(self, id, query):
+        self.id = id
+        self.query = normalize(query)
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.slow = 0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+    def add(self, event):
+        ms = event.duration * 1000
+
+        self.count += 1
+        self.errors += event.error is not None
+        self.total += ms
+        self.max = max(self.max, ms)
+        self.rows += event.rows
+
+        for i, bound in enumerate(BUCKETS_MS):
+            if ms <= bound:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+    def as_dict(self):
+        histogram = {str(bound): count for bound, count in zip(BUCKETS_MS, self.buckets)}
+        histogram["+Inf"] = self.buckets[-1]
+
+        return {
+            "fingerprint": self.id,
+            "query": self.query,
+            "count": self.count,
+            "errors": self.errors,
+            "slow": self.slow,
+            "totalMs": self.total,
+            "meanMs": self.total / self.count if self.count else 0.0,
+            "maxMs": self.max,
+            "rows": self.rows,
+            "histogramMs": histogram,
+        }
+
+
+class QueryLog:
+    """
+    A query listener (see `api.instrumentation`) that aggregates queries by
+    fingerprint and logs slow ones.  `driver` returns the driver to run
+    `PROFILE` queries with.
+    """
+
+    def __init__(self, slow_ms=100.0, profile_rate=0.0, driver=None, recent=100):
+        self.slow_ms = slow_ms
+        self.profile_rate = profile_rate
+        self.driver = driver
+        self.fingerprints = {}
+        self.recent = deque(maxlen=recent)
+        self._lock = threading.Lock()
+        self._random = random.Random()
+
+    def query_finished(self, event):
+        # Don't report on our own profiling
+        if event.query.lstrip().upper().startswith("PROFILE"):
+            return
+
+        id = fingerprint(event.query)
+
+        with self._lock:
+            stats = self.fingerprints.get(id)
+
+            if stats is None:
+                stats = self.fingerprints[id] = Fingerprint(id, event.query)
+
+            stats.add(event)
+
+            slow = self.slow_ms is not None and event.duration * 1000 >= self.slow_ms
+            if slow:
+                stats.slow += 1
+
+        if slow:
+            self.log_slow(id, event)
+
+    def log_slow(self, id, event):
+        entry = {
+            "fingerprint": id,
+            "query": " ".join(event.query.split()),
+            "parameters": redact(event.parameters),
+            "database": event.database,
+            "mode": event.mode,
+            "durationMs": event.duration * 1000,
+            "rows": event.rows,
+            "server": server_timings(event.summary),
+            "error": str(event.error) if event.error is not None else None,
+            "time": time.time(),
+            "profile": None,
+        }
+
+        with self._lock:
+            self.recent.append(entry)
+
+        log.warning(
+            "Slow query %s took %.1fms (server %s, %d rows): %s params=%s",
+            id, entry["durationMs"], entry["server"], entry["rows"],
+            entry["query"][:500], entry["parameters"],
+        )
+
+        # Profiling runs the query again, so only reads are profiled
+        if (
+            event.mode == "READ" and self.driver is not None
+            and self.profile_rate and self._random.random() < self.profile_rate
+        ):
+            threading.Thread(
+                target=self.profile, args=(entry, event), name="query-profile", daemon=True
+            ).start()
+
+    def profile(self, entry, event):
+        try:
+            driver = self.driver()
+
+            with driver.session(database=event.database) as session:
+                summary = session.execute_read(
+                    lambda tx: tx.run("PROFILE " + event.query, event.parameters).consume()
+                )
+        except Exception as e:
+            log.debug("Could not profile slow query %s: %s", entry["fingerprint"], e)
+            return
+
+        if summary.profile:
+            entry["profile"] = summarize_profile(summary.profile)
+            log.warning(
+                "Profile of slow query %s: %d db hits, %d rows",
+                entry["fingerprint"], entry["profile"]["dbHits"], entry["profile"]["rows"],
+            )
+
+    def top(self, sort="totalMs", limit=10):
+        with self._lock:
+            fingerprints = [f.as_dict() for f in self.fingerprints.values()]
+            recent = list(self.recent)
+
+        fingerprints.sort(key=lambda f: f[sort], reverse=True)
+
+        return {
+            "slowQueryMs": self.slow_ms,
+            "fingerprints": fingerprints[:limit],
+            "slow": recent[-limit:][::-1],
+        }
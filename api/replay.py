@@ -0,0 +1,415 @@
+"""
+Record and replay the queries the app sends to Neo4j.
+
+`RecordingDriver` wraps a real driver and appends every `tx.run` (and
+auto-commit `session.run`) to a gzipped JSON lines file: the query, its
+parameters, the keys and values of every record it returned and the time the
+server spent on it.  `ReplayDriver` reads such a file and answers the same
+queries from it, optionally sleeping for the recorded server time or a fixed
+latency, so the full HTTP stack can be exercised and profiled without a
+database and captured production traffic can be replayed against new builds.
+
+Both are selected through the app config, see `api.neo4j.init_driver`:
+
+    NEO4J_RECORD=queries.jsonl.gz      record while talking to Neo4j
+    NEO4J_REPLAY=queries.jsonl.gz      answer from a recording instead
+    NEO4J_REPLAY_LATENCY=recorded      or a number of seconds per query
+
+A replayed query is matched on its text and parameters.  Parameters that
+differ between runs (a freshly hashed password, a new user's id) would never
+match, so when there is no exact match any recording of the same query text
+is used.  Repeated matches cycle through the recordings in order.  A query
+that was never recorded raises `ReplayMissError`.
+"""
+
+import gzip
+import json
+import os
+import threading
+import time
+import warnings
+from collections import defaultdict
+
+from neo4j import Bookmarks, Record
+from neo4j.exceptions import ResultNotSingleError
+from neo4j.graph import Node, Relationship
+from neo4j.time import Date, DateTime, Duration, Time
+
+TEMPORAL_TYPES = {"Date": Date, "DateTime": DateTime, "Time": Time}
+
+
+class ReplayMissError(Exception):
+    pass
+
+
+"""
+Encoding
+"""
+
+
+def encode_value(value):
+    """
+    `json.dumps` default for the driver's temporal types, and for nodes and
+    relationships, which are recorded as their properties and replayed as
+    dicts
+    """
+    if isinstance(value, (Node, Relationship)):
+        return dict(value)
+
+    for name, cls in TEMPORAL_TYPES.items():
+        if isinstance(value, cls):
+            return {"$neo4j": name, "value": value.iso_format()}
+
+    if isinstance(value, Duration):
+        return {"$neo4j": "Duration", "value": list(value)}
+
+    raise TypeError("Cannot record a value of type %s" % type(value).__name__)
+
+
+def decode_value(obj):
+    """
+    `json.loads` object hook reversing `encode_value`
+    """
+    name = obj.get("$neo4j")
+
+    if name is None:
+        return obj
+    if name == "Duration":
+        months, days, seconds, nanoseconds = obj["value"]
+        return Duration(months=months, days=days, seconds=seconds, nanoseconds=nanoseconds)
+
+    return TEMPORAL_TYPES[name].from_iso_format(obj["value"])
+
+
+def _dumps(value):
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), default=encode_value)
+
+
+def _query_key(query):
+    # Queries are built from indented triple-quoted strings
+    return " ".join(query.split())
+
+
+"""
+Results
+"""
+
+
+class ReplaySummary:
+    def __init__(self, query, parameters, server_ms=0):
+        self.query = query
+        self.parameters = parameters
+        self.result_available_after = server_ms
+        self.result_consumed_after = 0
+
+
+class ReplayResult:
+    """
+    A fully buffered result with the parts of the `neo4j.Result` API the DAOs
+    use.
+    """
+
+    def __init__(self, keys, records, summary):
+        self._keys = list(keys)
+        self._records = list(records)
+        self._summary = summary
+
+    def __iter__(self):
+        records, self._records = self._records, []
+        return iter(records)
+
+    def keys(self):
+        return self._keys
+
+    def peek(self):
+        return self._records[0] if self._records else None
+
+    def single(self, strict=False):
+        records, self._records = self._records, []
+
+        if len(records) == 1:
+            return records[0]
+        if strict:
+            raise ResultNotSingleError(
+                "Expected a result with a single record, but found %d" % len(records)
+            )
+        if records:
+            warnings.warn("Expected a result with a single record, "
+                          "but this result contains at least one more.")
+            return records[0]
+
+        return None
+
+    def value(self, key=0, default=None):
+        return [record.value(key, default) for record in self]
+
+    def values(self, *keys):
+        return [record.values(*keys) for record in self]
+
+    def data(self, *keys):
+        return [record.data(*keys) for record in self]
+
+    def consume(self):
+        self._records = []
+        return self._summary
+
+
+"""
+Recording
+"""
+
+
+class Recorder:
+    """
+    Appends recordings to a gzipped JSON lines file.  `{pid}` in the path is
+    replaced with the process id, so that forked workers write separate files.
+    """
+
+    def __init__(self, path):
+        self.path = path.format(pid=os.getpid())
+        self._lock = threading.Lock()
+        self._file = gzip.open(self.path, "at", encoding="utf8")
+        self.recorded = 0
+
+    def write(self, query, parameters, keys, rows, server_ms, database):
+        # A value that can't be encoded raises here: a recording missing the
+        # query would only fail later, when it is replayed
+        line = _dumps({
+            "q": query,
+            "p": parameters,
+            "k": keys,
+            "r": rows,
+            "t": server_ms,
+            "db": database,
+        })
+
+        with self._lock:
+            self._file.write(line)
+            self._file.write("\n")
+            self.recorded += 1
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class RecordingTransaction:
+    def __init__(self, tx, recorder, database):
+        self._tx = tx
+        self._recorder = recorder
+        self._database = database
+
+    def run(self, query, parameters=None, **kwparameters):
+        return _record(
+            self._tx.run(query, parameters, **kwparameters),
+            self._recorder, self._database, query, {**(parameters or {}), **kwparameters},
+        )
+
+    def __getattr__(self, name):
+        return getattr(self._tx, name)
+
+
+def _record(result, recorder, database, query, parameters):
+    keys = list(result.keys())
+    records = list(result)
+    summary = result.consume()
+
+    server_ms = (summary.result_available_after or 0) + (summary.result_consumed_after or 0)
+    recorder.write(query, parameters, keys, [list(r.values()) for r in records], server_ms, database)
+
+    return ReplayResult(keys, records, summary)
+
+
+class RecordingSession:
+    def __init__(self, session, recorder, database):
+        self._session = session
+        self._recorder = recorder
+        self._database = database
+
+    def _wrap(self, work):
+        def recorded_work(tx, *args, **kwargs):
+            return work(RecordingTransaction(tx, self._recorder, self._database), *args, **kwargs)
+
+        return recorded_work
+
+    def execute_read(self, work, *args, **kwargs):
+        return self._session.execute_read(self._wrap(work), *args, **kwargs)
+
+    def execute_write(self, work, *args, **kwargs):
+        return self._session.execute_write(self._wrap(work), *args, **kwargs)
+
+    def read_transaction(self, work, *args, **kwargs):
+        return self.execute_read(work, *args, **kwargs)
+
+    def write_transaction(self, work, *args, **kwargs):
+        return self.execute_write(work, *args, **kwargs)
+
+    def run(self, query, parameters=None, **kwparameters):
+        return _record(
+            self._session.run(query, parameters, **kwparameters),
+            self._recorder, self._database, query, {**(parameters or {}), **kwparameters},
+        )
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+    def __enter__(self):
+        self._session.__enter__()
+        return self
+
+    def __exit__(self, *args):
+        return self._session.__exit__(*args)
+
+
+class RecordingDriver:
+    """
+    Wraps a driver and records every query run through its sessions
+    """
+
+    def __init__(self, driver, path):
+        self._driver = driver
+        self.recorder = Recorder(path)
+
+    def session(self, **config):
+        return RecordingSession(
+            self._driver.session(**config), self.recorder, config.get("database")
+        )
+
+    def close(self):
+        self._driver.close()
+        self.recorder.close()
+
+    def __getattr__(self, name):
+        return getattr(self._driver, name)
+
+
+"""
+Replay
+"""
+
+
+class ReplayDriver:
+    """
+    Answers queries from a recording.  `latency` is None (answer at once),
+    "recorded" (sleep for the recorded server time) or a number of seconds
+    to sleep per query.
+    """
+
+    def __init__(self, recordings, latency=None):
+        self.latency = latency
+        self.queries = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._exact = defaultdict(list)
+        self._by_query = defaultdict(list)
+        self._next = defaultdict(int)
+
+        for recording in recordings:
+            query = _query_key(recording["q"])
+            self._exact[(query, _dumps(recording["p"]))].append(recording)
+            self._by_query[query].append(recording)
+
+    @classmethod
+    def from_file(cls, path, latency=None):
+        with gzip.open(path, "rt", encoding="utf8") as f:
+            recordings = [json.loads(line, object_hook=decode_value) for line in f if line.strip()]
+
+        return cls(recordings, latency)
+
+    def lookup(self, query, parameters):
+        query = _query_key(query)
+        key = (query, _dumps(parameters))
+
+        with self._lock:
+            self.queries += 1
+
+            if key in self._exact:
+                candidates = self._exact[key]
+            elif query in self._by_query:
+                candidates = self._by_query[query]
+                key = query
+            else:
+                self.misses += 1
+                raise ReplayMissError("No recording for query: %s" % query)
+
+            index = self._next[key]
+            self._next[key] = index + 1
+
+        return candidates[index % len(candidates)]
+
+    def run(self, query, parameters):
+        recording = self.lookup(query, parameters)
+
+        if self.latency == "recorded":
+            time.sleep(recording["t"] / 1000)
+        elif self.latency:
+            time.sleep(self.latency)
+
+        keys = recording["k"]
+
+        return ReplayResult(
+            keys,
+            [Record(zip(keys, row)) for row in recording["r"]],
+            ReplaySummary(query, parameters, recording["t"]),
+        )
+
+    def session(self, **config):
+        return ReplaySession(self)
+
+    def verify_connectivity(self, **config):
+        pass
+
+    def close(self):
+        pass
+
+
+class ReplayTransaction:
+    def __init__(self, driver):
+        self._driver = driver
+
+    def run(self, query, parameters=None, **kwparameters):
+        return self._driver.run(query, {**(parameters or {}), **kwparameters})
+
+
+class ReplaySession:
+    def __init__(self, driver):
+        self._driver = driver
+
+    def execute_read(self, work, *args, **kwargs):
+        return work(ReplayTransaction(self._driver), *args, **kwargs)
+
+    def execute_write(self, work, *args, **kwargs):
+        return work(ReplayTransaction(self._driver), *args, **kwargs)
+
+    def read_transaction(self, work, *args, **kwargs):
+        return self.execute_read(work, *args, **kwargs)
+
+    def write_transaction(self, work, *args, **kwargs):
+        return self.execute_write(work, *args, **kwargs)
+
+    def run(self, query, parameters=None, **kwparameters):
+        return self._driver.run(query, {**(parameters or {}), **kwparameters})
+
+    def last_bookmarks(self):
+        return Bookmarks()
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def parse_latency(value):
+    """
+    Parse NEO4J_REPLAY_LATENCY: empty, "recorded" or seconds
+    """
+    if value in (None, ""):
+        return None
+    if value == "recorded":
+        return value
+
+    return float(value)
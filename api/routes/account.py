@@ -1,15 +1,16 @@
-from flask import Blueprint, current_app, request, jsonify
-from flask_jwt_extended import current_user, jwt_required
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import current_user, get_current_user, jwt_required
 
 from api.dao.favorites import FavoriteDAO
 from api.dao.ratings import RatingDAO
+from api.neo4j import get_dao
 
 account_routes = Blueprint("account", __name__, url_prefix="/api/account")
 
 @account_routes.route('/', methods=['GET'])
 @jwt_required()
 def get_profile():
-    return jsonify(current_user)
+    return jsonify(get_current_user())
 
 @account_routes.route('/favorites', methods=['GET'])
 @jwt_required()
@@ -24,7 +25,7 @@ def get_favorites():
     skip = request.args.get("skip", 0, type=int)
 
     # Create the DAO
-    dao = FavoriteDAO(current_app.driver)
+    dao = get_dao(FavoriteDAO)
 
     output = dao.all(user_id, sort, order, limit, skip)
 
@@ -37,7 +38,7 @@ def add_favorite(movie_id):
     user_id = current_user["sub"]
 
     # Create the DAO
-    dao = FavoriteDAO(current_app.driver)
+    dao = get_dao(FavoriteDAO)
 
     if request.method == "POST":
         # Save the favorite
@@ -61,7 +62,7 @@ def save_rating(movie_id):
     rating = int(form_data["rating"])
 
     # Create the DAO
-    dao = RatingDAO(current_app.driver)
+    dao = get_dao(RatingDAO)
 
     # Save the rating
     output = dao.add(user_id, movie_id, rating)
@@ -0,0 +1,36 @@
+import hmac
+
+from flask import Blueprint, current_app, jsonify, request
+
+admin_routes = Blueprint("admin", __name__, url_prefix="/api/admin")
+
+SORTS = {"total": "totalMs", "mean": "meanMs", "max": "maxMs", "count": "count"}
+
+@admin_routes.before_request
+def check_token():
+    # The admin routes only exist when a token has been configured
+    token = current_app.config.get('ADMIN_TOKEN')
+
+    if not token:
+        return {"message": "Not found"}, 404
+
+    given = request.headers.get("X-Admin-Token", "")
+
+    if not hmac.compare_digest(given.encode(), token.encode()):
+        return {"message": "Unauthorized"}, 401
+
+@admin_routes.route('/queries', methods=['GET'])
+def get_queries():
+    sort = SORTS.get(request.args.get("sort", "total"), "totalMs")
+    limit = request.args.get("limit", 10, type=int)
+
+    return jsonify(current_app.query_log.top(sort, limit))
+
+@admin_routes.route('/memory', methods=['GET'])
+def get_memory():
+    if current_app.memory_profile is None:
+        return {"message": "Memory profiling is disabled, set MEMORY_PROFILING"}, 404
+
+    limit = request.args.get("limit", 10, type=int)
+
+    return jsonify(current_app.memory_profile.report(limit))
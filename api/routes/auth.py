@@ -2,6 +2,7 @@ from flask import Blueprint, current_app, request, jsonify
 from flask_jwt_extended import current_user
 
 from api.dao.auth import AuthDAO
+from api.neo4j import get_dao
 
 auth_routes = Blueprint("auth", __name__, url_prefix="/api/auth")
 
@@ -13,7 +14,7 @@ def register():
     password = form_data['password']
     name = form_data['name']
 
-    dao = AuthDAO(current_app.driver, current_app.config.get('SECRET_KEY'))
+    dao = get_dao(AuthDAO, current_app.config.get('SECRET_KEY'))
 
     user = dao.register(email, password, name)
 
@@ -27,7 +28,7 @@ def login():
     email = form_data['email']
     password = form_data['password']
 
-    dao = AuthDAO(current_app.driver, current_app.config.get('SECRET_KEY'))
+    dao = get_dao(AuthDAO, current_app.config.get('SECRET_KEY'))
 
     user = dao.authenticate(email, password)
 
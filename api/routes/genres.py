@@ -1,15 +1,16 @@
-from flask import Blueprint, current_app, request, jsonify
+from flask import Blueprint, request, jsonify
 from flask_jwt_extended import current_user, jwt_required
 
 from api.dao.genres import GenreDAO
 from api.dao.movies import MovieDAO
+from api.neo4j import get_dao
 
 genre_routes = Blueprint("genre", __name__, url_prefix="/api/genres")
 
 @genre_routes.get('/')
 def get_index():
     # Create the DAO
-    dao = GenreDAO(current_app.driver)
+    dao = get_dao(GenreDAO)
 
     # Get output
     output = dao.all()
@@ -19,7 +20,7 @@ def get_index():
 @genre_routes.get('/<name>/')
 def get_genre(name):
     # Create the DAO
-    dao = GenreDAO(current_app.driver)
+    dao = get_dao(GenreDAO)
 
     # Get the Genre
     output = dao.find(name)
@@ -39,7 +40,7 @@ def get_genre_movies(name):
     skip = request.args.get("skip", 0, type=int)
 
     # Create the DAO
-    dao = MovieDAO(current_app.driver)
+    dao = get_dao(MovieDAO)
 
     # Get the Genre
     output = dao.get_by_genre(name, sort, order, limit, skip, user_id)
@@ -3,6 +3,7 @@ from flask_jwt_extended import current_user, jwt_required
 
 from api.dao.movies import MovieDAO
 from api.dao.ratings import RatingDAO
+from api.neo4j import get_dao
 
 movie_routes = Blueprint("movies", __name__, url_prefix="/api/movies")
 
@@ -20,7 +21,7 @@ def get_movies():
     user_id = current_user["sub"] if current_user != None else None
 
     # Create a new MovieDAO Instance
-    dao = MovieDAO(current_app.driver)
+    dao = get_dao(MovieDAO)
 
     # Retrieve a paginated list of movies
     output = dao.all(sort, order, limit=limit, skip=skip, user_id=user_id)
@@ -37,7 +38,11 @@ def get_movie_details(movie_id):
     user_id = current_user["sub"] if current_user != None else None
 
     # Create a new MovieDAO Instance
-    dao = MovieDAO(current_app.driver)
+    dao = get_dao(MovieDAO)
+
+    # Serve the pre-encoded body, see api.bodies
+    if current_app.bodies is not None:
+        return current_app.bodies.movie(dao, movie_id, user_id)
 
     # Get the Movie
     movie = dao.find_by_id(movie_id, user_id)
@@ -54,7 +59,7 @@ def get_movie_ratings(movie_id):
     skip = request.args.get("skip", 0, type=int)
 
     # Create a new RatingDAO Instance
-    dao = RatingDAO(current_app.driver)
+    dao = get_dao(RatingDAO)
 
     # Get ratings for the movie
     ratings = dao.for_movie(movie_id, sort, order, limit, skip)
@@ -73,7 +78,7 @@ def get_similar_movies(movie_id):
     skip = request.args.get("skip", 0, type=int)
 
     # Create a new MovieDAO Instance
-    dao = MovieDAO(current_app.driver)
+    dao = get_dao(MovieDAO)
 
     # Get Similar Movies
     output = dao.get_similar_movies(movie_id, limit, skip, user_id)
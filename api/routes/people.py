@@ -1,6 +1,7 @@
 from flask import Blueprint, current_app, request, jsonify
 
 from api.dao.people import PeopleDAO
+from api.neo4j import get_dao
 
 people_routes = Blueprint("people", __name__, url_prefix="/api/people")
 
@@ -14,7 +15,7 @@ def get_index():
     skip = request.args.get("skip", 0, type=int)
 
     # Create an instance of the PeopleDAO
-    dao = PeopleDAO(current_app.driver)
+    dao = get_dao(PeopleDAO)
 
     # Get output
     output = dao.all(q, sort, order, limit, skip)
@@ -25,7 +26,11 @@ def get_index():
 @people_routes.get('/<id>')
 def get_person(id):
     # Create an instance of the PeopleDAO
-    dao = PeopleDAO(current_app.driver)
+    dao = get_dao(PeopleDAO)
+
+    # Serve the pre-encoded body, see api.bodies
+    if current_app.bodies is not None:
+        return current_app.bodies.person(dao, id)
 
     # Get the person
     person = dao.find_by_id(id)
@@ -40,7 +45,7 @@ def get_similar_people(id):
     skip = request.args.get("skip", 0, type=int)
 
     # Create an instance of the PeopleDAO
-    dao = PeopleDAO(current_app.driver)
+    dao = get_dao(PeopleDAO)
 
     # Get the person
     similar = dao.get_similar_people(id, limit, skip)
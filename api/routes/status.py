@@ -1,14 +1,39 @@
-from flask import Blueprint, current_app, jsonify
+from flask import Blueprint, Response, current_app, jsonify
+
+from api.coalesce import reads
+from api.metrics import CONTENT_TYPE, exposition, registry
 
 status_routes = Blueprint("status", __name__, url_prefix="/api/status")
 
 @status_routes.route('/', methods=['GET'])
 def get_index():
+    pool_metrics = getattr(current_app, "pool_metrics", None)
+
     return jsonify({
         "driver": current_app.driver is not None,
-        "NEO4J_URI": current_app.config.get('NEO4J_URI'),
-        "NEO4J_USERNAME": current_app.config.get('NEO4J_USERNAME'),
-        "NEO4J_PASSWORD": current_app.config.get('NEO4J_PASSWORD'),
-        "NEO4J_DATABASE": current_app.config.get('NEO4J_DATABASE'),
-        "JWT_SECRET": current_app.config.get('JWT_SECRET'),
-    })
\ No newline at end of file
+        "readiness": current_app.readiness.as_dict(),
+        "pool": pool_metrics.snapshot() if pool_metrics is not None else None,
+        "reads": reads.stats(),
+        "cache": current_app.cache.stats() if current_app.cache is not None else None,
+        "bodies": current_app.bodies.stats() if current_app.bodies is not None else None,
+        "snapshots": current_app.snapshots.as_dict() if current_app.snapshots is not None else None,
+    })
+
+@status_routes.route('/ready', methods=['GET'])
+def get_ready():
+    readiness = current_app.readiness
+
+    return jsonify(readiness.as_dict()), 200 if readiness.ready else 503
+
+@status_routes.route('/pool', methods=['GET'])
+def get_pool():
+    pool_metrics = getattr(current_app, "pool_metrics", None)
+
+    if pool_metrics is None:
+        return {"message": "Driver not initialised"}, 503
+
+    return jsonify(pool_metrics.snapshot())
+
+@status_routes.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(exposition(registry.collect()), content_type=CONTENT_TYPE)
@@ -0,0 +1,284 @@
+"""
+Snapshots of the local cache tier, so that a restarted worker starts warm.
+
+With `CACHE=true` and `CACHE_SNAPSHOT` set to a file path, every worker
+writes its cached results to the file every `CACHE_SNAPSHOT_INTERVAL`
+seconds (`0` for never) and when it exits, and `create_app` loads the file
+back into the new worker's cache.  Results keep the time they had left: a
+result saved with 100 seconds to live and restored a minute later lives 40
+more seconds.
+
+A snapshot is only restored if it was written for the same
+`CATALOG_VERSION`, which should change whenever the catalog is re-imported,
+and by code using the same snapshot `FORMAT`.  The file holds a JSON header
+listing every entry, followed by the pickled results; it is memory-mapped
+to restore it, and each result is unpickled straight from the mapping.
+Workers replace the file atomically, so the last one to save wins.  A file
+that cannot be read is skipped, and an entry that cannot be unpickled (its
+class has changed, say) is left out; either is logged and reported as
+`invalid`.
+
+Results are saved with the time they were cached for, not the
+`CACHE_LOCAL_TTL` seconds the local tier keeps them for with a shared tier
+(`CACHE_SHARED`) or several `WORKERS`.  The restoring worker caps them the
+same way, so there a restored result lives `CACHE_LOCAL_TTL` seconds like
+any local entry, and is saved again with the time it has left.  The shared
+tier itself outlives restarts if it is on disk.
+"""
+
+import atexit
+import json
+import logging
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+
+from flask import current_app
+
+log = logging.getLogger(__name__)
+
+MAGIC = b"NEOFLIXCACHE"
+FORMAT = 2
+
+_HEADER_SIZE = struct.Struct("<Q")
+
+
+def save(cache, path, catalog_version=None):
+    """
+    Write the unexpired entries of `cache`'s local tier to `path`, and
+    return how many were written
+    """
+    now = time.monotonic()
+    index = []
+    chunks = []
+    offset = 0
+
+    for key, entry in cache.local.items():
+        try:
+            data = pickle.dumps(entry.value, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            continue
+
+        # The time the result had left, not what the local tier capped it
+        # to: the restoring worker applies its own cap
+        fresh_until, expires = entry.lifetime
+        index.append([
+            key, offset, len(data),
+            fresh_until - now, expires - now,
+            list(entry.tags), entry.delta, entry.computed,
+        ])
+        chunks.append(data)
+        offset += len(data)
+
+    header = json.dumps({
+        "format": FORMAT,
+        "catalogVersion": catalog_version,
+        "created": time.time(),
+        "pid": os.getpid(),
+        "entries": index,
+    }).encode("utf8")
+
+    temporary = "%s.%d.tmp" % (path, os.getpid())
+
+    with open(temporary, "wb") as f:
+        f.write(MAGIC)
+        f.write(_HEADER_SIZE.pack(len(header)))
+        f.write(header)
+
+        for data in chunks:
+            f.write(data)
+
+    os.replace(temporary, path)
+
+    return len(index)
+
+
+class Restored:
+    def __init__(self, entries=0, expired=0, reason=None, age=None):
+        self.entries = entries
+        self.expired = expired
+        self.reason = reason
+        self.age = age
+
+    def as_dict(self):
+        return {
+            "entries": self.entries,
+            "expired": self.expired,
+            "skipped": self.reason,
+            "ageSeconds": self.age,
+        }
+
+
+def _read_header(buffer):
+    if buffer[:len(MAGIC)] != MAGIC:
+        raise ValueError("not a cache snapshot")
+
+    start = len(MAGIC) + _HEADER_SIZE.size
+    size, = _HEADER_SIZE.unpack(buffer[len(MAGIC):start])
+
+    return json.loads(bytes(buffer[start:start + size])), start + size
+
+
+def restore(cache, path, catalog_version=None):
+    """
+    Load a snapshot written by `save` into `cache`'s local tier
+    """
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return Restored(reason="missing")
+
+    with f:
+        try:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files can't be mapped
+            return Restored(reason="invalid")
+
+        with buffer:
+            view = memoryview(buffer)
+
+            try:
+                return _restore(cache, view, catalog_version)
+            except Exception:
+                # Truncated or corrupted: whatever reading it raised
+                log.warning("Cache snapshot %s is invalid", path, exc_info=True)
+                return Restored(reason="invalid")
+            finally:
+                view.release()
+
+
+def _restore(cache, view, catalog_version):
+    header, data = _read_header(view)
+
+    if header["format"] != FORMAT:
+        return Restored(reason="format")
+
+    if header["catalogVersion"] != catalog_version:
+        return Restored(reason="catalogVersion")
+
+    age = max(time.time() - header["created"], 0.0)
+    restored = Restored(age=age)
+
+    # The most recently used entries, if the cache is now smaller
+    for key, offset, size, fresh, expires, tags, delta, computed in header["entries"][-cache.local.size:]:
+        fresh, expires = fresh - age, expires - age
+
+        if expires <= 0:
+            restored.expired += 1
+            continue
+
+        start = data + offset
+
+        # A class that has changed or gone since the snapshot was written
+        # only loses its own entries
+        try:
+            value = pickle.loads(view[start:start + size])
+        except Exception:
+            log.warning("Cache snapshot entry %r is invalid", key, exc_info=True)
+            restored.reason = "invalid"
+            continue
+
+        cache.put_local(key, value, fresh, expires - fresh, tags, delta, computed)
+        restored.entries += 1
+
+    return restored
+
+
+class Snapshots:
+    """
+    Saves the cache on a schedule and at exit, in every worker
+    """
+
+    def __init__(self, cache, path, catalog_version=None, interval=0.0):
+        self.cache = cache
+        self.path = path
+        self.catalog_version = catalog_version
+        self.interval = interval
+        self.restored = None
+        self.saved = 0
+        self.saved_at = None
+        self.failures = 0
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def restore(self):
+        self.restored = restore(self.cache, self.path, self.catalog_version)
+
+        if self.restored.reason not in (None, "missing"):
+            log.info("Cache snapshot %s not restored: %s", self.path, self.restored.reason)
+
+        return self.restored
+
+    def save(self):
+        with self._lock:
+            try:
+                self.saved = save(self.cache, self.path, self.catalog_version)
+                self.saved_at = time.time()
+            except OSError:
+                self.failures += 1
+                log.exception("Could not save the cache snapshot to %s", self.path)
+
+    def start(self):
+        """
+        Start saving from this process, once per process: called on every
+        request so that forked workers start their own schedule
+        """
+        if self._pid == os.getpid():
+            return
+
+        self._pid = os.getpid()
+        atexit.register(self.save)
+
+        if self.interval:
+            threading.Thread(target=self._run, name="cache-snapshot", daemon=True).start()
+
+    def stop(self):
+        """
+        Stop saving from this process
+        """
+        self._stop.set()
+        atexit.unregister(self.save)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.save()
+
+    def as_dict(self):
+        return {
+            "path": self.path,
+            "restored": self.restored.as_dict() if self.restored is not None else None,
+            "saved": self.saved,
+            "savedAt": self.saved_at,
+            "failures": self.failures,
+        }
+
+
+def start_snapshots():
+    """
+    `before_request` handler
+    """
+    current_app.snapshots.start()
+
+
+def init_snapshots(app):
+    """
+    Restore the cache from `CACHE_SNAPSHOT` and keep saving it there
+    """
+    if not app.config.get("CACHE_SNAPSHOT") or app.cache is None:
+        app.snapshots = None
+        return
+
+    app.snapshots = Snapshots(
+        app.cache,
+        app.config["CACHE_SNAPSHOT"],
+        app.config.get("CATALOG_VERSION"),
+        app.config.get("CACHE_SNAPSHOT_INTERVAL") or 0.0,
+    )
+    app.snapshots.restore()
+
+    app.before_request(start_snapshots)
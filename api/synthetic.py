@@ -0,0 +1,413 @@
+"""
+A seeded generator for a production-sized movie catalog.
+
+Generates Genre, Movie, Person and User nodes joined by IN_GENRE, ACTED_IN,
+DIRECTED, RATED and HAS_FAVORITE relationships.  Degrees follow power laws:
+a few movies collect most of the ratings and favorites, a few people appear
+in most casts and most users rate only a handful of movies.
+
+Records use the format `MemoryGraph.load` accepts:
+
+    {"label": "Movie", "properties": {"tmdbId": "m0", ...}}
+    {"type": "RATED", "start": "u0", "end": "m0", "properties": {...}}
+
+The catalog is generated in fixed-size chunks, each with its own random
+stream derived from the seed, so the output depends only on the seed and the
+sizes: it is identical whether the chunks are generated by one process or
+many.  Each chunk is streamed straight to its own files and memory use does
+not grow with the number of relationships.
+
+    python -m api.synthetic --movies 100000 --users 500000 --format csv --out catalog/
+
+CSV output is laid out for `neo4j-admin database import`: one header file
+and a set of part files for each label and relationship type.
+"""
+
+import csv
+import json
+import os
+import random
+from multiprocessing import Pool
+
+"""
+The password of every generated user is `letmein`, hashed with a fixed salt
+so that the output stays deterministic.
+"""
+PASSWORD = "letmein"
+ENCRYPTED_PASSWORD = "$2b$10$syntheticcatalogsalt..L2JcUrWQsLu9JPogVUuuGi5TCHsFFui"
+
+GENRES = [
+    "Drama", "Comedy", "Thriller", "Romance", "Action", "Crime", "Horror",
+    "Documentary", "Adventure", "Sci-Fi", "Mystery", "Fantasy", "Children",
+    "Animation", "War", "Musical", "Western", "Film-Noir", "IMAX",
+]
+
+LANGUAGES = ["English", "French", "Spanish", "German", "Italian", "Japanese", "Hindi"]
+
+CHUNK_SIZE = 10000
+
+"""
+Columns of the CSV files for each label and relationship type, with the
+types `neo4j-admin database import` should give them.
+"""
+COLUMNS = {
+    "Genre": [("name", "name:ID(Genre)")],
+    "Movie": [
+        ("tmdbId", "tmdbId:ID(Movie)"),
+        ("title", "title"),
+        ("year", "year:int"),
+        ("released", "released"),
+        ("runtime", "runtime:int"),
+        ("imdbRating", "imdbRating:float"),
+        ("languages", "languages:string[]"),
+        ("poster", "poster"),
+    ],
+    "Person": [
+        ("tmdbId", "tmdbId:ID(Person)"),
+        ("name", "name"),
+        ("born", "born"),
+        ("poster", "poster"),
+    ],
+    "User": [
+        ("userId", "userId:ID(User)"),
+        ("name", "name"),
+        ("email", "email"),
+        ("password", "password"),
+    ],
+    "IN_GENRE": [("start", ":START_ID(Movie)"), ("end", ":END_ID(Genre)")],
+    "ACTED_IN": [
+        ("start", ":START_ID(Person)"),
+        ("end", ":END_ID(Movie)"),
+        ("role", "role"),
+    ],
+    "DIRECTED": [("start", ":START_ID(Person)"), ("end", ":END_ID(Movie)")],
+    "RATED": [
+        ("start", ":START_ID(User)"),
+        ("end", ":END_ID(Movie)"),
+        ("rating", "rating:float"),
+        ("timestamp", "timestamp:long"),
+    ],
+    "HAS_FAVORITE": [("start", ":START_ID(User)"), ("end", ":END_ID(Movie)")],
+}
+
+
+class Catalog:
+    """
+    The sizes and shape of a generated catalog.
+
+    `movies`, `people` and `users` are node counts.  Each user rates a number
+    of movies drawn from a Pareto distribution with shape `rating_shape`,
+    starting at `min_ratings` and capped at `max_ratings`; the movies they
+    rate and favorite are drawn from a power law with exponent
+    `popularity_exponent`, as are the people cast in each movie.
+    """
+
+    def __init__(self, movies=1000, people=None, users=None, seed=0,
+                 min_ratings=5, max_ratings=2000, rating_shape=1.2,
+                 favorite_rate=0.1, popularity_exponent=1.1,
+                 chunk_size=CHUNK_SIZE):
+        self.movies = movies
+        self.people = people if people is not None else max(movies * 2, 1)
+        self.users = users if users is not None else max(movies, 1)
+        self.seed = seed
+        self.min_ratings = min_ratings
+        self.max_ratings = min(max_ratings, movies)
+        self.rating_shape = rating_shape
+        self.favorite_rate = favorite_rate
+        self.popularity_exponent = popularity_exponent
+        self.chunk_size = chunk_size
+
+    def chunks(self):
+        """
+        Every (kind, chunk) to generate, in load order: nodes before the
+        relationships that point at them.
+        """
+        yield ("Genre", 0)
+
+        for kind, count in (("Person", self.people), ("Movie", self.movies), ("User", self.users)):
+            for chunk in range(-(-count // self.chunk_size)):
+                yield (kind, chunk)
+
+    def rng(self, kind, chunk):
+        # String seeds are hashed with SHA-512, so streams are stable across runs
+        return random.Random("%s:%s:%d" % (self.seed, kind, chunk))
+
+    def records(self, kind, chunk):
+        """
+        The records of one chunk
+        """
+        rng = self.rng(kind, chunk)
+        start = chunk * self.chunk_size
+
+        if kind == "Genre":
+            return ({"label": "Genre", "properties": {"name": name}} for name in GENRES)
+        if kind == "Person":
+            end = min(start + self.chunk_size, self.people)
+            return self._people(rng, start, end)
+        if kind == "Movie":
+            end = min(start + self.chunk_size, self.movies)
+            return self._movies(rng, start, end)
+        if kind == "User":
+            end = min(start + self.chunk_size, self.users)
+            return self._users(rng, start, end)
+
+        raise ValueError("Unknown kind %s" % kind)
+
+    def __iter__(self):
+        for kind, chunk in self.chunks():
+            yield from self.records(kind, chunk)
+
+    """
+    Chunk generators
+    """
+
+    def _people(self, rng, start, end):
+        for i in range(start, end):
+            yield {"label": "Person", "properties": {
+                "tmdbId": "p%d" % i,
+                "name": "Person %d" % i,
+                "born": "%d-%02d-%02d" % (
+                    rng.randint(1900, 2005), rng.randint(1, 12), rng.randint(1, 28)
+                ),
+                "poster": "https://image.example.com/people/%d.jpg" % i,
+            }}
+
+    def _movies(self, rng, start, end):
+        for i in range(start, end):
+            id = "m%d" % i
+            year = rng.randint(1920, 2023)
+
+            yield {"label": "Movie", "properties": {
+                "tmdbId": id,
+                "title": "Movie %d" % i,
+                "year": year,
+                "released": "%d-%02d-%02d" % (year, rng.randint(1, 12), rng.randint(1, 28)),
+                "runtime": rng.randint(70, 200),
+                "imdbRating": quality(self.seed, i),
+                "languages": rng.sample(LANGUAGES, power_law_index(rng, 3, 2.0) + 1),
+                "poster": "https://image.example.com/movies/%d.jpg" % i,
+            }}
+
+            # Drama and Comedy are far more common than Film-Noir
+            for genre in self._distinct(rng, len(GENRES), rng.randint(1, 3), 1.5):
+                yield {"type": "IN_GENRE", "start": id, "end": GENRES[genre]}
+
+            cast_size = min(self.people, 2 + power_law_index(rng, 30, 1.5))
+            for person in self._distinct(rng, self.people, cast_size, self.popularity_exponent):
+                yield {"type": "ACTED_IN", "start": "p%d" % person, "end": id,
+                       "properties": {"role": "Character %d" % rng.randrange(1000)}}
+
+            director = power_law_index(rng, self.people, self.popularity_exponent)
+            yield {"type": "DIRECTED", "start": "p%d" % director, "end": id}
+
+    def _users(self, rng, start, end):
+        for i in range(start, end):
+            id = "u%d" % i
+
+            yield {"label": "User", "properties": {
+                "userId": id,
+                "name": "User %d" % i,
+                "email": "user%d@example.com" % i,
+                "password": ENCRYPTED_PASSWORD,
+            }}
+
+            rated = self._distinct(
+                rng, self.movies, self._degree(rng), self.popularity_exponent
+            )
+
+            for movie in rated:
+                # Ratings cluster around the movie's own rating
+                rating = rng.gauss(quality(self.seed, movie) / 2, 0.75)
+                yield {"type": "RATED", "start": id, "end": "m%d" % movie, "properties": {
+                    "rating": min(5.0, max(0.5, round(rating * 2) / 2)),
+                    "timestamp": rng.randint(1000000000, 1700000000),
+                }}
+
+                if rng.random() < self.favorite_rate:
+                    yield {"type": "HAS_FAVORITE", "start": id, "end": "m%d" % movie}
+
+    def _degree(self, rng):
+        degree = int(self.min_ratings * rng.paretovariate(self.rating_shape))
+
+        return max(min(degree, self.max_ratings), 0)
+
+    def _distinct(self, rng, n, count, exponent):
+        """
+        `count` distinct indexes below `n`, drawn from a power law
+        """
+        count = min(count, n)
+        chosen = {}
+        attempts = count * 20
+
+        while len(chosen) < count and attempts:
+            chosen[power_law_index(rng, n, exponent)] = None
+            attempts -= 1
+
+        # Top up uniformly when the head of the distribution is exhausted
+        while len(chosen) < count:
+            chosen[rng.randrange(n)] = None
+
+        return list(chosen)
+
+
+def power_law_index(rng, n, exponent):
+    """
+    An index in `range(n)` where index `i` is drawn with probability roughly
+    proportional to `(i + 1) ** -exponent`, sampled by inverting the CDF of
+    the continuous distribution in constant time and memory.
+    """
+    u = rng.random()
+
+    if exponent == 1:
+        x = (n + 1) ** u
+    else:
+        e = 1 - exponent
+        x = (1 + u * ((n + 1) ** e - 1)) ** (1 / e)
+
+    return min(int(x) - 1, n - 1)
+
+
+def quality(seed, movie):
+    """
+    The imdbRating of a movie, derived from its index so that any chunk can
+    look it up without generating the movie.
+    """
+    h = (movie * 2654435761 + seed * 40503) % 4294967296
+
+    return round(1 + 8.9 * ((h >> 8) % 1000) / 999, 1)
+
+
+"""
+Writers
+"""
+
+
+def _part_path(out, name, kind, chunk, extension):
+    return os.path.join(out, "%s.%s-%05d.%s" % (name, kind.lower(), chunk, extension))
+
+
+def _csv_value(value):
+    if isinstance(value, list):
+        return ";".join(value)
+
+    return value
+
+
+def write_chunk(catalog, format, out, kind, chunk):
+    """
+    Write one chunk to its own part files and return the number of records
+    written for each label and relationship type.
+    """
+    counts = {}
+
+    if format == "jsonl":
+        with open(_part_path(out, "records", kind, chunk, "jsonl"), "w") as f:
+            for record in catalog.records(kind, chunk):
+                name = record.get("label") or record["type"]
+                counts[name] = counts.get(name, 0) + 1
+                f.write(json.dumps(record, separators=(",", ":")))
+                f.write("\n")
+
+        return counts
+
+    files = {}
+    writers = {}
+
+    try:
+        for record in catalog.records(kind, chunk):
+            name = record.get("label") or record["type"]
+
+            if name not in writers:
+                files[name] = open(_part_path(out, name, kind, chunk, "csv"), "w", newline="")
+                writers[name] = csv.writer(files[name])
+
+            values = dict(record.get("properties") or {})
+            if "type" in record:
+                values["start"] = record["start"]
+                values["end"] = record["end"]
+
+            writers[name].writerow([_csv_value(values.get(key)) for key, _ in COLUMNS[name]])
+            counts[name] = counts.get(name, 0) + 1
+    finally:
+        for f in files.values():
+            f.close()
+
+    return counts
+
+
+def _write_chunk(args):
+    return write_chunk(*args)
+
+
+def write_headers(out):
+    for name, columns in COLUMNS.items():
+        with open(os.path.join(out, "%s.header.csv" % name), "w", newline="") as f:
+            csv.writer(f).writerow([header for _, header in columns])
+
+
+def generate(catalog, out, format="jsonl", workers=None):
+    """
+    Generate the catalog into the directory `out`, spreading the chunks over
+    `workers` processes (one per core by default).  Returns the total number
+    of records for each label and relationship type.
+    """
+    if format not in ("jsonl", "csv"):
+        raise ValueError("Unknown format %s" % format)
+
+    os.makedirs(out, exist_ok=True)
+
+    if format == "csv":
+        write_headers(out)
+
+    tasks = [(catalog, format, out, kind, chunk) for kind, chunk in catalog.chunks()]
+    totals = {}
+
+    if workers == 1:
+        results = map(_write_chunk, tasks)
+    else:
+        pool = Pool(workers or os.cpu_count())
+        results = pool.imap_unordered(_write_chunk, tasks)
+
+    try:
+        for counts in results:
+            for name, count in counts.items():
+                totals[name] = totals.get(name, 0) + count
+    finally:
+        if workers != 1:
+            pool.close()
+            pool.join()
+
+    return totals
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    # Use the importable module so that worker processes can unpickle tasks
+    from api.synthetic import Catalog, generate
+
+    parser = argparse.ArgumentParser(description="Generate a synthetic movie catalog")
+    parser.add_argument("--movies", type=int, default=10000)
+    parser.add_argument("--people", type=int)
+    parser.add_argument("--users", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--min-ratings", type=int, default=5)
+    parser.add_argument("--max-ratings", type=int, default=2000)
+    parser.add_argument("--format", choices=["jsonl", "csv"], default="jsonl")
+    parser.add_argument("--out", default="catalog")
+    parser.add_argument("--workers", type=int, help="Processes to use (default: one per core)")
+    args = parser.parse_args()
+
+    catalog = Catalog(
+        movies=args.movies, people=args.people, users=args.users, seed=args.seed,
+        min_ratings=args.min_ratings, max_ratings=args.max_ratings,
+    )
+
+    start = time.perf_counter()
+    totals = generate(catalog, args.out, args.format, args.workers)
+    elapsed = time.perf_counter() - start
+
+    for name, count in sorted(totals.items()):
+        print("%-14s %12d" % (name, count))
+    print("%d records in %.1fs" % (sum(totals.values()), elapsed))
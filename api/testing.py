@@ -0,0 +1,153 @@
+"""
+Helpers for tests that hold endpoints and DAOs to a query budget.
+
+    response = client.get("/api/movies/")
+    assert_query_budget(response, queries=1)
+
+    with query_budget(queries=2):
+        dao.find_by_id("769", user_id)
+
+and that repeating a request does not leak memory:
+
+    assert_no_leak(lambda: client.get("/api/movies/769"))
+
+`FakeDriver` stands in for the Neo4j driver in tests that check how DAOs
+open sessions, without a server.
+"""
+
+from contextlib import contextmanager
+
+from neo4j import Bookmarks
+
+from api.instrumentation import collect_query_stats, parse_server_timing
+from api.memprofile import measure_growth
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class MemoryLeakDetected(AssertionError):
+    pass
+
+
+def query_counts(response):
+    """
+    The database activity reported in a response's `Server-Timing` header
+    """
+    timing = parse_server_timing(response.headers.get("Server-Timing"))
+
+    return {
+        "queries": int(timing.get("db-queries", 0)),
+        "sessions": int(timing.get("db-sessions", 0)),
+        "rows": int(timing.get("db-rows", 0)),
+        "bytes": int(timing.get("db-bytes", 0)),
+        "durationMs": timing.get("db", 0.0),
+    }
+
+
+def _check(counts, budget, what):
+    over = [
+        "%s: %d > %d" % (name, counts[name], limit)
+        for name, limit in budget.items()
+        if limit is not None and counts[name] > limit
+    ]
+
+    if over:
+        raise QueryBudgetExceeded("%s exceeded its query budget (%s)" % (what, ", ".join(over)))
+
+
+def assert_query_budget(response, queries=None, sessions=None, rows=None):
+    """
+    Fail if a response reports more queries, sessions or rows than allowed
+    """
+    if "Server-Timing" not in response.headers:
+        raise AssertionError("The response has no Server-Timing header")
+
+    counts = query_counts(response)
+    _check(counts, {"queries": queries, "sessions": sessions, "rows": rows}, "Request")
+
+    return counts
+
+
+@contextmanager
+def query_budget(queries=None, sessions=None, rows=None):
+    """
+    Count the queries run on this thread inside the block, and fail if they
+    exceed the budget.  Yields the `QueryStats`.
+    """
+    with collect_query_stats() as stats:
+        yield stats
+
+    _check(
+        {"queries": stats.queries, "sessions": stats.sessions, "rows": stats.rows},
+        {"queries": queries, "sessions": sessions, "rows": rows},
+        "Block",
+    )
+
+
+def assert_no_leak(fn, iterations=200, warmup=20, max_bytes_per_iteration=64):
+    """
+    Fail if calling `fn` repeatedly keeps more than `max_bytes_per_iteration`
+    bytes alive per call, on average, once warmed up.  Returns the
+    `LeakReport`, which lists the lines that allocated the retained memory.
+    """
+    report = measure_growth(fn, iterations, warmup)
+
+    if report.per_iteration > max_bytes_per_iteration:
+        raise MemoryLeakDetected("Possible leak: %s" % report)
+
+    return report
+
+
+class FakeSession:
+    """
+    A session of `FakeDriver`, which records how it was opened and hands
+    transactions to the driver's `read` and `write` functions
+    """
+
+    def __init__(self, driver, database=None, bookmarks=None):
+        self.driver = driver
+        driver.databases.append(database)
+        driver.opened.append(bookmarks.raw_values if bookmarks else frozenset())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute_read(self, work, *args, **kwargs):
+        self.driver.executions += 1
+        return self.driver.read(work, *args, **kwargs)
+
+    read_transaction = execute_read
+
+    def execute_write(self, work, *args, **kwargs):
+        self.driver.writes += 1
+        return self.driver.write(work, *args, **kwargs)
+
+    write_transaction = execute_write
+
+    def last_bookmarks(self):
+        return Bookmarks.from_raw_values(["bookmark:%d" % self.driver.writes])
+
+
+class FakeDriver:
+    """
+    A driver without a server.  `read` and `write` are called with each
+    transaction function and its arguments, and return its result; by
+    default reads return no records and writes an empty one.  `databases`
+    and `opened` list the database and bookmarks of every session.
+    """
+
+    def __init__(self, read=None, write=None):
+        self.read = read or (lambda work, *args, **kwargs: [])
+        self.write = write or (lambda work, *args, **kwargs: {})
+        self.databases = []
+        self.opened = []
+        self.executions = 0
+        self.writes = 0
+
+    def session(self, database=None, bookmarks=None, **config):
+        return FakeSession(self, database, bookmarks)
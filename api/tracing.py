@@ -0,0 +1,415 @@
+"""
+Trace spans for requests, DAO methods, sessions, transactions and queries.
+
+A share `TRACING_SAMPLE_RATE` of requests is traced, as is every request
+whose W3C `traceparent` header has the sampled flag set; the trace id and
+parent span of an incoming `traceparent` are kept, so the app's spans join
+the caller's trace.  A traced request produces:
+
+    GET /api/movies/<movie_id>          http.route, http.status_code
+      MovieDAO.find_by_id
+        neo4j.session                   db.name
+          neo4j.transaction             neo4j.mode, neo4j.attempts, neo4j.pool.wait_ms
+            neo4j.query                 db.query.fingerprint, db.rows,
+                                        db.server.available_ms, db.server.consumed_ms
+
+The trace id and span id of every transaction are sent to Neo4j as
+transaction metadata (`traceId`, `spanId`), which the server writes to its
+query log, so slow server-side queries can be matched with their request.
+The response carries the trace in a `traceresponse` header.
+
+Finished spans are exported in batches from a background thread to
+`TRACING_EXPORT`: a `file:` path (one JSON span per line) or the `http://`
+URL of a collector that accepts JSON arrays of spans, such as
+`python -m benchmarks.trace_collector`.
+
+Requests that are not sampled have no current span, and every other hook
+returns as soon as it sees that.
+"""
+
+import json
+import os
+import queue
+import random
+import re
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+
+from flask import current_app, g, request
+
+TRACEPARENT = "traceparent"
+TRACERESPONSE = "traceresponse"
+
+_TRACEPARENT = re.compile(r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+_local = threading.local()
+
+
+def new_id(bytes):
+    return "%0*x" % (bytes * 2, random.getrandbits(bytes * 8))
+
+
+class Span:
+    def __init__(self, tracer, name, trace_id, parent_id=None, attributes=None, start=None):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = new_id(8)
+        self.parent_id = parent_id
+        self.attributes = attributes or {}
+        self.start = start if start is not None else time.time_ns()
+        self.end = None
+        self.error = None
+        self.previous = None
+
+    @property
+    def traceparent(self):
+        return "00-%s-%s-01" % (self.trace_id, self.span_id)
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def add(self, key, value):
+        self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def finish(self, error=None, end=None):
+        if self.end is not None:
+            return
+
+        self.end = end if end is not None else time.time_ns()
+
+        if error is not None:
+            self.error = "%s: %s" % (type(error).__name__, error)
+
+        self.tracer.export(self)
+
+    def as_dict(self):
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "startTimeUnixNano": self.start,
+            "endTimeUnixNano": self.end,
+            "durationMs": (self.end - self.start) / 1e6,
+            "attributes": self.attributes,
+            "status": {"code": "ERROR", "message": self.error} if self.error else {"code": "OK"},
+        }
+
+
+"""
+The span that new spans on this thread are children of
+"""
+
+
+def current_span():
+    return getattr(_local, "span", None)
+
+
+def child_span(name, **attributes):
+    """
+    Start a child of the current span without making it current.  Returns
+    None when this thread is not tracing.
+    """
+    parent = current_span()
+
+    if parent is None:
+        return None
+
+    return Span(parent.tracer, name, parent.trace_id, parent.span_id, attributes)
+
+
+def enter_span(name, **attributes):
+    """
+    Start a child of the current span and make it current until
+    `exit_span`.  Returns None when this thread is not tracing.
+    """
+    span = child_span(name, **attributes)
+
+    if span is not None:
+        span.previous = current_span()
+        _local.span = span
+
+    return span
+
+
+def exit_span(span, error=None):
+    if span is None:
+        return
+
+    if current_span() is span:
+        _local.span = span.previous
+
+    span.finish(error)
+
+
+@contextmanager
+def traced(name, **attributes):
+    span = enter_span(name, **attributes)
+
+    try:
+        yield span
+    except Exception as e:
+        exit_span(span, e)
+        raise
+
+    exit_span(span)
+
+
+def annotate(key, value, accumulate=False):
+    """
+    Set an attribute on the current span, if any
+    """
+    span = current_span()
+
+    if span is not None:
+        if accumulate:
+            span.add(key, value)
+        else:
+            span.set(key, value)
+
+
+def transaction_metadata(span):
+    return {"traceId": span.trace_id, "spanId": span.span_id}
+
+
+def parse_traceparent(header):
+    """
+    (trace id, parent span id, sampled) from a `traceparent` header, or None
+    """
+    match = _TRACEPARENT.match((header or "").strip().lower())
+
+    if match is None:
+        return None
+
+    version, trace_id, parent_id, flags = match.groups()
+
+    if version == "ff" or trace_id == "0" * 32 or parent_id == "0" * 16:
+        return None
+
+    return trace_id, parent_id, bool(int(flags, 16) & 1)
+
+
+"""
+Export
+"""
+
+
+class FileExporter:
+    def __init__(self, path):
+        self.path = path
+
+    def __call__(self, spans):
+        with open(self.path, "a") as f:
+            for span in spans:
+                f.write(json.dumps(span) + "\n")
+
+
+class HttpExporter:
+    def __init__(self, url, timeout=5.0):
+        self.url = url
+        self.timeout = timeout
+
+    def __call__(self, spans):
+        body = json.dumps(spans).encode("utf8")
+        post = urllib.request.Request(
+            self.url, data=body, headers={"Content-Type": "application/json"}
+        )
+
+        with urllib.request.urlopen(post, timeout=self.timeout) as response:
+            response.read()
+
+
+class MemoryExporter:
+    """
+    Keeps exported spans in `spans`, for tests
+    """
+
+    def __init__(self):
+        self.spans = []
+
+    def __call__(self, spans):
+        self.spans.extend(spans)
+
+
+def exporter_for(target):
+    if target.startswith(("http://", "https://")):
+        return HttpExporter(target)
+
+    if target.startswith("file:"):
+        target = target[len("file:"):]
+
+    return FileExporter(target)
+
+
+class Tracer:
+    """
+    Samples requests and exports their spans in the background
+    """
+
+    def __init__(self, exporter, sample_rate=0.0, batch_size=512, interval=1.0, max_queue=10000):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.batch_size = batch_size
+        self.interval = interval
+        self.exported = 0
+        self.dropped = 0
+        self.failed = 0
+        self._queue = queue.Queue(max_queue)
+        self._pid = None
+
+    def sampled(self, parent):
+        if parent is not None:
+            return parent[2]
+
+        return bool(self.sample_rate) and random.random() < self.sample_rate
+
+    def start_trace(self, name, parent=None, **attributes):
+        """
+        Start a root span (continuing `parent`, a parsed `traceparent`) and
+        make it current
+        """
+        if parent is not None:
+            trace_id, parent_id, _ = parent
+        else:
+            trace_id, parent_id = new_id(16), None
+
+        span = Span(self, name, trace_id, parent_id, attributes)
+        span.previous = current_span()
+        _local.span = span
+
+        return span
+
+    def export(self, span):
+        if self._pid != os.getpid():
+            self._start()
+
+        try:
+            self._queue.put_nowait(span.as_dict())
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self):
+        self._pid = os.getpid()
+        threading.Thread(target=self._run, name="span-exporter", daemon=True).start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+
+            self._send(batch)
+
+    def _send(self, batch):
+        try:
+            self.exporter(batch)
+            self.exported += len(batch)
+        except Exception:
+            self.failed += len(batch)
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+    def flush(self):
+        """
+        Export every span finished so far, and wait for the batch the
+        background thread may be holding
+        """
+        batch = []
+
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        if batch:
+            self._send(batch)
+
+        self._queue.join()
+
+    def dao_hook(self, dao, name, method, call):
+        """
+        `api.proxy` hook giving every DAO method call its own span
+        """
+        def traced_method(*args, **kwargs):
+            if current_span() is None:
+                return call(*args, **kwargs)
+
+            with traced("%s.%s" % (name, method), **{"code.function": method}):
+                return call(*args, **kwargs)
+
+        return traced_method
+
+
+"""
+Request hooks
+"""
+
+
+def start_request_span():
+    """
+    `before_request` handler that starts a trace if the request is sampled
+    """
+    tracer = current_app.tracer
+    parent = parse_traceparent(request.headers.get(TRACEPARENT))
+
+    if not tracer.sampled(parent):
+        return
+
+    route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+
+    g.span = tracer.start_trace(
+        "%s %s" % (request.method, route),
+        parent,
+        **{"http.method": request.method, "http.route": route, "http.target": request.full_path},
+    )
+
+
+def add_trace_response(response):
+    """
+    `after_request` handler
+    """
+    span = g.get("span")
+
+    if span is not None:
+        span.set("http.status_code", response.status_code)
+        response.headers[TRACERESPONSE] = span.traceparent
+
+    return response
+
+
+def finish_request_span(exc=None):
+    """
+    `teardown_request` handler
+    """
+    span = g.pop("span", None)
+
+    if span is not None:
+        _local.span = None
+        span.finish(exc)
+
+
+def init_tracing(app):
+    """
+    Trace a sample of requests if `TRACING_EXPORT` is set
+    """
+    target = app.config.get("TRACING_EXPORT")
+
+    if not target:
+        app.tracer = None
+        return
+
+    app.tracer = Tracer(exporter_for(target), app.config.get("TRACING_SAMPLE_RATE") or 0.0)
+
+    app.before_request(start_request_span)
+    app.after_request(add_trace_response)
+    app.teardown_request(finish_request_span)
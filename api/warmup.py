@@ -0,0 +1,146 @@
+"""
+Deferred driver verification and connection pool warmup.
+
+Creating the driver does not open any connections, so `create_app` can return
+straight away and leave verification to a background thread.  Once the
+database answers, the thread opens a few connections so the first requests
+don't pay for connection setup, then marks the app as ready.
+
+`GET /api/status/ready` reports the progress so that a load balancer or
+orchestrator only sends traffic once the database can be reached.
+"""
+
+import logging
+import threading
+import time
+
+from api.neo4j import verify_connectivity
+
+log = logging.getLogger(__name__)
+
+
+class Readiness:
+    STARTING = "starting"
+    READY = "ready"
+    FAILED = "failed"
+
+    def __init__(self):
+        self.state = self.STARTING
+        self.error = None
+        self.attempts = 0
+        self.connections = 0
+        self.started_at = time.time()
+        self.ready_after = None
+
+    @property
+    def ready(self):
+        return self.state == self.READY
+
+    def as_dict(self):
+        return {
+            "state": self.state,
+            "ready": self.ready,
+            "attempts": self.attempts,
+            "warmConnections": self.connections,
+            "readyAfterMs": self.ready_after * 1000
+            if self.ready_after is not None else None,
+            "error": self.error,
+        }
+
+
+def fill_pool(driver, database, connections, timeout=10.0):
+    """
+    Open `connections` connections at once by holding a transaction open on
+    each until they have all been acquired.  Returns the number opened.
+    """
+    barrier = threading.Barrier(connections)
+    opened = []
+
+    def hold(tx, held):
+        tx.run("RETURN 1").consume()
+
+        # Once the barrier has broken, other threads are releasing their
+        # connections, and this one may have been handed one of them
+        if not barrier.broken:
+            held.set()
+            barrier.wait(timeout)
+
+    def worker():
+        # Set if this thread held a connection of its own
+        held = threading.Event()
+
+        try:
+            with driver.session(database=database) as session:
+                session.execute_read(hold, held)
+        except threading.BrokenBarrierError:
+            # The pool could not supply every connection in time, whatever
+            # was opened stays in the pool
+            pass
+        except Exception as e:
+            barrier.abort()
+            log.warning("Connection warmup failed: %s", e)
+
+        if held.is_set():
+            opened.append(1)
+
+    threads = [threading.Thread(target=worker) for _ in range(connections)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return len(opened)
+
+
+def warm_up(driver, database, readiness, connections=0, retries=None, backoff=0.5,
+            max_backoff=10.0):
+    """
+    Verify connectivity, retrying with exponential backoff, then pre-fill the
+    connection pool.  `retries` of None retries until the database answers.
+    """
+    delay = backoff
+
+    while True:
+        readiness.attempts += 1
+
+        try:
+            verify_connectivity(driver, database)
+            break
+        except Exception as e:
+            readiness.error = str(e)
+            log.warning(
+                "Neo4j not reachable (attempt %d): %s", readiness.attempts, e
+            )
+
+            if retries is not None and readiness.attempts > retries:
+                readiness.state = Readiness.FAILED
+                return readiness
+
+            time.sleep(delay)
+            delay = min(delay * 2, max_backoff)
+
+    if connections > 0:
+        readiness.connections = fill_pool(driver, database, connections)
+
+    readiness.error = None
+    readiness.ready_after = time.time() - readiness.started_at
+    readiness.state = Readiness.READY
+
+    return readiness
+
+
+def start_warmup(driver, database, connections=0, retries=None):
+    """
+    Run `warm_up` on a daemon thread and return its `Readiness`
+    """
+    readiness = Readiness()
+
+    thread = threading.Thread(
+        target=warm_up,
+        args=(driver, database, readiness, connections, retries),
+        name="neo4j-warmup",
+        daemon=True,
+    )
+    thread.start()
+
+    return readiness
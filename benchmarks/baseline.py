@@ -0,0 +1,256 @@
+"""
+Store benchmark results as baselines and check new runs against them.
+
+    python -m benchmarks.baseline save results/dao.json --name dao-memory
+    python -m benchmarks.baseline compare results/dao.json --baseline dao-memory
+
+Works with the JSON written by `benchmarks.dao_bench` and `benchmarks.load`.
+Every result is matched to the baseline by name and parameters.  Latency is
+compared with a Mann-Whitney U test on the raw samples rather than by
+comparing means, and only counts as a regression when the difference is
+both significant (`--alpha`) and large enough to matter: at least
+`--threshold` of the baseline median and at least `--min-delta-ms`.  Samples
+within one run do not capture the drift between runs (CPU frequency, other
+processes), so very small differences are ignored however significant.
+
+Query counts are deterministic, so any increase in queries per call or per
+request is a regression, as is a higher error rate.
+
+`compare` exits with status 1 when anything regressed, so it can gate a CI
+job, and 2 when the baseline is missing.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from benchmarks.stats import mann_whitney_u, percentile
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+
+"""
+Fields holding a count that must not grow
+"""
+QUERY_FIELDS = ["queriesPerCall", "queriesPerRequest"]
+
+
+def environment():
+    """
+    Describe where a benchmark ran, so that comparisons across different
+    machines or interpreters can be flagged.
+    """
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    try:
+        import neo4j
+
+        driver = neo4j.__version__
+    except ImportError:
+        driver = None
+
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "neo4jDriver": driver,
+        "time": time.time(),
+    }
+
+
+def key(result):
+    return "%s %s" % (result["name"], json.dumps(result.get("params") or {}, sort_keys=True))
+
+
+def baseline_path(name, directory=BASELINE_DIR):
+    return os.path.join(directory, "%s.json" % name)
+
+
+def save(run, name, directory=BASELINE_DIR):
+    run = dict(run)
+    run.setdefault("environment", environment())
+
+    os.makedirs(directory, exist_ok=True)
+    path = baseline_path(name, directory)
+
+    with open(path, "w") as f:
+        json.dump(run, f, indent=2)
+
+    return path
+
+
+def compare_result(baseline, current, alpha=0.01, threshold=0.10, min_delta_ms=0.005):
+    """
+    Compare one result with its baseline and return a verdict:
+    `regressed`, `improved` or `unchanged`, with the reasons.
+    """
+    reasons = []
+    improvements = []
+
+    before = baseline.get("samplesMs") or []
+    after = current.get("samplesMs") or []
+
+    comparison = {
+        "name": key(current),
+        "baselineP50": percentile(before, 50) if before else baseline["latencyMs"]["p50"],
+        "currentP50": percentile(after, 50) if after else current["latencyMs"]["p50"],
+        "p": None,
+    }
+
+    base = comparison["baselineP50"]
+    delta = comparison["currentP50"] - base
+    change = delta / base if base else 0.0
+    comparison["change"] = change
+
+    if before and after:
+        _, p = mann_whitney_u(before, after)
+        comparison["p"] = p
+        significant = p < alpha and abs(delta) >= min_delta_ms
+
+        if significant and change > threshold:
+            reasons.append("p50 %+.1f%% (p=%.2g)" % (change * 100, p))
+        elif significant and change < -threshold:
+            improvements.append("p50 %+.1f%% (p=%.2g)" % (change * 100, p))
+
+    for field in QUERY_FIELDS:
+        if baseline.get(field) is None or current.get(field) is None:
+            continue
+
+        if current[field] > baseline[field] + 1e-9:
+            reasons.append("%s %g -> %g" % (field, baseline[field], current[field]))
+        elif current[field] < baseline[field] - 1e-9:
+            improvements.append("%s %g -> %g" % (field, baseline[field], current[field]))
+
+    if current.get("errorRate", 0) > baseline.get("errorRate", 0) + 1e-9:
+        reasons.append("errors %.1f%% -> %.1f%%" % (
+            baseline.get("errorRate", 0) * 100, current["errorRate"] * 100))
+
+    if reasons:
+        comparison["verdict"] = "regressed"
+    elif improvements:
+        comparison["verdict"] = "improved"
+    else:
+        comparison["verdict"] = "unchanged"
+
+    comparison["reasons"] = reasons + improvements
+
+    return comparison
+
+
+def compare(baseline, current, alpha=0.01, threshold=0.10, min_delta_ms=0.005):
+    baseline_results = {key(r): r for r in baseline["results"]}
+    comparisons = []
+    missing = []
+
+    for result in current["results"]:
+        match = baseline_results.pop(key(result), None)
+
+        if match is None:
+            comparisons.append({"name": key(result), "verdict": "new", "reasons": []})
+        else:
+            comparisons.append(compare_result(match, result, alpha, threshold, min_delta_ms))
+
+    missing.extend(baseline_results)
+
+    return comparisons, missing
+
+
+def environment_differences(baseline, current):
+    before = baseline.get("environment") or {}
+    after = current.get("environment") or environment()
+
+    return [
+        "%s: %s -> %s" % (field, before.get(field), after.get(field))
+        for field in ("python", "implementation", "machine", "cpus", "neo4jDriver")
+        if before.get(field) != after.get(field)
+    ]
+
+
+def print_report(comparisons, missing, differences, out=sys.stdout):
+    for difference in differences:
+        print("Environment differs, %s" % difference, file=out)
+
+    print("%-10s %-60s %10s %10s %8s %8s" % (
+        "verdict", "benchmark", "base p50", "p50", "change", "p"), file=out)
+
+    for c in comparisons:
+        if c["verdict"] == "new":
+            print("%-10s %-60s" % ("new", c["name"][:60]), file=out)
+            continue
+
+        print("%-10s %-60s %9.3fms %9.3fms %+7.1f%% %8s  %s" % (
+            c["verdict"], c["name"][:60], c["baselineP50"], c["currentP50"],
+            c["change"] * 100, "%.2g" % c["p"] if c["p"] is not None else "-",
+            "; ".join(c["reasons"]),
+        ), file=out)
+
+    for name in missing:
+        print("%-10s %-60s" % ("missing", name[:60]), file=out)
+
+    regressed = sum(1 for c in comparisons if c["verdict"] == "regressed")
+    print("%d compared, %d regressed" % (len(comparisons), regressed), file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--dir", default=BASELINE_DIR, help="Where baselines are stored")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    save_parser = commands.add_parser("save", help="Store a run as a baseline")
+    save_parser.add_argument("run")
+    save_parser.add_argument("--name", required=True)
+
+    compare_parser = commands.add_parser("compare", help="Compare a run with a baseline")
+    compare_parser.add_argument("run")
+    compare_parser.add_argument("--baseline", required=True)
+    compare_parser.add_argument("--alpha", type=float, default=0.01,
+                                help="Significance level for the latency test")
+    compare_parser.add_argument("--threshold", type=float, default=0.10,
+                                help="Smallest median slowdown that counts, as a fraction")
+    compare_parser.add_argument("--min-delta-ms", type=float, default=0.005,
+                                help="Smallest median slowdown that counts, in milliseconds")
+    compare_parser.add_argument("--output", help="Write the comparison to this JSON file")
+
+    args = parser.parse_args(argv)
+
+    with open(args.run) as f:
+        run = json.load(f)
+
+    if args.command == "save":
+        print("Saved %s" % save(run, args.name, args.dir))
+        return 0
+
+    path = baseline_path(args.baseline, args.dir)
+
+    if not os.path.exists(path):
+        print("No baseline named %s in %s" % (args.baseline, args.dir), file=sys.stderr)
+        return 2
+
+    with open(path) as f:
+        baseline = json.load(f)
+
+    comparisons, missing = compare(
+        baseline, run, args.alpha, args.threshold, args.min_delta_ms
+    )
+    print_report(comparisons, missing, environment_differences(baseline, run))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"comparisons": comparisons, "missing": missing}, f, indent=2)
+
+    return 1 if any(c["verdict"] == "regressed" for c in comparisons) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
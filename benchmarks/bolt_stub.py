@@ -0,0 +1,292 @@
+"""
+A minimal Bolt server that stands in for Neo4j in stress and load tests.
+
+It speaks enough of Bolt 4.4 for the official driver to connect, route, run
+auto-commit and transaction-function queries and receive records, without a
+database behind it.  Every query is answered by a handler function; the
+default handler echoes the query parameters back as a single record, which
+lets a client check that each response belongs to the request it sent.
+
+Every message that cannot be parsed is counted in `stats["errors"]`, so a test
+can assert that no connection was corrupted (for example by two processes
+writing to the same inherited socket).
+
+    with BoltStub() as stub:
+        driver = GraphDatabase.driver(stub.uri, auth=("neo4j", "stub"))
+"""
+
+import socketserver
+import struct
+import threading
+import time
+from collections import deque
+
+from neo4j._codec.packstream.v1 import (
+    PackableBuffer,
+    Packer,
+    UnpackableBuffer,
+    Unpacker,
+)
+
+MAGIC = b"\x60\x60\xB0\x17"
+VERSION = b"\x00\x00\x04\x04"
+
+HELLO = b"\x01"
+GOODBYE = b"\x02"
+RESET = b"\x0F"
+RUN = b"\x10"
+BEGIN = b"\x11"
+COMMIT = b"\x12"
+ROLLBACK = b"\x13"
+DISCARD = b"\x2F"
+PULL = b"\x3F"
+ROUTE = b"\x66"
+
+SUCCESS = b"\x70"
+RECORD = b"\x71"
+FAILURE = b"\x7F"
+
+
+def echo(query, parameters):
+    """
+    Default handler: `RETURN 1` returns 1, anything else returns one record
+    holding the parameters that were sent.
+    """
+    if query.strip().upper() == "RETURN 1":
+        return ["1"], [[1]]
+
+    keys = sorted(parameters)
+
+    return keys, [[parameters[key] for key in keys]]
+
+
+class ProtocolError(Exception):
+    pass
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def setup(self):
+        self.stub = self.server.stub
+        self.in_transaction = False
+        self.pending = []
+
+    def handle(self):
+        self.stub._count("connections")
+
+        try:
+            if self._recv_exactly(4) != MAGIC:
+                raise ProtocolError("Bad handshake")
+
+            self._recv_exactly(16)
+            self.request.sendall(VERSION)
+
+            while True:
+                tag, fields = self._read_message()
+
+                if tag == GOODBYE:
+                    return
+
+                self._dispatch(tag, fields)
+        except ConnectionError:
+            pass
+        except ProtocolError as e:
+            self.stub._count("errors")
+            self.stub.last_error = str(e)
+
+            try:
+                self._send(FAILURE, {
+                    "code": "Neo.ClientError.Request.Invalid",
+                    "message": str(e),
+                })
+            except OSError:
+                pass
+
+    def _recv_exactly(self, n):
+        data = bytearray()
+
+        while len(data) < n:
+            chunk = self.request.recv(n - len(data))
+
+            if not chunk:
+                raise ConnectionError("Client disconnected")
+
+            data.extend(chunk)
+
+        return bytes(data)
+
+    def _read_message(self):
+        data = bytearray()
+
+        while True:
+            (size,) = struct.unpack(">H", self._recv_exactly(2))
+
+            if size == 0:
+                if data:
+                    break
+
+                # NOOP chunk used as a keep-alive
+                continue
+
+            data.extend(self._recv_exactly(size))
+
+        try:
+            unpacker = Unpacker(UnpackableBuffer(data))
+            size, tag = unpacker.unpack_structure_header()
+            fields = [unpacker.unpack() for _ in range(size)]
+        except (ValueError, IndexError, TypeError) as e:
+            raise ProtocolError("Unreadable message: %s" % e)
+
+        if tag is None:
+            raise ProtocolError("Empty message")
+
+        return tag, fields
+
+    def _send(self, tag, *fields):
+        buffer = PackableBuffer()
+        Packer(buffer).pack_struct(tag, fields)
+        data = bytes(buffer.data)
+
+        out = bytearray()
+        for start in range(0, len(data), 0xFFFF):
+            chunk = data[start:start + 0xFFFF]
+            out.extend(struct.pack(">H", len(chunk)))
+            out.extend(chunk)
+        out.extend(b"\x00\x00")
+
+        self.request.sendall(out)
+
+    def _dispatch(self, tag, fields):
+        self.stub._count("messages")
+
+        if tag == HELLO:
+            self._send(SUCCESS, {
+                "server": "Neo4j/4.4.0",
+                "connection_id": "bolt-%d" % self.stub.stats["connections"],
+            })
+        elif tag == ROUTE:
+            address = "%s:%d" % self.stub.address
+            self._send(SUCCESS, {"rt": {
+                "ttl": 300,
+                "db": "neo4j",
+                "servers": [
+                    {"addresses": [address], "role": role}
+                    for role in ("ROUTE", "READ", "WRITE")
+                ],
+            }})
+        elif tag == BEGIN:
+            self.in_transaction = True
+
+            extra = fields[0] if fields and isinstance(fields[0], dict) else {}
+            self.stub.transactions.append(extra.get("tx_metadata"))
+
+            self._send(SUCCESS, {})
+        elif tag == RUN:
+            if len(fields) < 2 or not isinstance(fields[0], str):
+                raise ProtocolError("Malformed RUN")
+
+            self.stub._count("queries")
+
+            if self.stub.latency:
+                time.sleep(self.stub.latency)
+
+            keys, rows = self.stub.handler(fields[0], fields[1] or {})
+            self.pending = rows
+
+            metadata = {"fields": keys, "t_first": 0}
+            if self.in_transaction:
+                metadata["qid"] = 0
+
+            self._send(SUCCESS, metadata)
+        elif tag in (PULL, DISCARD):
+            if tag == PULL:
+                for row in self.pending:
+                    self._send(RECORD, row)
+            self.pending = []
+
+            metadata = {"has_more": False, "t_last": 0, "type": "r", "db": "neo4j"}
+            if not self.in_transaction:
+                metadata["bookmark"] = self.stub._bookmark()
+
+            self._send(SUCCESS, metadata)
+        elif tag == COMMIT:
+            self.in_transaction = False
+            self._send(SUCCESS, {"bookmark": self.stub._bookmark()})
+        elif tag in (ROLLBACK, RESET):
+            self.in_transaction = False
+            self.pending = []
+            self._send(SUCCESS, {})
+        else:
+            raise ProtocolError("Unexpected message 0x%02X" % ord(tag))
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class BoltStub:
+    def __init__(self, handler=echo, latency=0.0, host="127.0.0.1", port=0):
+        self.handler = handler
+        self.latency = latency
+        self.stats = {"connections": 0, "messages": 0, "queries": 0, "errors": 0}
+        self.last_error = None
+        # The metadata of recent transactions
+        self.transactions = deque(maxlen=1000)
+        self._lock = threading.Lock()
+        self._bookmarks = 0
+
+        self._server = _Server((host, port), _Handler)
+        self._server.stub = self
+        self.address = self._server.server_address
+        self._thread = None
+
+    @property
+    def uri(self):
+        return "bolt://%s:%d" % self.address
+
+    @property
+    def routing_uri(self):
+        return "neo4j://%s:%d" % self.address
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _bookmark(self):
+        with self._lock:
+            self._bookmarks += 1
+            return "stub:%d" % self._bookmarks
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="bolt-stub", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run a Bolt stand-in server")
+    parser.add_argument("--port", type=int, default=7687)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    stub = BoltStub(latency=args.latency, port=args.port)
+    print("Listening on %s" % stub.uri)
+
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
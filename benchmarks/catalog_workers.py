@@ -0,0 +1,192 @@
+"""
+Compare the memory of 1, 2, 4... workers serving the in-memory backend from
+their own graphs and from a shared catalog file (see `api.memory.catalog`).
+
+    python -m benchmarks.catalog_workers --movies 50000 --workers 1 2 4
+
+For each backend and number of workers, the workers are started as fresh
+processes, load the catalog, serve `--requests` reads over the whole of it,
+and then, all at once, read their memory from `/proc/self/smaps_rollup`:
+
+* PSS: the worker's private memory plus its share of the pages it shares
+  with other processes.  The sum over the workers is what they use together.
+* USS: its private memory alone, what stopping the worker would free.
+
+With `dict` every worker builds its own `MemoryGraph`, so the total grows
+by a whole catalog per worker.  With `catalog` the records are read from one
+mapped file and the total should only grow by what each worker builds for
+its requests.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+
+from api import create_app
+from benchmarks.baseline import environment
+
+MB = 1024 * 1024
+
+
+def memory():
+    """
+    This process's memory in bytes, by smaps_rollup field
+    """
+    fields = {}
+
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                parts = value.split()
+
+                if len(parts) == 2 and parts[1] == "kB":
+                    fields[name] = int(parts[0]) * 1024
+    except FileNotFoundError:
+        return None
+
+    return {
+        "rss": fields.get("Rss"),
+        "pss": fields.get("Pss"),
+        "uss": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+    }
+
+
+def make_app(args, path):
+    config = {
+        "TESTING": True,
+        "SECRET_KEY": "catalog",
+        "JWT_SECRET_KEY": "catalog",
+        "DAO_BACKEND": "memory",
+        "MEMORY_SEED": "synthetic",
+        "MEMORY_SYNTHETIC_MOVIES": args.movies,
+        "MEMORY_SYNTHETIC_SEED": args.seed,
+        "MEMORY_CATALOG": path,
+    }
+
+    return create_app(config)
+
+
+def worker(args, path, loaded, measured, results):
+    from api.memory.dao import get_graph
+
+    app = make_app(args, path)
+
+    with app.app_context():
+        graph = get_graph()
+        movies = list(graph.movies)
+        people = list(graph.people)
+
+    client = app.test_client()
+    rng = random.Random(os.getpid())
+
+    for _ in range(args.requests):
+        client.get(rng.choice([
+            "/api/movies/?sort=imdbRating&order=DESC&skip=%d" % (6 * rng.randrange(100)),
+            "/api/movies/%s" % rng.choice(movies),
+            "/api/people/%s" % rng.choice(people),
+            "/api/genres/",
+        ]))
+
+    # Measure once every worker is loaded, so that shared pages are shared
+    loaded.wait()
+    results.put(memory())
+    measured.wait()
+
+
+def run_workers(args, path, workers):
+    context = multiprocessing.get_context("spawn")
+    loaded = context.Barrier(workers + 1)
+    measured = context.Barrier(workers + 1)
+    results = context.Queue()
+
+    processes = [
+        context.Process(target=worker, args=(args, path, loaded, measured, results))
+        for _ in range(workers)
+    ]
+
+    for process in processes:
+        process.start()
+
+    loaded.wait()
+    samples = [results.get() for _ in processes]
+    measured.wait()
+
+    for process in processes:
+        process.join()
+
+    if None in samples:
+        return {"workers": workers, "pssMb": None, "ussMb": None}
+
+    return {
+        "workers": workers,
+        "totalPssMb": sum(s["pss"] for s in samples) / MB,
+        "pssMb": sum(s["pss"] for s in samples) / len(samples) / MB,
+        "ussMb": sum(s["uss"] for s in samples) / len(samples) / MB,
+        "rssMb": sum(s["rss"] for s in samples) / len(samples) / MB,
+    }
+
+
+def run(args):
+    from api.memory.catalog import build
+    from api.memory.graph import MemoryGraph
+
+    results = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "catalog.bin")
+        build(MemoryGraph.synthetic(args.movies, args.seed), path)
+
+        for backend in args.backends:
+            for workers in args.workers:
+                result = run_workers(args, path if backend == "catalog" else None, workers)
+                results.append({"backend": backend, **result})
+
+        size = os.path.getsize(path)
+
+    return {
+        "benchmark": "catalog_workers",
+        "movies": args.movies,
+        "requests": args.requests,
+        "catalogMb": size / MB,
+        "results": results,
+        "environment": environment(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--movies", type=int, default=50000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--backends", nargs="+", choices=["dict", "catalog"], default=["dict", "catalog"])
+    parser.add_argument("--requests", type=int, default=500, help="Reads served by each worker")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the report to this JSON file")
+    args = parser.parse_args()
+
+    result = run(args)
+
+    print("catalog file %.1f MB, %d movies" % (result["catalogMb"], result["movies"]))
+    print("%-8s %8s %14s %14s %14s" % ("backend", "workers", "total PSS MB", "PSS/worker MB", "USS/worker MB"))
+
+    for r in result["results"]:
+        if r["pssMb"] is None:
+            print("%-8s %8d %14s %14s %14s" % (r["backend"], r["workers"], "-", "-", "-"))
+            continue
+
+        print("%-8s %8d %14.1f %14.1f %14.1f" % (
+            r["backend"], r["workers"], r["totalPssMb"], r["pssMb"], r["ussMb"],
+        ))
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
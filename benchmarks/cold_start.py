@@ -0,0 +1,119 @@
+"""
+Measure cold-start time: from launching a fresh interpreter to the first
+request served by the app, and to the app reporting itself ready.
+
+    python -m benchmarks.cold_start --runs 10
+
+Each run starts a new Python process that imports `api`, calls `create_app`
+and issues `GET /api/status/ready` through the test client, once with the
+driver verified synchronously during `create_app` and once with verification
+and pool warmup deferred to the background.
+
+Connection details are read from the environment (or `.env`).  Point
+NEO4J_URI at an unreachable address to see how each mode behaves when the
+database is down.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.stats import percentile
+
+CHILD = r"""
+import json, sys, time
+start = time.perf_counter()
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from api import create_app
+imported = time.perf_counter()
+
+try:
+    app = create_app()
+except Exception as e:
+    print(json.dumps({"error": str(e)}))
+    sys.exit(0)
+created = time.perf_counter()
+
+client = app.test_client()
+client.get("/api/status/ready")
+served = time.perf_counter()
+
+deadline = served + float(sys.argv[1])
+ready = None
+while time.perf_counter() < deadline:
+    if client.get("/api/status/ready").status_code == 200:
+        ready = time.perf_counter()
+        break
+    time.sleep(0.01)
+
+print(json.dumps({
+    "import": imported - start,
+    "createApp": created - imported,
+    "firstRequest": served - start,
+    "ready": ready - start if ready is not None else None,
+}))
+"""
+
+
+def run_once(deferred, ready_timeout):
+    env = dict(os.environ, NEO4J_DEFERRED_STARTUP="true" if deferred else "false")
+
+    launched = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD, str(ready_timeout)],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    total = time.perf_counter() - launched
+
+    result = json.loads(output.strip().splitlines()[-1])
+    result["process"] = total
+
+    return result
+
+
+def summarize_runs(runs):
+    errors = [r["error"] for r in runs if "error" in r]
+    ok = [r for r in runs if "error" not in r]
+    summary = {"runs": len(runs), "errors": len(errors)}
+
+    for key in ("import", "createApp", "firstRequest", "ready"):
+        samples = [r[key] for r in ok if r.get(key) is not None]
+
+        if samples:
+            summary[key + "Ms"] = {
+                "p50": percentile(samples, 50) * 1000,
+                "max": max(samples) * 1000,
+            }
+
+    if errors:
+        summary["lastError"] = errors[-1]
+
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--ready-timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    results = {}
+
+    for name, deferred in (("synchronous", False), ("deferred", True)):
+        runs = [run_once(deferred, args.ready_timeout) for _ in range(args.runs)]
+        results[name] = summarize_runs(runs)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,425 @@
+"""
+Micro-benchmarks for every public DAO method.
+
+Each method is called across sweeps of the parameters that drive its cost:
+page size, skip depth, the number of favorites the user has, the size of a
+movie's cast and the number of movies in a genre.  For every case the
+benchmark reports p50/p95/p99 latency, the memory allocated per call (peak
+and retained, measured with `tracemalloc` in separate iterations so that
+tracing does not skew the timings) and the number of queries per call.
+
+    python -m benchmarks.dao_bench --backend memory --output results/dao.json
+
+The DAOs are created through `api.neo4j.get_dao`, so the backend is chosen
+the same way the app chooses it:
+
+* `memory`: the in-memory graph, seeded with a synthetic catalog of
+  `--movies` movies.  Deterministic and needs no database.
+* `neo4j`: the database configured by NEO4J_URI, NEO4J_USERNAME,
+  NEO4J_PASSWORD and NEO4J_DATABASE.  The write benchmarks create users,
+  ratings and favorites, so point it at a disposable database.
+* `replay`: answers from a recording made with `--backend neo4j --record
+  FILE` (see `api.replay`), optionally with `--replay-latency recorded`.
+
+Results are written as JSON for comparison between runs.
+"""
+
+import argparse
+import json
+import os
+import time
+import tracemalloc
+import uuid
+
+from api import create_app
+from api.dao.auth import AuthDAO
+from api.dao.favorites import FavoriteDAO
+from api.dao.genres import GenreDAO
+from api.dao.movies import MovieDAO
+from api.dao.people import PeopleDAO
+from api.dao.ratings import RatingDAO
+from api.neo4j import get_dao
+from benchmarks.baseline import environment
+from benchmarks.stats import summarize
+
+PAGE_SIZES = [6, 24, 96]
+SKIPS = [0, 100, 1000]
+FAVORITE_COUNTS = [0, 10, 100]
+
+PASSWORD = "letmein"
+
+
+class Case:
+    """
+    One call to benchmark: `call` is run repeatedly, and `teardown` (if any)
+    after each timed call to undo its writes.
+    """
+
+    def __init__(self, dao, method, params, call, teardown=None, iterations=None):
+        self.dao = dao
+        self.method = method
+        self.params = params
+        self.call = call
+        self.teardown = teardown
+        self.iterations = iterations
+
+    @property
+    def name(self):
+        return "%s.%s" % (self.dao, self.method)
+
+
+"""
+Backends
+"""
+
+
+def memory_app(args):
+    return create_app({
+        "TESTING": True,
+        "SECRET_KEY": "bench",
+        "JWT_SECRET_KEY": "bench",
+        "DAO_BACKEND": "memory",
+        "MEMORY_SEED": "synthetic",
+        "MEMORY_SYNTHETIC_MOVIES": args.movies,
+        "MEMORY_SYNTHETIC_SEED": args.seed,
+    })
+
+
+def neo4j_app(args):
+    return create_app({
+        "TESTING": True,
+        "SECRET_KEY": "bench",
+        "NEO4J_DEFERRED_STARTUP": False,
+        "NEO4J_RECORD": args.record,
+    })
+
+
+def replay_app(args):
+    return create_app({
+        "TESTING": True,
+        "SECRET_KEY": "bench",
+        "NEO4J_DEFERRED_STARTUP": False,
+        "NEO4J_REPLAY": args.replay,
+        "NEO4J_REPLAY_LATENCY": args.replay_latency,
+    })
+
+
+"""
+Each backend builds an app and a function returning the number of queries
+issued so far, or None when the backend cannot count them.
+"""
+BACKENDS = {
+    "memory": memory_app,
+    "neo4j": neo4j_app,
+    "replay": replay_app,
+}
+
+
+def query_counter(app):
+    if app.config.get("DAO_BACKEND") == "memory":
+        from api.memory.dao import get_graph
+
+        graph = get_graph()
+
+        return lambda: graph.queries
+
+    if app.driver is not None:
+        # Counted by api.instrumentation.InstrumentedDriver
+        return lambda: app.driver.queries
+
+    return lambda: None
+
+
+"""
+Fixtures
+"""
+
+
+def _pick(items, key):
+    """
+    The smallest, median and largest item by `key`
+    """
+    ordered = sorted(items, key=key)
+
+    return {
+        "small": ordered[0],
+        "median": ordered[len(ordered) // 2],
+        "large": ordered[-1],
+    }
+
+
+def create_user(favorites):
+    """
+    Register a user and favorite the given movies
+    """
+    email = "bench-%s@example.com" % uuid.uuid4()
+    user = get_dao(AuthDAO, "bench").register(email, PASSWORD, "Benchmark")
+
+    for movie_id in favorites:
+        get_dao(FavoriteDAO).add(user["userId"], movie_id)
+
+    return user
+
+
+def fixtures(sample_size=200):
+    """
+    Find the movies, genres, people and users the sweeps need, using the DAOs
+    themselves so that every backend is explored the same way.
+    """
+    genres = get_dao(GenreDAO).all()
+    movies = get_dao(MovieDAO).all("imdbRating", "DESC", sample_size, 0)
+    details = [get_dao(MovieDAO).find_by_id(movie["tmdbId"]) for movie in movies]
+
+    casts = _pick(details, lambda m: len(m["actors"]))
+    people = [
+        get_dao(PeopleDAO).find_by_id(actor["tmdbId"])
+        for actor in casts["large"]["actors"]
+    ]
+    directors = [
+        get_dao(PeopleDAO).find_by_id(director["tmdbId"])
+        for movie in details[:20]
+        for director in movie["directors"]
+    ]
+
+    ids = [movie["tmdbId"] for movie in movies]
+    users = {
+        count: create_user(ids[:count])
+        for count in FAVORITE_COUNTS
+    }
+
+    return {
+        "genres": _pick(genres, lambda g: g["movies"]),
+        "casts": casts,
+        "rated": max(details, key=lambda m: m["ratingCount"]),
+        "actor": max(people, key=lambda p: p["actedCount"]),
+        "director": max(directors, key=lambda p: p["directedCount"]),
+        "users": users,
+        "unfavorited": ids[-1],
+    }
+
+
+"""
+Cases
+"""
+
+
+def cases(f):
+    user = f["users"][FAVORITE_COUNTS[-1]]
+    email = user["email"]
+    user_id = f["users"][0]["userId"]
+    movie_id = f["casts"]["median"]["tmdbId"]
+
+    movie = lambda: get_dao(MovieDAO)
+
+    for limit in PAGE_SIZES:
+        for skip in SKIPS:
+            yield Case("MovieDAO", "all", {"limit": limit, "skip": skip},
+                       lambda l=limit, s=skip: movie().all("imdbRating", "DESC", l, s))
+
+    for count, u in f["users"].items():
+        yield Case("MovieDAO", "all", {"limit": 24, "skip": 0, "favorites": count},
+                   lambda u=u: movie().all("imdbRating", "DESC", 24, 0, u["userId"]))
+
+    for size, genre in f["genres"].items():
+        for limit in PAGE_SIZES:
+            yield Case("MovieDAO", "get_by_genre",
+                       {"genre": size, "genreMovies": genre["movies"], "limit": limit},
+                       lambda g=genre, l=limit: movie().get_by_genre(g["name"], "imdbRating", "DESC", l))
+
+    for limit in PAGE_SIZES:
+        yield Case("MovieDAO", "get_for_actor", {"limit": limit},
+                   lambda l=limit: movie().get_for_actor(f["actor"]["tmdbId"], "title", "ASC", l))
+        yield Case("MovieDAO", "get_for_director", {"limit": limit},
+                   lambda l=limit: movie().get_for_director(f["director"]["tmdbId"], "title", "ASC", l))
+        yield Case("MovieDAO", "get_similar_movies", {"limit": limit},
+                   lambda l=limit: movie().get_similar_movies(movie_id, l))
+
+    for size, m in f["casts"].items():
+        yield Case("MovieDAO", "find_by_id", {"cast": size, "castSize": len(m["actors"])},
+                   lambda m=m: movie().find_by_id(m["tmdbId"]))
+
+    for count, u in f["users"].items():
+        yield Case("MovieDAO", "find_by_id", {"cast": "median", "favorites": count},
+                   lambda u=u: movie().find_by_id(movie_id, u["userId"]))
+
+    for count, u in f["users"].items():
+        yield Case("MovieDAO", "favorite_ids", {"favorites": count},
+                   lambda u=u: movie().favorite_ids(u["userId"]))
+
+    yield Case("GenreDAO", "all", {}, lambda: get_dao(GenreDAO).all())
+
+    for size, genre in f["genres"].items():
+        yield Case("GenreDAO", "find", {"genre": size, "genreMovies": genre["movies"]},
+                   lambda g=genre: get_dao(GenreDAO).find(g["name"]))
+
+    for limit in PAGE_SIZES:
+        for skip in SKIPS:
+            yield Case("PeopleDAO", "all", {"limit": limit, "skip": skip},
+                       lambda l=limit, s=skip: get_dao(PeopleDAO).all(None, "name", "ASC", l, s))
+        yield Case("PeopleDAO", "get_similar_people", {"limit": limit},
+                   lambda l=limit: get_dao(PeopleDAO).get_similar_people(f["actor"]["tmdbId"], l))
+
+    yield Case("PeopleDAO", "find_by_id", {},
+               lambda: get_dao(PeopleDAO).find_by_id(f["actor"]["tmdbId"]))
+
+    for limit in PAGE_SIZES:
+        yield Case("RatingDAO", "for_movie",
+                   {"limit": limit, "ratings": f["rated"]["ratingCount"]},
+                   lambda l=limit: get_dao(RatingDAO).for_movie(f["rated"]["tmdbId"], "timestamp", "DESC", l))
+
+    yield Case("RatingDAO", "add", {},
+               lambda: get_dao(RatingDAO).add(user_id, movie_id, 4))
+
+    for count, u in f["users"].items():
+        for limit in PAGE_SIZES:
+            yield Case("FavoriteDAO", "all", {"favorites": count, "limit": limit},
+                       lambda u=u, l=limit: get_dao(FavoriteDAO).all(u["userId"], "title", "ASC", l))
+
+    yield Case("FavoriteDAO", "add", {},
+               lambda: get_dao(FavoriteDAO).add(user_id, f["unfavorited"]),
+               teardown=lambda: get_dao(FavoriteDAO).remove(user_id, f["unfavorited"]))
+
+    yield Case("FavoriteDAO", "remove", {},
+               lambda: get_dao(FavoriteDAO).remove(user_id, f["unfavorited"]),
+               teardown=lambda: get_dao(FavoriteDAO).add(user_id, f["unfavorited"]))
+
+    # bcrypt dominates both, so fewer iterations are enough
+    yield Case("AuthDAO", "authenticate", {},
+               lambda: get_dao(AuthDAO, "bench").authenticate(email, PASSWORD),
+               iterations=20)
+
+    yield Case("AuthDAO", "register", {},
+               lambda: get_dao(AuthDAO, "bench").register(
+                   "bench-%s@example.com" % uuid.uuid4(), PASSWORD, "Benchmark"),
+               iterations=20)
+
+
+"""
+Measurement
+"""
+
+
+def measure(case, iterations, warmup, queries, alloc_iterations):
+    iterations = min(iterations, case.iterations or iterations)
+
+    def once():
+        case.call()
+        if case.teardown:
+            case.teardown()
+
+    # `remove` needs something to remove
+    if case.method == "remove":
+        case.teardown()
+
+    for _ in range(warmup):
+        once()
+
+    samples = []
+    query_total = 0
+
+    for _ in range(iterations):
+        before = queries()
+        start = time.perf_counter()
+        case.call()
+        samples.append(time.perf_counter() - start)
+
+        if before is not None:
+            query_total += queries() - before
+
+        if case.teardown:
+            case.teardown()
+
+    peaks = []
+    retained = []
+    tracemalloc.start()
+
+    try:
+        for _ in range(min(iterations, alloc_iterations)):
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            result = case.call()
+            current, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - base)
+            retained.append(current - base)
+            del result
+
+            if case.teardown:
+                case.teardown()
+    finally:
+        tracemalloc.stop()
+
+    if case.method == "remove":
+        case.call()
+
+    result = {
+        "name": case.name,
+        "dao": case.dao,
+        "method": case.method,
+        "params": case.params,
+        "latencyMs": summarize(samples),
+        "samplesMs": [sample * 1000 for sample in samples],
+        "allocPeakKiB": max(peaks) / 1024 if peaks else None,
+        "allocRetainedKiB": sum(retained) / len(retained) / 1024 if retained else None,
+        "queriesPerCall": query_total / iterations if queries() is not None else None,
+    }
+
+    return result
+
+
+def run(app, iterations=100, warmup=10, alloc_iterations=10, only=None):
+    with app.app_context():
+        queries = query_counter(app)
+        results = []
+
+        for case in cases(fixtures()):
+            if only and not case.name.startswith(only):
+                continue
+
+            results.append(measure(case, iterations, warmup, queries, alloc_iterations))
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="memory")
+    parser.add_argument("--movies", type=int, default=5000,
+                        help="Size of the synthetic catalog (memory backend)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--record", help="Record the neo4j backend's queries to this file")
+    parser.add_argument("--replay", help="Recording to answer from (replay backend)")
+    parser.add_argument("--replay-latency", help="'recorded' or seconds per query")
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--alloc-iterations", type=int, default=10)
+    parser.add_argument("--only", help="Only run cases whose name starts with this, e.g. MovieDAO.all")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    app = BACKENDS[args.backend](args)
+    results = run(app, args.iterations, args.warmup, args.alloc_iterations, args.only)
+
+    for r in results:
+        params = " ".join("%s=%s" % kv for kv in r["params"].items())
+        queries = r["queriesPerCall"]
+        print("%-30s %-40s p50 %8.3fms p99 %8.3fms %9.1fKiB %s" % (
+            r["name"], params, r["latencyMs"]["p50"], r["latencyMs"]["p99"],
+            r["allocPeakKiB"], "%.1fq" % queries if queries is not None else "",
+        ))
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+
+        with open(args.output, "w") as f:
+            json.dump({
+                "benchmark": "dao",
+                "backend": args.backend,
+                "movies": args.movies if args.backend == "memory" else None,
+                "environment": environment(),
+                "iterations": args.iterations,
+                "results": results,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
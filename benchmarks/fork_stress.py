@@ -0,0 +1,132 @@
+"""
+Multi-process stress test for the driver lifecycle.
+
+Creates the app in this process against a local Bolt stand-in (see
+`benchmarks.bolt_stub`), leaves a connection idle in its pool, then forks
+worker processes the way gunicorn does with `--preload`.  Every worker runs
+queries from several threads; each query sends the worker's pid and a
+sequence number and checks that the record it gets back carries the same
+values.  A worker that shared an inherited connection with another process
+would receive someone else's records or corrupt the stream, which the
+stand-in counts as a protocol error.
+
+    python -m benchmarks.fork_stress --workers 8 --threads 8 --queries 200
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import threading
+import time
+
+from api import create_app
+from api.neo4j import close_driver, close_drivers, get_driver
+from benchmarks.bolt_stub import BoltStub
+
+
+def run_queries(app, count, mismatches, errors):
+    pid = os.getpid()
+
+    def check(tx, n):
+        record = tx.run("RETURN $pid AS pid, $n AS n", pid=pid, n=n).single()
+
+        if record["pid"] != pid or record["n"] != n:
+            mismatches.append((pid, n, record["pid"], record["n"]))
+
+    try:
+        with app.app_context():
+            with get_driver().session() as session:
+                for n in range(count):
+                    session.execute_read(check, n)
+    except Exception as e:
+        errors.append(repr(e))
+
+
+def worker(app, threads, queries, results):
+    mismatches = []
+    errors = []
+
+    pool = [
+        threading.Thread(
+            target=run_queries, args=(app, queries, mismatches, errors)
+        )
+        for _ in range(threads)
+    ]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+
+    results.put({
+        "pid": os.getpid(),
+        "ownsDriver": app.driver_pid == os.getpid(),
+        "mismatches": len(mismatches),
+        "errors": errors,
+    })
+
+    # What gunicorn's worker_exit hook does
+    close_drivers()
+
+
+def stress(workers=4, threads=4, queries=50):
+    with BoltStub() as stub:
+        app = create_app({
+            "TESTING": True,
+            "NEO4J_URI": stub.uri,
+            "NEO4J_USERNAME": "neo4j",
+            "NEO4J_PASSWORD": "stub",
+            "NEO4J_DEFERRED_STARTUP": False,
+        })
+
+        # Leave an idle connection in the parent's pool for children to inherit
+        mismatches = []
+        errors = []
+        run_queries(app, 1, mismatches, errors)
+
+        context = multiprocessing.get_context("fork")
+        results = context.Queue()
+
+        start = time.perf_counter()
+        processes = [
+            context.Process(target=worker, args=(app, threads, queries, results))
+            for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+
+        reports = [results.get(timeout=120) for _ in processes]
+
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - start
+
+        # The parent's own connection must still be usable afterwards
+        run_queries(app, 1, mismatches, errors)
+
+        with app.app_context():
+            close_driver()
+
+        return {
+            "workers": reports,
+            "queries": workers * threads * queries,
+            "elapsedSeconds": elapsed,
+            "protocolErrors": stub.stats["errors"],
+            "parentMismatches": len(mismatches),
+            "parentErrors": errors,
+            "connections": stub.stats["connections"],
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=100)
+    args = parser.parse_args()
+
+    print(json.dumps(stress(args.workers, args.threads, args.queries), indent=2))
+
+
+if __name__ == "__main__":
+    main()
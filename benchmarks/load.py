@@ -0,0 +1,475 @@
+"""
+Load test the API with scripted user journeys.
+
+Each journey is what the single page app does for one visitor: list the
+genres, browse a genre's movies, open a movie with its similar movies and
+ratings, and, for members, log in, favorite the movie and rate it.
+
+Journeys arrive open-loop: start times follow a Poisson process at `--rate`
+journeys per second regardless of how quickly earlier journeys complete, and
+are run by up to `--users` concurrent virtual users.  When every virtual user
+is busy, journeys queue, and the time they spend waiting is reported as
+`queueMs` rather than hidden (a closed-loop generator would simply slow down
+and under-report latency).
+
+    python -m benchmarks.load --rate 20 --duration 30 --users 50
+
+By default requests go through the Flask test client of an app backed by the
+in-memory graph.  `--target server` serves the same app over HTTP on a local
+port, and `--target http://host:port` drives an app that is already running.
+`--backend replay --replay FILE` answers from a recording instead (see
+`api.replay`).
+
+Per endpoint the report shows throughput, error rate, p50/p95/p99 latency,
+a latency histogram and the mean queries per request (from the
+`Server-Timing` header, see `api.instrumentation`); `--output` saves it as
+JSON.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import threading
+import time
+import urllib.parse
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from api.instrumentation import parse_server_timing
+from benchmarks.baseline import environment
+from benchmarks.stats import histogram, summarize
+
+PASSWORD = "letmein"
+
+
+"""
+Transports
+"""
+
+
+class Response:
+    def __init__(self, status, body, headers):
+        self.status = status
+        self.body = body
+        self.headers = headers
+
+    def json(self):
+        try:
+            return json.loads(self.body)
+        except ValueError:
+            return None
+
+
+class FlaskClientTransport:
+    """
+    Sends requests through the app's test client, one client per thread
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def request(self, method, path, body=None, headers=None):
+        client = getattr(self._local, "client", None)
+
+        if client is None:
+            client = self._local.client = self.app.test_client()
+
+        response = client.open(path, method=method, json=body, headers=headers or {})
+
+        return Response(response.status_code, response.get_data(), dict(response.headers))
+
+
+class HttpTransport:
+    """
+    Sends requests over HTTP, keeping one connection alive per thread
+    """
+
+    def __init__(self, base_url, timeout=30):
+        url = urllib.parse.urlsplit(base_url)
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        payload = None
+
+        if body is not None:
+            payload = json.dumps(body).encode("utf8")
+            headers["Content-Type"] = "application/json"
+
+        for attempt in (1, 2):
+            connection = getattr(self._local, "connection", None)
+
+            if connection is None:
+                connection = self._local.connection = http.client.HTTPConnection(
+                    self.host, self.port, timeout=self.timeout
+                )
+
+            try:
+                connection.request(method, path, payload, headers)
+                response = connection.getresponse()
+
+                return Response(response.status, response.read(), dict(response.getheaders()))
+            except (http.client.HTTPException, ConnectionError):
+                # The server closed an idle keep-alive connection
+                connection.close()
+                self._local.connection = None
+
+                if attempt == 2:
+                    raise
+
+
+class LocalServer:
+    """
+    Serves an app over HTTP from a background thread
+    """
+
+    def __init__(self, app, host="127.0.0.1", port=0):
+        from werkzeug.serving import make_server
+
+        self._server = make_server(host, port, app, threaded=True)
+        self.url = "http://%s:%d" % (host, self._server.server_port)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._server.shutdown()
+
+
+"""
+Recording
+"""
+
+
+class Results:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.errors = defaultdict(int)
+        self.queries = defaultdict(list)
+        self.journeys = defaultdict(list)
+        self.queued = []
+
+    def request(self, endpoint, seconds, status, expected=(), queries=None):
+        with self._lock:
+            self.samples[endpoint].append(seconds)
+
+            if queries is not None:
+                self.queries[endpoint].append(queries)
+            self.statuses[endpoint][status] += 1
+
+            if status is None or (status >= 400 and status not in expected):
+                self.errors[endpoint] += 1
+
+    def journey(self, name, seconds, queued):
+        with self._lock:
+            self.journeys[name].append(seconds)
+            self.queued.append(queued)
+
+    def report(self, elapsed):
+        endpoints = []
+
+        for endpoint, samples in sorted(self.samples.items()):
+            queries = self.queries.get(endpoint)
+
+            endpoints.append({
+                "name": endpoint,
+                "requests": len(samples),
+                "throughput": len(samples) / elapsed,
+                "errorRate": self.errors[endpoint] / len(samples),
+                "statuses": {str(k): v for k, v in self.statuses[endpoint].items()},
+                "latencyMs": summarize(samples),
+                "histogramMs": histogram(samples),
+                "samplesMs": [sample * 1000 for sample in samples],
+                "queriesPerRequest": sum(queries) / len(queries) if queries else None,
+            })
+
+        return {
+            "elapsed": elapsed,
+            "journeys": {
+                name: summarize(samples) for name, samples in self.journeys.items()
+            },
+            "queueMs": summarize(self.queued),
+            "results": endpoints,
+        }
+
+
+class VirtualUser:
+    """
+    Runs a journey, recording each request under the route it matches
+    """
+
+    def __init__(self, transport, results, rng, think=0.0):
+        self.transport = transport
+        self.results = results
+        self.rng = rng
+        self.think = think
+        self.token = None
+
+    def call(self, method, endpoint, path, body=None, expect=None):
+        headers = {}
+        if self.token:
+            headers["Authorization"] = "Bearer %s" % self.token
+
+        start = time.perf_counter()
+
+        try:
+            response = self.transport.request(method, path, body, headers)
+        except Exception:
+            self.results.request("%s %s" % (method, endpoint), time.perf_counter() - start, None)
+            raise
+
+        elapsed = time.perf_counter() - start
+
+        # Queries reported by api.instrumentation, if the app sends them
+        timing = parse_server_timing(response.headers.get("Server-Timing"))
+
+        # Some statuses are part of the journey, such as a 401 for a new user
+        self.results.request(
+            "%s %s" % (method, endpoint), elapsed, response.status, expect or (),
+            timing.get("db-queries"),
+        )
+
+        if self.think:
+            time.sleep(self.rng.expovariate(1 / self.think))
+
+        return response
+
+    def choose(self, items):
+        return self.rng.choice(items) if items else None
+
+
+"""
+Journeys
+"""
+
+
+def browse(user):
+    """
+    List the genres, browse one and open a movie from it
+    """
+    genres = user.call("GET", "/api/genres/", "/api/genres/").json() or []
+    genre = user.choose([g["name"] for g in genres])
+
+    if genre is None:
+        return None
+
+    movies = user.call(
+        "GET", "/api/genres/<name>/movies",
+        "/api/genres/%s/movies?sort=imdbRating&order=DESC&limit=6"
+        % urllib.parse.quote(genre),
+    ).json() or []
+    movie = user.choose([m["tmdbId"] for m in movies])
+
+    if movie is None:
+        return None
+
+    user.call("GET", "/api/movies/<id>", "/api/movies/%s" % movie)
+    user.call("GET", "/api/movies/<id>/similar", "/api/movies/%s/similar" % movie)
+    user.call("GET", "/api/movies/<id>/ratings", "/api/movies/%s/ratings" % movie)
+
+    return movie
+
+
+def member(user, members=1000):
+    """
+    Log in (registering on first visit), browse, then favorite and rate
+    """
+    n = user.rng.randrange(members)
+    credentials = {"email": "user%d@example.com" % n, "password": PASSWORD, "name": "User %d" % n}
+
+    response = user.call("POST", "/api/auth/login", "/api/auth/login", credentials, expect=(401,))
+
+    if response.status == 401:
+        response = user.call(
+            "POST", "/api/auth/register", "/api/auth/register", credentials, expect=(422,)
+        )
+
+        # Another virtual user registered them first
+        if response.status == 422:
+            response = user.call("POST", "/api/auth/login", "/api/auth/login", credentials)
+
+    user.token = (response.json() or {}).get("token")
+
+    movie = browse(user)
+
+    if movie is not None and user.token:
+        user.call("POST", "/api/account/favorites/<id>", "/api/account/favorites/%s" % movie)
+        user.call(
+            "POST", "/api/account/ratings/<id>", "/api/account/ratings/%s" % movie,
+            {"rating": user.rng.randint(1, 5)},
+        )
+        user.call("GET", "/api/account/favorites", "/api/account/favorites")
+
+    return movie
+
+
+JOURNEYS = {
+    "browse": browse,
+    "member": member,
+}
+
+
+"""
+Load generation
+"""
+
+
+def run(transport, rate=10.0, duration=10.0, users=20, member_ratio=0.3,
+        think=0.0, seed=0, warmup=5):
+    """
+    Start journeys at `rate` per second for `duration` seconds, with up to
+    `users` running at once, and return the report.  `warmup` journeys are
+    run first and not measured.
+    """
+    for i in range(warmup):
+        JOURNEYS["member" if i == 0 else "browse"](
+            VirtualUser(transport, Results(), random.Random(-i))
+        )
+
+    results = Results()
+    rng = random.Random(seed)
+    pool = ThreadPoolExecutor(max_workers=users, thread_name_prefix="vu")
+
+    def journey(name, journey_seed, scheduled):
+        started = time.perf_counter()
+        user = VirtualUser(transport, results, random.Random(journey_seed), think)
+
+        try:
+            JOURNEYS[name](user)
+        except Exception:
+            # Already counted as an error against the request that failed
+            pass
+
+        finished = time.perf_counter()
+        # Measured from the scheduled start, so that queueing is included
+        results.journey(name, finished - scheduled, started - scheduled)
+
+    start = time.perf_counter()
+    next_arrival = start
+    futures = []
+
+    while True:
+        next_arrival += rng.expovariate(rate)
+
+        if next_arrival - start > duration:
+            break
+
+        delay = next_arrival - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+        name = "member" if rng.random() < member_ratio else "browse"
+        futures.append(pool.submit(journey, name, rng.random(), next_arrival))
+
+    for future in futures:
+        future.result()
+
+    pool.shutdown()
+
+    report = results.report(time.perf_counter() - start)
+    report.update({
+        "rate": rate,
+        "duration": duration,
+        "users": users,
+        "memberRatio": member_ratio,
+        "started": len(futures),
+    })
+
+    return report
+
+
+def make_app(args):
+    from api import create_app
+
+    config = {
+        "SECRET_KEY": "load",
+        "JWT_SECRET_KEY": "load",
+        "NEO4J_DEFERRED_STARTUP": False,
+    }
+
+    if args.backend == "memory":
+        config.update({
+            "DAO_BACKEND": "memory",
+            "MEMORY_SEED": "synthetic",
+            "MEMORY_SYNTHETIC_MOVIES": args.movies,
+        })
+    elif args.backend == "replay":
+        config.update({
+            "NEO4J_REPLAY": args.replay,
+            "NEO4J_REPLAY_LATENCY": args.replay_latency,
+        })
+
+    return create_app(config)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rate", type=float, default=10.0, help="Journeys started per second")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to start journeys for")
+    parser.add_argument("--users", type=int, default=20, help="Concurrent virtual users")
+    parser.add_argument("--member-ratio", type=float, default=0.3,
+                        help="Share of journeys that log in, favorite and rate")
+    parser.add_argument("--think", type=float, default=0.0, help="Mean think time between requests")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--target", default="test-client",
+                        help="test-client, server, or the URL of a running app")
+    parser.add_argument("--backend", choices=["memory", "replay", "neo4j"], default="memory")
+    parser.add_argument("--movies", type=int, default=5000,
+                        help="Size of the synthetic catalog (memory backend)")
+    parser.add_argument("--replay", help="Recording to answer from (replay backend)")
+    parser.add_argument("--replay-latency", help="'recorded' or seconds per query")
+    parser.add_argument("--output", help="Write the report to this JSON file")
+    args = parser.parse_args()
+
+    options = dict(
+        rate=args.rate, duration=args.duration, users=args.users,
+        member_ratio=args.member_ratio, think=args.think, seed=args.seed,
+    )
+
+    if args.target == "test-client":
+        report = run(FlaskClientTransport(make_app(args)), **options)
+    elif args.target == "server":
+        with LocalServer(make_app(args)) as server:
+            report = run(HttpTransport(server.url), **options)
+    else:
+        report = run(HttpTransport(args.target), **options)
+
+    report.update({
+        "benchmark": "load",
+        "target": args.target,
+        "backend": args.backend,
+        "environment": environment(),
+    })
+
+    print("%-36s %8s %8s %7s %9s %9s %9s %8s" % (
+        "endpoint", "requests", "req/s", "errors", "p50 ms", "p95 ms", "p99 ms", "queries"))
+
+    for r in report["results"]:
+        print("%-36s %8d %8.1f %6.1f%% %9.2f %9.2f %9.2f %8s" % (
+            r["name"], r["requests"], r["throughput"], r["errorRate"] * 100,
+            r["latencyMs"]["p50"], r["latencyMs"]["p95"], r["latencyMs"]["p99"],
+            "%.1f" % r["queriesPerRequest"] if r["queriesPerRequest"] is not None else "-",
+        ))
+
+    print("%d journeys started, queued p99 %.2fms" % (
+        report["started"], report["queueMs"]["p99"]))
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Measure the memory per movie of the in-memory backend's movie records, as
+one dict per movie and as the columns of a `GrowingTable` (see
+`api.memory.columns`), and the time to sort and page through them.
+
+    python -m benchmarks.movie_records --movies 1000000
+
+Both stores are loaded from the same synthetic movies (see `api.synthetic`),
+the way `MemoryGraph.add_node` loads them, and then measured by walking
+every object they reference, each counted once with `sys.getsizeof`:
+tracing the allocations with `tracemalloc` instead slows loading a million
+movies down by minutes.  Then each store sorts every movie by `--sort`, the
+way an uncached listing does, and reads the first `--pages` pages of six
+movies in descending order.
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+
+from api.memory.columns import GrowingTable, Keys
+from api.memory.graph import sort_records
+from api.synthetic import Catalog
+from benchmarks.baseline import environment
+
+PAGE = 6
+
+
+def movie_properties(movies, seed):
+    catalog = Catalog(movies=movies, people=100, users=0, seed=seed)
+
+    for chunk in range(-(-movies // catalog.chunk_size)):
+        for record in catalog.records("Movie", chunk):
+            if record.get("label") == "Movie":
+                yield record["properties"]
+
+
+class DictMovies:
+    name = "dict"
+
+    def __init__(self):
+        self.movies = {}
+
+    def add(self, properties):
+        self.movies.setdefault(properties["tmdbId"], {}).update(properties)
+
+    def order(self, sort):
+        return [
+            m["tmdbId"] for m in sort_records(list(self.movies.values()), sort)
+            if m.get(sort) is not None
+        ]
+
+    def get(self, id):
+        return self.movies[id]
+
+
+class ColumnMovies:
+    name = "columns"
+
+    def __init__(self):
+        self.movies = GrowingTable("tmdbId")
+
+    def add(self, properties):
+        self.movies.merge(properties)
+
+    def order(self, sort):
+        return Keys(self.movies.order(range(len(self.movies)), sort), self.movies)
+
+    def get(self, id):
+        return self.movies[id]
+
+
+def deep_size(root):
+    """
+    The size of `root` and of every object it references, each counted once
+    """
+    seen = set()
+    size = 0
+    stack = [root]
+
+    while stack:
+        obj = stack.pop()
+
+        if id(obj) in seen:
+            continue
+
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif hasattr(obj, "__dict__"):
+            stack.append(obj.__dict__)
+
+    return size
+
+
+def measure(store, args):
+    started = time.perf_counter()
+    for properties in movie_properties(args.movies, args.seed):
+        store.add(properties)
+    loaded = time.perf_counter() - started
+
+    gc.collect()
+    size = deep_size(store.movies)
+
+    started = time.perf_counter()
+    ordered = store.order(args.sort)
+    sorted_in = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for page in range(args.pages):
+        end = len(ordered) - page * PAGE
+        [store.get(id) for id in ordered[max(end - PAGE, 0):end]]
+    paged = time.perf_counter() - started
+
+    return {
+        "store": store.name,
+        "bytes": size,
+        "bytesPerMovie": size / args.movies,
+        "loadSeconds": loaded,
+        "sortSeconds": sorted_in,
+        "pageMs": paged / args.pages * 1000,
+    }
+
+
+def run(args):
+    results = []
+
+    for store in (DictMovies, ColumnMovies):
+        results.append(measure(store(), args))
+        gc.collect()
+
+    return {
+        "benchmark": "movie_records",
+        "movies": args.movies,
+        "sort": args.sort,
+        "results": results,
+        "environment": environment(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--movies", type=int, default=1000000)
+    parser.add_argument("--sort", default="imdbRating")
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the report to this JSON file")
+    args = parser.parse_args()
+
+    result = run(args)
+
+    print("%d movies, sorted by %s" % (result["movies"], result["sort"]))
+    print("%-8s %10s %14s %10s %10s %10s" % (
+        "store", "MB", "bytes/movie", "load s", "sort s", "page ms"))
+
+    for r in result["results"]:
+        print("%-8s %10.1f %14.1f %10.2f %10.2f %10.3f" % (
+            r["store"], r["bytes"] / 1024 / 1024, r["bytesPerMovie"],
+            r["loadSeconds"], r["sortSeconds"], r["pageMs"],
+        ))
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Measure the cost of home database resolution on a routing cluster.
+
+Opens a fresh session per iteration and runs a trivial read, first without a
+database name (so the driver has to resolve the home database for every new
+session) and then with the database named explicitly (so the cached routing
+table for that database is reused).
+
+    python -m benchmarks.session_latency --iterations 500
+
+Connection details are read from NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD and
+NEO4J_DATABASE.  Use a `neo4j://` URI; with `bolt://` there is no routing and
+both variants should perform the same.
+"""
+
+import argparse
+import json
+import os
+import time
+
+from dotenv import load_dotenv
+from neo4j import GraphDatabase
+
+from benchmarks.stats import summarize
+
+
+def run(driver, database, iterations):
+    samples = []
+
+    for _ in range(iterations):
+        start = time.perf_counter()
+
+        with driver.session(database=database) as session:
+            session.execute_read(lambda tx: tx.run("RETURN 1").consume())
+
+        samples.append(time.perf_counter() - start)
+
+    return summarize(samples)
+
+
+def main():
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--database", default=os.getenv("NEO4J_DATABASE") or "neo4j")
+    args = parser.parse_args()
+
+    uri = os.environ["NEO4J_URI"]
+
+    if not uri.startswith("neo4j"):
+        print("Warning: %s is not a routing URI, expect no difference" % uri)
+
+    with GraphDatabase.driver(
+        uri, auth=(os.environ["NEO4J_USERNAME"], os.environ["NEO4J_PASSWORD"])
+    ) as driver:
+        run(driver, args.database, args.warmup)
+
+        results = {
+            "uri": uri,
+            "iterations": args.iterations,
+            "homeDatabase": run(driver, None, args.iterations),
+            "namedDatabase": run(driver, args.database, args.iterations),
+        }
+
+    saved = results["homeDatabase"]["mean"] - results["namedDatabase"]["mean"]
+    results["savedPerSessionMs"] = saved
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Helpers shared by the benchmark scripts.
+"""
+
+import math
+
+
+def percentile(samples, p):
+    """
+    Return the `p`th percentile (0-100) of `samples` using linear
+    interpolation between the closest ranks.
+    """
+    if not samples:
+        return 0.0
+
+    ordered = sorted(samples)
+    rank = (len(ordered) - 1) * p / 100
+    low = math.floor(rank)
+    high = math.ceil(rank)
+
+    if low == high:
+        return ordered[low]
+
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(samples):
+    """
+    Summarise a list of latencies (in seconds) as milliseconds.
+    """
+    return {
+        "count": len(samples),
+        "mean": sum(samples) / len(samples) * 1000 if samples else 0.0,
+        "p50": percentile(samples, 50) * 1000,
+        "p95": percentile(samples, 95) * 1000,
+        "p99": percentile(samples, 99) * 1000,
+    }
+
+
+"""
+Upper bounds (in milliseconds) of the latency histogram buckets
+"""
+BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+
+def histogram(samples, bounds=BUCKETS_MS):
+    """
+    Count latencies (in seconds) into buckets by upper bound in milliseconds,
+    with a final `+Inf` bucket for anything slower.
+    """
+    counts = {str(bound): 0 for bound in bounds}
+    counts["+Inf"] = 0
+
+    for sample in samples:
+        ms = sample * 1000
+
+        for bound in bounds:
+            if ms <= bound:
+                counts[str(bound)] += 1
+                break
+        else:
+            counts["+Inf"] += 1
+
+    return counts
+
+
+def mann_whitney_u(a, b):
+    """
+    Two-sided Mann-Whitney U test of whether samples `a` and `b` come from
+    the same distribution, using the normal approximation with a correction
+    for ties.  Returns `(u, p)` where `u` is the statistic for `a`.
+    """
+    n1 = len(a)
+    n2 = len(b)
+    n = n1 + n2
+
+    if not n1 or not n2:
+        return 0.0, 1.0
+
+    values = sorted([(value, 0) for value in a] + [(value, 1) for value in b])
+
+    # Average the ranks of tied values
+    rank_sum = 0.0
+    ties = 0.0
+    i = 0
+    while i < n:
+        j = i
+        while j + 1 < n and values[j + 1][0] == values[i][0]:
+            j += 1
+
+        rank = (i + j) / 2 + 1
+        rank_sum += rank * sum(1 for k in range(i, j + 1) if values[k][1] == 0)
+
+        t = j - i + 1
+        ties += t ** 3 - t
+        i = j + 1
+
+    u = rank_sum - n1 * (n1 + 1) / 2
+    mean = n1 * n2 / 2
+    variance = n1 * n2 / 12 * ((n + 1) - ties / (n * (n - 1))) if n > 1 else 0
+
+    if variance <= 0:
+        return u, 1.0
+
+    # Continuity correction
+    z = (abs(u - mean) - 0.5) / math.sqrt(variance)
+
+    return u, min(1.0, math.erfc(max(z, 0) / math.sqrt(2)))
@@ -0,0 +1,121 @@
+"""
+A stand-in for a trace collector.
+
+    python -m benchmarks.trace_collector --port 4318 --output spans.jsonl
+    TRACING_EXPORT=http://127.0.0.1:4318/v1/spans TRACING_SAMPLE_RATE=0.1 flask run
+
+Accepts the JSON arrays of spans posted by `api.tracing.HttpExporter`, appends
+them to `--output` (one span per line) and prints each trace's spans as a
+tree once it has been quiet for a second.
+"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def tree(spans):
+    """
+    Lines showing the spans of one trace as a tree, slowest first among
+    siblings
+    """
+    ids = {span["spanId"] for span in spans}
+    children = {}
+
+    for span in spans:
+        parent = span["parentSpanId"] if span["parentSpanId"] in ids else None
+        children.setdefault(parent, []).append(span)
+
+    lines = []
+
+    def walk(parent, depth):
+        for span in sorted(children.get(parent, []), key=lambda s: s["startTimeUnixNano"]):
+            lines.append("%s%-*s %8.2fms" % (
+                "  " * depth, 50 - 2 * depth, span["name"], span["durationMs"]))
+            walk(span["spanId"], depth + 1)
+
+    walk(None, 0)
+
+    return lines
+
+
+class Collector(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, output=None, quiet=False):
+        super().__init__(address, _Handler)
+        self.output = output
+        self.quiet = quiet
+        self.spans = []
+        self.traces = {}
+        self.lock = threading.Lock()
+
+    def receive(self, spans):
+        with self.lock:
+            self.spans.extend(spans)
+
+            for span in spans:
+                trace = self.traces.setdefault(span["traceId"], {"spans": [], "seen": 0})
+                trace["spans"].append(span)
+                trace["seen"] = time.monotonic()
+
+            if self.output:
+                with open(self.output, "a") as f:
+                    for span in spans:
+                        f.write(json.dumps(span) + "\n")
+
+    def print_quiet_traces(self, quiet_for=1.0):
+        with self.lock:
+            done = [
+                trace_id for trace_id, trace in self.traces.items()
+                if time.monotonic() - trace["seen"] > quiet_for
+            ]
+            traces = [(trace_id, self.traces.pop(trace_id)["spans"]) for trace_id in done]
+
+        for trace_id, spans in traces:
+            print("trace %s" % trace_id)
+            print("\n".join("  " + line for line in tree(spans)), flush=True)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+
+        try:
+            spans = json.loads(self.rfile.read(length))
+        except ValueError:
+            self.send_response(400)
+            self.end_headers()
+            return
+
+        self.server.receive(spans)
+        self.send_response(202)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4318)
+    parser.add_argument("--output", help="Append received spans to this file")
+    args = parser.parse_args()
+
+    collector = Collector((args.host, args.port), args.output)
+    threading.Thread(target=collector.serve_forever, daemon=True).start()
+    print("Collecting spans on http://%s:%d/" % collector.server_address, flush=True)
+
+    try:
+        while True:
+            time.sleep(1)
+            collector.print_quiet_traces()
+    except KeyboardInterrupt:
+        collector.shutdown()
+
+
+if __name__ == "__main__":
+    main()
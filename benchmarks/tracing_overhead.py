@@ -0,0 +1,119 @@
+"""
+Measure what tracing costs per request.
+
+    python -m benchmarks.tracing_overhead --requests 2000
+    python -m benchmarks.tracing_overhead --backend stub
+
+Serves the same request through the Flask test client of several apps: one
+without tracing, and traced apps sampling 0%, 1%, 10% and 100% of requests,
+exporting to a file in a temporary directory.  Requests are interleaved
+between the apps so that drift affects them all alike.  `--backend stub`
+runs the DAOs through the driver against a local Bolt stand-in, which adds
+the session, transaction and query spans; `memory` (the default) only has
+request and DAO spans.
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from api import create_app
+from benchmarks.stats import summarize
+
+RATES = [None, 0.0, 0.01, 0.1, 1.0]
+
+
+def movies(query, parameters):
+    return ["movie"], [[{"tmdbId": str(i), "title": "Movie %d" % i}] for i in range(6)]
+
+
+def make_app(rate, backend, directory, uri=None):
+    config = {"TESTING": True}
+
+    if backend == "memory":
+        config["DAO_BACKEND"] = "memory"
+    else:
+        config.update({
+            "NEO4J_URI": uri,
+            "NEO4J_USERNAME": "neo4j",
+            "NEO4J_PASSWORD": "stub",
+            "NEO4J_DEFERRED_STARTUP": False,
+        })
+
+    if rate is not None:
+        config["TRACING_EXPORT"] = "file:%s" % os.path.join(directory, "spans-%s.jsonl" % rate)
+        config["TRACING_SAMPLE_RATE"] = rate
+
+    return create_app(config)
+
+
+def run(backend="memory", requests=1000, path="/api/movies/", uri=None):
+    with tempfile.TemporaryDirectory() as directory:
+        apps = {rate: make_app(rate, backend, directory, uri) for rate in RATES}
+        clients = {rate: app.test_client() for rate, app in apps.items()}
+        samples = {rate: [] for rate in RATES}
+
+        # Warm up, including the lazy seeding of the in-memory graph
+        for client in clients.values():
+            for _ in range(20):
+                client.get(path)
+
+        for _ in range(requests):
+            for rate, client in clients.items():
+                start = time.perf_counter()
+                client.get(path)
+                samples[rate].append(time.perf_counter() - start)
+
+        for app in apps.values():
+            if app.tracer is not None:
+                app.tracer.flush()
+            if app.driver is not None:
+                app.driver.close()
+
+    base = summarize(samples[None])
+    results = []
+
+    for rate in RATES:
+        summary = summarize(samples[rate])
+        results.append({
+            "sampleRate": rate,
+            "latencyMs": summary,
+            "overheadP50Ms": summary["p50"] - base["p50"],
+            "overheadP50": (summary["p50"] - base["p50"]) / base["p50"] if base["p50"] else 0.0,
+        })
+
+    return {"backend": backend, "path": path, "requests": requests, "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--backend", choices=["memory", "stub"], default="memory")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--path", default="/api/movies/")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    if args.backend == "stub":
+        from benchmarks.bolt_stub import BoltStub
+
+        with BoltStub(handler=movies) as stub:
+            report = run("stub", args.requests, args.path, stub.uri)
+    else:
+        report = run("memory", args.requests, args.path)
+
+    print("%-10s %10s %10s %12s" % ("sampling", "p50", "p99", "overhead"))
+    for result in report["results"]:
+        print("%-10s %8.3fms %8.3fms %+10.1f%%" % (
+            "off" if result["sampleRate"] is None else "%g%%" % (result["sampleRate"] * 100),
+            result["latencyMs"]["p50"], result["latencyMs"]["p99"], result["overheadP50"] * 100,
+        ))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
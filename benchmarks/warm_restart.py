@@ -0,0 +1,220 @@
+"""
+Compare how quickly a restarted worker reaches its steady-state latency with
+an empty cache and with a cache restored from a snapshot (see
+`api.snapshot`).
+
+    python -m benchmarks.warm_restart --movies 20000 --requests 2000 --workers 4
+
+A first app serves the workload until its cache is warm and saves a
+snapshot; its p99 over the second half of the workload is the steady-state
+p99.  Then two new apps serve the same workload, one starting cold and one
+restoring the snapshot.  For each, the report shows how long `create_app`
+took (restoring included), the p99 of the first `--window` requests, and the time to p99: how long after
+the first request it took for a window of `--window` consecutive requests
+to have a p99 within `--tolerance` times the steady-state p99.
+
+The workload is what visitors open first after a deploy: the genre list,
+the first pages of the most popular movies, and popular movies' details
+and similar movies and people, picked with a Zipf distribution.  By default
+the app is backed by a synthetic in-memory catalog, where the similarity
+reads are the expensive ones; `--backend neo4j` uses the database from the
+environment.
+
+Each app is configured as one of `--workers` workers (`WORKERS`, default 2),
+as it would be behind gunicorn, so its local cache keeps results for at most
+`CACHE_LOCAL_TTL` seconds and a restored result is only reused that long;
+`--workers 1` measures a single worker, which keeps them their full time.
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from api import create_app
+from api.testing import query_counts
+from benchmarks.baseline import environment
+from benchmarks.stats import percentile, summarize
+
+
+def make_app(args, snapshot):
+    config = {
+        "TESTING": True,
+        "SECRET_KEY": "warm",
+        "JWT_SECRET_KEY": "warm",
+        "NEO4J_DEFERRED_STARTUP": False,
+        "CACHE": True,
+        "CACHE_SNAPSHOT": snapshot,
+        "CACHE_SNAPSHOT_INTERVAL": 0,
+        "WORKERS": args.workers,
+    }
+
+    if args.backend == "memory":
+        config.update({
+            "DAO_BACKEND": "memory",
+            "MEMORY_SEED": "synthetic",
+            "MEMORY_SYNTHETIC_MOVIES": args.movies,
+        })
+
+    started = time.perf_counter()
+    app = create_app(config)
+    created = time.perf_counter() - started
+
+    if args.backend == "memory":
+        # Seed the catalog before timing requests, as a database would
+        # already hold it
+        from api.memory.dao import get_graph
+
+        with app.app_context():
+            get_graph()
+
+    return app, created
+
+
+def workload(app, requests, seed=0):
+    client = app.test_client()
+    movies = client.get("/api/movies/?sort=imdbRating&order=DESC&limit=100").get_json()
+    people = client.get("/api/people/?sort=name&limit=100").get_json()
+
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(len(movies))]
+    paths = []
+
+    for _ in range(requests):
+        movie = rng.choices(movies, weights)[0]["tmdbId"]
+        person = rng.choices(people, weights[:len(people)])[0]["tmdbId"]
+
+        paths.append(rng.choice([
+            "/api/genres/",
+            "/api/movies/?sort=imdbRating&order=DESC&skip=%d" % (6 * rng.randrange(5)),
+            "/api/movies/%s" % movie,
+            "/api/movies/%s/similar" % movie,
+            "/api/people/%s/similar" % person,
+        ]))
+
+    return paths
+
+
+def serve(app, paths):
+    """
+    (seconds since the first request, latency, queries) for each request
+    """
+    client = app.test_client()
+    samples = []
+    started = time.perf_counter()
+
+    for path in paths:
+        before = time.perf_counter()
+        response = client.get(path)
+        after = time.perf_counter()
+
+        samples.append((before - started, after - before, query_counts(response)["queries"]))
+
+    return samples
+
+
+def time_to_p99(samples, target, window):
+    """
+    Seconds until the end of the first window of requests with a p99 at or
+    below `target`, or None
+    """
+    latencies = [latency for _, latency, _ in samples]
+
+    for end in range(window, len(samples) + 1):
+        if percentile(latencies[end - window:end], 99) <= target:
+            at, latency, _ = samples[end - 1]
+            return at + latency
+
+    return None
+
+
+def report(name, samples, target, window, restore=None, created=None):
+    latencies = [latency for _, latency, _ in samples]
+    settled = time_to_p99(samples, target, window)
+
+    return {
+        "name": name,
+        "createAppMs": created * 1000 if created is not None else None,
+        "restore": restore,
+        "latencyMs": summarize(latencies),
+        "firstWindowP99Ms": percentile(latencies[:window], 99) * 1000,
+        "timeToP99Ms": settled * 1000 if settled is not None else None,
+        "queries": sum(queries for _, _, queries in samples),
+    }
+
+
+def run(args):
+    with tempfile.TemporaryDirectory() as directory:
+        snapshot = os.path.join(directory, "cache.snapshot")
+
+        # The worker running before the deploy
+        before, _ = make_app(args, snapshot)
+        paths = workload(before, args.requests, args.seed)
+        steady = serve(before, paths + paths)[len(paths):]
+        before.snapshots.save()
+        before.snapshots.stop()
+
+        target = percentile([latency for _, latency, _ in steady], 99) * args.tolerance
+        results = [report("steady", steady, target, args.window)]
+
+        for name, path in (("cold", os.path.join(directory, "none")), ("warm", snapshot)):
+            app, created = make_app(args, path)
+            restored = app.snapshots.restored.as_dict()
+            results.append(report(name, serve(app, paths), target, args.window, restored, created))
+            app.snapshots.stop()
+
+    return {
+        "benchmark": "warm_restart",
+        "backend": args.backend,
+        "movies": args.movies if args.backend == "memory" else None,
+        "requests": args.requests,
+        "workers": args.workers,
+        "window": args.window,
+        "targetP99Ms": target * 1000,
+        "results": results,
+        "environment": environment(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--backend", choices=["memory", "neo4j"], default="memory")
+    parser.add_argument("--movies", type=int, default=20000,
+                        help="Size of the synthetic catalog (memory backend)")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=2,
+                        help="Workers each app is configured as one of (WORKERS)")
+    parser.add_argument("--window", type=int, default=100,
+                        help="Requests per window when looking for the steady-state p99")
+    parser.add_argument("--tolerance", type=float, default=1.5,
+                        help="How far above the steady-state p99 counts as settled")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the report to this JSON file")
+    args = parser.parse_args()
+
+    result = run(args)
+
+    print("target p99 %.2fms" % result["targetP99Ms"])
+    print("%-8s %10s %10s %10s %14s %14s %8s" % (
+        "start", "restored", "p50 ms", "p99 ms", "first p99 ms", "to p99 ms", "queries"))
+
+    for r in result["results"]:
+        restored = r["restore"]["entries"] if r["restore"] else None
+        print("%-8s %10s %10.2f %10.2f %14.2f %14s %8d" % (
+            r["name"], "-" if restored is None else restored,
+            r["latencyMs"]["p50"], r["latencyMs"]["p99"], r["firstWindowP99Ms"],
+            "-" if r["timeToP99Ms"] is None else "%.1f" % r["timeToP99Ms"],
+            r["queries"],
+        ))
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""
+Gunicorn configuration for running the API with several worker processes.
+
+    gunicorn "api:create_app()"
+
+With `preload_app` the app (and its driver) is created once in the master
+and inherited by each forked worker.  Connections must never be shared
+between processes, so every worker replaces the inherited driver with its own
+in `post_fork` and closes it in `worker_exit`.  See "Running with multiple
+worker processes" in README.adoc.
+"""
+
+import multiprocessing
+import os
+
+bind = os.getenv("GUNICORN_BIND", "127.0.0.1:5000")
+workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+# Tell the app how many workers there are, for its cache (see api/cache.py)
+os.environ["GUNICORN_WORKERS"] = str(workers)
+threads = int(os.getenv("GUNICORN_THREADS", 4))
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() in ("1", "true", "yes")
+
+
+def post_fork(server, worker):
+    from api.neo4j import after_fork
+
+    after_fork()
+
+
+def worker_exit(server, worker):
+    from api.neo4j import close_drivers
+
+    close_drivers()
@@ -0,0 +1,64 @@
+import threading
+import time
+
+from api.coalesce import SingleFlight, shared_read
+from api.testing import FakeDriver
+
+
+def test_concurrent_identical_calls_share_one_execution():
+    group = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def fetch():
+        calls.append(1)
+        release.wait(timeout=5)
+        return {"tmdbId": "862"}
+
+    results = []
+
+    def worker():
+        results.append(group.do(("find_by_id", "862"), fetch))
+
+    threads = [threading.Thread(target=worker) for _ in range(10)]
+    for t in threads:
+        t.start()
+
+    # Give every waiter the chance to join the in-flight call
+    deadline = time.time() + 5
+    while group.coalesced < 9 and time.time() < deadline:
+        time.sleep(0.01)
+
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert group.executed == 1
+    assert group.coalesced == 9
+    assert all(r is results[0] for r in results)
+
+
+def test_errors_are_fanned_out_and_not_cached():
+    group = SingleFlight()
+
+    def fail():
+        raise ValueError("boom")
+
+    try:
+        group.do("key", fail)
+    except ValueError:
+        pass
+
+    assert group.do("key", lambda: 1) == 1
+    assert group.stats()["inFlight"] == 0
+
+
+def test_shared_read_runs_the_unit_of_work():
+    driver = FakeDriver(read=lambda work, *args: work(None, *args))
+
+    def get_movie(tx, id):
+        return {"tmdbId": id}
+
+    assert shared_read(driver, get_movie, "862") == {"tmdbId": "862"}
+    assert driver.executions == 1
@@ -0,0 +1,44 @@
+import pytest
+from neo4j import GraphDatabase
+from neo4j.exceptions import ServiceUnavailable
+
+from api.neo4j import driver_config
+from api.pool import instrument_pool
+
+
+def test_driver_config_only_includes_configured_settings():
+    config = {
+        "NEO4J_MAX_CONNECTION_POOL_SIZE": 50,
+        "NEO4J_CONNECTION_ACQUISITION_TIMEOUT": 5.0,
+        "NEO4J_FETCH_SIZE": None,
+    }
+
+    assert driver_config(config) == {
+        "max_connection_pool_size": 50,
+        "connection_acquisition_timeout": 5.0,
+    }
+
+
+def test_pool_metrics_report_size_and_failures():
+    # Nothing listens on port 1, so every acquisition fails
+    driver = GraphDatabase.driver(
+        "bolt://127.0.0.1:1",
+        auth=("neo4j", "password"),
+        max_connection_pool_size=7,
+        connection_acquisition_timeout=1.0,
+    )
+    metrics = instrument_pool(driver)
+
+    snapshot = metrics.snapshot()
+
+    assert snapshot["maxSize"] == 7
+    assert snapshot["size"] == 0
+    assert snapshot["inUse"] == 0
+
+    with pytest.raises(ServiceUnavailable):
+        with driver.session() as session:
+            session.run("RETURN 1").consume()
+
+    assert metrics.snapshot()["acquisitionFailures"] == 1
+
+    driver.close()
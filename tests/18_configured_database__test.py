@@ -0,0 +1,18 @@
+from flask import Flask
+
+from api.dao.favorites import FavoriteDAO
+from api.dao.genres import GenreDAO
+from api.neo4j import get_dao
+from api.testing import FakeDriver
+
+
+def test_get_dao_threads_configured_database_into_sessions():
+    app = Flask(__name__)
+    app.config["NEO4J_DATABASE"] = "movies"
+    app.driver = FakeDriver()
+
+    with app.app_context():
+        get_dao(GenreDAO).all()
+        get_dao(FavoriteDAO).all("user-1")
+
+    assert app.driver.databases == ["movies", "movies"]
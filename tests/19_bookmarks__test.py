@@ -0,0 +1,75 @@
+from flask import Flask, jsonify
+
+from api.bookmarks import (
+    HEADER, MAX_BOOKMARK_LENGTH, MAX_BOOKMARKS, BookmarkStore, decode_token, encode_token,
+    save_bookmarks,
+)
+from api.dao.favorites import FavoriteDAO
+from api.dao.genres import GenreDAO
+from api.neo4j import get_dao
+from api.testing import FakeDriver
+
+
+def create_test_app():
+    app = Flask(__name__)
+    app.driver = FakeDriver(write=lambda work, *args: {"tmdbId": args[-1], "favorite": True})
+    app.bookmarks = BookmarkStore()
+    app.after_request(save_bookmarks)
+
+    @app.post("/favorite/<movie_id>")
+    def favorite(movie_id):
+        return jsonify(get_dao(FavoriteDAO).add("user-1", movie_id))
+
+    @app.get("/genres")
+    def genres():
+        return jsonify(get_dao(GenreDAO).all())
+
+    return app
+
+
+def test_token_round_trip():
+    token = encode_token({"a", "b"})
+
+    assert decode_token(token) == {"a", "b"}
+    assert decode_token("not a token") == frozenset()
+
+
+def test_made_up_bookmarks_are_dropped():
+    # Only well-formed bookmarks of a reasonable length are kept
+    token = encode_token({"FB:kcwQ6bY=", "x" * (MAX_BOOKMARK_LENGTH + 1), "a b", "\u00e9"})
+    assert decode_token(token) == {"FB:kcwQ6bY="}
+
+    # Too many of them, or a huge header, and none are
+    assert decode_token(encode_token({"b%d" % i for i in range(MAX_BOOKMARKS + 1)})) == frozenset()
+    assert decode_token("A" * 100000) == frozenset()
+
+
+def test_reads_wait_for_bookmarks_from_previous_write():
+    app = create_test_app()
+    client = app.test_client()
+
+    # A read without any writes does not return a token
+    assert HEADER not in client.get("/genres").headers
+
+    # The write returns the bookmark it produced
+    response = client.post("/favorite/862")
+    token = response.headers[HEADER]
+
+    assert decode_token(token) == {"bookmark:1"}
+
+    # The next read passes the token back and its session waits for it
+    response = client.get("/genres", headers={HEADER: token})
+
+    assert app.driver.opened[-1] == {"bookmark:1"}
+    assert response.headers[HEADER] == token
+
+
+def test_store_is_bounded():
+    store = BookmarkStore(size=2)
+
+    store.set("a", ["1"])
+    store.set("b", ["2"])
+    store.set("c", ["3"])
+
+    assert store.get("a") == frozenset()
+    assert store.get("c") == {"3"}
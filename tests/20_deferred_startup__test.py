@@ -0,0 +1,101 @@
+import threading
+import time
+
+from api import create_app
+from api.warmup import Readiness, fill_pool, warm_up
+
+
+class FlakyDriver:
+    def __init__(self, failures):
+        self.failures = failures
+        self.verified = 0
+
+    def verify_connectivity(self):
+        self.verified += 1
+
+        if self.verified <= self.failures:
+            raise OSError("connection refused")
+
+
+class SmallPoolDriver:
+    """
+    A driver whose pool has `size` connections: sessions beyond that wait
+    for one to be released
+    """
+
+    def __init__(self, size):
+        self.pool = threading.Semaphore(size)
+
+    def session(self, database=None):
+        return SmallPoolSession(self.pool)
+
+
+class SmallPoolSession:
+    def __init__(self, pool):
+        self.pool = pool
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute_read(self, work, *args):
+        self.pool.acquire()
+
+        try:
+            return work(SmallPoolTransaction(), *args)
+        finally:
+            self.pool.release()
+
+
+class SmallPoolTransaction:
+    def run(self, query):
+        return self
+
+    def consume(self):
+        pass
+
+
+def test_fill_pool_counts_only_connections_it_opened():
+    assert fill_pool(SmallPoolDriver(4), None, 4, timeout=2) == 4
+    # The last two threads only get the connections the first two release
+    # when the barrier times out
+    assert fill_pool(SmallPoolDriver(2), None, 4, timeout=0.1) == 2
+
+
+def test_warm_up_retries_until_the_database_answers():
+    driver = FlakyDriver(failures=2)
+    readiness = warm_up(driver, None, Readiness(), backoff=0)
+
+    assert readiness.ready
+    assert readiness.attempts == 3
+    assert readiness.error is None
+
+
+def test_warm_up_gives_up_after_retries():
+    readiness = warm_up(FlakyDriver(failures=5), None, Readiness(), retries=1, backoff=0)
+
+    assert readiness.state == Readiness.FAILED
+    assert readiness.error == "connection refused"
+
+
+def test_create_app_does_not_block_on_unreachable_database():
+    start = time.perf_counter()
+
+    app = create_app({
+        "TESTING": True,
+        # Nothing listens on port 1
+        "NEO4J_URI": "bolt://127.0.0.1:1",
+        "NEO4J_USERNAME": "neo4j",
+        "NEO4J_PASSWORD": "password",
+        "NEO4J_DEFERRED_STARTUP": True,
+        "NEO4J_WARMUP_RETRIES": 0,
+    })
+
+    assert time.perf_counter() - start < 5
+
+    response = app.test_client().get("/api/status/ready")
+
+    assert response.status_code == 503
+    assert response.get_json()["ready"] is False
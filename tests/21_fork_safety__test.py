@@ -0,0 +1,56 @@
+import multiprocessing
+import os
+
+import pytest
+
+from api import create_app
+from api.neo4j import close_driver, get_driver
+from benchmarks.bolt_stub import BoltStub
+from benchmarks.fork_stress import stress
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+def test_forked_workers_get_their_own_driver():
+    result = stress(workers=3, threads=3, queries=20)
+
+    assert result["protocolErrors"] == 0
+    assert result["parentMismatches"] == 0
+    assert result["parentErrors"] == []
+
+    for worker in result["workers"]:
+        assert worker["ownsDriver"]
+        assert worker["mismatches"] == 0
+        assert worker["errors"] == []
+
+
+def report_driver(app, results):
+    inherited = app.driver
+    rebuilt_on_fork = app.driver_pid == os.getpid()
+
+    with app.app_context():
+        owns = get_driver() is not inherited and app.driver_pid == os.getpid()
+
+    results.put((rebuilt_on_fork, owns))
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+def test_forked_children_build_their_driver_on_first_use():
+    with BoltStub() as stub:
+        app = create_app({
+            "TESTING": True,
+            "NEO4J_URI": stub.uri,
+            "NEO4J_USERNAME": "neo4j",
+            "NEO4J_PASSWORD": "stub",
+            "NEO4J_DEFERRED_STARTUP": False,
+        })
+
+        context = multiprocessing.get_context("fork")
+        results = context.Queue()
+        process = context.Process(target=report_driver, args=(app, results))
+        process.start()
+
+        assert results.get(timeout=30) == (False, True)
+        process.join()
+
+        with app.app_context():
+            close_driver()
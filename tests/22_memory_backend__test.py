@@ -0,0 +1,123 @@
+import pytest
+
+from api.exceptions.notfound import NotFoundException
+from api.memory.dao import MemoryMovieDAO, MemoryPeopleDAO
+from api.memory.graph import MemoryGraph
+
+goodfellas = "769"
+pacino = "1158"
+
+
+@pytest.fixture
+def graph():
+    return MemoryGraph.from_fixtures()
+
+
+@pytest.fixture
+def memory_client(memory_app):
+    with memory_app().test_client() as client:
+        yield client
+
+
+def test_fixtures_are_indexed(graph):
+    assert goodfellas in graph.movies
+    assert pacino in graph.people
+    assert "Drama" in graph.genres
+    assert len(graph.ratings[goodfellas]) == 5
+
+
+def test_movie_lists_are_sorted_and_paginated(graph):
+    dao = MemoryMovieDAO(graph)
+
+    first = dao.all("imdbRating", "DESC", 3, 0)
+    second = dao.all("imdbRating", "DESC", 3, 3)
+
+    ratings = [m["imdbRating"] for m in first + second]
+
+    assert ratings == sorted(ratings, reverse=True)
+    assert {m["tmdbId"] for m in first}.isdisjoint(m["tmdbId"] for m in second)
+    assert all(m["favorite"] is False for m in first)
+
+
+def test_find_by_id_includes_cast_and_counts(graph):
+    dao = MemoryMovieDAO(graph)
+
+    movie = dao.find_by_id(goodfellas)
+
+    assert movie["title"] == "Goodfellas"
+    assert len(movie["actors"]) > 0
+    assert movie["ratingCount"] == 5
+
+    with pytest.raises(NotFoundException):
+        dao.find_by_id("missing")
+
+
+def test_queries_are_counted(graph):
+    dao = MemoryMovieDAO(graph)
+    graph.users["u1"] = {"userId": "u1"}
+
+    dao.find_by_id(goodfellas)
+    assert graph.queries == 1
+
+    dao.find_by_id(goodfellas, "u1")
+    assert graph.queries == 3
+
+
+def test_similar_people_share_movies(graph):
+    similar = MemoryPeopleDAO(graph).get_similar_people(pacino, 6, 0)
+
+    assert all(len(p["inCommon"]) > 0 for p in similar)
+
+
+def test_routes_are_served_from_memory(memory_client):
+    genres = memory_client.get("/api/genres/").get_json()
+    assert [g["name"] for g in genres] == sorted(g["name"] for g in genres)
+
+    movie = memory_client.get("/api/movies/%s" % goodfellas).get_json()
+    assert movie["tmdbId"] == goodfellas
+
+    ratings = memory_client.get("/api/movies/%s/ratings" % goodfellas).get_json()
+    assert len(ratings) == 5
+
+    assert memory_client.get("/api/movies/missing").status_code == 404
+    assert memory_client.get("/api/status/ready").status_code == 200
+
+
+def test_register_and_login(memory_client):
+    user = {"email": "memory@neo4j.com", "password": "letmein", "name": "Memory"}
+
+    registered = memory_client.post("/api/auth/register", json=user)
+    assert registered.status_code == 200
+
+    duplicate = memory_client.post("/api/auth/register", json=user)
+    assert duplicate.status_code == 422
+
+    login = memory_client.post("/api/auth/login", json=user)
+    assert login.get_json()["token"]
+
+
+def test_similar_movies_share_genres_only():
+    # Like the Cypher pattern, which follows relationships out of the movie
+    graph = MemoryGraph()
+    graph.add_node("Genre", {"name": "Drama"})
+    graph.add_node("Person", {"tmdbId": "p1"})
+    for id, rating in (("1", 8.0), ("2", 7.0), ("3", 9.0)):
+        graph.add_node("Movie", {"tmdbId": id, "imdbRating": rating})
+        graph.add_relationship("ACTED_IN", "p1", id)
+    graph.add_relationship("IN_GENRE", "1", "Drama")
+    graph.add_relationship("IN_GENRE", "2", "Drama")
+
+    similar = MemoryMovieDAO(graph).get_similar_movies("1")
+
+    assert [(m["tmdbId"], m["score"]) for m in similar] == [("2", 7.0)]
+
+
+def test_actor_orders_follow_new_roles(graph):
+    dao = MemoryMovieDAO(graph)
+    graph.add_node("Movie", {"tmdbId": "new", "title": "New"})
+    before = dao.get_for_actor(pacino, "title", "ASC", limit=100)
+
+    graph.add_relationship("ACTED_IN", pacino, "new")
+
+    after = dao.get_for_actor(pacino, "title", "ASC", limit=100)
+    assert sorted(m["tmdbId"] for m in after) == sorted(["new"] + [m["tmdbId"] for m in before])
@@ -0,0 +1,63 @@
+import csv
+import filecmp
+import json
+import os
+
+from api.memory.graph import MemoryGraph
+from api.synthetic import COLUMNS, Catalog, generate
+
+
+def small_catalog(seed=0):
+    return Catalog(movies=300, people=200, users=250, seed=seed, chunk_size=100)
+
+
+def test_catalog_is_deterministic():
+    assert list(small_catalog()) == list(small_catalog())
+    assert list(small_catalog(0)) != list(small_catalog(1))
+
+
+def test_degrees_follow_a_power_law():
+    graph = MemoryGraph().load(small_catalog())
+
+    ratings = sorted((len(r) for r in graph.ratings.values()), reverse=True)
+
+    # The most rated movie has far more ratings than the median movie
+    assert ratings[0] > 10 * ratings[len(ratings) // 2]
+    assert len(graph.users) == 250
+    assert all(len(genres) >= 1 for genres in graph.movie_genres.values())
+
+
+def test_output_does_not_depend_on_workers(tmp_path):
+    one = tmp_path / "one"
+    many = tmp_path / "many"
+
+    totals = generate(small_catalog(), str(one), "jsonl", workers=1)
+    assert generate(small_catalog(), str(many), "jsonl", workers=2) == totals
+
+    names = sorted(os.listdir(one))
+    assert names == sorted(os.listdir(many))
+    assert filecmp.cmpfiles(one, many, names, shallow=False)[0] == names
+
+    records = [
+        json.loads(line)
+        for name in names
+        for line in open(one / name)
+    ]
+    assert len(records) == sum(totals.values())
+
+
+def test_csv_files_match_their_headers(tmp_path):
+    totals = generate(small_catalog(), str(tmp_path), "csv", workers=1)
+
+    for name, columns in COLUMNS.items():
+        with open(tmp_path / ("%s.header.csv" % name)) as f:
+            assert next(csv.reader(f)) == [header for _, header in columns]
+
+        rows = [
+            row
+            for part in sorted(tmp_path.glob("%s.*-*.csv" % name))
+            for row in csv.reader(open(part))
+        ]
+
+        assert len(rows) == totals[name]
+        assert all(len(row) == len(columns) for row in rows)
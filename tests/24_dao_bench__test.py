@@ -0,0 +1,55 @@
+import inspect
+
+import pytest
+
+from api.dao.auth import AuthDAO
+from api.dao.favorites import FavoriteDAO
+from api.dao.genres import GenreDAO
+from api.dao.movies import MovieDAO
+from api.dao.people import PeopleDAO
+from api.dao.ratings import RatingDAO
+from benchmarks import dao_bench
+
+
+class Args:
+    movies = 300
+    seed = 0
+
+
+@pytest.fixture(scope="module")
+def results():
+    app = dao_bench.memory_app(Args())
+
+    return dao_bench.run(app, iterations=3, warmup=0, alloc_iterations=1)
+
+
+def public_methods(dao_class):
+    return {
+        name for name, member in inspect.getmembers(dao_class, inspect.isfunction)
+        if not name.startswith("_")
+    }
+
+
+def test_every_public_dao_method_is_benchmarked(results):
+    covered = {(r["dao"], r["method"]) for r in results}
+
+    for dao_class in (AuthDAO, FavoriteDAO, GenreDAO, MovieDAO, PeopleDAO, RatingDAO):
+        # Helpers that take a transaction or work on results are not benchmarked
+        methods = public_methods(dao_class) - {"decode_token", "get_user_favorites", "flag_favorites"}
+
+        for method in methods:
+            assert (dao_class.__name__, method) in covered
+
+
+def test_results_report_latency_allocations_and_queries(results):
+    for r in results:
+        assert r["latencyMs"]["p50"] <= r["latencyMs"]["p95"] <= r["latencyMs"]["p99"]
+        assert r["allocPeakKiB"] >= 0
+        assert r["queriesPerCall"] >= 1
+
+
+def test_sweeps_cover_page_size_and_favorites(results):
+    all_movies = [r["params"] for r in results if r["name"] == "MovieDAO.all"]
+
+    assert {p["limit"] for p in all_movies} == set(dao_bench.PAGE_SIZES)
+    assert {p.get("favorites") for p in all_movies} >= set(dao_bench.FAVORITE_COUNTS)
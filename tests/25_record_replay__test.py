@@ -0,0 +1,163 @@
+import pytest
+from neo4j._codec.packstream import Structure
+from neo4j.time import Date, DateTime
+
+from api import create_app
+from api.neo4j import close_driver
+from api.replay import Recorder, ReplayDriver, ReplayMissError, decode_value, encode_value
+from benchmarks.bolt_stub import BoltStub
+
+movie = {"tmdbId": "862", "title": "Toy Story", "imdbRating": 8.3}
+
+
+def movies(query, parameters):
+    if query.strip().upper() == "RETURN 1":
+        return ["1"], [[1]]
+
+    return ["movie"], [[movie]]
+
+
+class Users:
+    """
+    Stub handler for the AuthDAO queries, which return User nodes
+    """
+
+    def __init__(self):
+        self.users = {}
+
+    def __call__(self, query, parameters):
+        if query.strip().upper() == "RETURN 1":
+            return ["1"], [[1]]
+
+        if "CREATE" in query:
+            self.users[parameters["email"]] = {
+                "userId": "u1",
+                "email": parameters["email"],
+                "password": parameters["encrypted"],
+                "name": parameters["name"],
+            }
+
+        user = self.users.get(parameters.get("email"))
+
+        # A Bolt 4 node: id, labels and properties
+        return ["u"], [[Structure(b"N", 1, ["User"], user)]] if user else []
+
+
+def app_config(**config):
+    return {
+        "TESTING": True,
+        "NEO4J_USERNAME": "neo4j",
+        "NEO4J_PASSWORD": "stub",
+        "NEO4J_DEFERRED_STARTUP": False,
+        **config,
+    }
+
+
+@pytest.fixture
+def recording(tmp_path):
+    path = str(tmp_path / "queries.jsonl.gz")
+
+    with BoltStub(handler=movies) as stub:
+        app = create_app(app_config(NEO4J_URI=stub.uri, NEO4J_RECORD=path))
+
+        with app.test_client() as client:
+            listed = client.get("/api/movies/?sort=title&limit=1").get_json()
+            found = client.get("/api/movies/862").get_json()
+
+        with app.app_context():
+            close_driver()
+
+    return path, listed, found
+
+
+def test_replay_serves_recorded_responses(recording):
+    path, listed, found = recording
+
+    app = create_app(app_config(NEO4J_REPLAY=path))
+
+    with app.test_client() as client:
+        assert client.get("/api/movies/?sort=title&limit=1").get_json() == listed
+        assert client.get("/api/movies/862").get_json() == found
+        assert listed[0]["title"] == "Toy Story"
+
+        # Same query, different parameters: falls back to the query text
+        assert client.get("/api/movies/1").get_json()["tmdbId"] == "862"
+
+    assert app.driver.queries == 3
+    assert app.readiness.ready
+
+
+def test_unrecorded_queries_raise():
+    driver = ReplayDriver([])
+
+    with pytest.raises(ReplayMissError):
+        with driver.session() as session:
+            session.run("MATCH (n) RETURN n")
+
+    assert driver.misses == 1
+
+
+def test_repeated_queries_cycle_through_recordings():
+    driver = ReplayDriver([
+        {"q": "RETURN $x AS x", "p": {"x": 1}, "k": ["x"], "r": [[1]], "t": 0, "db": None},
+        {"q": "RETURN $x AS x", "p": {"x": 1}, "k": ["x"], "r": [[2]], "t": 0, "db": None},
+    ])
+
+    def read(tx):
+        return tx.run("RETURN   $x AS x", x=1).single()["x"]
+
+    with driver.session() as session:
+        assert [session.execute_read(read) for _ in range(3)] == [1, 2, 1]
+
+
+def test_recorded_latency_is_simulated():
+    driver = ReplayDriver(
+        [{"q": "RETURN 1", "p": {}, "k": ["1"], "r": [[1]], "t": 20, "db": None}],
+        latency="recorded",
+    )
+
+    summary = driver.run("RETURN 1", {}).consume()
+
+    assert summary.result_available_after == 20
+
+
+def test_temporal_values_round_trip():
+    for value in (Date(2023, 1, 2), DateTime(2023, 1, 2, 3, 4, 5)):
+        assert decode_value(encode_value(value)) == value
+
+
+def test_auth_queries_are_recorded_and_replayed(tmp_path):
+    path = str(tmp_path / "queries.jsonl.gz")
+    user = {"email": "replay@neo4j.com", "password": "letmein", "name": "Replay"}
+
+    with BoltStub(handler=Users()) as stub:
+        app = create_app(app_config(
+            NEO4J_URI=stub.uri, NEO4J_RECORD=path, SECRET_KEY="secret", JWT_SECRET_KEY="secret"
+        ))
+
+        with app.test_client() as client:
+            registered = client.post("/api/auth/register", json=user).get_json()
+            assert client.post("/api/auth/login", json=user).status_code == 200
+
+        with app.app_context():
+            close_driver()
+
+    app = create_app(app_config(NEO4J_REPLAY=path, SECRET_KEY="secret", JWT_SECRET_KEY="secret"))
+
+    with app.test_client() as client:
+        replayed = client.post("/api/auth/register", json=user).get_json()
+        login = client.post("/api/auth/login", json=user)
+
+    assert {k: replayed[k] for k in ("userId", "email", "name")} == \
+        {k: registered[k] for k in ("userId", "email", "name")}
+    assert login.status_code == 200 and login.get_json()["userId"] == "u1"
+    assert app.driver.misses == 0
+
+
+def test_values_that_cannot_be_recorded_raise(tmp_path):
+    recorder = Recorder(str(tmp_path / "queries.jsonl.gz"))
+
+    with pytest.raises(TypeError):
+        recorder.write("RETURN $x", {}, ["x"], [[object()]], 0, None)
+
+    assert recorder.recorded == 0
@@ -0,0 +1,31 @@
+from benchmarks.load import FlaskClientTransport, HttpTransport, LocalServer, run
+
+
+def test_journeys_through_the_test_client(memory_app):
+    report = run(
+        FlaskClientTransport(memory_app()),
+        rate=50, duration=0.5, users=5, member_ratio=0.2, warmup=1,
+    )
+
+    endpoints = {r["name"]: r for r in report["results"]}
+
+    assert "GET /api/genres/<name>/movies" in endpoints
+    assert "GET /api/movies/<id>/similar" in endpoints
+    assert "POST /api/account/ratings/<id>" in endpoints
+
+    for r in report["results"]:
+        assert r["errorRate"] == 0, r
+        assert sum(r["histogramMs"].values()) == r["requests"]
+
+    assert report["started"] > 0
+
+
+def test_journeys_over_http(memory_app):
+    with LocalServer(memory_app()) as server:
+        report = run(
+            HttpTransport(server.url),
+            rate=20, duration=0.3, users=2, member_ratio=0, warmup=0,
+        )
+
+    assert report["results"]
+    assert all(r["errorRate"] == 0 for r in report["results"])
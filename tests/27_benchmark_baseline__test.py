@@ -0,0 +1,69 @@
+import json
+import random
+
+from benchmarks import baseline
+from benchmarks.stats import mann_whitney_u
+
+
+def run(shift=0.0, queries=2, seed=0, error_rate=0.0):
+    rng = random.Random(seed)
+    samples = [rng.gauss(10 + shift, 0.5) for _ in range(200)]
+
+    return {
+        "results": [{
+            "name": "MovieDAO.all",
+            "params": {"limit": 6},
+            "latencyMs": {"p50": sorted(samples)[100]},
+            "samplesMs": samples,
+            "queriesPerCall": queries,
+            "errorRate": error_rate,
+        }],
+    }
+
+
+def verdict(before, after):
+    comparisons, missing = baseline.compare(before, after)
+
+    assert missing == []
+
+    return comparisons[0]["verdict"]
+
+
+def test_mann_whitney_u_detects_shifts():
+    rng = random.Random(1)
+    a = [rng.gauss(10, 1) for _ in range(100)]
+    b = [rng.gauss(11, 1) for _ in range(100)]
+
+    assert mann_whitney_u(a, b)[1] < 0.001
+    assert mann_whitney_u(a, list(a))[1] == 1.0
+
+
+def test_noise_is_not_a_regression():
+    assert verdict(run(seed=0), run(seed=1)) == "unchanged"
+
+
+def test_slower_runs_regress_and_faster_runs_improve():
+    assert verdict(run(), run(shift=2, seed=1)) == "regressed"
+    assert verdict(run(), run(shift=-2, seed=1)) == "improved"
+
+
+def test_extra_queries_and_errors_regress():
+    assert verdict(run(), run(queries=3, seed=1)) == "regressed"
+    assert verdict(run(), run(error_rate=0.1, seed=1)) == "regressed"
+
+
+def test_compare_exit_codes(tmp_path):
+    before = tmp_path / "before.json"
+    after = tmp_path / "after.json"
+    before.write_text(json.dumps(run()))
+    after.write_text(json.dumps(run(shift=2, seed=1)))
+
+    directory = str(tmp_path / "baselines")
+
+    assert baseline.main(["--dir", directory, "compare", str(after), "--baseline", "main"]) == 2
+    assert baseline.main(["--dir", directory, "save", str(before), "--name", "main"]) == 0
+    assert baseline.main(["--dir", directory, "compare", str(before), "--baseline", "main"]) == 0
+    assert baseline.main(["--dir", directory, "compare", str(after), "--baseline", "main"]) == 1
+
+    saved = json.loads((tmp_path / "baselines" / "main.json").read_text())
+    assert saved["environment"]["python"]
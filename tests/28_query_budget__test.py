@@ -0,0 +1,97 @@
+import logging
+
+import pytest
+
+from api import create_app
+from api.instrumentation import collect_query_stats, current_stats, parse_server_timing, record_query
+from api.memory.dao import MemoryMovieDAO
+from api.memory.graph import MemoryGraph
+from api.testing import QueryBudgetExceeded, assert_query_budget, query_budget, query_counts
+from benchmarks.bolt_stub import BoltStub
+
+goodfellas = "769"
+
+
+@pytest.fixture
+def app(memory_app):
+    return memory_app()
+
+
+def test_favorites_cost_a_second_query(app, login):
+    with app.test_client() as client:
+        anonymous = client.get("/api/movies/%s" % goodfellas)
+        assert_query_budget(anonymous, queries=1)
+
+        member = client.get("/api/movies/%s" % goodfellas, headers=login(client))
+        assert query_counts(member)["queries"] == 2
+
+        with pytest.raises(QueryBudgetExceeded):
+            assert_query_budget(member, queries=1)
+
+
+def test_query_budget_block():
+    dao = MemoryMovieDAO(MemoryGraph.from_fixtures())
+
+    with query_budget(queries=1) as stats:
+        dao.find_by_id(goodfellas)
+
+    assert stats.queries == 1
+
+    with pytest.raises(QueryBudgetExceeded):
+        with query_budget(queries=2):
+            for movie in dao.all("imdbRating", "DESC", 3):
+                dao.find_by_id(movie["tmdbId"])
+
+
+def test_collected_stats_nest():
+    with collect_query_stats() as outer:
+        record_query("RETURN 1")
+
+        with collect_query_stats() as inner:
+            record_query("RETURN 2")
+
+        record_query("RETURN 3")
+
+    assert (outer.queries, inner.queries) == (2, 1)
+    assert current_stats() is None
+
+
+def test_repeated_queries_are_reported(app, caplog):
+    app.config["NPLUSONE_THRESHOLD"] = 1
+
+    with caplog.at_level(logging.WARNING, logger="api.queries"):
+        app.test_client().get("/api/genres/")
+
+    assert "Possible N+1" in caplog.text
+
+
+def test_driver_counts_rows_and_bytes():
+    def movies(query, parameters):
+        return ["movie"], [[{"tmdbId": str(i), "title": "Movie %d" % i}] for i in range(3)]
+
+    with BoltStub(handler=movies) as stub:
+        app = create_app({
+            "TESTING": True,
+            "NEO4J_URI": stub.uri,
+            "NEO4J_USERNAME": "neo4j",
+            "NEO4J_PASSWORD": "stub",
+            "NEO4J_DEFERRED_STARTUP": False,
+        })
+
+        response = app.test_client().get("/api/movies/")
+
+        with app.app_context():
+            app.driver.close()
+
+    counts = query_counts(response)
+
+    assert counts["queries"] == 1
+    assert counts["sessions"] == 1
+    assert counts["rows"] == 3
+    assert counts["bytes"] > 0
+
+
+def test_parse_server_timing():
+    timing = parse_server_timing('db;dur=1.5, db-queries;desc=2, other;desc="x"')
+
+    assert timing == {"db": 1.5, "db-queries": 2.0}
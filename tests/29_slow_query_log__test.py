@@ -0,0 +1,111 @@
+import logging
+
+from api import create_app
+from api.instrumentation import QueryEvent
+from api.querylog import QueryLog, fingerprint, normalize, redact, summarize_profile
+from benchmarks.bolt_stub import BoltStub
+
+
+def event(query, parameters=None, duration=0.001, mode="READ"):
+    e = QueryEvent(query, parameters or {}, None, mode)
+    e.duration = duration
+    return e
+
+
+def test_sort_and_order_variants_share_a_fingerprint():
+    by_title = "MATCH (m:Movie) RETURN m ORDER BY m.`title` ASC SKIP $skip LIMIT $limit"
+    by_rating = """
+        MATCH (m:Movie)
+        RETURN m ORDER BY m.`imdbRating` DESC SKIP $skip LIMIT $limit
+    """
+
+    assert fingerprint(by_title) == fingerprint(by_rating)
+    assert normalize("MATCH (m {id: '1'}) WHERE m.year > 1999 RETURN m LIMIT 10") == \
+        "MATCH (m {id: ?}) WHERE m.year > ? RETURN m LIMIT ?"
+    assert fingerprint("MATCH (m:Movie) RETURN m") != fingerprint("MATCH (p:Person) RETURN p")
+
+
+def test_credentials_are_redacted():
+    parameters = {"email": "a@b.c", "Password": "letmein", "user": {"encrypted": "$2b$..."}}
+
+    assert redact(parameters) == {"email": "a@b.c", "Password": "***", "user": {"encrypted": "***"}}
+
+
+def test_queries_are_aggregated_and_slow_ones_logged(caplog):
+    log = QueryLog(slow_ms=50)
+
+    with caplog.at_level(logging.WARNING, logger="api.slow_queries"):
+        log.query_finished(event("MATCH (m) RETURN m ORDER BY m.`title` ASC", duration=0.002))
+        log.query_finished(event("MATCH (m) RETURN m ORDER BY m.`released` DESC", duration=0.2))
+        log.query_finished(event(
+            "MATCH (u:User {email: $email}) RETURN u", {"email": "x", "password": "letmein"}, 0.1
+        ))
+
+    top = log.top("totalMs")
+    assert top["fingerprints"][0]["count"] == 2
+    assert top["fingerprints"][0]["slow"] == 1
+    assert top["fingerprints"][0]["histogramMs"]["5"] == 1
+    assert top["fingerprints"][0]["histogramMs"]["250"] == 1
+    assert [s["durationMs"] for s in top["slow"]] == [100.0, 200.0]
+
+    assert "Slow query" in caplog.text
+    assert "letmein" not in caplog.text
+
+
+def test_profile_summary():
+    plan = {
+        "operatorType": "ProduceResults", "dbHits": 0, "rows": 2,
+        "children": [{"operatorType": "NodeByLabelScan", "dbHits": 30, "rows": 29, "children": []}],
+    }
+
+    summary = summarize_profile(plan)
+
+    assert summary["dbHits"] == 30
+    assert summary["rows"] == 2
+    assert [o["operator"] for o in summary["operators"]] == ["ProduceResults", "NodeByLabelScan"]
+
+
+def test_driver_queries_reach_the_log(caplog):
+    def movies(query, parameters):
+        return ["movie"], [[{"tmdbId": "1", "title": "Movie"}]]
+
+    with BoltStub(handler=movies, latency=0.02) as stub:
+        app = create_app({
+            "TESTING": True,
+            "NEO4J_URI": stub.uri,
+            "NEO4J_USERNAME": "neo4j",
+            "NEO4J_PASSWORD": "stub",
+            "NEO4J_DEFERRED_STARTUP": False,
+            "SLOW_QUERY_MS": 10,
+            "ADMIN_TOKEN": "admin",
+        })
+
+        client = app.test_client()
+
+        with caplog.at_level(logging.WARNING, logger="api.slow_queries"):
+            client.get("/api/movies/?sort=title&order=ASC")
+            client.get("/api/movies/?sort=released&order=DESC")
+
+        app.driver.close()
+
+    response = client.get("/api/admin/queries?sort=count", headers={"X-Admin-Token": "admin"})
+    top = response.get_json()
+
+    movies = [f for f in top["fingerprints"] if "Movie" in f["query"]]
+    assert len(movies) == 1
+    assert movies[0]["count"] == 2
+    assert top["slow"][0]["mode"] == "READ"
+    assert top["slow"][0]["server"] is not None
+    assert "Slow query" in caplog.text
+
+
+def test_admin_endpoint_requires_a_token(memory_app):
+    app = memory_app()
+    assert app.test_client().get("/api/admin/queries").status_code == 404
+
+    app.config["ADMIN_TOKEN"] = "admin"
+    client = app.test_client()
+
+    assert client.get("/api/admin/queries").status_code == 401
+    assert client.get("/api/admin/queries", headers={"X-Admin-Token": "wrong"}).status_code == 401
+    assert client.get("/api/admin/queries", headers={"X-Admin-Token": "admin"}).status_code == 200
@@ -0,0 +1,198 @@
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+
+from api import create_app
+from api.bookmarks import BookmarkStore
+from api.metrics import Registry, exposition, registry
+from api.neo4j import close_driver, init_driver
+from benchmarks.bolt_stub import BoltStub
+
+
+def sample(text, name, **labels):
+    """
+    The value of one sample in an exposition, or 0 if it is missing
+    """
+    for line in text.splitlines():
+        if line.startswith("#"):
+            continue
+
+        metric, _, value = line.rpartition(" ")
+        found, _, rest = metric.partition("{")
+
+        if found == name and all('%s="%s"' % item in rest for item in labels.items()):
+            return float(value)
+
+    return 0.0
+
+
+@pytest.fixture
+def client(memory_app):
+    return memory_app().test_client()
+
+
+def scrape(client):
+    response = client.get("/api/status/metrics")
+
+    assert response.status_code == 200
+    assert response.content_type.startswith("text/plain; version=0.0.4")
+
+    return response.get_data(as_text=True)
+
+
+def test_requests_daos_bcrypt_and_json_are_measured(client):
+    before = scrape(client)
+
+    client.get("/api/movies/")
+    client.get("/api/movies/")
+    client.post("/api/auth/register", json={"email": "m@example.com", "password": "pw", "name": "M"})
+
+    after = scrape(client)
+
+    def delta(name, **labels):
+        return sample(after, name, **labels) - sample(before, name, **labels)
+
+    assert delta("http_requests_total", method="GET", route="/api/movies/", status="200") == 2
+    assert delta("http_request_duration_seconds_count", route="/api/movies/") == 2
+    assert delta("dao_method_duration_seconds_count", dao="MovieDAO", method="all") == 2
+    assert delta("bcrypt_duration_seconds_count", operation="hash") == 1
+    assert delta("json_serialization_duration_seconds_count") >= 3
+
+    assert "# TYPE http_request_duration_seconds histogram" in after
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/api/movies/",le="+Inf"}' in after
+
+
+def test_status_no_longer_dumps_config(client):
+    assert "NEO4J_URI" not in client.get("/api/status/").get_json()
+
+
+def test_cache_counters():
+    before = exposition(registry.snapshot())
+
+    store = BookmarkStore(size=1)
+    store.get("a")
+    store.set("a", ["b1"])
+    store.get("a")
+    store.set("b", ["b2"])
+
+    after = exposition(registry.snapshot())
+
+    def delta(name, **labels):
+        return sample(after, name, **labels) - sample(before, name, **labels)
+
+    assert delta("cache_requests_total", cache="bookmarks", result="hit") == 1
+    assert delta("cache_requests_total", cache="bookmarks", result="miss") == 1
+    assert delta("cache_evictions_total", cache="bookmarks") == 1
+
+
+def test_driver_queries_and_pool():
+    with BoltStub() as stub:
+        app = create_app({
+            "TESTING": True,
+            "NEO4J_URI": stub.uri,
+            "NEO4J_USERNAME": "neo4j",
+            "NEO4J_PASSWORD": "stub",
+            "NEO4J_DEFERRED_STARTUP": False,
+        })
+
+        client = app.test_client()
+        before = scrape(client)
+        client.get("/api/genres/")
+        after = scrape(client)
+
+        assert sample(after, "neo4j_transactions_total", mode="READ", outcome="ok") > \
+            sample(before, "neo4j_transactions_total", mode="READ", outcome="ok")
+        assert sample(after, "neo4j_queries_total", mode="READ", outcome="ok") > \
+            sample(before, "neo4j_queries_total", mode="READ", outcome="ok")
+        assert sample(after, "neo4j_pool_max_size") >= 1
+        assert sample(after, "neo4j_pool_acquisitions_total", outcome="ok") > \
+            sample(before, "neo4j_pool_acquisitions_total", outcome="ok")
+        assert "# TYPE neo4j_pool_acquisition_wait_seconds_total counter" in after
+
+        # A new driver starts its pool's totals from zero, the counters go on
+        acquisitions = sample(after, "neo4j_pool_acquisitions_total", outcome="ok")
+        with app.app_context():
+            close_driver()
+            init_driver(stub.uri, "neo4j", "stub", verify=False)
+
+        assert sample(scrape(client), "neo4j_pool_acquisitions_total", outcome="ok") >= acquisitions
+
+        app.driver.close()
+
+
+def test_values_are_added_up_across_processes(tmp_path):
+    # A worker that has already exited leaves its counters behind
+    child = """
+from api.metrics import registry
+registry.directory = %r
+registry.counter("jobs_total", "Jobs", ("kind",)).inc(3, kind="a")
+registry.gauge("busy", "Busy workers").set(1)
+registry.write()
+""" % str(tmp_path)
+    subprocess.run([sys.executable, "-c", child], check=True, cwd=os.getcwd())
+
+    mine = Registry()
+    mine.directory = str(tmp_path)
+    mine.counter("jobs_total", "Jobs", ("kind",)).inc(2, kind="a")
+    mine.gauge("busy", "Busy workers").set(1)
+
+    text = exposition(mine.collect())
+
+    assert sample(text, "jobs_total", kind="a") == 5
+    # Gauges only count while their process is alive
+    assert sample(text, "busy") == 1
+    assert re.search(r"^# TYPE jobs_total counter$", text, re.M)
+
+
+def test_transaction_retries_are_counted():
+    from api.instrumentation import InstrumentedDriver
+    from api.metrics import listener
+
+    class Session:
+        def execute_read(self, work):
+            # The driver runs the work again after a transient error
+            work(object())
+            return work(object())
+
+        def close(self):
+            pass
+
+    class Driver:
+        def session(self, **config):
+            return Session()
+
+    before = exposition(registry.snapshot())
+    InstrumentedDriver(Driver(), [listener]).session().execute_read(lambda tx: 1)
+    after = exposition(registry.snapshot())
+
+    assert sample(after, "neo4j_transaction_retries_total", mode="READ") - \
+        sample(before, "neo4j_transaction_retries_total", mode="READ") == 1
+
+
+def test_daos_have_one_proxy_with_every_hook(memory_app):
+    from api.dao.genres import GenreDAO
+    from api.memory.dao import MemoryGenreDAO
+    from api.neo4j import get_dao
+    from api.proxy import DAOProxy
+
+    app = memory_app(CACHE=True)
+
+    with app.test_request_context():
+        dao = get_dao(GenreDAO)
+
+        assert isinstance(dao, DAOProxy) and not isinstance(dao._dao, DAOProxy)
+        assert isinstance(dao._dao, MemoryGenreDAO)
+
+        # Each method is wrapped once per proxy
+        assert dao.all is dao.all
+
+        before = sample(exposition(registry.snapshot()), "dao_method_duration_seconds_count", dao="GenreDAO", method="all")
+        dao.all()
+        dao.all()
+        after = sample(exposition(registry.snapshot()), "dao_method_duration_seconds_count", dao="GenreDAO", method="all")
+
+    # Cached calls are timed too
+    assert after - before == 2
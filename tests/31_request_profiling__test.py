@@ -0,0 +1,96 @@
+import json
+import time
+
+import pytest
+
+from api.profiling import ID_HEADER, sign, verify
+
+
+@pytest.fixture
+def make_app(memory_app, tmp_path):
+    def make(**config):
+        return memory_app(PROFILE_DIR=str(tmp_path), **config)
+
+    return make
+
+
+def profile(tmp_path, response):
+    id = response.headers[ID_HEADER]
+
+    with open(tmp_path / ("%s.json" % id)) as f:
+        meta = json.load(f)
+
+    with open(tmp_path / ("%s.collapsed" % id)) as f:
+        stacks = [line.rsplit(" ", 1) for line in f.read().splitlines()]
+
+    return meta, stacks
+
+
+def test_requests_are_not_profiled_by_default(tmp_path, make_app):
+    response = make_app().test_client().get("/api/movies/")
+
+    assert ID_HEADER not in response.headers
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_signed_header_triggers_a_tracing_profile(tmp_path, make_app):
+    app = make_app(PROFILE_SECRET="s3cret", PROFILE_MODE="tracing")
+    client = app.test_client()
+
+    response = client.get(
+        "/api/movies/?sort=imdbRating&limit=3",
+        headers={"X-Profile": sign("s3cret", "/api/movies/")},
+    )
+    meta, stacks = profile(tmp_path, response)
+
+    assert meta["route"] == "/api/movies/"
+    assert meta["args"] == {"sort": ["imdbRating"], "limit": ["3"]}
+    assert meta["status"] == 200
+    assert all(stack.startswith("GET /api/movies/;") for stack, _ in stacks)
+    assert all(int(weight) >= 0 for _, weight in stacks)
+    assert any("get_movies" in stack for stack, _ in stacks)
+    assert any("dumps" in stack for stack, _ in stacks)
+
+
+def test_sampled_requests_use_the_sampling_profiler(tmp_path, make_app):
+    app = make_app(PROFILE_SAMPLE_RATE=1.0, PROFILE_INTERVAL=0.0005)
+
+    @app.route("/slow")
+    def slow():
+        for _ in range(50):
+            time.sleep(0.001)
+        return "done"
+
+    meta, stacks = profile(tmp_path, app.test_client().get("/slow"))
+
+    assert meta["mode"] == "sampling"
+    assert meta["samples"] > 10
+    assert sum(int(weight) for stack, weight in stacks if ";slow (" in stack) > 10
+
+
+def test_only_the_newest_profiles_are_kept(tmp_path, make_app):
+    client = make_app(PROFILE_SAMPLE_RATE=1.0, PROFILE_KEEP=3).test_client()
+    ids = [client.get("/api/genres/").headers[ID_HEADER] for _ in range(5)]
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted(
+        "%s.%s" % (id, extension) for id in ids[-3:] for extension in ("json", "collapsed")
+    )
+
+
+@pytest.mark.parametrize("value", [
+    None, "", "garbage", "%d.%s" % (time.time() + 60, "0" * 64),
+])
+def test_invalid_signatures_are_ignored(tmp_path, value, make_app):
+    app = make_app(PROFILE_SECRET="s3cret")
+    headers = {"X-Profile": value} if value is not None else {}
+
+    response = app.test_client().get("/api/movies/", headers=headers)
+
+    assert ID_HEADER not in response.headers
+
+
+def test_signatures_are_bound_to_path_and_expiry():
+    assert verify("k", "/api/movies/", sign("k", "/api/movies/"))
+    assert not verify("k", "/api/people/", sign("k", "/api/movies/"))
+    assert not verify("other", "/api/movies/", sign("k", "/api/movies/"))
+    assert not verify("k", "/api/movies/", sign("k", "/api/movies/", ttl=-1))
@@ -0,0 +1,73 @@
+import tracemalloc
+
+import pytest
+
+from api.testing import MemoryLeakDetected, assert_no_leak
+
+goodfellas = "769"
+al_pacino = "1158"
+
+
+@pytest.fixture
+def app(memory_app):
+    app = memory_app(MEMORY_PROFILING=True, ADMIN_TOKEN="admin")
+
+    yield app
+
+    tracemalloc.stop()
+
+
+def test_memory_is_attributed_to_routes_and_daos(app):
+    client = app.test_client()
+
+    for _ in range(3):
+        client.get("/api/movies/%s" % goodfellas)
+        client.get("/api/people/%s/similar?limit=50" % al_pacino)
+
+    report = client.get("/api/admin/memory", headers={"X-Admin-Token": "admin"}).get_json()
+
+    movie = report["routes"]["GET /api/movies/<movie_id>"]
+    assert movie["count"] == 3
+    assert movie["peakBytes"]["max"] > 0
+    assert movie["peakBytes"]["max"] >= movie["retainedBytes"]["max"]
+
+    assert report["daos"]["MovieDAO.find_by_id"]["count"] == 3
+    assert report["daos"]["PeopleDAO.get_similar_people"]["peakBytes"]["max"] > 0
+
+    sites = report["sites"]["GET /api/people/<id>/similar"]
+    assert sites and all(site["bytes"] > 0 for site in sites)
+
+
+def test_memory_report_is_disabled_by_default(memory_app):
+    app = memory_app(ADMIN_TOKEN="admin")
+
+    response = app.test_client().get("/api/admin/memory", headers={"X-Admin-Token": "admin"})
+
+    assert response.status_code == 404
+    assert app.memory_profile is None
+
+
+def test_repeated_requests_do_not_leak(memory_app):
+    app = memory_app()
+    client = app.test_client()
+
+    report = assert_no_leak(lambda: client.get("/api/movies/%s" % goodfellas), iterations=100)
+
+    assert len(report.samples) == 4
+
+
+def test_leaks_are_detected(memory_app):
+    app = memory_app()
+    kept = []
+
+    @app.route("/leak")
+    def leak():
+        kept.append(bytearray(1000))
+        return "ok"
+
+    client = app.test_client()
+
+    with pytest.raises(MemoryLeakDetected) as error:
+        assert_no_leak(lambda: client.get("/leak"), iterations=50)
+
+    assert "32_memory_profiling__test.py" in str(error.value)
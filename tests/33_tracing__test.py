@@ -0,0 +1,120 @@
+import threading
+
+import pytest
+
+from api import create_app
+from api.tracing import HttpExporter, MemoryExporter, parse_traceparent
+from benchmarks.bolt_stub import BoltStub
+from benchmarks.trace_collector import Collector, tree
+
+goodfellas = "769"
+incoming = "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"
+
+
+@pytest.fixture
+def traced_app(memory_app):
+    def make(rate):
+        app = memory_app(TRACING_EXPORT="file:/dev/null", TRACING_SAMPLE_RATE=rate)
+        app.tracer.exporter = MemoryExporter()
+
+        return app
+
+    return make
+
+
+def spans(app):
+    app.tracer.flush()
+
+    return app.tracer.exporter.spans
+
+
+def test_parse_traceparent():
+    assert parse_traceparent(incoming) == (
+        "0af7651916cd43dd8448eb211c80319c", "b7ad6b7169203331", True
+    )
+    assert parse_traceparent(incoming[:-2] + "00")[2] is False
+    assert parse_traceparent("00-%s-b7ad6b7169203331-01" % ("0" * 32)) is None
+    assert parse_traceparent("garbage") is None
+
+
+def test_unsampled_requests_have_no_spans(traced_app):
+    app = traced_app(0.0)
+    response = app.test_client().get("/api/movies/%s" % goodfellas)
+
+    assert "traceresponse" not in response.headers
+    assert spans(app) == []
+
+
+def test_incoming_context_is_continued(traced_app):
+    app = traced_app(0.0)
+    response = app.test_client().get("/api/movies/%s" % goodfellas, headers={"traceparent": incoming})
+
+    exported = {span["name"]: span for span in spans(app)}
+    root = exported["GET /api/movies/<movie_id>"]
+
+    assert root["traceId"] == "0af7651916cd43dd8448eb211c80319c"
+    assert root["parentSpanId"] == "b7ad6b7169203331"
+    assert root["attributes"]["http.status_code"] == 200
+    assert exported["MovieDAO.find_by_id"]["parentSpanId"] == root["spanId"]
+    assert response.headers["traceresponse"] == "00-%s-%s-01" % (root["traceId"], root["spanId"])
+
+
+def test_driver_spans_and_transaction_metadata():
+    def genres(query, parameters):
+        return ["genre"], [[{"name": "Action", "movies": 3}], [{"name": "Drama", "movies": 5}]]
+
+    with BoltStub(handler=genres) as stub:
+        app = create_app({
+            "TESTING": True,
+            "NEO4J_URI": stub.uri,
+            "NEO4J_USERNAME": "neo4j",
+            "NEO4J_PASSWORD": "stub",
+            "NEO4J_DEFERRED_STARTUP": False,
+            "TRACING_EXPORT": "file:/dev/null",
+            "TRACING_SAMPLE_RATE": 1.0,
+        })
+        app.tracer.exporter = MemoryExporter()
+
+        app.test_client().get("/api/genres/")
+        app.driver.close()
+
+        exported = {span["name"]: span for span in spans(app)}
+        metadata = stub.transactions[-1]
+
+    root = exported["GET /api/genres/"]
+    dao = exported["GenreDAO.all"]
+    session = exported["neo4j.session"]
+    transaction = exported["neo4j.transaction"]
+    query = exported["neo4j.query"]
+
+    assert dao["parentSpanId"] == root["spanId"]
+    assert session["parentSpanId"] == dao["spanId"]
+    assert transaction["parentSpanId"] == session["spanId"]
+    assert query["parentSpanId"] == transaction["spanId"]
+
+    assert transaction["attributes"]["neo4j.mode"] == "READ"
+    assert transaction["attributes"]["neo4j.attempts"] == 1
+    assert transaction["attributes"]["neo4j.pool.wait_ms"] >= 0
+    assert query["attributes"]["db.rows"] == 2
+    assert len(query["attributes"]["db.query.fingerprint"]) == 12
+
+    assert metadata == {"traceId": root["traceId"], "spanId": transaction["spanId"]}
+
+
+def test_spans_reach_the_collector(traced_app):
+    collector = Collector(("127.0.0.1", 0))
+    threading.Thread(target=collector.serve_forever, daemon=True).start()
+
+    try:
+        app = traced_app(1.0)
+        app.tracer.exporter = HttpExporter("http://%s:%d/v1/spans" % collector.server_address)
+
+        app.test_client().get("/api/movies/%s" % goodfellas)
+        app.tracer.flush()
+    finally:
+        collector.shutdown()
+
+    lines = tree(collector.spans)
+
+    assert lines[0].startswith("GET /api/movies/<movie_id>")
+    assert lines[1].startswith("  MovieDAO.find_by_id")
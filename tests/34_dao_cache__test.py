@@ -0,0 +1,265 @@
+import logging
+import time
+
+import pytest
+from flask import Flask, jsonify
+
+from api import cache as cache_module
+from api.bookmarks import HEADER, BookmarkStore, save_bookmarks
+from api.cache import (
+    MISS, Cache, LocalCache, MemorySharedCache, SqliteSharedCache, init_cache,
+)
+from api.dao.favorites import FavoriteDAO
+from api.dao.genres import GenreDAO
+from api.neo4j import get_dao
+from api.testing import FakeDriver
+
+goodfellas = "769"
+al_pacino = "1158"
+
+
+@pytest.fixture
+def app(memory_app):
+    return memory_app(CACHE=True, CACHE_SHARED="memory")
+
+
+def test_reads_are_served_from_the_cache(app, queries):
+    client = app.test_client()
+
+    first = client.get("/api/movies/%s" % goodfellas)
+    second = client.get("/api/movies/%s" % goodfellas)
+
+    assert queries(first) == 1
+    assert queries(second) == 0
+    assert first.get_json() == second.get_json()
+
+    # Arguments are matched by name, with defaults applied
+    assert queries(client.get("/api/movies/?limit=6")) == 1
+    assert queries(client.get("/api/movies/")) == 0
+
+
+def test_writes_invalidate_the_tags_they_change(app, login, queries):
+    client = app.test_client()
+    headers = login(client)
+
+    client.get("/api/movies/%s" % goodfellas, headers=headers)
+    client.get("/api/movies/%s/ratings" % goodfellas)
+    client.get("/api/genres/")
+    client.get("/api/people/%s" % al_pacino)
+
+    client.post("/api/account/favorites/%s" % goodfellas, headers=headers)
+
+    # The user's own view changed, nothing else did
+    favorite = client.get("/api/movies/%s" % goodfellas, headers=headers)
+    assert queries(favorite) > 0
+    assert favorite.get_json()["favorite"] is True
+    assert queries(client.get("/api/movies/%s/ratings" % goodfellas)) == 0
+
+    client.post("/api/account/ratings/%s" % goodfellas, json={"rating": 5}, headers=headers)
+
+    ratings = client.get("/api/movies/%s/ratings" % goodfellas)
+    assert queries(ratings) == 1
+    assert any(review["rating"] == 5 for review in ratings.get_json())
+    assert queries(client.get("/api/genres/")) == 0
+    assert queries(client.get("/api/people/%s" % al_pacino)) == 0
+
+
+def test_ttls_can_be_overridden_per_method(memory_app, queries):
+    client = memory_app(CACHE=True, CACHE_TTLS='{"GenreDAO.all": 0}').test_client()
+
+    client.get("/api/genres/")
+    assert queries(client.get("/api/genres/")) == 1
+
+
+def test_tinylfu_keeps_popular_entries():
+    cache = LocalCache(size=4)
+
+    # Every set follows a missed get, as in CachedDAO
+    for key in ("a", "b", "c", "d"):
+        cache.get(key)
+        cache.set(key, key, 60)
+
+    for _ in range(5):
+        cache.get("a")
+
+    # One-off keys are not admitted in place of entries used as often
+    for i in range(20):
+        cache.get("scan-%d" % i)
+        cache.set("scan-%d" % i, i, 60)
+
+    assert cache.get("a") == "a"
+    assert cache.stats()["rejections"] > 0
+
+    # A key asked for more often than the least recently used entry is
+    for _ in range(3):
+        cache.get("hot")
+    assert cache.set("hot", "hot", 60)
+    assert cache.get("hot") == "hot"
+
+
+def test_expired_entries_make_room_whatever_their_frequency():
+    cache = LocalCache(size=2)
+
+    for key in ("popular", "other"):
+        for _ in range(10):
+            cache.get(key)
+    cache.set("popular", 1, -1)
+    cache.set("other", 2, 60)
+
+    assert cache.set("new", 3, 60)
+    assert cache.get("new") == 3 and cache.get("other") == 2
+
+
+@pytest.mark.parametrize("shared", ["memory", "sqlite"])
+def test_shared_tiers_prune_expired_and_surplus_entries(shared, tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_module, "PRUNE_EVERY", 10)
+
+    if shared == "memory":
+        tier = MemorySharedCache(size=5)
+
+        def rows():
+            return len(tier._entries)
+    else:
+        tier = SqliteSharedCache(str(tmp_path / "cache.db"), size=5)
+
+        def rows():
+            return tier._connection().execute("SELECT count(*) FROM entries").fetchone()[0]
+
+    for i in range(5):
+        tier.set("expired-%d" % i, b"x", -1)
+    for i in range(5):
+        tier.set("kept-%d" % i, b"x", 60 + i)
+    assert rows() == 5
+
+    for i in range(10):
+        tier.set("later-%d" % i, b"x", 120 + i)
+
+    # The entries closest to expiring go first
+    assert rows() == 5
+    assert tier.get("kept-4") is None and tier.get("later-9") == b"x"
+
+
+def test_entries_expire():
+    cache = LocalCache()
+    cache.set("k", "v", -1)
+
+    assert cache.get("k") is MISS
+
+
+@pytest.mark.parametrize("shared", ["memory", "sqlite"])
+def test_shared_tier_invalidation_reaches_other_processes(shared, tmp_path):
+    if shared == "memory":
+        shared_tier = MemorySharedCache()
+        other_tier = shared_tier
+    else:
+        shared_tier = SqliteSharedCache(str(tmp_path / "cache.db"))
+        other_tier = SqliteSharedCache(str(tmp_path / "cache.db"))
+
+    mine = Cache(LocalCache(), shared_tier)
+    # Another worker, with its own local tier
+    theirs = Cache(LocalCache(), other_tier)
+
+    mine.set("MovieDAO.find_by_id 769", {"title": "Goodfellas"}, 60, ["movie:769"])
+    assert theirs.get("MovieDAO.find_by_id 769") == {"title": "Goodfellas"}
+
+    theirs.local.clear()
+    mine.invalidate(["movie:769"])
+    assert theirs.get("MovieDAO.find_by_id 769") is MISS
+
+
+def test_shared_results_are_kept_per_catalog_version(memory_app, queries, tmp_path):
+    def worker(version):
+        return memory_app(
+            CACHE=True, CACHE_BODIES=True, CACHE_SHARED="sqlite:%s" % (tmp_path / "cache.db"),
+            CATALOG_VERSION=version,
+        ).test_client()
+
+    paths = ["/api/genres/", "/api/movies/769"]
+
+    for path in paths:
+        worker("2024-01").get(path)
+
+    for path in paths:
+        assert queries(worker("2024-01").get(path)) == 0
+        assert queries(worker("2024-02").get(path)) > 0
+
+
+def test_results_computed_before_an_invalidation_are_not_stored():
+    cache = Cache(LocalCache(), MemorySharedCache())
+
+    token = cache.token()
+    cache.invalidate(["movie:769"])
+    cache.set("k", "stale", 60, ["movie:769"], token)
+
+    assert cache.get("k") is MISS
+
+
+@pytest.mark.parametrize("workers,lives", [(1, 60), (4, 5)])
+def test_local_entries_are_capped_with_several_workers(workers, lives):
+    cache = Cache(LocalCache(), local_ttl=5, workers=workers)
+    cache.set("k", "v", 60, ["movie:769"])
+
+    entry = cache.local.get_entry("k")
+    assert entry.fresh_until - time.monotonic() == pytest.approx(lives, abs=1)
+
+
+def test_several_workers_without_a_shared_tier_warn(memory_app, caplog):
+    with caplog.at_level(logging.WARNING, logger="api.cache"):
+        app = memory_app(CACHE=True, WORKERS=4)
+
+    assert app.cache.workers == 4
+    assert "CACHE_SHARED" in caplog.text
+
+
+def create_neo4j_app(window):
+    # The Neo4j DAOs, on a driver without a server
+    app = Flask(__name__)
+    app.config.update(CACHE=True, CACHE_WRITE_WINDOW=window)
+    app.driver = FakeDriver(write=lambda work, *args: {"tmdbId": args[-1], "favorite": True})
+    app.bookmarks = BookmarkStore()
+    app.after_request(save_bookmarks)
+    init_cache(app)
+
+    @app.post("/favorite/<movie_id>")
+    def favorite(movie_id):
+        return jsonify(get_dao(FavoriteDAO).add("user-1", movie_id))
+
+    @app.get("/genres")
+    def genres():
+        return jsonify(get_dao(GenreDAO).all())
+
+    return app
+
+
+def test_writers_skip_only_results_computed_before_their_write():
+    app = create_neo4j_app(window=0.05)
+    client = app.test_client()
+    driver = app.driver
+
+    client.get("/genres")
+    assert driver.executions == 1
+
+    token = client.post("/favorite/%s" % goodfellas).headers[HEADER]
+
+    # The cached genres predate the write: the writer computes them again...
+    client.get("/genres", headers={HEADER: token})
+    assert driver.executions == 2
+
+    # ...until a result is computed after the write, plus the window for
+    # followers to catch up, and then reads from the cache like anyone else
+    time.sleep(0.1)
+    client.get("/genres", headers={HEADER: token})
+    assert driver.executions == 3
+
+    client.get("/genres", headers={HEADER: token})
+    client.get("/genres")
+    assert driver.executions == 3
+
+
+def test_requests_without_a_write_join_older_flights():
+    cache = Cache(LocalCache(), write_window=0.0)
+    flight, _ = cache._flight("k")
+    flight.started -= 10
+
+    # Computed before the write: not joined
+    assert cache.single_flight("k", lambda: "fresh", written_at=time.time() - 1) == "fresh"
@@ -0,0 +1,57 @@
+import pytest
+
+goodfellas = "769"
+
+
+@pytest.fixture
+def app(memory_app):
+    return memory_app(CACHE=True)
+
+
+def test_users_share_one_cached_page(app, login, queries):
+    client = app.test_client()
+    users = [login(client, "user%d@neo4j.com" % i) for i in range(3)]
+
+    anonymous = client.get("/api/movies/?sort=imdbRating")
+    assert queries(anonymous) == 1
+
+    for headers in users:
+        page = client.get("/api/movies/?sort=imdbRating", headers=headers)
+
+        # Only the user's favorites are read
+        assert queries(page) == 1
+        assert [m["tmdbId"] for m in page.get_json()] == [m["tmdbId"] for m in anonymous.get_json()]
+
+    # Which are cached as well
+    assert queries(client.get("/api/movies/?sort=imdbRating", headers=users[0])) == 0
+
+
+def test_favorite_flags_are_applied_per_user(app, login, queries):
+    client = app.test_client()
+    alice = login(client, "alice@neo4j.com")
+    bob = login(client, "bob@neo4j.com")
+
+    top = client.get("/api/movies/?sort=imdbRating&order=DESC").get_json()[0]["tmdbId"]
+    client.post("/api/account/favorites/%s" % top, headers=alice)
+
+    page = client.get("/api/movies/?sort=imdbRating&order=DESC", headers=alice)
+    assert queries(page) == 1
+    assert page.get_json()[0]["favorite"] is True
+
+    assert client.get("/api/movies/?sort=imdbRating&order=DESC", headers=bob).get_json()[0]["favorite"] is False
+    assert client.get("/api/movies/?sort=imdbRating&order=DESC").get_json()[0]["favorite"] is False
+
+    client.delete("/api/account/favorites/%s" % top, headers=alice)
+    assert client.get("/api/movies/?sort=imdbRating&order=DESC", headers=alice).get_json()[0]["favorite"] is False
+
+
+def test_cached_records_are_not_modified_by_flagging(app, login, queries):
+    client = app.test_client()
+    headers = login(client, "carol@neo4j.com")
+    client.post("/api/account/favorites/%s" % goodfellas, headers=headers)
+
+    assert client.get("/api/movies/%s" % goodfellas, headers=headers).get_json()["favorite"] is True
+
+    anonymous = client.get("/api/movies/%s" % goodfellas)
+    assert queries(anonymous) == 0
+    assert anonymous.get_json()["favorite"] is False
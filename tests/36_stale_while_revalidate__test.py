@@ -0,0 +1,121 @@
+import threading
+import time
+
+import pytest
+
+from api.cache import Cache, CachedDAO, Entry, LocalCache
+
+
+class SlowGenreDAO:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+        self.fail = False
+
+    def all(self):
+        self.calls += 1
+        time.sleep(self.delay)
+
+        if self.fail:
+            raise RuntimeError("database unavailable")
+
+        return [{"name": "Drama", "version": self.calls}]
+
+
+@pytest.fixture
+def app(memory_app):
+    app = memory_app()
+
+    with app.app_context():
+        yield app
+
+
+def cached(dao, ttl=0.05, stale=60):
+    # No early refreshes, which are tested on their own
+    cache = Cache(
+        LocalCache(), ttls={"GenreDAO.all": ttl}, stale={"GenreDAO.all": stale}, beta=0.0
+    )
+
+    return CachedDAO(dao, "GenreDAO", cache), cache
+
+
+def test_stale_results_are_served_while_one_request_refreshes(app):
+    dao = SlowGenreDAO(delay=0.1)
+    genres, cache = cached(dao)
+
+    assert genres.all()[0]["version"] == 1
+    time.sleep(0.06)
+
+    # Past the TTL: every request gets the stale result straight away
+    started = time.perf_counter()
+    for _ in range(20):
+        assert genres.all()[0]["version"] == 1
+    assert time.perf_counter() - started < 0.1
+
+    cache.wait()
+    assert genres.all()[0]["version"] == 2
+    assert dao.calls == 2
+
+    revalidations = cache.stats()["revalidations"]
+    assert revalidations["servedStale"] == 1
+    assert revalidations["count"] == 2
+    assert revalidations["maxMs"] >= 100
+
+
+def test_requests_for_a_missing_key_share_one_computation(app):
+    dao = SlowGenreDAO(delay=0.1)
+    genres, cache = cached(dao)
+    results = []
+
+    def request():
+        with app.app_context():
+            results.append(genres.all())
+
+    threads = [threading.Thread(target=request) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert dao.calls == 1
+    assert len(results) == 10 and all(r is results[0] for r in results)
+    assert cache.stats()["revalidations"]["coalesced"] == 9
+
+
+def test_requests_wait_once_the_hard_ttl_has_passed(app):
+    dao = SlowGenreDAO()
+    genres, cache = cached(dao, ttl=0.01, stale=0.01)
+
+    genres.all()
+    time.sleep(0.03)
+
+    assert genres.all()[0]["version"] == 2
+    assert cache.stats()["revalidations"]["servedStale"] == 0
+
+
+def test_failed_refreshes_keep_serving_the_stale_result(app):
+    dao = SlowGenreDAO()
+    genres, cache = cached(dao)
+
+    genres.all()
+    time.sleep(0.06)
+    dao.fail = True
+
+    assert genres.all()[0]["version"] == 1
+    cache.wait()
+    assert genres.all()[0]["version"] == 1
+    assert cache.stats()["revalidations"]["errors"] >= 1
+
+
+def test_refreshes_start_early_at_random_for_slow_results():
+    now = time.monotonic()
+
+    cheap = Entry("v", now + 1, now + 60, (), delta=0.0)
+    slow = Entry("v", now + 1, now + 60, (), delta=1.0)
+
+    assert not any(cheap.refresh_due(now) for _ in range(1000))
+    assert cheap.refresh_due(now + 1)
+
+    # Due when -log(u) >= 1, so with a probability of about 1/e
+    early = sum(slow.refresh_due(now) for _ in range(2000))
+    assert 500 < early < 1000
@@ -0,0 +1,143 @@
+import gzip
+import json
+import time
+
+import pytest
+
+from api.bodies import BodyCache, EncodedBody
+from api.bookmarks import RequestBookmarks
+from api.metrics import CACHE_REQUESTS
+from api.testing import query_counts
+
+goodfellas = "769"
+al_pacino = "1158"
+
+
+@pytest.fixture
+def app(memory_app):
+    return memory_app(CACHE=True, CACHE_BODIES=True)
+
+
+@pytest.fixture
+def uncached(memory_app):
+    def uncached(path, headers=None):
+        return memory_app().test_client().get(path, headers=headers).get_json()
+
+    return uncached
+
+
+def test_bodies_match_the_uncached_responses(app, uncached):
+    client = app.test_client()
+
+    for path in ("/api/movies/%s" % goodfellas, "/api/people/%s" % al_pacino):
+        first = client.get(path)
+        second = client.get(path)
+
+        assert first.get_json() == uncached(path)
+        assert second.data == first.data
+        assert query_counts(second)["queries"] == 0
+        assert int(second.headers["Content-Length"]) == len(second.data)
+
+    assert app.bodies.stats() == {"hits": 2, "misses": 2}
+
+
+def test_body_requests_are_counted_in_the_cache_metrics(app):
+    def count(result):
+        return CACHE_REQUESTS.values.get(CACHE_REQUESTS.key({"cache": "bodies", "result": result}), 0)
+
+    hits, misses = count("hit"), count("miss")
+
+    client = app.test_client()
+    client.get("/api/movies/%s" % goodfellas)
+    client.get("/api/movies/%s" % goodfellas)
+
+    assert count("hit") - hits == 1
+    assert count("miss") - misses == 1
+
+
+@pytest.mark.parametrize("record", [{}, {"favorite": True}])
+def test_records_with_only_a_favorite_flag_encode_to_json(app, record):
+    with app.app_context():
+        encoded = EncodedBody.encode(record, flag=True)
+
+    assert json.loads(b"".join(encoded.chunks(True))) == {"favorite": True}
+    assert json.loads(b"".join(encoded.chunks(False))) == {"favorite": False}
+
+
+def test_favorite_flags_are_patched_in_per_user(app, login):
+    client = app.test_client()
+    headers = login(client)
+
+    anonymous = client.get("/api/movies/%s" % goodfellas)
+    client.post("/api/account/favorites/%s" % goodfellas, headers=headers)
+
+    favorite = client.get("/api/movies/%s" % goodfellas, headers=headers)
+    assert favorite.get_json() == {**anonymous.get_json(), "favorite": True}
+    assert query_counts(favorite)["queries"] == 1
+
+    assert client.get("/api/movies/%s" % goodfellas).get_json()["favorite"] is False
+
+
+def test_gzipped_bodies_are_sent_to_clients_that_accept_them(app, login):
+    client = app.test_client()
+    headers = login(client)
+    client.post("/api/account/favorites/%s" % goodfellas, headers=headers)
+
+    plain = client.get("/api/movies/%s" % goodfellas)
+    compressed = client.get("/api/movies/%s" % goodfellas, headers={"Accept-Encoding": "gzip"})
+
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert len(compressed.data) < len(plain.data)
+    assert gzip.decompress(compressed.data) == plain.data
+
+    favorite = client.get(
+        "/api/movies/%s" % goodfellas, headers={**headers, "Accept-Encoding": "gzip"}
+    )
+    assert json.loads(gzip.decompress(favorite.data))["favorite"] is True
+
+
+def test_writes_drop_the_bodies_they_change(app, login):
+    client = app.test_client()
+    headers = login(client)
+
+    before = client.get("/api/movies/%s" % goodfellas).get_json()
+    client.post("/api/account/ratings/%s" % goodfellas, json={"rating": 5}, headers=headers)
+
+    after = client.get("/api/movies/%s" % goodfellas)
+    assert query_counts(after)["queries"] > 0
+    assert after.get_json()["ratingCount"] == before["ratingCount"] + 1
+
+
+def test_missing_entities_are_not_cached(app):
+    client = app.test_client()
+
+    assert client.get("/api/movies/missing").status_code == 404
+    assert client.get("/api/movies/missing").status_code == 404
+
+
+def test_bodies_follow_the_read_your_writes_rule(memory_app):
+    app = memory_app(CACHE=True, CACHE_BODIES=True, CACHE_WRITE_WINDOW=0)
+
+    class PersonDAO:
+        def __init__(self, written_at=None):
+            self.bookmarks = RequestBookmarks(["bookmark:1"] if written_at else (), written_at)
+            self.loads = 0
+
+        def find_by_id(self, person_id):
+            self.loads += 1
+            return {"tmdbId": person_id}
+
+    with app.test_request_context():
+        bodies = BodyCache(app.cache)
+        bodies.person(PersonDAO(), al_pacino)
+
+        writer = PersonDAO(written_at=time.time())
+        bodies.person(writer, al_pacino)
+        bodies.person(writer, al_pacino)
+
+        reader = PersonDAO()
+        bodies.person(reader, al_pacino)
+
+    # The body computed before the write is skipped once, then shared again
+    assert writer.loads == 1
+    assert reader.loads == 0
@@ -0,0 +1,136 @@
+import time
+
+import pytest
+
+from api.cache import Cache, LocalCache
+from api.snapshot import MAGIC, restore, save
+from api.testing import query_counts
+
+goodfellas = "769"
+
+
+@pytest.fixture
+def make_app(memory_app):
+    def make(path, **config):
+        return memory_app(CACHE=True, CACHE_SNAPSHOT=str(path), CACHE_SNAPSHOT_INTERVAL=0, **config)
+
+    return make
+
+
+def test_a_restarted_app_starts_warm(tmp_path, make_app):
+    path = tmp_path / "cache.snapshot"
+    paths = ["/api/genres/", "/api/movies/?sort=imdbRating", "/api/movies/%s/similar" % goodfellas]
+
+    before = make_app(path)
+    client = before.test_client()
+    responses = [client.get(p).get_json() for p in paths]
+    before.snapshots.save()
+
+    after = make_app(path)
+    assert after.snapshots.restored.entries == before.snapshots.saved > 0
+
+    client = after.test_client()
+    for p, expected in zip(paths, responses):
+        response = client.get(p)
+
+        assert query_counts(response)["queries"] == 0
+        assert response.get_json() == expected
+
+    status = client.get("/api/status/").get_json()
+    assert status["snapshots"]["restored"]["entries"] == after.snapshots.restored.entries
+
+
+def test_snapshots_of_another_catalog_are_not_restored(tmp_path, make_app):
+    path = tmp_path / "cache.snapshot"
+
+    before = make_app(path, CATALOG_VERSION="2024-01")
+    before.test_client().get("/api/genres/")
+    before.snapshots.save()
+
+    after = make_app(path, CATALOG_VERSION="2024-02")
+    assert after.snapshots.restored.reason == "catalogVersion"
+    assert after.snapshots.restored.entries == 0
+    assert query_counts(after.test_client().get("/api/genres/"))["queries"] == 1
+
+
+def test_entries_keep_the_time_they_had_left(tmp_path, monkeypatch):
+    path = str(tmp_path / "cache.snapshot")
+    cache = Cache(LocalCache())
+    cache.set("short", 1, 10, ["movie:1"])
+    cache.set("long", 2, 100, ["movie:2"])
+
+    assert save(cache, path, "v1") == 2
+
+    created = time.time()
+    monkeypatch.setattr(time, "time", lambda: created + 30)
+
+    restored_cache = Cache(LocalCache())
+    restored = restore(restored_cache, path, "v1")
+
+    assert restored.entries == 1 and restored.expired == 1
+    assert restored_cache.get("long") == 2
+    assert restored_cache.local.get_entry("long").fresh_until - time.monotonic() == pytest.approx(70, abs=1)
+
+    # Tags are restored too
+    restored_cache.invalidate(["movie:2"])
+    assert len(restored_cache.local) == 0
+
+
+def test_entries_capped_for_several_workers_are_saved_with_their_full_time(tmp_path):
+    path = str(tmp_path / "cache.snapshot")
+    cache = Cache(LocalCache(), workers=4, local_ttl=5)
+    cache.set("long", 2, 100, ["movie:2"])
+
+    assert cache.local.get_entry("long").fresh_until - time.monotonic() == pytest.approx(5, abs=1)
+    save(cache, path, "v1")
+
+    single = Cache(LocalCache())
+    restore(single, path, "v1")
+    assert single.local.get_entry("long").fresh_until - time.monotonic() == pytest.approx(100, abs=1)
+
+    # A worker among several caps restored entries too, and saves them
+    # with their full time again
+    several = Cache(LocalCache(), workers=4, local_ttl=5)
+    restore(several, path, "v1")
+    assert several.local.get_entry("long").fresh_until - time.monotonic() == pytest.approx(5, abs=1)
+
+    save(several, path, "v1")
+    restore(single, path, "v1")
+    assert single.local.get_entry("long").fresh_until - time.monotonic() == pytest.approx(100, abs=1)
+
+
+@pytest.mark.parametrize("contents", [
+    b"", b"not a snapshot", MAGIC + b"\x01", MAGIC + b"\x10" + b"\x00" * 7 + b'{"format"',
+])
+def test_invalid_files_are_ignored(tmp_path, contents, make_app):
+    path = tmp_path / "cache.snapshot"
+    path.write_bytes(contents)
+
+    assert restore(Cache(LocalCache()), str(path)).reason == "invalid"
+
+    # And do not stop the app from starting
+    assert make_app(path).snapshots.restored.reason == "invalid"
+
+
+class Removed:
+    pass
+
+
+def test_entries_that_cannot_be_unpickled_are_skipped(tmp_path, monkeypatch):
+    path = str(tmp_path / "cache.snapshot")
+    cache = Cache(LocalCache())
+    cache.set("gone", Removed(), 60, ["movie:1"])
+    cache.set("kept", 2, 60, ["movie:2"])
+    save(cache, path)
+
+    monkeypatch.delitem(globals(), "Removed")
+
+    restored_cache = Cache(LocalCache())
+    restored = restore(restored_cache, path)
+
+    assert restored.reason == "invalid" and restored.entries == 1
+    assert restored_cache.get("kept") == 2
+
+
+def test_missing_files_are_ignored(tmp_path):
+    assert restore(Cache(LocalCache()), str(tmp_path / "missing")).reason == "missing"
@@ -0,0 +1,107 @@
+import mmap
+
+import pytest
+
+from api.memory.catalog import Catalog, CatalogGraph, build
+from api.memory.graph import MemoryGraph
+
+goodfellas = "769"
+pacino = "1158"
+
+
+@pytest.fixture(scope="module")
+def catalog_path(tmp_path_factory):
+    return build(MemoryGraph.from_fixtures(), str(tmp_path_factory.mktemp("catalog") / "catalog.bin"), "v1")
+
+
+@pytest.fixture(scope="module")
+def graph_app(memory_app):
+    return memory_app()
+
+
+@pytest.fixture(scope="module")
+def catalog_app(memory_app, catalog_path):
+    return memory_app(MEMORY_CATALOG=catalog_path)
+
+
+@pytest.mark.parametrize("path", [
+    "/api/movies/?sort=title",
+    "/api/movies/?sort=imdbRating&order=DESC&limit=20",
+    "/api/movies/?sort=released&skip=3",
+    "/api/movies/?sort=budget",
+    "/api/genres/",
+    "/api/genres/Drama/",
+    "/api/genres/Drama/movies?sort=year&order=DESC",
+    "/api/genres/Missing/",
+    "/api/people/%s" % pacino,
+    "/api/people/?sort=name&limit=20",
+    "/api/people/?q=Al",
+    "/api/people/%s/acted" % pacino,
+    "/api/people/%s/directed" % pacino,
+])
+def test_the_catalog_serves_what_the_graph_does(graph_app, catalog_app, path):
+    graph = graph_app.test_client().get(path)
+    catalog = catalog_app.test_client().get(path)
+
+    assert catalog.status_code == graph.status_code
+    assert catalog.get_json() == graph.get_json()
+
+
+def test_movie_details_come_from_the_catalog(graph_app, catalog_app):
+    graph = graph_app.test_client().get("/api/movies/%s" % goodfellas).get_json()
+    catalog = catalog_app.test_client().get("/api/movies/%s" % goodfellas).get_json()
+
+    # Ratings belong to users, who are not part of the catalog
+    assert catalog.pop("ratingCount") == 0
+    graph.pop("ratingCount")
+    assert catalog == graph
+
+    similar = catalog_app.test_client().get("/api/movies/%s/similar?limit=50" % goodfellas)
+    expected = graph_app.test_client().get("/api/movies/%s/similar?limit=50" % goodfellas)
+    assert sorted(m["score"] for m in similar.get_json()) == sorted(m["score"] for m in expected.get_json())
+
+
+def test_columns_are_read_from_the_mapping(catalog_path):
+    catalog = Catalog(catalog_path)
+    graph = CatalogGraph(catalog)
+
+    titles = graph.movies.table.columns["title"].values
+    assert isinstance(titles, memoryview)
+    assert isinstance(titles.obj, mmap.mmap)
+    assert catalog.version == "v1"
+
+    assert graph.movies[goodfellas]["title"] == "Goodfellas"
+    assert goodfellas in graph.movies and "missing" not in graph.movies
+    assert len(graph.movies) == len(MemoryGraph.from_fixtures().movies)
+
+
+def test_the_catalog_is_read_only(catalog_path):
+    graph = CatalogGraph(Catalog(catalog_path))
+
+    with pytest.raises(ValueError):
+        graph.add_node("Movie", {"tmdbId": "1", "title": "New"})
+
+    with pytest.raises(ValueError):
+        graph.add_relationship("IN_GENRE", goodfellas, "Drama")
+
+
+def test_users_are_kept_per_worker(catalog_path, memory_app):
+    app = memory_app(MEMORY_CATALOG=catalog_path)
+    client = app.test_client()
+    user = {"email": "catalog@neo4j.com", "password": "letmein", "name": "Catalog"}
+
+    assert client.post("/api/auth/register", json=user).status_code == 200
+    token = client.post("/api/auth/login", json=user).get_json()["token"]
+    headers = {"Authorization": "Bearer %s" % token}
+
+    assert client.post("/api/account/favorites/%s" % goodfellas, headers=headers).status_code == 200
+    favorites = client.get("/api/account/favorites", headers=headers).get_json()
+    assert [m["tmdbId"] for m in favorites] == [goodfellas]
+
+
+def test_other_files_are_rejected(tmp_path):
+    path = tmp_path / "catalog.bin"
+    path.write_bytes(b"not a catalog, but long enough to map")
+
+    with pytest.raises(ValueError):
+        Catalog(str(path))
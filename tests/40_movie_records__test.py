@@ -0,0 +1,72 @@
+import argparse
+import math
+
+from api.memory.columns import GrowingObjects, GrowingTable
+from api.memory.graph import MemoryGraph, sort_records
+from benchmarks import movie_records
+
+goodfellas = "769"
+
+
+def test_records_round_trip():
+    graph = MemoryGraph.from_fixtures()
+    table = GrowingTable("tmdbId")
+
+    for movie in graph.movies.values():
+        table.merge(movie)
+
+    assert list(table) == list(graph.movies)
+    assert table.values() == graph.movies.values()
+    assert table[goodfellas]["title"] == "Goodfellas"
+
+    # Reading builds a new record every time
+    table[goodfellas]["title"] = "Changed"
+    assert table[goodfellas]["title"] == "Goodfellas"
+
+
+def test_merging_updates_in_place():
+    table = GrowingTable("tmdbId")
+    table.merge({"tmdbId": "1", "title": "First", "year": 1999})
+    table.merge({"tmdbId": "2", "imdbRating": 7.5})
+    row = table.merge({"tmdbId": "1", "title": "First, again", "runtime": 90})
+
+    assert row == 0 and len(table) == 2
+    assert table["1"] == {"tmdbId": "1", "title": "First, again", "year": 1999, "runtime": 90}
+    assert table["2"] == {"tmdbId": "2", "imdbRating": 7.5}
+
+
+def test_columns_are_typed_and_widened():
+    table = GrowingTable("tmdbId")
+    table.merge({"tmdbId": "1", "year": 1999, "imdbRating": 8.0, "languages": ["English"]})
+    table.merge({"tmdbId": "2", "year": "unknown", "imdbRating": math.inf, "languages": ["English"]})
+
+    assert isinstance(table.columns["year"], GrowingObjects)
+    assert table.columns["imdbRating"].values.typecode == "d"
+    assert table["2"]["year"] == "unknown" and table["1"]["year"] == 1999
+
+    # Lists of strings are stored once, however many movies share them
+    assert table.columns["languages"].values.tolist() == [0, 0]
+    assert table["1"]["languages"] == table["2"]["languages"] == ["English"]
+
+
+def test_orders_match_sort_records():
+    graph = MemoryGraph.synthetic(300)
+
+    for sort in ("imdbRating", "title", "year", "released", "tmdbId", "missing"):
+        expected = [
+            m["tmdbId"] for m in sort_records(graph.movies.values(), sort)
+            if m.get(sort) is not None
+        ]
+        ordered = graph.sorted_movie_ids(None, graph.movies, sort)
+
+        assert ordered.rows.typecode == "i"
+        assert list(ordered) == expected
+        assert ordered[2:5] == expected[2:5]
+
+
+def test_benchmark_reports_memory_per_movie():
+    args = argparse.Namespace(movies=200, sort="imdbRating", pages=5, seed=0)
+    result = movie_records.run(args)
+
+    stores = {r["store"]: r for r in result["results"]}
+    assert stores["columns"]["bytesPerMovie"] < stores["dict"]["bytesPerMovie"]
@@ -6,6 +6,7 @@ from dotenv import load_dotenv
 
 from api import create_app
 from api.neo4j import init_driver, close_driver
+from api.testing import query_counts
 
 @pytest.fixture(scope = 'session', autouse = True)
 def load_env():
@@ -29,3 +30,51 @@ def client(app):
                 os.environ.get('NEO4J_PASSWORD'),
             )
         yield client
+
+
+"""
+Apps on the in-memory backend (`DAO_BACKEND=memory`), which need no
+database.  `memory_app(**config)` builds one with `config` on top of
+`MEMORY_CONFIG`.
+"""
+MEMORY_CONFIG = {
+    "TESTING": True,
+    "SECRET_KEY": "secret",
+    "JWT_SECRET_KEY": "secret",
+    "DAO_BACKEND": "memory",
+}
+
+
+@pytest.fixture(scope = 'session')
+def memory_app():
+    def make(**config):
+        return create_app({**MEMORY_CONFIG, **config})
+
+    return make
+
+
+@pytest.fixture(scope = 'session')
+def login():
+    """
+    `login(client, email)` registers a user if needed, signs them in and
+    returns the `Authorization` header
+    """
+    def login(client, email="test@neo4j.com"):
+        user = {"email": email, "password": "letmein", "name": email.split("@")[0]}
+        client.post("/api/auth/register", json=user)
+        token = client.post("/api/auth/login", json=user).get_json()["token"]
+
+        return {"Authorization": "Bearer %s" % token}
+
+    return login
+
+
+@pytest.fixture(scope = 'session')
+def queries():
+    """
+    `queries(response)` is the number of queries a response reports
+    """
+    def queries(response):
+        return query_counts(response)["queries"]
+
+    return queries